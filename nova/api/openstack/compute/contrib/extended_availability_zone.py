@@ -27,9 +27,10 @@ authorize = extensions.soft_extension_authorizer('compute',
 
 
 class ExtendedAZController(wsgi.Controller):
-    def _extend_server(self, context, server, instance):
+    def _extend_server(self, context, server, instance, az=None):
         key = "%s:availability_zone" % Extended_availability_zone.alias
-        az = avail_zone.get_instance_availability_zone(context, instance)
+        if az is None:
+            az = avail_zone.get_instance_availability_zone(context, instance)
         if not az and instance.get('availability_zone'):
             # Likely hasn't reached a viable compute node yet so give back the
             # desired availability_zone that *may* exist in the instance
@@ -52,9 +53,14 @@ class ExtendedAZController(wsgi.Controller):
         if authorize(context):
             resp_obj.attach(xml=ExtendedAZsTemplate())
             servers = list(resp_obj.obj['servers'])
+            req.prefetch_db_availability_zones(
+                [server['id'] for server in servers],
+                lambda uuids: avail_zone.get_instances_availability_zones(
+                    context, [req.get_db_instance(uuid) for uuid in uuids]))
             for server in servers:
                 db_instance = req.get_db_instance(server['id'])
-                self._extend_server(context, server, db_instance)
+                az = req.get_db_availability_zone(server['id'])
+                self._extend_server(context, server, db_instance, az)
 
 
 class Extended_availability_zone(extensions.ExtensionDescriptor):
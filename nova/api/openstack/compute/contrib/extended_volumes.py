@@ -29,8 +29,9 @@ class ExtendedVolumesController(wsgi.Controller):
         super(ExtendedVolumesController, self).__init__(*args, **kwargs)
         self.compute_api = compute.API()
 
-    def _extend_server(self, context, server, instance):
-        bdms = self.compute_api.get_instance_bdms(context, instance)
+    def _extend_server(self, context, server, instance, bdms=None):
+        if bdms is None:
+            bdms = self.compute_api.get_instance_bdms(context, instance)
         volume_ids = [bdm['volume_id'] for bdm in bdms if bdm['volume_id']]
         key = "%s:volumes_attached" % Extended_volumes.alias
         server[key] = [{'id': volume_id} for volume_id in volume_ids]
@@ -54,11 +55,16 @@ class ExtendedVolumesController(wsgi.Controller):
             # Attach our slave template to the response object
             resp_obj.attach(xml=ExtendedVolumesServersTemplate())
             servers = list(resp_obj.obj['servers'])
+            # server['id'] is guaranteed to be in the cache due to
+            # the core API adding it in its 'detail' method.
+            req.prefetch_db_instance_bdms(
+                [server['id'] for server in servers],
+                lambda uuids: self.compute_api.get_instances_bdms(
+                    context, [req.get_db_instance(uuid) for uuid in uuids]))
             for server in servers:
                 db_instance = req.get_db_instance(server['id'])
-                # server['id'] is guaranteed to be in the cache due to
-                # the core API adding it in its 'detail' method.
-                self._extend_server(context, server, db_instance)
+                bdms = req.get_db_instance_bdms(server['id'])
+                self._extend_server(context, server, db_instance, bdms)
 
 
 class Extended_volumes(extensions.ExtensionDescriptor):
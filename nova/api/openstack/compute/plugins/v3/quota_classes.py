@@ -92,6 +92,7 @@ class QuotaClassSetsController(wsgi.Controller):
                     db.quota_class_create(context, quota_class, key, value)
                 except exception.AdminRequired:
                     raise webob.exc.HTTPForbidden()
+                QUOTAS.limits_changed(quota_class=quota_class)
         return self._format_quota_set(
             quota_class,
             QUOTAS.get_class_quotas(context, quota_class))
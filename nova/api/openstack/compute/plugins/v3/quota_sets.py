@@ -216,6 +216,7 @@ class QuotaSetsController(wsgi.Controller):
                                 user_id=user_id)
             except exception.AdminRequired:
                 raise webob.exc.HTTPForbidden()
+            QUOTAS.limits_changed(project_id=project_id, user_id=user_id)
         return self._format_quota_set(id, self._get_quotas(context, id,
                                                            user_id=user_id))
 
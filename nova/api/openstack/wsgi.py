@@ -125,6 +125,24 @@ class Request(webob.Request):
         """
         return self.get_db_items(key).get(item_key)
 
+    def prefetch_db_items(self, key, item_keys, load):
+        """
+        Allow API extensions to load at once the objects they would
+        otherwise look up one at a time within the same API request.
+
+        load is called once with the keys among item_keys which are not
+        stored yet, and returns a dict of the objects found by key.  Keys
+        it does not return are stored as None, so that they are not looked
+        up again.
+        """
+        db_items = self._extension_data['db_items'].setdefault(key, {})
+        missing = set(item_keys) - set(db_items)
+        if not missing:
+            return
+        loaded = load(list(missing))
+        for item_key in missing:
+            db_items[item_key] = loaded.get(item_key)
+
     def cache_db_instances(self, instances):
         self.cache_db_items('instances', instances, 'uuid')
 
@@ -161,6 +179,18 @@ class Request(webob.Request):
     def get_db_compute_node(self, id):
         return self.get_db_item('compute_nodes', id)
 
+    def prefetch_db_instance_bdms(self, instance_uuids, load):
+        self.prefetch_db_items('instance_bdms', instance_uuids, load)
+
+    def get_db_instance_bdms(self, instance_uuid):
+        return self.get_db_item('instance_bdms', instance_uuid)
+
+    def prefetch_db_availability_zones(self, instance_uuids, load):
+        self.prefetch_db_items('availability_zones', instance_uuids, load)
+
+    def get_db_availability_zone(self, instance_uuid):
+        return self.get_db_item('availability_zones', instance_uuid)
+
     def best_match_content_type(self):
         """Determine the requested response content-type."""
         if 'nova.best_content_type' not in self.environ:
@@ -141,3 +141,42 @@ def get_instance_availability_zone(context, instance):
         az = get_host_availability_zone(elevated, host)
         cache.set(cache_key, az, AZ_CACHE_SECONDS)
     return az
+
+
+def get_hosts_availability_zones(context, hosts):
+    """Return the availability zones of several hosts by host, looked up
+    in a single query.
+    """
+    metadata = db.aggregate_host_get_by_metadata_key(context,
+            key='availability_zone')
+    azs = {}
+    for host in hosts:
+        if host in metadata:
+            azs[host] = list(metadata[host])[0]
+        else:
+            azs[host] = CONF.default_availability_zone
+    return azs
+
+
+def get_instances_availability_zones(context, instances):
+    """Return the availability zones of several instances by uuid, looking
+    up at once those of the hosts missing from the cache.
+    """
+    cache = _get_cache()
+    azs = {}
+    missing = set()
+    for instance in instances:
+        host = str(instance.get('host'))
+        if not host or host in azs:
+            continue
+        azs[host] = cache.get(_make_cache_key(host))
+        if not azs[host]:
+            missing.add(host)
+    if missing:
+        elevated = context.elevated()
+        for host, az in get_hosts_availability_zones(elevated,
+                                                     missing).iteritems():
+            cache.set(_make_cache_key(host), az, AZ_CACHE_SECONDS)
+            azs[host] = az
+    return dict((instance['uuid'], azs.get(str(instance.get('host'))))
+                for instance in instances)
@@ -55,8 +55,11 @@
 
 from __future__ import print_function
 
+import datetime
+import itertools
 import os
 import sys
+import time
 
 import netaddr
 from oslo.config import cfg
@@ -77,6 +80,7 @@ from nova.openstack.common.gettextutils import _
 from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
 from nova.openstack.common import rpc
+from nova.openstack.common import timeutils
 from nova import quota
 from nova import servicegroup
 from nova import version
@@ -95,6 +99,9 @@ CONF.import_opt('public_interface', 'nova.network.linux_net')
 
 QUOTAS = quota.QUOTAS
 
+# Number of instances read from the database at a time when listing them
+INSTANCE_CHUNK_SIZE = 1000
+
 
 # Decorators for actions
 def args(*args, **kwargs):
@@ -321,10 +328,15 @@ class FixedIpCommands(object):
             print(_("error: %s") % ex)
             return(2)
 
-        instances = db.instance_get_all(context.get_admin_context())
+        # Only keep the hostname and host of each instance.
+        chunks = db.instance_get_all_by_filters_chunked(
+                context.get_admin_context(),
+                {'deleted': False, 'soft_deleted': True},
+                INSTANCE_CHUNK_SIZE, columns_to_join=[])
         instances_by_uuid = {}
-        for instance in instances:
-            instances_by_uuid[instance['uuid']] = instance
+        for instance in itertools.chain.from_iterable(chunks):
+            instances_by_uuid[instance['uuid']] = dict(
+                    hostname=instance['hostname'], host=instance['host'])
 
         print("%-18s\t%-15s\t%-15s\t%s" % (_('network'),
                                               _('IP address'),
@@ -651,13 +663,15 @@ class VmCommands(object):
                                              _('zone'),
                                              _('index'))))
 
-        if host is None:
-            instances = db.instance_get_all(context.get_admin_context())
-        else:
-            instances = db.instance_get_all_by_host(
-                           context.get_admin_context(), host)
+        # Print the instances as they are read, rather than reading them
+        # all first.
+        filters = {'deleted': False, 'soft_deleted': True}
+        if host is not None:
+            filters['host'] = host
+        chunks = db.instance_get_all_by_filters_chunked(
+                context.get_admin_context(), filters, INSTANCE_CHUNK_SIZE)
 
-        for instance in instances:
+        for instance in itertools.chain.from_iterable(chunks):
             instance_type = flavors.extract_flavor(instance)
             print(("%-10s %-15s %-10s %-10s %-26s %-9s %-9s %-9s"
                    " %-10s %-10s %-10s %-5d" % (instance['display_name'],
@@ -903,6 +917,113 @@ class DbCommands(object):
         admin_context = context.get_admin_context()
         db.archive_deleted_rows(admin_context, max_rows)
 
+    @args('--batch_size', metavar='<number>', default=1000,
+            help='Rows to archive or purge in each transaction')
+    @args('--max_rows', metavar='<number>',
+            help='Maximum number of deleted rows to archive')
+    @args('--older_than', metavar='<days>',
+            help='Only archive rows deleted more than this many days ago')
+    @args('--purge_older_than', metavar='<days>',
+            help='Also delete the rows archived more than this many days '
+                 'ago from the shadow tables')
+    @args('--max_rate', metavar='<rows/s>',
+            help='Maximum number of rows to archive or purge per second')
+    def archive(self, batch_size=1000, max_rows=None, older_than=None,
+                purge_older_than=None, max_rate=None):
+        """Move deleted rows from production tables to shadow tables in
+        batches, dependent tables first, and purge old shadow rows.
+
+        Each batch is archived in its own transaction, lowest key first, so
+        an interrupted run can simply be started again.
+        """
+        try:
+            batch_size = int(batch_size)
+            max_rows = int(max_rows) if max_rows is not None else None
+            older_than = self._days_ago(older_than)
+            purge_older_than = self._days_ago(purge_older_than)
+            max_rate = float(max_rate) if max_rate is not None else None
+        except ValueError:
+            print(_("Must supply numbers for the batch size, the maximum "
+                    "number of rows, the days and the rate"))
+            return(1)
+        if (batch_size <= 0 or (max_rows is not None and max_rows < 0) or
+                (max_rate is not None and max_rate <= 0)):
+            print(_("Must supply positive values for batch_size, max_rows "
+                    "and max_rate"))
+            return(1)
+
+        admin_context = context.get_admin_context()
+        tablenames = db.archive_tablenames(admin_context)
+        self._throttle_start = time.time()
+        self._throttle_rows = 0
+
+        def archive_batch(tablename, limit):
+            return db.archive_deleted_rows_for_table(
+                admin_context, tablename, max_rows=limit,
+                deleted_before=older_than)
+
+        print("%-40s %10s %10s %10s" % (_('Archived'), _('Rows'),
+                                        _('Seconds'), _('Rows/s')))
+        self._run_batches(tablenames, archive_batch, batch_size, max_rows,
+                          max_rate)
+        if purge_older_than is None:
+            return
+
+        def purge_batch(tablename, limit):
+            return db.purge_shadow_rows_for_table(
+                admin_context, tablename, purge_older_than, max_rows=limit)
+
+        print("%-40s %10s %10s %10s" % (_('Purged'), _('Rows'),
+                                        _('Seconds'), _('Rows/s')))
+        self._run_batches(tablenames, purge_batch, batch_size, None,
+                          max_rate)
+
+    @staticmethod
+    def _days_ago(days):
+        if days is None:
+            return None
+        return timeutils.utcnow() - datetime.timedelta(days=float(days))
+
+    def _run_batches(self, tablenames, run_batch, batch_size, max_rows,
+                     max_rate):
+        """Run batches of at most batch_size rows on each table until one
+        comes short, printing the rows per table and in total.
+        """
+        total = 0
+        start = time.time()
+        for tablename in tablenames:
+            rows = 0
+            table_start = time.time()
+            while max_rows is None or total < max_rows:
+                limit = batch_size
+                if max_rows is not None:
+                    limit = min(limit, max_rows - total)
+                count = run_batch(tablename, limit)
+                rows += count
+                total += count
+                self._throttle(count, max_rate)
+                if count < limit:
+                    break
+            if rows:
+                self._print_rate(tablename, rows, time.time() - table_start)
+        self._print_rate(_('Total'), total, time.time() - start)
+        return total
+
+    def _throttle(self, rows, max_rate):
+        """Sleep as long as needed to stay under max_rate rows per second."""
+        self._throttle_rows += rows
+        if max_rate is None:
+            return
+        ahead = (self._throttle_rows / max_rate -
+                 (time.time() - self._throttle_start))
+        if ahead > 0:
+            time.sleep(ahead)
+
+    @staticmethod
+    def _print_rate(name, rows, seconds):
+        rate = rows / seconds if seconds > 0 else 0
+        print("%-40s %10d %10.1f %10.1f" % (name, rows, seconds, rate))
+
 
 class FlavorCommands(object):
     """Class for managing flavors.
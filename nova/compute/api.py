@@ -69,6 +69,7 @@ from nova.openstack.common import timeutils
 from nova.openstack.common import uuidutils
 import nova.policy
 from nova import quota
+from nova.scheduler import rpcapi as scheduler_rpcapi
 from nova import servicegroup
 from nova import utils
 from nova import volume
@@ -2883,6 +2884,20 @@ class API(base.Base):
             return block_device.legacy_mapping(bdms)
         return bdms
 
+    def get_instances_bdms(self, context, instances, legacy=True):
+        """Get all bdm tables for several instances at once, by instance
+        uuid.
+        """
+        bdms = dict((instance['uuid'], []) for instance in instances)
+        for bdm in self.db.block_device_mapping_get_all_by_instance_uuids(
+                context, bdms.keys()):
+            bdms[bdm['instance_uuid']].append(bdm)
+        if legacy:
+            for instance_uuid in bdms:
+                bdms[instance_uuid] = block_device.legacy_mapping(
+                    bdms[instance_uuid])
+        return bdms
+
     def is_volume_backed_instance(self, context, instance, bdms=None):
         if not instance['image_ref']:
             return True
@@ -3132,6 +3147,7 @@ class AggregateAPI(base.Base):
     """Sub-set of the Compute Manager API for managing host aggregates."""
     def __init__(self, **kwargs):
         self.compute_rpcapi = compute_rpcapi.ComputeAPI()
+        self.scheduler_rpcapi = scheduler_rpcapi.SchedulerAPI()
         super(AggregateAPI, self).__init__(**kwargs)
 
     @wrap_exception()
@@ -3143,6 +3159,7 @@ class AggregateAPI(base.Base):
         if availability_zone:
             aggregate.metadata = {'availability_zone': availability_zone}
         aggregate.create(context)
+        self.scheduler_rpcapi.aggregates_changed(context)
 
         aggregate = self._reformat_aggregate_info(aggregate)
         # To maintain the same API result as before.
@@ -3169,6 +3186,7 @@ class AggregateAPI(base.Base):
         if values:
             aggregate.metadata = values
         aggregate.save()
+        self.scheduler_rpcapi.aggregates_changed(context)
 
         # If updated values include availability_zones, then the cache
         # which stored availability_zones and host need to be reset
@@ -3181,6 +3199,7 @@ class AggregateAPI(base.Base):
         """Updates the aggregate metadata."""
         aggregate = aggregate_obj.Aggregate.get_by_id(context, aggregate_id)
         aggregate.update_metadata(metadata)
+        self.scheduler_rpcapi.aggregates_changed(context)
         return aggregate
 
     @wrap_exception()
@@ -3197,6 +3216,7 @@ class AggregateAPI(base.Base):
                                                    aggregate_id=aggregate_id,
                                                    reason='not empty')
         aggregate.destroy()
+        self.scheduler_rpcapi.aggregates_changed(context)
         compute_utils.notify_about_aggregate_update(context,
                                                     "delete.end",
                                                     aggregate_payload)
@@ -3237,6 +3257,7 @@ class AggregateAPI(base.Base):
                 self._check_az_for_host(aggregate_meta, host_az, aggregate_id)
         aggregate = aggregate_obj.Aggregate.get_by_id(context, aggregate_id)
         aggregate.add_host(context, host_name)
+        self.scheduler_rpcapi.aggregates_changed(context)
         #NOTE(jogo): Send message to host to support resource pools
         self.compute_rpcapi.add_aggregate_host(context,
                 aggregate=aggregate, host_param=host_name, host=host_name)
@@ -3258,6 +3279,7 @@ class AggregateAPI(base.Base):
         service_obj.Service.get_by_compute_host(context, host_name)
         aggregate = aggregate_obj.Aggregate.get_by_id(context, aggregate_id)
         aggregate.delete_host(host_name)
+        self.scheduler_rpcapi.aggregates_changed(context)
         self.compute_rpcapi.remove_aggregate_host(context,
                 aggregate=aggregate, host_param=host_name, host=host_name)
         compute_utils.notify_about_aggregate_update(context,
@@ -36,6 +36,7 @@ import time
 import traceback
 import uuid
 
+from eventlet import greenpool
 from eventlet import greenthread
 from oslo.config import cfg
 
@@ -130,6 +131,20 @@ interval_opts = [
                default=600,
                help='interval to sync power states between '
                     'the database and the hypervisor'),
+    cfg.IntOpt('sync_power_state_pool_size',
+               default=10,
+               help='Number of greenthreads syncing the instances found '
+                    'out of sync with the hypervisor at once, during the '
+                    'sync of power states. This bounds the concurrent '
+                    'calls made to the hypervisor and the database by the '
+                    'sync'),
+    cfg.IntOpt('sync_power_state_audit_interval',
+               default=1,
+               help='Read the power states of all the instances from the '
+                    'hypervisor every this many runs of the sync of power '
+                    'states, when the virt driver reports lifecycle events. '
+                    'The runs in between compare the database with the '
+                    'power states last reported by the events'),
     cfg.IntOpt("heal_instance_info_cache_interval",
                default=60,
                help="Number of seconds between instance info_cache self "
@@ -440,6 +455,11 @@ class ComputeManager(manager.SchedulerDependentManager):
         self.consoleauth_rpcapi = consoleauth.rpcapi.ConsoleAuthAPI()
         self.cells_rpcapi = cells_rpcapi.CellsAPI()
         self._resource_tracker_dict = {}
+        # The power states of the instances of the host, by uuid, as last
+        # read from the hypervisor or reported by its lifecycle events, and
+        # the runs of the sync of power states since it last read them all.
+        self._power_states = {}
+        self._power_state_runs_since_audit = None
 
         super(ComputeManager, self).__init__(service_name="compute",
                                              *args, **kwargs)
@@ -471,13 +491,17 @@ class ComputeManager(manager.SchedulerDependentManager):
         instance_ref = self.conductor_api.instance_update(context,
                                                           instance_uuid,
                                                           **kwargs)
-        if (instance_ref['host'] == self.host and
-                self.driver.node_is_available(instance_ref['node'])):
-            rt = self._get_resource_tracker(instance_ref.get('node'))
-            rt.update_usage(context, instance_ref)
+        self._update_resource_tracker(context, instance_ref)
 
         return instance_ref
 
+    def _update_resource_tracker(self, context, instance):
+        """Let the resource tracker know about a change to an instance."""
+        if (instance['host'] == self.host and
+                self.driver.node_is_available(instance['node'])):
+            rt = self._get_resource_tracker(instance.get('node'))
+            rt.update_usage(context, instance)
+
     def _set_instance_error_state(self, context, instance_uuid):
         try:
             self._instance_update(context, instance_uuid,
@@ -745,6 +769,7 @@ class ComputeManager(manager.SchedulerDependentManager):
                         event.get_transition())
 
         if vm_power_state is not None:
+            self._power_states[instance.uuid] = vm_power_state
             self._sync_instance_power_state(context,
                                             instance,
                                             vm_power_state)
@@ -1948,6 +1973,10 @@ class ComputeManager(manager.SchedulerDependentManager):
                                      project_id=project_id,
                                      user_id=user_id)
 
+        # Free the resources of the instance on the node now, rather than
+        # in the next audit:
+        self._update_resource_tracker(context, instance)
+
         quotas = quotas_obj.Quotas.from_reservations(context,
                                                      reservations,
                                                      instance=instance)
@@ -4794,15 +4823,22 @@ class ComputeManager(manager.SchedulerDependentManager):
     def _sync_power_states(self, context):
         """Align power states between the database and the hypervisor.
 
-        To sync power state data we make a DB call to get the number of
-        virtual machines known by the hypervisor and if the number matches the
-        number of virtual machines known by the database, we proceed in a lazy
-        loop, one database record at a time, checking if the hypervisor has the
-        same power state as is in the database.
+        The power states of all the instances of the host are read from
+        the hypervisor at once and compared with the database in memory.
+        Only the instances found out of sync are then synced, in a pool of
+        greenthreads.
+
+        When the driver reports lifecycle events, the power states are only
+        read from the hypervisor every sync_power_state_audit_interval runs,
+        the runs in between use the ones reported by the events.
         """
-        db_instances = instance_obj.InstanceList.get_by_host(context,
-                                                             self.host,
-                                                             use_slave=True)
+        start = time.time()
+        # Only read the columns the sync needs, the others are lazy-loaded
+        # for all the instances at once if they are needed.
+        db_instances = instance_obj.InstanceList.get_by_host(
+                context, self.host, use_slave=True,
+                columns=['host', 'node', 'power_state', 'vm_state',
+                         'task_state'])
 
         num_vm_instances = self.driver.get_num_instances()
         num_db_instances = len(db_instances)
@@ -4813,33 +4849,117 @@ class ComputeManager(manager.SchedulerDependentManager):
                      {'num_db_instances': num_db_instances,
                       'num_vm_instances': num_vm_instances})
 
+        instances = []
         for db_instance in db_instances:
             if db_instance['task_state'] is not None:
                 LOG.info(_("During sync_power_state the instance has a "
                            "pending task. Skip."), instance=db_instance)
                 continue
-            # No pending tasks. Now try to figure out the real vm_power_state.
-            try:
-                try:
-                    vm_instance = self.driver.get_info(db_instance)
-                    vm_power_state = vm_instance['state']
-                except exception.InstanceNotFound:
-                    vm_power_state = power_state.NOSTATE
-                # Note(maoy): the above get_info call might take a long time,
-                # for example, because of a broken libvirt driver.
-                try:
-                    self._sync_instance_power_state(context,
-                                                    db_instance,
-                                                    vm_power_state,
-                                                    use_slave=True)
-                except exception.InstanceNotFound:
-                    # NOTE(hanlind): If the instance gets deleted during sync,
-                    # silently ignore and move on to next instance.
-                    continue
-            except Exception:
-                LOG.exception(_("Periodic sync_power_state task had an error "
-                                "while processing an instance."),
-                                instance=db_instance)
+            instances.append(db_instance)
+
+        if self._power_state_audit_due():
+            to_read = instances
+        else:
+            to_read = [db_instance for db_instance in instances
+                       if db_instance.uuid not in self._power_states]
+        try:
+            self._read_power_states(to_read)
+        except Exception:
+            LOG.exception(_("Periodic sync_power_state task had an error "
+                            "while reading the power states."))
+            self._power_state_runs_since_audit = None
+            return
+
+        # Forget the instances that left the host.
+        uuids = set(db_instance.uuid for db_instance in db_instances)
+        for inst_uuid in self._power_states.keys():
+            if inst_uuid not in uuids:
+                del self._power_states[inst_uuid]
+        vm_power_states = self._power_states
+
+        pool = greenpool.GreenPool(CONF.sync_power_state_pool_size)
+        out_of_sync = 0
+        for db_instance in instances:
+            vm_power_state = vm_power_states.get(db_instance.uuid)
+            if (vm_power_state is None or
+                    not self._power_state_out_of_sync(db_instance,
+                                                      vm_power_state)):
+                continue
+            out_of_sync += 1
+            pool.spawn_n(self._sync_power_state_out_of_sync, context,
+                         db_instance, vm_power_state)
+        pool.waitall()
+
+        LOG.info(_("Synced the power states of %(count)d instances in "
+                   "%(seconds).2f seconds, %(out_of_sync)d of them were out "
+                   "of sync, %(read)d read from the hypervisor"),
+                 {'count': len(instances), 'seconds': time.time() - start,
+                  'out_of_sync': out_of_sync, 'read': len(to_read)})
+
+    def _power_state_audit_due(self):
+        """Tell whether this run of the sync of power states reads them
+        all from the hypervisor, rather than relying on its events.
+        """
+        if (CONF.sync_power_state_audit_interval <= 1 or
+                not self.driver.capabilities.get('supports_lifecycle_events')
+                or self._power_state_runs_since_audit is None or
+                self._power_state_runs_since_audit + 1 >=
+                CONF.sync_power_state_audit_interval):
+            self._power_state_runs_since_audit = 0
+            return True
+        self._power_state_runs_since_audit += 1
+        return False
+
+    def _read_power_states(self, instances):
+        """Read the power states of instances from the hypervisor into the
+        power state table, unless an event reported a new one meanwhile.
+        """
+        if not instances:
+            return
+        before = dict(self._power_states)
+        vm_power_states = self.driver.get_power_states(instances)
+        for db_instance in instances:
+            inst_uuid = db_instance.uuid
+            if self._power_states.get(inst_uuid) != before.get(inst_uuid):
+                # An event reported a newer power state meanwhile.
+                continue
+            if inst_uuid in vm_power_states:
+                self._power_states[inst_uuid] = vm_power_states[inst_uuid]
+            else:
+                self._power_states.pop(inst_uuid, None)
+
+    @staticmethod
+    def _power_state_out_of_sync(db_instance, vm_power_state):
+        """Tell whether _sync_instance_power_state() has anything to do
+        for an instance, from what the database said of it.
+        """
+        if vm_power_state != db_instance.power_state:
+            return True
+        vm_state = db_instance.vm_state
+        if vm_state == vm_states.ACTIVE:
+            return vm_power_state != power_state.RUNNING
+        elif vm_state == vm_states.STOPPED:
+            return vm_power_state not in (power_state.NOSTATE,
+                                          power_state.SHUTDOWN,
+                                          power_state.CRASHED)
+        elif vm_state in (vm_states.SOFT_DELETED, vm_states.DELETED):
+            return vm_power_state not in (power_state.NOSTATE,
+                                          power_state.SHUTDOWN)
+        return False
+
+    def _sync_power_state_out_of_sync(self, context, db_instance,
+                                      vm_power_state):
+        try:
+            self._sync_instance_power_state(context, db_instance,
+                                            vm_power_state, use_slave=True)
+        except exception.InstanceNotFound:
+            # NOTE(hanlind): If the instance gets deleted during sync,
+            # silently ignore and move on to next instance.
+            pass
+        except Exception:
+            LOG.exception(_("Periodic sync_power_state task had an error "
+                            "while processing an instance."),
+                          instance=db_instance)
 
     def _sync_instance_power_state(self, context, db_instance, vm_power_state,
                                    use_slave=False):
@@ -19,6 +19,8 @@ scheduler with useful information about availability through the ComputeNode
 model.
 """
 
+import copy
+
 from oslo.config import cfg
 
 from nova.compute import claims
@@ -45,7 +47,14 @@ resource_tracker_opts = [
                help='Amount of memory in MB to reserve for the host'),
     cfg.StrOpt('compute_stats_class',
                default='nova.compute.stats.Stats',
-               help='Class that will manage stats for the local compute host')
+               help='Class that will manage stats for the local compute host'),
+    cfg.IntOpt('resource_audit_interval', default=1,
+               help='Audit the resources used on the compute node from '
+                    'the database and the hypervisor every this many runs '
+                    'of the periodic resource update. The runs in between '
+                    'only check that the instances of the node add up to '
+                    'the usage tracked as they are claimed, resized and '
+                    'deleted, and audit if they do not'),
 ]
 
 CONF = cfg.CONF
@@ -54,6 +63,12 @@ CONF.register_opts(resource_tracker_opts)
 LOG = logging.getLogger(__name__)
 COMPUTE_RESOURCE_SEMAPHORE = "compute_resources"
 
+# Usage columns of the compute node the scheduler may reserve the resources
+# of instances against. They are written on every audit, changed or not, so
+# that the reservations of instances which never claimed them are dropped.
+AUDITED_USAGE_FIELDS = ('memory_mb_used', 'free_ram_mb', 'vcpus_used',
+                        'local_gb_used', 'free_disk_gb')
+
 CONF.import_opt('my_ip', 'nova.netconf')
 
 
@@ -72,6 +87,10 @@ class ResourceTracker(object):
         self.tracked_instances = {}
         self.tracked_migrations = {}
         self.conductor_api = conductor.API()
+        # The compute node as last written to the DB, and the runs of the
+        # periodic resource update since the last audit:
+        self._written_compute_node = {}
+        self._runs_since_audit = None
 
     @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
     def instance_claim(self, context, instance_ref, limits=None):
@@ -270,7 +289,18 @@ class ResourceTracker(object):
         Add in resource claims in progress to account for operations that have
         declared a need for resources, but not necessarily retrieved them from
         the hypervisor layer yet.
+
+        The audit is skipped when resource_audit_interval allows it and the
+        usage tracked since the last one still adds up.  The tracked usage
+        is then written instead, which drops the reservations of instances
+        which never claimed them like an audit does.
         """
+        if self._usage_reconciled(context):
+            usage = dict((field, self.compute_node[field])
+                         for field in AUDITED_USAGE_FIELDS)
+            self._update(context, usage, always=AUDITED_USAGE_FIELDS)
+            return
+
         LOG.audit(_("Auditing locally available compute resources"))
         resources = self.driver.get_available_resource(self.nodename)
 
@@ -324,6 +354,42 @@ class ResourceTracker(object):
         self._report_final_resource_view(resources)
 
         self._sync_compute_node(context, resources)
+        self._runs_since_audit = 0
+
+    def _usage_reconciled(self, context):
+        """Tell whether the usage tracked since the last audit can be kept:
+        the last audit is recent enough, and the instances of the node in
+        the DB add up to the tracked instances.
+        """
+        if (self.disabled or self._runs_since_audit is None or
+                self._runs_since_audit + 1 >= CONF.resource_audit_interval):
+            return False
+
+        statistics = instance_obj.InstanceList.get_statistics_by_host_and_node(
+            context, self.host, self.nodename)
+        tracked = self._tracked_statistics()
+        if statistics != tracked:
+            LOG.info(_("Instances of %(host)s:%(node)s do not add up to the "
+                       "tracked usage, auditing: %(statistics)s, tracked "
+                       "%(tracked)s"),
+                     {'host': self.host, 'node': self.nodename,
+                      'statistics': statistics, 'tracked': tracked})
+            return False
+
+        self._runs_since_audit += 1
+        LOG.debug(_("Tracked usage of %(host)s:%(node)s reconciled"),
+                  {'host': self.host, 'node': self.nodename})
+        return True
+
+    def _tracked_statistics(self):
+        """Sum up the tracked instances like
+        InstanceList.get_statistics_by_host_and_node() does.
+        """
+        statistics = {'count': len(self.tracked_instances)}
+        for field in ('vcpus', 'memory_mb', 'root_gb', 'ephemeral_gb'):
+            statistics[field] = sum(instance[field] or 0 for instance
+                                    in self.tracked_instances.itervalues())
+        return statistics
 
     def _sync_compute_node(self, context, resources):
         """Create or update the compute node DB record."""
@@ -339,6 +405,7 @@ class ResourceTracker(object):
                 for cn in compute_node_refs:
                     if cn.get('hypervisor_hostname') == self.nodename:
                         self.compute_node = cn
+                        self._written_compute_node = copy.deepcopy(cn)
                         if self.pci_tracker:
                             self.pci_tracker.set_compute_node_id(cn['id'])
                         break
@@ -354,7 +421,8 @@ class ResourceTracker(object):
 
         else:
             # just update the record:
-            self._update(context, resources, prune_stats=True)
+            self._update(context, resources, prune_stats=True,
+                         always=AUDITED_USAGE_FIELDS)
             LOG.info(_('Compute_service record updated for %(host)s:%(node)s')
                     % {'host': self.host, 'node': self.nodename})
 
@@ -363,6 +431,7 @@ class ResourceTracker(object):
         # initialize load stats from existing instances:
         self.compute_node = self.conductor_api.compute_node_create(context,
                                                                    values)
+        self._written_compute_node = copy.deepcopy(self.compute_node)
 
     def _get_service(self, context):
         try:
@@ -421,12 +490,28 @@ class ResourceTracker(object):
         if 'pci_devices' in resources:
             LOG.audit(_("Free PCI devices: %s") % resources['pci_devices'])
 
-    def _update(self, context, values, prune_stats=False):
-        """Persist the compute node updates to the DB."""
+    def _update(self, context, values, prune_stats=False, always=()):
+        """Persist the compute node updates to the DB.
+
+        Only the values which changed since the last update are written,
+        along with the stats, which the DB layer compares itself, and the
+        values named in always.  The usage columns which are not written
+        keep their tracked values rather than those of the updated record,
+        which include the resources the scheduler reserved since.
+        """
         if "service" in self.compute_node:
             del self.compute_node['service']
+        written = self._written_compute_node
+        values = dict((key, value) for key, value in values.iteritems()
+                      if (key == 'stats' or key in always or
+                          key not in written or written[key] != value))
+        tracked = dict((field, self.compute_node[field])
+                       for field in AUDITED_USAGE_FIELDS
+                       if field not in values and field in self.compute_node)
         self.compute_node = self.conductor_api.compute_node_update(
             context, self.compute_node, values, prune_stats)
+        self.compute_node.update(tracked)
+        self._written_compute_node = copy.deepcopy(self.compute_node)
         if self.pci_tracker:
             self.pci_tracker.save(context)
 
@@ -113,6 +113,15 @@ def service_get_all_by_topic(context, topic):
     return IMPL.service_get_all_by_topic(context, topic)
 
 
+def service_get_all_by_binary(context, binary, updated_since=None):
+    """Get all services for a given binary.
+
+    If updated_since is set, only services created, updated or deleted at
+    or after that time are returned, deleted services included.
+    """
+    return IMPL.service_get_all_by_binary(context, binary, updated_since)
+
+
 def service_get_all_by_host(context, host):
     """Get all services for a given host."""
     return IMPL.service_get_all_by_host(context, host)
@@ -176,7 +185,7 @@ def compute_node_get_by_service_id(context, service_id):
     return IMPL.compute_node_get_by_service_id(context, service_id)
 
 
-def compute_node_get_all(context, no_date_fields=False):
+def compute_node_get_all(context, no_date_fields=False, updated_since=None):
     """Get all computeNodes.
 
     :param context: The security context
@@ -184,11 +193,16 @@ def compute_node_get_all(context, no_date_fields=False):
                            'deleted_at' and 'deleted' fields from the output,
                            thus significantly reducing its size.
                            Set to False by default
+    :param updated_since: If set, only returns compute nodes created, updated
+                          or deleted at or after this time. Deleted compute
+                          nodes are included (with their 'deleted' field set)
+                          so that callers can drop them from any cache.
+                          Date fields are always returned in this case
 
     :returns: List of dictionaries each containing compute node properties,
               including corresponding service and stats
     """
-    return IMPL.compute_node_get_all(context, no_date_fields)
+    return IMPL.compute_node_get_all(context, no_date_fields, updated_since)
 
 
 def compute_node_search_by_hypervisor(context, hypervisor_match):
@@ -234,6 +248,40 @@ def compute_node_update(context, compute_id, values, prune_stats=False):
     return IMPL.compute_node_update(context, compute_id, values, prune_stats)
 
 
+def compute_node_reserve(context, compute_id, memory_mb, vcpus, local_gb,
+                         limits=None):
+    """Add the resources of an instance to the usage of a compute node, if
+    it stays within the limits.
+
+    The usage is checked and updated in a single statement, so concurrent
+    reservations cannot both take the last resources of a compute node.
+
+    :param context: The security context
+    :param compute_id: ID of the compute node
+    :param memory_mb: RAM to reserve, in MB
+    :param vcpus: Number of VCPUs to reserve
+    :param local_gb: Disk to reserve, in GB
+    :param limits: Optional dictionary of the maximum memory_mb, vcpu and
+                   disk_gb usage of the compute node
+
+    :returns: True if the resources were reserved, False if the compute
+              node does not exist or has not enough resources left
+    """
+    return IMPL.compute_node_reserve(context, compute_id, memory_mb, vcpus,
+                                     local_gb, limits)
+
+
+def compute_node_release(context, compute_id, memory_mb, vcpus, local_gb):
+    """Remove the resources reserved for an instance with
+    compute_node_reserve() from the usage of a compute node.
+
+    :returns: True if the resources were released, False if the compute
+              node does not exist
+    """
+    return IMPL.compute_node_release(context, compute_id, memory_mb, vcpus,
+                                     local_gb)
+
+
 def compute_node_delete(context, compute_id):
     """Delete a compute node from the database.
 
@@ -646,12 +694,26 @@ def instance_get_all(context, columns_to_join=None):
 
 def instance_get_all_by_filters(context, filters, sort_key='created_at',
                                 sort_dir='desc', limit=None, marker=None,
-                                columns_to_join=None):
-    """Get all instances that match all filters."""
+                                columns_to_join=None, columns=None):
+    """Get all instances that match all filters, reading only the given
+    columns if columns is not None.
+    """
     return IMPL.instance_get_all_by_filters(context, filters, sort_key,
                                             sort_dir, limit=limit,
                                             marker=marker,
-                                            columns_to_join=columns_to_join)
+                                            columns_to_join=columns_to_join,
+                                            columns=columns)
+
+
+def instance_get_all_by_filters_chunked(context, filters, chunk_size,
+                                        sort_key='created_at', sort_dir='desc',
+                                        columns_to_join=None, columns=None):
+    """Yield all instances that match all filters, in lists of at most
+    chunk_size instances.
+    """
+    return IMPL.instance_get_all_by_filters_chunked(
+            context, filters, sort_key, sort_dir, chunk_size,
+            columns_to_join=columns_to_join, columns=columns)
 
 
 def instance_get_active_by_window_joined(context, begin, end=None,
@@ -666,9 +728,13 @@ def instance_get_active_by_window_joined(context, begin, end=None,
 
 
 def instance_get_all_by_host(context, host,
-                             columns_to_join=None, use_slave=False):
-    """Get all instances belonging to a host."""
-    return IMPL.instance_get_all_by_host(context, host, columns_to_join)
+                             columns_to_join=None, use_slave=False,
+                             columns=None):
+    """Get all instances belonging to a host, reading only the given
+    columns if columns is not None.
+    """
+    return IMPL.instance_get_all_by_host(context, host, columns_to_join,
+                                         columns=columns)
 
 
 def instance_get_all_by_host_and_node(context, host, node):
@@ -676,6 +742,15 @@ def instance_get_all_by_host_and_node(context, host, node):
     return IMPL.instance_get_all_by_host_and_node(context, host, node)
 
 
+def instance_statistics_by_host_and_node(context, host, node):
+    """Count the instances of a node and sum up the resources they use.
+
+    :returns: Dictionary of the count of the instances, and of their vcpus,
+              memory_mb, root_gb and ephemeral_gb summed up.
+    """
+    return IMPL.instance_statistics_by_host_and_node(context, host, node)
+
+
 def instance_get_all_by_host_and_not_type(context, host, type_id=None):
     """Get all instances belonging to a host with a different type_id."""
     return IMPL.instance_get_all_by_host_and_not_type(context, host, type_id)
@@ -1111,6 +1186,35 @@ def reservation_rollback(context, reservations, project_id=None, user_id=None):
                                      user_id=user_id)
 
 
+def quota_reserve_conditional(context, resources, quotas, user_quotas,
+                              deltas, expire, until_refresh, max_age,
+                              project_id=None, user_id=None):
+    """Check quotas and create appropriate reservations, with conditional
+    updates of the usages instead of locking them.
+    """
+    return IMPL.quota_reserve_conditional(context, resources, quotas,
+                                          user_quotas, deltas, expire,
+                                          until_refresh, max_age,
+                                          project_id=project_id,
+                                          user_id=user_id)
+
+
+def reservation_commit_conditional(context, reservations, project_id=None,
+                                   user_id=None):
+    """Commit quota reservations made by quota_reserve_conditional()."""
+    return IMPL.reservation_commit_conditional(context, reservations,
+                                               project_id=project_id,
+                                               user_id=user_id)
+
+
+def reservation_rollback_conditional(context, reservations, project_id=None,
+                                     user_id=None):
+    """Roll back quota reservations made by quota_reserve_conditional()."""
+    return IMPL.reservation_rollback_conditional(context, reservations,
+                                                 project_id=project_id,
+                                                 user_id=user_id)
+
+
 def quota_destroy_all_by_project_and_user(context, project_id, user_id):
     """Destroy all quotas associated with a given project and user."""
     return IMPL.quota_destroy_all_by_project_and_user(context,
@@ -1127,6 +1231,13 @@ def reservation_expire(context):
     return IMPL.reservation_expire(context)
 
 
+def reservation_expire_conditional(context):
+    """Roll back any expired reservations made by
+    quota_reserve_conditional().
+    """
+    return IMPL.reservation_expire_conditional(context)
+
+
 ###################
 
 
@@ -1181,6 +1292,12 @@ def block_device_mapping_get_all_by_instance(context, instance_uuid):
                                                          instance_uuid)
 
 
+def block_device_mapping_get_all_by_instance_uuids(context, instance_uuids):
+    """Get all block device mapping belonging to a list of instances."""
+    return IMPL.block_device_mapping_get_all_by_instance_uuids(context,
+                                                               instance_uuids)
+
+
 def block_device_mapping_get_by_volume_id(context, volume_id,
         columns_to_join=None):
     """Get block device mapping for a given volume."""
@@ -1894,20 +2011,42 @@ def task_log_get(context, task_name, period_beginning,
 ####################
 
 
-def archive_deleted_rows(context, max_rows=None):
+def archive_tablenames(context):
+    """Return the names of the tables whose deleted rows can be archived,
+    dependent tables first.
+    """
+    return IMPL.archive_tablenames(context)
+
+
+def archive_deleted_rows(context, max_rows=None, deleted_before=None):
     """Move up to max_rows rows from production tables to corresponding shadow
     tables.
 
     :returns: number of rows archived.
     """
-    return IMPL.archive_deleted_rows(context, max_rows=max_rows)
+    return IMPL.archive_deleted_rows(context, max_rows=max_rows,
+                                     deleted_before=deleted_before)
 
 
-def archive_deleted_rows_for_table(context, tablename, max_rows=None):
+def archive_deleted_rows_for_table(context, tablename, max_rows=None,
+                                   deleted_before=None):
     """Move up to max_rows rows from tablename to corresponding shadow
     table.
 
     :returns: number of rows archived.
     """
     return IMPL.archive_deleted_rows_for_table(context, tablename,
-                                               max_rows=max_rows)
+                                               max_rows=max_rows,
+                                               deleted_before=deleted_before)
+
+
+def purge_shadow_rows_for_table(context, tablename, deleted_before,
+                                max_rows=None):
+    """Delete up to max_rows rows deleted before deleted_before from the
+    shadow table of tablename.
+
+    :returns: number of rows purged.
+    """
+    return IMPL.purge_shadow_rows_for_table(context, tablename,
+                                            deleted_before,
+                                            max_rows=max_rows)
@@ -19,11 +19,13 @@
 
 """Implementation of SQLAlchemy backend."""
 
+import bisect
 import collections
 import copy
 import datetime
 import functools
 import itertools
+import random
 import sys
 import time
 import uuid
@@ -54,9 +56,9 @@ from nova.compute import task_states
 from nova.compute import vm_states
 import nova.context
 from nova.db.sqlalchemy import models
+from nova.db.sqlalchemy import routing
 from nova import exception
 from nova.openstack.common.db import exception as db_exc
-from nova.openstack.common.db.sqlalchemy import session as db_session
 from nova.openstack.common.db.sqlalchemy import utils as sqlalchemyutils
 from nova.openstack.common import excutils
 from nova.openstack.common.gettextutils import _
@@ -70,6 +72,19 @@ db_opts = [
                help='When set, compute API will consider duplicate hostnames '
                     'invalid within the specified scope, regardless of case. '
                     'Should be empty, "project" or "global".'),
+    cfg.IntOpt('db_deadlock_max_retries',
+               default=10,
+               help='Number of times a database API call is retried after '
+                    'a deadlock before the deadlock is raised, or -1 to '
+                    'retry forever'),
+    cfg.FloatOpt('db_deadlock_retry_interval',
+                 default=0.1,
+                 help='Seconds the first retry after a deadlock waits at '
+                      'most. The bound doubles with each retry and the wait '
+                      'is drawn at random below it'),
+    cfg.FloatOpt('db_deadlock_max_retry_interval',
+                 default=2.0,
+                 help='Seconds a retry after a deadlock waits at most'),
 ]
 
 CONF = cfg.CONF
@@ -85,8 +100,8 @@ CONF.import_opt('slave_connection',
 
 LOG = logging.getLogger(__name__)
 
-get_engine = db_session.get_engine
-get_session = db_session.get_session
+get_engine = routing.get_engine
+get_session = routing.get_session
 
 
 _SHADOW_TABLE_PREFIX = 'shadow_'
@@ -95,8 +110,10 @@ PER_PROJECT_QUOTAS = ['fixed_ips', 'floating_ips', 'networks']
 
 
 def get_backend():
-    """The backend is this module itself."""
-    return sys.modules[__name__]
+    """The backend is this module itself, with its read-only calls routed
+    to the slave databases.
+    """
+    return routing.Router(sys.modules[__name__])
 
 
 def require_admin_context(f):
@@ -159,24 +176,70 @@ def require_aggregate_exists(f):
     return wrapper
 
 
+# Upper bounds in seconds of the buckets of the latency histograms of the
+# calls retried on deadlock, the last bucket holding the slower calls.
+DEADLOCK_LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5)
+
+# Calls, deadlocks, calls failed after the last retry and latency histogram
+# of each DB API call retried on deadlock.
+deadlock_retry_counters = collections.defaultdict(
+    lambda: dict(calls=0, deadlocks=0, failures=0,
+                 latency=[0] * (len(DEADLOCK_LATENCY_BUCKETS) + 1)))
+
+
 def _retry_on_deadlock(f):
-    """Decorator to retry a DB API call if Deadlock was received."""
+    """Decorator to retry a DB API call if Deadlock was received.
+
+    The call is retried up to db_deadlock_max_retries times, after waiting
+    a random time below a bound which starts at db_deadlock_retry_interval
+    and doubles with each retry up to db_deadlock_max_retry_interval, so
+    that the calls which deadlocked do not retry at the same time.  The
+    decorated call must run its own transaction.
+    """
     @functools.wraps(f)
     def wrapped(*args, **kwargs):
-        while True:
-            try:
-                return f(*args, **kwargs)
-            except db_exc.DBDeadlock:
-                LOG.warn(_("Deadlock detected when running "
-                           "'%(func_name)s': Retrying..."),
-                           dict(func_name=f.__name__))
-                # Retry!
-                time.sleep(0.5)
-                continue
-    functools.update_wrapper(wrapped, f)
+        counters = deadlock_retry_counters[f.__name__]
+        counters['calls'] += 1
+        start = time.time()
+        attempt = 0
+        try:
+            while True:
+                try:
+                    return f(*args, **kwargs)
+                except db_exc.DBDeadlock:
+                    counters['deadlocks'] += 1
+                    max_retries = CONF.db_deadlock_max_retries
+                    if attempt == max_retries:
+                        counters['failures'] += 1
+                        LOG.error(_("Deadlock detected when running "
+                                    "'%(func_name)s': giving up after "
+                                    "%(retries)d retries"),
+                                  dict(func_name=f.__name__,
+                                       retries=attempt))
+                        raise
+                    # NOTE: The doubling stops early enough for the bound
+                    # not to overflow when retrying forever.
+                    interval = min(CONF.db_deadlock_max_retry_interval,
+                                   CONF.db_deadlock_retry_interval *
+                                   2 ** min(attempt, 30))
+                    delay = random.uniform(0, interval)
+                    attempt += 1
+                    LOG.warn(_("Deadlock detected when running "
+                               "'%(func_name)s': retry %(attempt)d in "
+                               "%(delay).3f seconds"),
+                             dict(func_name=f.__name__, attempt=attempt,
+                                  delay=delay))
+                    time.sleep(delay)
+        finally:
+            bucket = bisect.bisect_left(DEADLOCK_LATENCY_BUCKETS,
+                                        time.time() - start)
+            counters['latency'][bucket] += 1
     return wrapped
 
 
+_read_only = routing.read_only
+
+
 def model_query(context, model, *args, **kwargs):
     """Query helper that accounts for context's `read_deleted` field.
 
@@ -402,11 +465,13 @@ def _service_get(context, service_id, with_compute_node=True, session=None):
 
 
 @require_admin_context
+@_read_only
 def service_get(context, service_id):
     return _service_get(context, service_id)
 
 
 @require_admin_context
+@_read_only
 def service_get_all(context, disabled=None):
     query = model_query(context, models.Service)
 
@@ -417,6 +482,20 @@ def service_get_all(context, disabled=None):
 
 
 @require_admin_context
+@_read_only
+def service_get_all_by_binary(context, binary, updated_since=None):
+    if updated_since is None:
+        query = model_query(context, models.Service, read_deleted="no")
+    else:
+        query = model_query(context, models.Service, read_deleted="yes").\
+                    filter(or_(models.Service.created_at >= updated_since,
+                               models.Service.updated_at >= updated_since,
+                               models.Service.deleted_at >= updated_since))
+    return query.filter_by(binary=binary).all()
+
+
+@require_admin_context
+@_read_only
 def service_get_all_by_topic(context, topic):
     return model_query(context, models.Service, read_deleted="no").\
                 filter_by(disabled=False).\
@@ -425,6 +504,7 @@ def service_get_all_by_topic(context, topic):
 
 
 @require_admin_context
+@_read_only
 def service_get_by_host_and_topic(context, host, topic):
     return model_query(context, models.Service, read_deleted="no").\
                 filter_by(disabled=False).\
@@ -434,6 +514,7 @@ def service_get_by_host_and_topic(context, host, topic):
 
 
 @require_admin_context
+@_read_only
 def service_get_all_by_host(context, host):
     return model_query(context, models.Service, read_deleted="no").\
                 filter_by(host=host).\
@@ -441,6 +522,7 @@ def service_get_all_by_host(context, host):
 
 
 @require_admin_context
+@_read_only
 def service_get_by_compute_host(context, host):
     result = model_query(context, models.Service, read_deleted="no").\
                 options(joinedload('compute_node')).\
@@ -455,6 +537,7 @@ def service_get_by_compute_host(context, host):
 
 
 @require_admin_context
+@_read_only
 def service_get_by_args(context, host, binary):
     result = model_query(context, models.Service).\
                      filter_by(host=host).\
@@ -497,6 +580,7 @@ def service_update(context, service_id, values):
 
 ###################
 
+@_read_only
 def compute_node_get(context, compute_id):
     return _compute_node_get(context, compute_id)
 
@@ -515,6 +599,7 @@ def _compute_node_get(context, compute_id, session=None):
 
 
 @require_admin_context
+@_read_only
 def compute_node_get_by_service_id(context, service_id):
     result = model_query(context, models.ComputeNode, read_deleted='no').\
         filter_by(service_id=service_id).\
@@ -527,7 +612,8 @@ def compute_node_get_by_service_id(context, service_id):
 
 
 @require_admin_context
-def compute_node_get_all(context, no_date_fields):
+@_read_only
+def compute_node_get_all(context, no_date_fields, updated_since=None):
 
     # NOTE(msdubov): Using lower-level 'select' queries and joining the tables
     #                manually here allows to gain 3x speed-up and to have 5x
@@ -541,14 +627,27 @@ def compute_node_get_all(context, no_date_fields):
     stat = models.ComputeNodeStat.__table__
 
     with engine.begin() as conn:
-        redundant_columns = set(['deleted_at', 'created_at', 'updated_at',
-                                 'deleted']) if no_date_fields else set([])
+        # NOTE: Callers asking for the changes since a point in time need
+        #       the date fields to keep track of what they have already seen.
+        if no_date_fields and updated_since is None:
+            redundant_columns = set(['deleted_at', 'created_at', 'updated_at',
+                                     'deleted'])
+        else:
+            redundant_columns = set([])
 
         def filter_columns(table):
             return [c for c in table.c if c.name not in redundant_columns]
 
-        compute_node_query = select(filter_columns(compute_node)).\
-                                where(compute_node.c.deleted == 0).\
+        compute_node_query = select(filter_columns(compute_node))
+        if updated_since is None:
+            compute_node_query = compute_node_query.\
+                                    where(compute_node.c.deleted == 0)
+        else:
+            compute_node_query = compute_node_query.\
+                where(or_(compute_node.c.created_at >= updated_since,
+                          compute_node.c.updated_at >= updated_since,
+                          compute_node.c.deleted_at >= updated_since))
+        compute_node_query = compute_node_query.\
                                 order_by(compute_node.c.service_id)
         compute_node_rows = conn.execute(compute_node_query).fetchall()
 
@@ -556,12 +655,29 @@ def compute_node_get_all(context, no_date_fields):
                             where((service.c.deleted == 0) &
                                   (service.c.binary == 'nova-compute')).\
                             order_by(service.c.id)
-        service_rows = conn.execute(service_query).fetchall()
+        if updated_since is None:
+            service_rows = conn.execute(service_query).fetchall()
+        elif compute_node_rows:
+            service_ids = set(proxy['service_id']
+                              for proxy in compute_node_rows)
+            service_query = service_query.\
+                                where(service.c.id.in_(service_ids))
+            service_rows = conn.execute(service_query).fetchall()
+        else:
+            service_rows = []
 
         stat_query = select(filter_columns(stat)).\
                         where(stat.c.deleted == 0).\
                         order_by(stat.c.compute_node_id)
-        stat_rows = conn.execute(stat_query).fetchall()
+        if updated_since is None:
+            stat_rows = conn.execute(stat_query).fetchall()
+        elif compute_node_rows:
+            node_ids = [proxy['id'] for proxy in compute_node_rows]
+            stat_query = stat_query.\
+                            where(stat.c.compute_node_id.in_(node_ids))
+            stat_rows = conn.execute(stat_query).fetchall()
+        else:
+            stat_rows = []
 
     # NOTE(msdubov): Transferring sqla.RowProxy objects to dicts.
     stats = [dict(proxy.items()) for proxy in stat_rows]
@@ -685,6 +801,37 @@ def compute_node_update(context, compute_id, values, prune_stats=False):
     return compute_ref
 
 
+@require_admin_context
+def compute_node_reserve(context, compute_id, memory_mb, vcpus, local_gb,
+                         limits=None):
+    limits = limits or {}
+    node = models.ComputeNode
+    query = model_query(context, node, read_deleted='no').\
+                filter_by(id=compute_id)
+    if limits.get('memory_mb') is not None:
+        query = query.filter(node.memory_mb_used + memory_mb <=
+                             limits['memory_mb'])
+    if limits.get('vcpu') is not None:
+        query = query.filter(node.vcpus_used + vcpus <= limits['vcpu'])
+    if limits.get('disk_gb') is not None:
+        query = query.filter(node.local_gb_used + local_gb <=
+                             limits['disk_gb'])
+    result = query.update({'memory_mb_used': node.memory_mb_used + memory_mb,
+                           'free_ram_mb': node.free_ram_mb - memory_mb,
+                           'vcpus_used': node.vcpus_used + vcpus,
+                           'local_gb_used': node.local_gb_used + local_gb,
+                           'free_disk_gb': node.free_disk_gb - local_gb,
+                           'updated_at': timeutils.utcnow()},
+                          synchronize_session=False)
+    return result == 1
+
+
+@require_admin_context
+def compute_node_release(context, compute_id, memory_mb, vcpus, local_gb):
+    return compute_node_reserve(context, compute_id, -memory_mb, -vcpus,
+                                -local_gb)
+
+
 @require_admin_context
 def compute_node_delete(context, compute_id):
     """Delete a ComputeNode record and prune its stats."""
@@ -739,6 +886,7 @@ def certificate_create(context, values):
 
 
 @require_admin_context
+@_read_only
 def certificate_get_all_by_project(context, project_id):
     return model_query(context, models.Certificate, read_deleted="no").\
                    filter_by(project_id=project_id).\
@@ -746,6 +894,7 @@ def certificate_get_all_by_project(context, project_id):
 
 
 @require_admin_context
+@_read_only
 def certificate_get_all_by_user(context, user_id):
     return model_query(context, models.Certificate, read_deleted="no").\
                    filter_by(user_id=user_id).\
@@ -753,6 +902,7 @@ def certificate_get_all_by_user(context, user_id):
 
 
 @require_admin_context
+@_read_only
 def certificate_get_all_by_user_and_project(context, user_id, project_id):
     return model_query(context, models.Certificate, read_deleted="no").\
                    filter_by(user_id=user_id).\
@@ -764,6 +914,7 @@ def certificate_get_all_by_user_and_project(context, user_id, project_id):
 
 
 @require_context
+@_read_only
 def floating_ip_get(context, id):
     try:
         result = model_query(context, models.FloatingIp, project_only=True).\
@@ -781,6 +932,7 @@ def floating_ip_get(context, id):
 
 
 @require_context
+@_read_only
 def floating_ip_get_pools(context):
     pools = []
     for result in model_query(context, models.FloatingIp.pool,
@@ -948,6 +1100,7 @@ def _floating_ip_get_all(context, session=None):
 
 
 @require_admin_context
+@_read_only
 def floating_ip_get_all(context):
     floating_ip_refs = _floating_ip_get_all(context).all()
     if not floating_ip_refs:
@@ -956,6 +1109,7 @@ def floating_ip_get_all(context):
 
 
 @require_admin_context
+@_read_only
 def floating_ip_get_all_by_host(context, host):
     floating_ip_refs = _floating_ip_get_all(context).\
                             filter_by(host=host).\
@@ -966,6 +1120,7 @@ def floating_ip_get_all_by_host(context, host):
 
 
 @require_context
+@_read_only
 def floating_ip_get_all_by_project(context, project_id):
     nova.context.authorize_project_context(context, project_id)
     # TODO(tr3buchet): why do we not want auto_assigned floating IPs here?
@@ -977,6 +1132,7 @@ def floating_ip_get_all_by_project(context, project_id):
 
 
 @require_context
+@_read_only
 def floating_ip_get_by_address(context, address):
     return _floating_ip_get_by_address(context, address)
 
@@ -1008,6 +1164,7 @@ def _floating_ip_get_by_address(context, address, session=None):
 
 
 @require_context
+@_read_only
 def floating_ip_get_by_fixed_address(context, fixed_address):
     return model_query(context, models.FloatingIp).\
                        outerjoin(models.FixedIp,
@@ -1018,6 +1175,7 @@ def floating_ip_get_by_fixed_address(context, fixed_address):
 
 
 @require_context
+@_read_only
 def floating_ip_get_by_fixed_ip_id(context, fixed_ip_id):
     return model_query(context, models.FloatingIp).\
                 filter_by(fixed_ip_id=fixed_ip_id).\
@@ -1045,6 +1203,7 @@ def _dnsdomain_get(context, session, fqdomain):
 
 
 @require_context
+@_read_only
 def dnsdomain_get(context, fqdomain):
     session = get_session()
     with session.begin():
@@ -1137,6 +1296,7 @@ def fixed_ip_associate(context, address, instance_uuid, network_id=None,
 
 
 @require_admin_context
+@_retry_on_deadlock
 def fixed_ip_associate_pool(context, network_id, instance_uuid=None,
                             host=None):
     if instance_uuid and not uuidutils.is_uuid_like(instance_uuid):
@@ -1242,6 +1402,7 @@ def fixed_ip_disassociate_all_by_timeout(context, host, time):
 
 
 @require_context
+@_read_only
 def fixed_ip_get(context, id, get_network=False):
     query = model_query(context, models.FixedIp).filter_by(id=id)
     if get_network:
@@ -1262,6 +1423,7 @@ def fixed_ip_get(context, id, get_network=False):
 
 
 @require_admin_context
+@_read_only
 def fixed_ip_get_all(context):
     result = model_query(context, models.FixedIp, read_deleted="yes").all()
     if not result:
@@ -1271,6 +1433,7 @@ def fixed_ip_get_all(context):
 
 
 @require_context
+@_read_only
 def fixed_ip_get_by_address(context, address):
     return _fixed_ip_get_by_address(context, address)
 
@@ -1307,6 +1470,7 @@ def _fixed_ip_get_by_address(context, address, session=None):
 
 
 @require_admin_context
+@_read_only
 def fixed_ip_get_by_address_detailed(context, address):
     """
     :returns: a tuple of (models.FixedIp, models.Network, models.Instance)
@@ -1335,6 +1499,7 @@ def fixed_ip_get_by_address_detailed(context, address):
 
 
 @require_context
+@_read_only
 def fixed_ip_get_by_floating_address(context, floating_address):
     return model_query(context, models.FixedIp).\
                        outerjoin(models.FloatingIp,
@@ -1346,6 +1511,7 @@ def fixed_ip_get_by_floating_address(context, floating_address):
 
 
 @require_context
+@_read_only
 def fixed_ip_get_by_instance(context, instance_uuid):
     if not uuidutils.is_uuid_like(instance_uuid):
         raise exception.InvalidUUID(uuid=instance_uuid)
@@ -1361,6 +1527,7 @@ def fixed_ip_get_by_instance(context, instance_uuid):
 
 
 @require_admin_context
+@_read_only
 def fixed_ip_get_by_host(context, host):
     session = get_session()
     with session.begin():
@@ -1375,6 +1542,7 @@ def fixed_ip_get_by_host(context, host):
 
 
 @require_context
+@_read_only
 def fixed_ip_get_by_network_host(context, network_id, host):
     result = model_query(context, models.FixedIp, read_deleted="no").\
                  filter_by(network_id=network_id).\
@@ -1440,6 +1608,7 @@ def _virtual_interface_query(context, session=None):
 
 
 @require_context
+@_read_only
 def virtual_interface_get(context, vif_id):
     """Gets a virtual interface from the table.
 
@@ -1452,6 +1621,7 @@ def virtual_interface_get(context, vif_id):
 
 
 @require_context
+@_read_only
 def virtual_interface_get_by_address(context, address):
     """Gets a virtual interface from the table.
 
@@ -1469,6 +1639,7 @@ def virtual_interface_get_by_address(context, address):
 
 
 @require_context
+@_read_only
 def virtual_interface_get_by_uuid(context, vif_uuid):
     """Gets a virtual interface from the table.
 
@@ -1482,6 +1653,7 @@ def virtual_interface_get_by_uuid(context, vif_uuid):
 
 @require_context
 @require_instance_exists_using_uuid
+@_read_only
 def virtual_interface_get_by_instance(context, instance_uuid):
     """Gets all virtual interfaces for instance.
 
@@ -1494,6 +1666,7 @@ def virtual_interface_get_by_instance(context, instance_uuid):
 
 
 @require_context
+@_read_only
 def virtual_interface_get_by_instance_and_network(context, instance_uuid,
                                                   network_id):
     """Gets virtual interface for instance that's associated with network."""
@@ -1517,6 +1690,7 @@ def virtual_interface_delete_by_instance(context, instance_uuid):
 
 
 @require_context
+@_read_only
 def virtual_interface_get_all(context):
     """Get all vifs."""
     vif_refs = _virtual_interface_query(context).all()
@@ -1683,6 +1857,7 @@ def instance_destroy(context, instance_uuid, constraint=None):
 
 
 @require_context
+@_read_only
 def instance_get_by_uuid(context, uuid, columns_to_join=None, use_slave=False):
     return _instance_get_by_uuid(context, uuid,
             columns_to_join=columns_to_join, use_slave=use_slave)
@@ -1703,6 +1878,7 @@ def _instance_get_by_uuid(context, uuid, session=None,
 
 
 @require_context
+@_read_only
 def instance_get(context, instance_id, columns_to_join=None):
     try:
         result = _build_instance_get(context, columns_to_join=columns_to_join
@@ -1794,6 +1970,7 @@ def _manual_join_columns(columns_to_join):
 
 
 @require_context
+@_read_only
 def instance_get_all(context, columns_to_join=None):
     if columns_to_join is None:
         columns_to_join = ['info_cache', 'security_groups']
@@ -1814,8 +1991,10 @@ def instance_get_all(context, columns_to_join=None):
 
 
 @require_context
+@_read_only
 def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
-                                limit=None, marker=None, columns_to_join=None):
+                                limit=None, marker=None, columns_to_join=None,
+                                columns=None):
     """Return instances that match all filters.  Deleted instances
     will be returned by default, unless there's a filter that says
     otherwise.
@@ -1848,24 +2027,97 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
         'soft_deleted' - modify behavior of 'deleted' to either
                          include or exclude instances whose
                          vm_state is SOFT_DELETED.
+
+    If columns is given, only these columns of the instances are read,
+    along with their id and uuid, and the instances are returned as dicts
+    of them.  Only the manually joined metadata, system_metadata and
+    pci_devices can then be in columns_to_join.
     """
 
-    sort_fn = {'desc': desc, 'asc': asc}
+    session = get_session()
+    sort_keys = _instance_sort_keys(sort_key)
+    marker_values = None
+    if marker is not None:
+        marker_values = _instance_get_sort_values(context, marker, sort_keys,
+                                                  session=session)
+    return _instance_get_all_by_filters(context, filters, sort_keys,
+                                        sort_dir, limit, marker_values,
+                                        columns_to_join, session,
+                                        columns=columns)
 
+
+@require_context
+def instance_get_all_by_filters_chunked(context, filters, sort_key, sort_dir,
+                                        chunk_size, columns_to_join=None,
+                                        columns=None):
+    """Yield the instances that match all filters, as with
+    instance_get_all_by_filters(), in lists of at most chunk_size instances.
+
+    Each list is read from the database, with its metadata, only once the
+    previous one has been consumed, starting after the last instance of
+    the previous list, so that listing all the instances only ever holds
+    one list in memory.
+    """
     session = get_session()
+    sort_keys = _instance_sort_keys(sort_key)
+    marker_values = None
+    while True:
+        instances = _instance_get_all_by_filters(
+                context, filters, sort_keys, sort_dir, chunk_size,
+                marker_values, columns_to_join and list(columns_to_join),
+                session, columns=columns)
+        if instances:
+            yield instances
+        if len(instances) < chunk_size:
+            return
+        marker_values = [instances[-1][key] for key in sort_keys]
+
+
+def _instance_sort_keys(sort_key):
+    """Return the keys to sort instances by so that their order is total."""
+    sort_keys = [sort_key]
+    for key in ('created_at', 'id'):
+        if key not in sort_keys:
+            sort_keys.append(key)
+    return sort_keys
+
+
+def _instance_column_keys(columns, sort_keys=()):
+    """Return the keys of the instance columns to read when only the given
+    columns are wanted, starting with the id and uuid of the instances.
+    """
+    keys = ['id', 'uuid']
+    for key in itertools.chain(columns, sort_keys):
+        if key not in keys:
+            keys.append(key)
+    return keys
+
+
+def _instance_columns(keys):
+    """Return the instance columns of the given keys, to query them."""
+    try:
+        return [getattr(models.Instance, key) for key in keys]
+    except AttributeError:
+        raise exception.InvalidInput(
+                reason=_('Unknown instance column in %s') % keys)
 
+
+def _instance_get_all_by_filters(context, filters, sort_keys, sort_dir, limit,
+                                 marker_values, columns_to_join, session,
+                                 columns=None):
     if columns_to_join is None:
         columns_to_join = ['info_cache', 'security_groups']
         manual_joins = ['metadata', 'system_metadata']
     else:
         manual_joins, columns_to_join = _manual_join_columns(columns_to_join)
 
-    query_prefix = session.query(models.Instance)
-    for column in columns_to_join:
-        query_prefix = query_prefix.options(joinedload(column))
-
-    query_prefix = query_prefix.order_by(sort_fn[sort_dir](
-            getattr(models.Instance, sort_key)))
+    if columns is None:
+        query_prefix = session.query(models.Instance)
+        for column in columns_to_join:
+            query_prefix = query_prefix.options(joinedload(column))
+    else:
+        keys = _instance_column_keys(columns, sort_keys)
+        query_prefix = session.query(*_instance_columns(keys))
 
     # Make a copy of the filters dictionary to use going forward, as we'll
     # be modifying it and we shouldn't affect the caller's use of it.
@@ -1928,18 +2180,98 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                               filters)
 
     # paginate query
-    if marker is not None:
-        try:
-            marker = _instance_get_by_uuid(context, marker, session=session)
-        except exception.InstanceNotFound:
-            raise exception.MarkerNotFound(marker)
-    query_prefix = sqlalchemyutils.paginate_query(query_prefix,
-                           models.Instance, limit,
-                           [sort_key, 'created_at', 'id'],
-                           marker=marker,
-                           sort_dir=sort_dir)
+    query_prefix = _instance_paginate_query(query_prefix, limit, sort_keys,
+                                            sort_dir,
+                                            marker_values=marker_values)
+
+    instances = query_prefix.all()
+    if columns is not None:
+        instances = [dict(zip(keys, row)) for row in instances]
+    return _instances_fill_metadata(context, instances, manual_joins)
+
+
+def _instance_get_sort_values(context, marker, sort_keys, session=None):
+    """Return the values of the sort keys of the marker instance.
+
+    Only these columns are read, rather than the marker instance with all
+    of its joined rows.
+    """
+    try:
+        columns = [getattr(models.Instance, key) for key in sort_keys]
+    except AttributeError:
+        raise sqlalchemyutils.InvalidSortKey()
+    result = model_query(context, *columns, session=session,
+                         base_model=models.Instance, project_only=True).\
+                filter(models.Instance.uuid == marker).\
+                first()
+
+    if not result:
+        raise exception.MarkerNotFound(marker)
+
+    return list(result)
+
+
+def _instance_paginate_query(query, limit, sort_keys, sort_dir,
+                             marker_values=None):
+    """Add sorting by sort_keys and pagination to an instance query.
+
+    This works like sqlalchemyutils.paginate_query() but takes the values
+    of the sort keys of the marker, and also bounds the first sort key by
+    the value of the marker.  The bound is implied by the other criteria,
+    but unlike them lets the database start reading an index on the sort
+    keys at the marker, so that the later pages are as fast as the first.
+
+    NULL values of the sort keys, of the marker or of the rows, are placed
+    where the database sorts them: first in ascending order on MySQL and
+    SQLite, last on PostgreSQL.
+    """
+    sort_fn = {'desc': desc, 'asc': asc}[sort_dir]
+    try:
+        attrs = [getattr(models.Instance, key) for key in sort_keys]
+    except AttributeError:
+        raise sqlalchemyutils.InvalidSortKey()
+    for attr in attrs:
+        query = query.order_by(sort_fn(attr))
+
+    if marker_values is not None:
+        nulls_first = (sort_dir == 'desc') == (get_engine().name ==
+                                               'postgresql')
+        criteria_list = []
+        for i, attr in enumerate(attrs):
+            after = _instance_sort_after(attr, marker_values[i], sort_dir,
+                                         nulls_first, False)
+            if after is None:
+                # No value sorts after NULL.
+                continue
+            crit_attrs = [attrs[j] == marker_values[j] for j in range(i)]
+            crit_attrs.append(after)
+            criteria_list.append(and_(*crit_attrs))
+        query = query.filter(or_(*criteria_list))
+        bound = _instance_sort_after(attrs[0], marker_values[0], sort_dir,
+                                     nulls_first, True)
+        if bound is not None:
+            query = query.filter(bound)
+
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
 
-    return _instances_fill_metadata(context, query_prefix.all(), manual_joins)
+def _instance_sort_after(attr, value, sort_dir, nulls_first, inclusive):
+    """Return the criterion on attr of the rows that sort after value, or
+    also at value if inclusive, or None if there is no such criterion.
+    """
+    if value is None:
+        if nulls_first:
+            return None if inclusive else attr != None
+        return attr == None if inclusive else None
+    if sort_dir == 'desc':
+        after = attr <= value if inclusive else attr < value
+    else:
+        after = attr >= value if inclusive else attr > value
+    if not nulls_first and attr.property.columns[0].nullable:
+        after = or_(after, attr == None)
+    return after
 
 
 def tag_filter(context, query, model, model_metadata,
@@ -2034,6 +2366,7 @@ def regex_filter(query, model, filters):
 
 
 @require_context
+@_read_only
 def instance_get_active_by_window_joined(context, begin, end=None,
                                          project_id=None, host=None):
     """Return instances and joins that were active during window."""
@@ -2069,14 +2402,25 @@ def _instance_get_all_query(context, project_only=False,
 
 
 @require_admin_context
+@_read_only
 def instance_get_all_by_host(context, host,
                              columns_to_join=None,
-                             use_slave=False):
-    return _instances_fill_metadata(context,
-      _instance_get_all_query(context,
-                              use_slave=use_slave).filter_by(host=host).all(),
-                              manual_joins=columns_to_join,
-                              use_slave=use_slave)
+                             use_slave=False, columns=None):
+    if columns is None:
+        instances = _instance_get_all_query(context, use_slave=use_slave).\
+                        filter_by(host=host).\
+                        all()
+    else:
+        keys = _instance_column_keys(columns)
+        instances = model_query(context, *_instance_columns(keys),
+                                base_model=models.Instance,
+                                use_slave=use_slave).\
+                        filter(models.Instance.host == host).\
+                        all()
+        instances = [dict(zip(keys, row)) for row in instances]
+    return _instances_fill_metadata(context, instances,
+                                    manual_joins=columns_to_join,
+                                    use_slave=use_slave)
 
 
 def _instance_get_all_uuids_by_host(context, host, session=None):
@@ -2095,6 +2439,7 @@ def _instance_get_all_uuids_by_host(context, host, session=None):
 
 
 @require_admin_context
+@_read_only
 def instance_get_all_by_host_and_node(context, host, node):
     return _instances_fill_metadata(context,
         _instance_get_all_query(context, joins=[]).filter_by(host=host).
@@ -2102,6 +2447,30 @@ def instance_get_all_by_host_and_node(context, host, node):
 
 
 @require_admin_context
+@_read_only
+def instance_statistics_by_host_and_node(context, host, node):
+    result = model_query(context,
+                         func.count(models.Instance.id),
+                         func.sum(models.Instance.vcpus),
+                         func.sum(models.Instance.memory_mb),
+                         func.sum(models.Instance.root_gb),
+                         func.sum(models.Instance.ephemeral_gb),
+                         base_model=models.Instance,
+                         read_deleted="no").\
+                     filter_by(host=host).\
+                     filter_by(node=node).\
+                     filter(or_(models.Instance.vm_state == None,
+                                models.Instance.vm_state !=
+                                vm_states.DELETED)).\
+                     first()
+
+    fields = ('count', 'vcpus', 'memory_mb', 'root_gb', 'ephemeral_gb')
+    return dict((field, int(result[idx] or 0))
+                for idx, field in enumerate(fields))
+
+
+@require_admin_context
+@_read_only
 def instance_get_all_by_host_and_not_type(context, host, type_id=None):
     return _instances_fill_metadata(context,
         _instance_get_all_query(context).filter_by(host=host).
@@ -2114,6 +2483,7 @@ def instance_get_all_by_host_and_not_type(context, host, type_id=None):
 #                function and its call in compute/manager.py on 1829 can
 #                go away
 @require_context
+@_read_only
 def instance_get_floating_address(context, instance_id):
     instance = instance_get(context, instance_id)
     fixed_ips = fixed_ip_get_by_instance(context, instance['uuid'])
@@ -2132,6 +2502,7 @@ def instance_get_floating_address(context, instance_id):
 
 
 @require_context
+@_read_only
 def instance_floating_address_get_all(context, instance_uuid):
     if not uuidutils.is_uuid_like(instance_uuid):
         raise exception.InvalidUUID(uuid=instance_uuid)
@@ -2154,6 +2525,7 @@ def instance_floating_address_get_all(context, instance_uuid):
 
 # NOTE(hanlind): This method can be removed as conductor RPC API moves to v2.0.
 @require_admin_context
+@_read_only
 def instance_get_all_hung_in_rebooting(context, reboot_window):
     reboot_window = (timeutils.utcnow() -
                      datetime.timedelta(seconds=reboot_window))
@@ -2175,6 +2547,7 @@ def instance_update(context, instance_uuid, values):
 
 
 @require_context
+@_retry_on_deadlock
 def instance_update_and_get_original(context, instance_uuid, values,
                                      columns_to_join=None):
     """Set the given properties on an instance and update it. Return
@@ -2193,7 +2566,9 @@ def instance_update_and_get_original(context, instance_uuid, values,
 
     Raises NotFound if instance does not exist.
     """
-    return _instance_update(context, instance_uuid, values,
+    # NOTE: _instance_update() pops the expected states and metadata from
+    # the values, which must be there again if this is retried on deadlock.
+    return _instance_update(context, instance_uuid, dict(values),
                             copy_old_instance=True,
                             columns_to_join=columns_to_join)
 
@@ -2312,6 +2687,7 @@ def instance_remove_security_group(context, instance_uuid, security_group_id):
 
 
 @require_context
+@_read_only
 def instance_info_cache_get(context, instance_uuid):
     """Gets an instance info cache from the table.
 
@@ -2395,6 +2771,7 @@ def key_pair_destroy(context, user_id, name):
 
 
 @require_context
+@_read_only
 def key_pair_get(context, user_id, name):
     nova.context.authorize_user_context(context, user_id)
     result = model_query(context, models.KeyPair).\
@@ -2409,6 +2786,7 @@ def key_pair_get(context, user_id, name):
 
 
 @require_context
+@_read_only
 def key_pair_get_all_by_user(context, user_id):
     nova.context.authorize_user_context(context, user_id)
     return model_query(context, models.KeyPair, read_deleted="no").\
@@ -2416,6 +2794,7 @@ def key_pair_get_all_by_user(context, user_id):
                    all()
 
 
+@_read_only
 def key_pair_count_by_user(context, user_id):
     nova.context.authorize_user_context(context, user_id)
     return model_query(context, models.KeyPair, read_deleted="no").\
@@ -2482,6 +2861,7 @@ def _network_ips_query(context, network_id):
 
 
 @require_admin_context
+@_read_only
 def network_count_reserved_ips(context, network_id):
     return _network_ips_query(context, network_id).\
                     filter_by(reserved=True).\
@@ -2547,11 +2927,13 @@ def _network_get(context, network_id, session=None, project_only='allow_none'):
 
 
 @require_context
+@_read_only
 def network_get(context, network_id, project_only='allow_none'):
     return _network_get(context, network_id, project_only=project_only)
 
 
 @require_context
+@_read_only
 def network_get_all(context, project_only):
     result = model_query(context, models.Network, read_deleted="no",
                          project_only=project_only).all()
@@ -2563,6 +2945,7 @@ def network_get_all(context, project_only):
 
 
 @require_context
+@_read_only
 def network_get_all_by_uuids(context, network_uuids, project_only):
     result = model_query(context, models.Network, read_deleted="no",
                          project_only=project_only).\
@@ -2594,6 +2977,7 @@ def network_get_all_by_uuids(context, network_uuids, project_only):
 
 
 @require_admin_context
+@_read_only
 def network_get_associated_fixed_ips(context, network_id, host=None):
     # FIXME(sirp): since this returns fixed_ips, this would be better named
     # fixed_ip_get_all_by_network.
@@ -2654,6 +3038,7 @@ def _network_get_query(context, session=None):
 
 
 @require_admin_context
+@_read_only
 def network_get_by_uuid(context, uuid):
     result = _network_get_query(context).filter_by(uuid=uuid).first()
 
@@ -2664,6 +3049,7 @@ def network_get_by_uuid(context, uuid):
 
 
 @require_admin_context
+@_read_only
 def network_get_by_cidr(context, cidr):
     result = _network_get_query(context).\
                 filter(or_(models.Network.cidr == cidr,
@@ -2677,6 +3063,7 @@ def network_get_by_cidr(context, cidr):
 
 
 @require_admin_context
+@_read_only
 def network_get_all_by_host(context, host):
     session = get_session()
     fixed_host_filter = or_(models.FixedIp.host == host,
@@ -2739,6 +3126,7 @@ def network_update(context, network_id, values):
 
 
 @require_context
+@_read_only
 def quota_get(context, project_id, resource, user_id=None):
     model = models.ProjectUserQuota if user_id else models.Quota
     query = model_query(context, model).\
@@ -2759,6 +3147,7 @@ def quota_get(context, project_id, resource, user_id=None):
 
 
 @require_context
+@_read_only
 def quota_get_all_by_project_and_user(context, project_id, user_id):
     nova.context.authorize_project_context(context, project_id)
 
@@ -2777,6 +3166,7 @@ def quota_get_all_by_project_and_user(context, project_id, user_id):
 
 
 @require_context
+@_read_only
 def quota_get_all_by_project(context, project_id):
     nova.context.authorize_project_context(context, project_id)
 
@@ -2792,6 +3182,7 @@ def quota_get_all_by_project(context, project_id):
 
 
 @require_context
+@_read_only
 def quota_get_all(context, project_id):
     nova.context.authorize_project_context(context, project_id)
 
@@ -2841,6 +3232,7 @@ def quota_update(context, project_id, resource, limit, user_id=None):
 
 
 @require_context
+@_read_only
 def quota_class_get(context, class_name, resource):
     result = model_query(context, models.QuotaClass, read_deleted="no").\
                      filter_by(class_name=class_name).\
@@ -2853,6 +3245,7 @@ def quota_class_get(context, class_name, resource):
     return result
 
 
+@_read_only
 def quota_class_get_default(context):
     rows = model_query(context, models.QuotaClass, read_deleted="no").\
                    filter_by(class_name=_DEFAULT_QUOTA_NAME).\
@@ -2866,6 +3259,7 @@ def quota_class_get_default(context):
 
 
 @require_context
+@_read_only
 def quota_class_get_all_by_name(context, class_name):
     nova.context.authorize_quota_class_context(context, class_name)
 
@@ -2905,6 +3299,7 @@ def quota_class_update(context, class_name, resource, limit):
 
 
 @require_context
+@_read_only
 def quota_usage_get(context, project_id, resource, user_id=None):
     query = model_query(context, models.QuotaUsage, read_deleted="no").\
                      filter_by(project_id=project_id).\
@@ -2946,11 +3341,13 @@ def _quota_usage_get_all(context, project_id, user_id=None):
 
 
 @require_context
+@_read_only
 def quota_usage_get_all_by_project_and_user(context, project_id, user_id):
     return _quota_usage_get_all(context, project_id, user_id=user_id)
 
 
 @require_context
+@_read_only
 def quota_usage_get_all_by_project(context, project_id):
     return _quota_usage_get_all(context, project_id)
 
@@ -3016,26 +3413,28 @@ def _reservation_create(context, uuid, usage, project_id, user_id, resource,
 # code always acquires the lock on quota_usages before acquiring the lock
 # on reservations.
 
-def _get_user_quota_usages(context, session, project_id, user_id):
+def _get_user_quota_usages(context, session, project_id, user_id,
+                           lock=True):
     # Broken out for testability
-    rows = model_query(context, models.QuotaUsage,
-                       read_deleted="no",
-                       session=session).\
+    query = model_query(context, models.QuotaUsage,
+                        read_deleted="no",
+                        session=session).\
                    filter_by(project_id=project_id).\
                    filter(or_(models.QuotaUsage.user_id == user_id,
-                              models.QuotaUsage.user_id == None)).\
-                   with_lockmode('update').\
-                   all()
-    return dict((row.resource, row) for row in rows)
+                              models.QuotaUsage.user_id == None))
+    if lock:
+        query = query.with_lockmode('update')
+    return dict((row.resource, row) for row in query.all())
 
 
-def _get_project_quota_usages(context, session, project_id):
-    rows = model_query(context, models.QuotaUsage,
-                       read_deleted="no",
-                       session=session).\
-                   filter_by(project_id=project_id).\
-                   with_lockmode('update').\
-                   all()
+def _get_project_quota_usages(context, session, project_id, lock=True):
+    query = model_query(context, models.QuotaUsage,
+                        read_deleted="no",
+                        session=session).\
+                   filter_by(project_id=project_id)
+    if lock:
+        query = query.with_lockmode('update')
+    rows = query.all()
     result = dict()
     # Get the total count of in_use,reserved
     for row in rows:
@@ -3050,6 +3449,157 @@ def _get_project_quota_usages(context, session, project_id):
     return result
 
 
+def _quota_usages_refresh(elevated, session, resources, deltas, user_usages,
+                          project_id, user_id, until_refresh, max_age):
+    """Create the missing usages of the resources in deltas, and refresh
+    those which need it with their sync routines.
+    """
+    work = set(deltas.keys())
+    while work:
+        resource = work.pop()
+
+        # Do we need to refresh the usage?
+        refresh = False
+        if ((resource not in PER_PROJECT_QUOTAS) and
+                (resource not in user_usages)):
+            user_usages[resource] = _quota_usage_create(elevated,
+                                                  project_id,
+                                                  user_id,
+                                                  resource,
+                                                  0, 0,
+                                                  until_refresh or None,
+                                                  session=session)
+            refresh = True
+        elif ((resource in PER_PROJECT_QUOTAS) and
+                (resource not in user_usages)):
+            user_usages[resource] = _quota_usage_create(elevated,
+                                                  project_id,
+                                                  None,
+                                                  resource,
+                                                  0, 0,
+                                                  until_refresh or None,
+                                                  session=session)
+            refresh = True
+        elif user_usages[resource].in_use < 0:
+            # Negative in_use count indicates a desync, so try to
+            # heal from that...
+            refresh = True
+        elif user_usages[resource].until_refresh is not None:
+            user_usages[resource].until_refresh -= 1
+            if user_usages[resource].until_refresh <= 0:
+                refresh = True
+        elif max_age and (user_usages[resource].updated_at -
+                          timeutils.utcnow()).seconds >= max_age:
+            refresh = True
+
+        # OK, refresh the usage
+        if refresh:
+            # Grab the sync routine
+            sync = QUOTA_SYNC_FUNCTIONS[resources[resource].sync]
+
+            updates = sync(elevated, project_id, user_id, session)
+            for res, in_use in updates.items():
+                # Make sure we have a destination for the usage!
+                if ((res not in PER_PROJECT_QUOTAS) and
+                        (res not in user_usages)):
+                    user_usages[res] = _quota_usage_create(elevated,
+                                                     project_id,
+                                                     user_id,
+                                                     res,
+                                                     0, 0,
+                                                     until_refresh or None,
+                                                     session=session)
+                if ((res in PER_PROJECT_QUOTAS) and
+                        (res not in user_usages)):
+                    user_usages[res] = _quota_usage_create(elevated,
+                                                     project_id,
+                                                     None,
+                                                     res,
+                                                     0, 0,
+                                                     until_refresh or None,
+                                                     session=session)
+
+                if user_usages[res].in_use != in_use:
+                    LOG.debug(_('quota_usages out of sync, updating. '
+                                'project_id: %(project_id)s, '
+                                'user_id: %(user_id)s, '
+                                'resource: %(res)s, '
+                                'tracked usage: %(tracked_use)s, '
+                                'actual usage: %(in_use)s'),
+                        {'project_id': project_id,
+                         'user_id': user_id,
+                         'res': res,
+                         'tracked_use': user_usages[res].in_use,
+                         'in_use': in_use})
+
+                # Update the usage
+                user_usages[res].in_use = in_use
+                user_usages[res].until_refresh = until_refresh or None
+
+                # Because more than one resource may be refreshed
+                # by the call to the sync routine, and we don't
+                # want to double-sync, we make sure all refreshed
+                # resources are dropped from the work set.
+                work.discard(res)
+
+                # NOTE(Vek): We make the assumption that the sync
+                #            routine actually refreshes the
+                #            resources that it is the sync routine
+                #            for.  We don't check, because this is
+                #            a best-effort mechanism.
+
+
+def _quota_overs(deltas, project_quotas, user_quotas, project_usages,
+                 user_usages):
+    """Return the resources whose deltas would go over quota."""
+    # NOTE(Vek): We're only concerned about positive increments.
+    #            If a project has gone over quota, we want them to
+    #            be able to reduce their usage without any
+    #            problems.
+    for key, value in user_usages.items():
+        if key not in project_usages:
+            project_usages[key] = value
+    return [res for res, delta in deltas.items()
+            if user_quotas[res] >= 0 and delta >= 0 and
+            (project_quotas[res] < delta +
+             project_usages[res]['total'] or
+             user_quotas[res] < delta +
+             user_usages[res].total)]
+
+
+def _raise_over_quota(overs, deltas, project_quotas, user_quotas,
+                      project_usages, user_usages):
+    if project_quotas == user_quotas:
+        usages = project_usages
+    else:
+        usages = user_usages
+    usages = dict((k, dict(in_use=v['in_use'], reserved=v['reserved']))
+                  for k, v in usages.items())
+    headroom = dict((res, user_quotas[res] -
+                         (usages[res]['in_use'] + usages[res]['reserved']))
+                    for res in user_quotas.keys())
+
+    # If quota_cores is unlimited [-1]:
+    # - set cores headroom based on instances headroom:
+    if user_quotas.get('cores') == -1:
+        if deltas['cores']:
+            hc = headroom['instances'] * deltas['cores']
+            headroom['cores'] = hc / deltas['instances']
+        else:
+            headroom['cores'] = headroom['instances']
+
+    # If quota_ram is unlimited [-1]:
+    # - set ram headroom based on instances headroom:
+    if user_quotas.get('ram') == -1:
+        if deltas['ram']:
+            hr = headroom['instances'] * deltas['ram']
+            headroom['ram'] = hr / deltas['instances']
+        else:
+            headroom['ram'] = headroom['instances']
+    raise exception.OverQuota(overs=sorted(overs), quotas=user_quotas,
+                              usages=usages, headroom=headroom)
+
+
 @require_context
 @_retry_on_deadlock
 def quota_reserve(context, resources, project_quotas, user_quotas, deltas,
@@ -3071,99 +3621,9 @@ def quota_reserve(context, resources, project_quotas, user_quotas, deltas,
                                                    project_id)
 
         # Handle usage refresh
-        work = set(deltas.keys())
-        while work:
-            resource = work.pop()
-
-            # Do we need to refresh the usage?
-            refresh = False
-            if ((resource not in PER_PROJECT_QUOTAS) and
-                    (resource not in user_usages)):
-                user_usages[resource] = _quota_usage_create(elevated,
-                                                      project_id,
-                                                      user_id,
-                                                      resource,
-                                                      0, 0,
-                                                      until_refresh or None,
-                                                      session=session)
-                refresh = True
-            elif ((resource in PER_PROJECT_QUOTAS) and
-                    (resource not in user_usages)):
-                user_usages[resource] = _quota_usage_create(elevated,
-                                                      project_id,
-                                                      None,
-                                                      resource,
-                                                      0, 0,
-                                                      until_refresh or None,
-                                                      session=session)
-                refresh = True
-            elif user_usages[resource].in_use < 0:
-                # Negative in_use count indicates a desync, so try to
-                # heal from that...
-                refresh = True
-            elif user_usages[resource].until_refresh is not None:
-                user_usages[resource].until_refresh -= 1
-                if user_usages[resource].until_refresh <= 0:
-                    refresh = True
-            elif max_age and (user_usages[resource].updated_at -
-                              timeutils.utcnow()).seconds >= max_age:
-                refresh = True
-
-            # OK, refresh the usage
-            if refresh:
-                # Grab the sync routine
-                sync = QUOTA_SYNC_FUNCTIONS[resources[resource].sync]
-
-                updates = sync(elevated, project_id, user_id, session)
-                for res, in_use in updates.items():
-                    # Make sure we have a destination for the usage!
-                    if ((res not in PER_PROJECT_QUOTAS) and
-                            (res not in user_usages)):
-                        user_usages[res] = _quota_usage_create(elevated,
-                                                         project_id,
-                                                         user_id,
-                                                         res,
-                                                         0, 0,
-                                                         until_refresh or None,
-                                                         session=session)
-                    if ((res in PER_PROJECT_QUOTAS) and
-                            (res not in user_usages)):
-                        user_usages[res] = _quota_usage_create(elevated,
-                                                         project_id,
-                                                         None,
-                                                         res,
-                                                         0, 0,
-                                                         until_refresh or None,
-                                                         session=session)
-
-                    if user_usages[res].in_use != in_use:
-                        LOG.debug(_('quota_usages out of sync, updating. '
-                                    'project_id: %(project_id)s, '
-                                    'user_id: %(user_id)s, '
-                                    'resource: %(res)s, '
-                                    'tracked usage: %(tracked_use)s, '
-                                    'actual usage: %(in_use)s'),
-                            {'project_id': project_id,
-                             'user_id': user_id,
-                             'res': res,
-                             'tracked_use': user_usages[res].in_use,
-                             'in_use': in_use})
-
-                    # Update the usage
-                    user_usages[res].in_use = in_use
-                    user_usages[res].until_refresh = until_refresh or None
-
-                    # Because more than one resource may be refreshed
-                    # by the call to the sync routine, and we don't
-                    # want to double-sync, we make sure all refreshed
-                    # resources are dropped from the work set.
-                    work.discard(res)
-
-                    # NOTE(Vek): We make the assumption that the sync
-                    #            routine actually refreshes the
-                    #            resources that it is the sync routine
-                    #            for.  We don't check, because this is
-                    #            a best-effort mechanism.
+        _quota_usages_refresh(elevated, session, resources, deltas,
+                              user_usages, project_id, user_id,
+                              until_refresh, max_age)
 
         # Check for deltas that would go negative
         unders = [res for res, delta in deltas.items()
@@ -3171,19 +3631,8 @@ def quota_reserve(context, resources, project_quotas, user_quotas, deltas,
                   delta + user_usages[res].in_use < 0]
 
         # Now, let's check the quotas
-        # NOTE(Vek): We're only concerned about positive increments.
-        #            If a project has gone over quota, we want them to
-        #            be able to reduce their usage without any
-        #            problems.
-        for key, value in user_usages.items():
-            if key not in project_usages:
-                project_usages[key] = value
-        overs = [res for res, delta in deltas.items()
-                 if user_quotas[res] >= 0 and delta >= 0 and
-                 (project_quotas[res] < delta +
-                  project_usages[res]['total'] or
-                  user_quotas[res] < delta +
-                  user_usages[res].total)]
+        overs = _quota_overs(deltas, project_quotas, user_quotas,
+                             project_usages, user_usages)
 
         # NOTE(Vek): The quota check needs to be in the transaction,
         #            but the transaction doesn't fail just because
@@ -3228,39 +3677,199 @@ def quota_reserve(context, resources, project_quotas, user_quotas, deltas,
         LOG.warning(_("Change will make usage less than 0 for the following "
                       "resources: %s"), unders)
     if overs:
-        if project_quotas == user_quotas:
-            usages = project_usages
-        else:
-            usages = user_usages
-        usages = dict((k, dict(in_use=v['in_use'], reserved=v['reserved']))
-                      for k, v in usages.items())
-        headroom = dict((res, user_quotas[res] -
-                             (usages[res]['in_use'] + usages[res]['reserved']))
-                        for res in user_quotas.keys())
-
-        # If quota_cores is unlimited [-1]:
-        # - set cores headroom based on instances headroom:
-        if user_quotas.get('cores') == -1:
-            if deltas['cores']:
-                hc = headroom['instances'] * deltas['cores']
-                headroom['cores'] = hc / deltas['instances']
-            else:
-                headroom['cores'] = headroom['instances']
-
-        # If quota_ram is unlimited [-1]:
-        # - set ram headroom based on instances headroom:
-        if user_quotas.get('ram') == -1:
-            if deltas['ram']:
-                hr = headroom['instances'] * deltas['ram']
-                headroom['ram'] = hr / deltas['instances']
-            else:
-                headroom['ram'] = headroom['instances']
-        raise exception.OverQuota(overs=sorted(overs), quotas=user_quotas,
-                                  usages=usages, headroom=headroom)
+        _raise_over_quota(overs, deltas, project_quotas, user_quotas,
+                          project_usages, user_usages)
+
+    return reservations
+
+
+# NOTE: quota_reserve_conditional() and the reservation_*_conditional()
+# functions keep the usages up to date without locking them.  Each change
+# to a usage is a single UPDATE adding to its current values, and a
+# reservation is only made if the UPDATE finds the usage still within its
+# quota.  No lock is held for longer than a short transaction, so bursts
+# of reservations in a single project do not queue up behind each other.
+# The usages must be changed with these functions only, as the locking
+# ones overwrite them with the values they read.
+
+def _quota_usage_reserve(context, session, usage, delta, quota):
+    """Add delta to the quantity reserved on a usage, if it stays within
+    quota, and return whether it did.  A negative quota is unlimited.
+    """
+    query = model_query(context, models.QuotaUsage, read_deleted="no",
+                        session=session).\
+                   filter_by(id=usage.id)
+    if quota >= 0:
+        query = query.filter(models.QuotaUsage.in_use +
+                             models.QuotaUsage.reserved + delta <= quota)
+    return query.update({'reserved': models.QuotaUsage.reserved + delta},
+                        synchronize_session=False) > 0
+
+
+def _quota_project_usage_total(context, project_id, resource):
+    """Return the in_use and reserved quantities of a resource, for all
+    the users of a project.
+    """
+    total = model_query(context,
+                        func.sum(models.QuotaUsage.in_use +
+                                 models.QuotaUsage.reserved),
+                        base_model=models.QuotaUsage, read_deleted="no").\
+                    filter_by(project_id=project_id).\
+                    filter_by(resource=resource).\
+                    scalar()
+    return total or 0
+
+
+def _quota_reservations_release(context, reservations, commit):
+    """Soft-delete reservations, and take their deltas off the reserved
+    quantities of their usages, adding them to their in_use quantities if
+    commit is True.
+
+    Reservations already released by someone else are skipped.
+    """
+    if not reservations:
+        return
+    session = get_session()
+    with session.begin():
+        rows = model_query(context, models.Reservation.id,
+                           models.Reservation.usage_id,
+                           models.Reservation.delta,
+                           base_model=models.Reservation, read_deleted="no",
+                           session=session).\
+                       filter(models.Reservation.uuid.in_(reservations)).\
+                       all()
+        # Change the usages in the same order everywhere, so that
+        # concurrent releases do not deadlock.
+        for reservation_id, usage_id, delta in sorted(
+                rows, key=lambda row: row[1:]):
+            released = model_query(context, models.Reservation,
+                                   read_deleted="no", session=session).\
+                               filter_by(id=reservation_id).\
+                               soft_delete(synchronize_session=False)
+            if not released:
+                continue
+            updates = {}
+            if delta >= 0:
+                updates['reserved'] = models.QuotaUsage.reserved - delta
+            if commit:
+                updates['in_use'] = models.QuotaUsage.in_use + delta
+            if updates:
+                model_query(context, models.QuotaUsage, read_deleted="no",
+                            session=session).\
+                        filter_by(id=usage_id).\
+                        update(updates, synchronize_session=False)
+
+
+def _quota_reserve_one(context, project_quotas, user_quotas, usage, res,
+                       delta, expire, project_id, user_id, reservations):
+    """Reserve delta of a resource, appending the reservation made to
+    reservations, and return whether it stayed within quota.
+    """
+    quota = user_quotas[res]
+    if quota >= 0 and usage.user_id is None:
+        # The usage is shared by all the users of the project.
+        quota = project_quotas[res]
+    session = get_session()
+    with session.begin():
+        # Only positive increments are checked against the quota, and
+        # added to the reserved quantity, as in quota_reserve().
+        if delta > 0 and not _quota_usage_reserve(context, session, usage,
+                                                  delta, quota):
+            return False
+        reservation = _reservation_create(context, str(uuid.uuid4()),
+                                          usage, project_id, user_id,
+                                          res, delta, expire,
+                                          session=session)
+        reservations.append(reservation.uuid)
+
+    # The reservation is visible to everyone now, so if the total of the
+    # project is still within its quota, it stays within it whatever
+    # other reservations are being made.
+    return not (delta > 0 and quota >= 0 and project_quotas[res] >= 0 and
+                usage.user_id is not None and
+                _quota_project_usage_total(context, project_id, res) >
+                project_quotas[res])
+
+
+@require_context
+@_retry_on_deadlock
+def quota_reserve_conditional(context, resources, project_quotas,
+                              user_quotas, deltas, expire, until_refresh,
+                              max_age, project_id=None, user_id=None):
+    elevated = context.elevated()
+    if project_id is None:
+        project_id = context.project_id
+    if user_id is None:
+        user_id = context.user_id
+
+    # Create and refresh the usages.  A refresh overwrites in_use with
+    # the usage the sync routine counted, which is best-effort anyway.
+    session = get_session()
+    with session.begin():
+        user_usages = _get_user_quota_usages(context, session, project_id,
+                                             user_id, lock=False)
+        _quota_usages_refresh(elevated, session, resources, deltas,
+                              user_usages, project_id, user_id,
+                              until_refresh, max_age)
+        for usage_ref in user_usages.values():
+            session.add(usage_ref)
+
+    unders = [res for res, delta in deltas.items()
+              if delta < 0 and
+              delta + user_usages[res].in_use < 0]
+
+    # Reserve the resources one at a time, always in the same order.
+    reservations = []
+    overs = []
+    try:
+        for res in sorted(deltas):
+            if not _quota_reserve_one(elevated, project_quotas, user_quotas,
+                                      user_usages[res], res, deltas[res],
+                                      expire, project_id, user_id,
+                                      reservations):
+                overs.append(res)
+                break
+    except Exception:
+        with excutils.save_and_reraise_exception():
+            _quota_reservations_release(elevated, reservations,
+                                        commit=False)
+
+    if unders:
+        LOG.warning(_("Change will make usage less than 0 for the following "
+                      "resources: %s"), unders)
+    if overs:
+        _quota_reservations_release(elevated, reservations, commit=False)
+        session = get_session()
+        with session.begin():
+            user_usages = _get_user_quota_usages(context, session,
+                                                 project_id, user_id,
+                                                 lock=False)
+            project_usages = _get_project_quota_usages(context, session,
+                                                       project_id,
+                                                       lock=False)
+        overs = set(overs).union(_quota_overs(deltas, project_quotas,
+                                              user_quotas, project_usages,
+                                              user_usages))
+        _raise_over_quota(overs, deltas, project_quotas, user_quotas,
+                          project_usages, user_usages)
 
     return reservations
 
 
+@require_context
+@_retry_on_deadlock
+def reservation_commit_conditional(context, reservations, project_id=None,
+                                   user_id=None):
+    _quota_reservations_release(context, reservations, commit=True)
+
+
+@require_context
+@_retry_on_deadlock
+def reservation_rollback_conditional(context, reservations, project_id=None,
+                                     user_id=None):
+    _quota_reservations_release(context, reservations, commit=False)
+
+
 def _quota_reservations_query(session, context, reservations):
     """Return the relevant reservations."""
 
@@ -3366,6 +3975,17 @@ def reservation_expire(context):
         reservation_query.soft_delete(synchronize_session=False)
 
 
+@require_context
+@_retry_on_deadlock
+def reservation_expire_conditional(context):
+    rows = model_query(context, models.Reservation.uuid,
+                       base_model=models.Reservation, read_deleted="no").\
+                   filter(models.Reservation.expire < timeutils.utcnow()).\
+                   all()
+    _quota_reservations_release(context, [row[0] for row in rows],
+                                commit=False)
+
+
 ###################
 
 
@@ -3393,6 +4013,7 @@ def ec2_volume_create(context, volume_uuid, id=None):
 
 
 @require_context
+@_read_only
 def get_ec2_volume_id_by_uuid(context, volume_id):
     result = _ec2_volume_get_query(context).\
                     filter_by(uuid=volume_id).\
@@ -3405,6 +4026,7 @@ def get_ec2_volume_id_by_uuid(context, volume_id):
 
 
 @require_context
+@_read_only
 def get_volume_uuid_by_ec2_id(context, ec2_id):
     result = _ec2_volume_get_query(context).\
                     filter_by(id=ec2_id).\
@@ -3430,6 +4052,7 @@ def ec2_snapshot_create(context, snapshot_uuid, id=None):
 
 
 @require_context
+@_read_only
 def get_ec2_snapshot_id_by_uuid(context, snapshot_id):
     result = _ec2_snapshot_get_query(context).\
                     filter_by(uuid=snapshot_id).\
@@ -3442,6 +4065,7 @@ def get_ec2_snapshot_id_by_uuid(context, snapshot_id):
 
 
 @require_context
+@_read_only
 def get_snapshot_uuid_by_ec2_id(context, ec2_id):
     result = _ec2_snapshot_get_query(context).\
                     filter_by(id=ec2_id).\
@@ -3543,6 +4167,7 @@ def block_device_mapping_update_or_create(context, values, legacy=True):
 
 
 @require_context
+@_read_only
 def block_device_mapping_get_all_by_instance(context, instance_uuid):
     return _block_device_mapping_get_query(context).\
                  filter_by(instance_uuid=instance_uuid).\
@@ -3550,6 +4175,18 @@ def block_device_mapping_get_all_by_instance(context, instance_uuid):
 
 
 @require_context
+@_read_only
+def block_device_mapping_get_all_by_instance_uuids(context, instance_uuids):
+    if not instance_uuids:
+        return []
+    return _block_device_mapping_get_query(context).\
+                 filter(models.BlockDeviceMapping.instance_uuid.in_(
+                     instance_uuids)).\
+                 all()
+
+
+@require_context
+@_read_only
 def block_device_mapping_get_by_volume_id(context, volume_id,
         columns_to_join=None):
     return _block_device_mapping_get_query(context,
@@ -3631,11 +4268,13 @@ def _security_group_get_by_names(context, session, project_id, group_names):
 
 
 @require_context
+@_read_only
 def security_group_get_all(context):
     return _security_group_get_query(context).all()
 
 
 @require_context
+@_read_only
 def security_group_get(context, security_group_id, columns_to_join=None):
     query = _security_group_get_query(context, project_only=True).\
                     filter_by(id=security_group_id)
@@ -3655,6 +4294,7 @@ def security_group_get(context, security_group_id, columns_to_join=None):
 
 
 @require_context
+@_read_only
 def security_group_get_by_name(context, project_id, group_name,
                                columns_to_join=None):
     query = _security_group_get_query(context,
@@ -3677,6 +4317,7 @@ def security_group_get_by_name(context, project_id, group_name,
 
 
 @require_context
+@_read_only
 def security_group_get_by_project(context, project_id):
     return _security_group_get_query(context, read_deleted="no").\
                         filter_by(project_id=project_id).\
@@ -3684,6 +4325,7 @@ def security_group_get_by_project(context, project_id):
 
 
 @require_context
+@_read_only
 def security_group_get_by_instance(context, instance_uuid):
     return _security_group_get_query(context, read_deleted="no").\
                    join(models.SecurityGroup.instances).\
@@ -3823,6 +4465,7 @@ def _security_group_rule_get_query(context, session=None):
 
 
 @require_context
+@_read_only
 def security_group_rule_get(context, security_group_rule_id):
     result = (_security_group_rule_get_query(context).
                          filter_by(id=security_group_rule_id).
@@ -3836,6 +4479,7 @@ def security_group_rule_get(context, security_group_rule_id):
 
 
 @require_context
+@_read_only
 def security_group_rule_get_by_security_group(context, security_group_id,
                                               columns_to_join=None):
     if columns_to_join is None:
@@ -3849,6 +4493,7 @@ def security_group_rule_get_by_security_group(context, security_group_id,
 
 
 @require_context
+@_read_only
 def security_group_rule_get_by_security_group_grantee(context,
                                                       security_group_id):
 
@@ -3873,6 +4518,7 @@ def security_group_rule_destroy(context, security_group_rule_id):
 
 
 @require_context
+@_read_only
 def security_group_rule_count_by_group(context, security_group_id):
     return (model_query(context, models.SecurityGroupIngressRule,
                    read_deleted="no").
@@ -3889,6 +4535,7 @@ def _security_group_rule_get_default_query(context, session=None):
 
 
 @require_context
+@_read_only
 def security_group_default_rule_get(context, security_group_rule_default_id):
     result = _security_group_rule_get_default_query(context).\
                         filter_by(id=security_group_rule_default_id).\
@@ -3941,6 +4588,7 @@ def provider_fw_rule_create(context, rule):
 
 
 @require_admin_context
+@_read_only
 def provider_fw_rule_get_all(context):
     return model_query(context, models.ProviderFirewallRule).all()
 
@@ -3958,6 +4606,7 @@ def provider_fw_rule_destroy(context, rule_id):
 
 
 @require_context
+@_read_only
 def project_get_networks(context, project_id, associate=True):
     # NOTE(tr3buchet): as before this function will associate
     # a project with a network if it doesn't have one and
@@ -4009,11 +4658,13 @@ def _migration_get(context, id, session=None):
 
 
 @require_admin_context
+@_read_only
 def migration_get(context, id):
     return _migration_get(context, id)
 
 
 @require_admin_context
+@_read_only
 def migration_get_by_instance_and_status(context, instance_uuid, status):
     result = model_query(context, models.Migration, read_deleted="yes").\
                      filter_by(instance_uuid=instance_uuid).\
@@ -4028,6 +4679,7 @@ def migration_get_by_instance_and_status(context, instance_uuid, status):
 
 
 @require_admin_context
+@_read_only
 def migration_get_unconfirmed_by_dest_compute(context, confirm_window,
                                               dest_compute, use_slave=False):
     confirm_window = (timeutils.utcnow() -
@@ -4042,6 +4694,7 @@ def migration_get_unconfirmed_by_dest_compute(context, confirm_window,
 
 
 @require_admin_context
+@_read_only
 def migration_get_in_progress_by_host_and_node(context, host, node):
 
     return model_query(context, models.Migration).\
@@ -4055,6 +4708,7 @@ def migration_get_in_progress_by_host_and_node(context, host, node):
 
 
 @require_admin_context
+@_read_only
 def migration_get_all_by_filters(context, filters):
     query = model_query(context, models.Migration)
     if "status" in filters:
@@ -4083,6 +4737,7 @@ def console_pool_create(context, values):
     return pool
 
 
+@_read_only
 def console_pool_get_by_host_type(context, compute_host, host,
                                   console_type):
 
@@ -4101,6 +4756,7 @@ def console_pool_get_by_host_type(context, compute_host, host,
     return result
 
 
+@_read_only
 def console_pool_get_all_by_host_type(context, host, console_type):
     return model_query(context, models.ConsolePool, read_deleted="no").\
                    filter_by(host=host).\
@@ -4125,6 +4781,7 @@ def console_delete(context, console_id):
                 delete()
 
 
+@_read_only
 def console_get_by_pool_instance(context, pool_id, instance_uuid):
     result = model_query(context, models.Console, read_deleted="yes").\
                    filter_by(pool_id=pool_id).\
@@ -4139,6 +4796,7 @@ def console_get_by_pool_instance(context, pool_id, instance_uuid):
     return result
 
 
+@_read_only
 def console_get_all_by_instance(context, instance_uuid, columns_to_join=None):
     query = model_query(context, models.Console, read_deleted="yes").\
                 filter_by(instance_uuid=instance_uuid)
@@ -4148,6 +4806,7 @@ def console_get_all_by_instance(context, instance_uuid, columns_to_join=None):
     return query.all()
 
 
+@_read_only
 def console_get(context, console_id, instance_uuid=None):
     query = model_query(context, models.Console, read_deleted="yes").\
                     filter_by(id=console_id).\
@@ -4237,6 +4896,7 @@ def _flavor_get_query(context, session=None, read_deleted=None):
 
 
 @require_context
+@_read_only
 def flavor_get_all(context, inactive=False, filters=None,
                    sort_key='flavorid', sort_dir='asc', limit=None,
                    marker=None):
@@ -4311,6 +4971,7 @@ def _flavor_get_id_from_flavor(context, flavor_id, session=None):
 
 
 @require_context
+@_read_only
 def flavor_get(context, id):
     """Returns a dict describing specific flavor."""
     result = _flavor_get_query(context).\
@@ -4322,6 +4983,7 @@ def flavor_get(context, id):
 
 
 @require_context
+@_read_only
 def flavor_get_by_name(context, name):
     """Returns a dict describing specific flavor."""
     result = _flavor_get_query(context).\
@@ -4333,6 +4995,7 @@ def flavor_get_by_name(context, name):
 
 
 @require_context
+@_read_only
 def flavor_get_by_flavor_id(context, flavor_id, read_deleted):
     """Returns a dict describing specific flavor_id."""
     result = _flavor_get_query(context, read_deleted=read_deleted).\
@@ -4372,6 +5035,7 @@ def _flavor_access_query(context, session=None):
 
 
 @require_admin_context
+@_read_only
 def flavor_access_get_by_flavor_id(context, flavor_id):
     """Get flavor access list by flavor id."""
     instance_type_id_subq = \
@@ -4422,12 +5086,14 @@ def _flavor_extra_specs_get_query(context, flavor_id, session=None):
 
 
 @require_context
+@_read_only
 def flavor_extra_specs_get(context, flavor_id):
     rows = _flavor_extra_specs_get_query(context, flavor_id).all()
     return dict([(row['key'], row['value']) for row in rows])
 
 
 @require_context
+@_read_only
 def flavor_extra_specs_get_item(context, flavor_id, key):
     result = _flavor_extra_specs_get_query(context, flavor_id).\
                 filter(models.InstanceTypeExtraSpecs.key == key).\
@@ -4525,6 +5191,7 @@ def cell_delete(context, cell_name):
 
 
 @require_admin_context
+@_read_only
 def cell_get(context, cell_name):
     result = _cell_get_by_name_query(context, cell_name).first()
     if not result:
@@ -4533,6 +5200,7 @@ def cell_get(context, cell_name):
 
 
 @require_admin_context
+@_read_only
 def cell_get_all(context):
     return model_query(context, models.Cell, read_deleted="no").all()
 
@@ -4556,6 +5224,7 @@ def _instance_metadata_get_query(context, instance_uuid, session=None):
 
 
 @require_context
+@_read_only
 def instance_metadata_get(context, instance_uuid):
     rows = _instance_metadata_get_query(context, instance_uuid).all()
     return dict((row['key'], row['value']) for row in rows)
@@ -4620,6 +5289,7 @@ def _instance_system_metadata_get_query(context, instance_uuid, session=None):
 
 
 @require_context
+@_read_only
 def instance_system_metadata_get(context, instance_uuid):
     rows = _instance_system_metadata_get_query(context, instance_uuid).all()
     return dict((row['key'], row['value']) for row in rows)
@@ -4672,6 +5342,7 @@ def agent_build_create(context, values):
 
 
 @require_admin_context
+@_read_only
 def agent_build_get_by_triple(context, hypervisor, os, architecture):
     return model_query(context, models.AgentBuild, read_deleted="no").\
                    filter_by(hypervisor=hypervisor).\
@@ -4681,6 +5352,7 @@ def agent_build_get_by_triple(context, hypervisor, os, architecture):
 
 
 @require_admin_context
+@_read_only
 def agent_build_get_all(context, hypervisor=None):
     if hypervisor:
         return model_query(context, models.AgentBuild, read_deleted="no").\
@@ -4711,6 +5383,7 @@ def agent_build_update(context, agent_build_id, values):
 ####################
 
 @require_context
+@_read_only
 def bw_usage_get(context, uuid, start_period, mac):
     return model_query(context, models.BandwidthUsage, read_deleted="yes").\
                       filter_by(start_period=start_period).\
@@ -4720,6 +5393,7 @@ def bw_usage_get(context, uuid, start_period, mac):
 
 
 @require_context
+@_read_only
 def bw_usage_get_by_uuids(context, uuids, start_period):
     return model_query(context, models.BandwidthUsage, read_deleted="yes").\
                    filter(models.BandwidthUsage.uuid.in_(uuids)).\
@@ -4776,6 +5450,7 @@ def bw_usage_update(context, uuid, mac, start_period, bw_in, bw_out,
 
 
 @require_context
+@_read_only
 def vol_get_usage_by_time(context, begin):
     """Return volumes usage that have been updated after a specified time."""
     return model_query(context, models.VolumeUsage, read_deleted="yes").\
@@ -4896,6 +5571,7 @@ def vol_usage_update(context, id, rd_req, rd_bytes, wr_req, wr_bytes,
 ####################
 
 
+@_read_only
 def s3_image_get(context, image_id):
     """Find local s3 image represented by the provided id."""
     result = model_query(context, models.S3Image, read_deleted="yes").\
@@ -4908,6 +5584,7 @@ def s3_image_get(context, image_id):
     return result
 
 
+@_read_only
 def s3_image_get_by_uuid(context, image_uuid):
     """Find local s3 image represented by the provided uuid."""
     result = model_query(context, models.S3Image, read_deleted="yes").\
@@ -4977,6 +5654,7 @@ def aggregate_create(context, values, metadata=None):
 
 
 @require_admin_context
+@_read_only
 def aggregate_get(context, aggregate_id):
     query = _aggregate_get_query(context,
                                  models.Aggregate,
@@ -4991,6 +5669,7 @@ def aggregate_get(context, aggregate_id):
 
 
 @require_admin_context
+@_read_only
 def aggregate_get_by_host(context, host, key=None):
     """Return rows that match host (mandatory) and metadata key (optional).
 
@@ -5010,6 +5689,7 @@ def aggregate_get_by_host(context, host, key=None):
 
 
 @require_admin_context
+@_read_only
 def aggregate_metadata_get_by_host(context, host, key=None):
     query = model_query(context, models.Aggregate)
     query = query.join("_hosts")
@@ -5029,6 +5709,7 @@ def aggregate_metadata_get_by_host(context, host, key=None):
 
 
 @require_admin_context
+@_read_only
 def aggregate_metadata_get_by_metadata_key(context, aggregate_id, key):
     query = model_query(context, models.Aggregate)
     query = query.join("_metadata")
@@ -5045,6 +5726,7 @@ def aggregate_metadata_get_by_metadata_key(context, aggregate_id, key):
 
 
 @require_admin_context
+@_read_only
 def aggregate_host_get_by_metadata_key(context, key):
     query = model_query(context, models.Aggregate)
     query = query.join("_metadata")
@@ -5114,6 +5796,7 @@ def aggregate_delete(context, aggregate_id):
 
 
 @require_admin_context
+@_read_only
 def aggregate_get_all(context):
     return _aggregate_get_query(context, models.Aggregate).all()
 
@@ -5129,6 +5812,7 @@ def _aggregate_metadata_get_query(context, aggregate_id, session=None,
 
 @require_admin_context
 @require_aggregate_exists
+@_read_only
 def aggregate_metadata_get(context, aggregate_id):
     rows = model_query(context,
                        models.AggregateMetadata).\
@@ -5200,6 +5884,7 @@ def aggregate_metadata_add(context, aggregate_id, metadata, set_delete=False,
 
 @require_admin_context
 @require_aggregate_exists
+@_read_only
 def aggregate_host_get_all(context, aggregate_id):
     rows = model_query(context,
                        models.AggregateHost).\
@@ -5246,6 +5931,7 @@ def instance_fault_create(context, values):
     return dict(fault_ref.iteritems())
 
 
+@_read_only
 def instance_fault_get_by_instance_uuids(context, instance_uuids):
     """Get all instance faults for the provided instance_uuids."""
     if not instance_uuids:
@@ -5298,6 +5984,7 @@ def action_finish(context, values):
     return action_ref
 
 
+@_read_only
 def actions_get(context, instance_uuid):
     """Get all instance actions for the provided uuid."""
     actions = model_query(context, models.InstanceAction).\
@@ -5307,6 +5994,7 @@ def actions_get(context, instance_uuid):
     return actions
 
 
+@_read_only
 def action_get_by_request_id(context, instance_uuid, request_id):
     """Get the action by request_id and given instance."""
     action = _action_get_by_request_id(context, instance_uuid, request_id)
@@ -5373,6 +6061,7 @@ def action_event_finish(context, values):
     return event_ref
 
 
+@_read_only
 def action_events_get(context, action_id):
     events = model_query(context, models.InstanceActionEvent).\
                          filter_by(action_id=action_id).\
@@ -5382,6 +6071,7 @@ def action_events_get(context, action_id):
     return events
 
 
+@_read_only
 def action_event_get_by_id(context, action_id, event_id):
     event = model_query(context, models.InstanceActionEvent).\
                         filter_by(action_id=action_id).\
@@ -5408,6 +6098,7 @@ def ec2_instance_create(context, instance_uuid, id=None):
 
 
 @require_context
+@_read_only
 def get_ec2_instance_id_by_uuid(context, instance_id):
     result = _ec2_instance_get_query(context).\
                     filter_by(uuid=instance_id).\
@@ -5420,6 +6111,7 @@ def get_ec2_instance_id_by_uuid(context, instance_id):
 
 
 @require_context
+@_read_only
 def get_instance_uuid_by_ec2_id(context, ec2_id):
     result = _ec2_instance_get_query(context).\
                     filter_by(id=ec2_id).\
@@ -5452,6 +6144,7 @@ def _task_log_get_query(context, task_name, period_beginning,
 
 
 @require_admin_context
+@_read_only
 def task_log_get(context, task_name, period_beginning, period_ending, host,
                  state=None):
     return _task_log_get_query(context, task_name, period_beginning,
@@ -5459,6 +6152,7 @@ def task_log_get(context, task_name, period_beginning, period_ending, host,
 
 
 @require_admin_context
+@_read_only
 def task_log_get_all(context, task_name, period_beginning, period_ending,
                      host=None, state=None):
     return _task_log_get_query(context, task_name, period_beginning,
@@ -5521,50 +6215,73 @@ def _get_default_deleted_value(table):
         return None
 
 
+def _archive_tables(tablename):
+    """Return the table and shadow table to archive tablename with, or None
+    if it has no shadow table.
+    """
+    engine = get_engine()
+    metadata = MetaData()
+    metadata.bind = engine
+    table = Table(tablename, metadata, autoload=True)
+    try:
+        shadow_table = Table(_SHADOW_TABLE_PREFIX + tablename, metadata,
+                             autoload=True)
+    except NoSuchTableError:
+        return None
+    return table, shadow_table
+
+
+def _archive_key(table):
+    # We have one table (dns_domains) where the key is called "domain"
+    # rather than "id"
+    if table.name.endswith('dns_domains'):
+        return table.c.domain
+    return table.c.id
+
+
 @require_admin_context
-def archive_deleted_rows_for_table(context, tablename, max_rows):
+def archive_tablenames(context):
+    """Return the names of the tables whose deleted rows can be archived,
+    the tables with foreign keys to others before them.
+    """
+    tables = reversed(models.BASE.metadata.sorted_tables)
+    return [table.name for table in tables if 'deleted' in table.c]
+
+
+@require_admin_context
+def archive_deleted_rows_for_table(context, tablename, max_rows,
+                                   deleted_before=None):
     """Move up to max_rows rows from one tables to the corresponding
-    shadow table. The context argument is only used for the decorator.
+    shadow table, lowest key first, in one transaction. The context
+    argument is only used for the decorator.
 
+    :param deleted_before: if set, only rows deleted before this time are
+                           moved.
     :returns: number of rows archived
     """
     # NOTE(guochbo): There is a circular import, nova.db.sqlalchemy.utils
     # imports nova.db.sqlalchemy.api.
     from nova.db.sqlalchemy import utils as db_utils
 
-    engine = get_engine()
-    conn = engine.connect()
-    metadata = MetaData()
-    metadata.bind = engine
-    table = Table(tablename, metadata, autoload=True)
-    default_deleted_value = _get_default_deleted_value(table)
-    shadow_tablename = _SHADOW_TABLE_PREFIX + tablename
+    tables = _archive_tables(tablename)
     rows_archived = 0
-    try:
-        shadow_table = Table(shadow_tablename, metadata, autoload=True)
-    except NoSuchTableError:
+    if tables is None:
         # No corresponding shadow table; skip it.
         return rows_archived
-
-    if tablename == "dns_domains":
-        # We have one table (dns_domains) where the key is called
-        # "domain" rather than "id"
-        column = table.c.domain
-        column_name = "domain"
-    else:
-        column = table.c.id
-        column_name = "id"
+    table, shadow_table = tables
+    default_deleted_value = _get_default_deleted_value(table)
+    column = _archive_key(table)
+    where = table.c.deleted != default_deleted_value
+    if deleted_before is not None:
+        where = and_(where, table.c.deleted_at < deleted_before)
     # NOTE(guochbo): Use InsertFromSelect and DeleteFromSelect to avoid
     # database's limit of maximum parameter in one SQL statment.
-    query_insert = select([table],
-                          table.c.deleted != default_deleted_value).\
-                          order_by(column).limit(max_rows)
-    query_delete = select([column],
-                          table.c.deleted != default_deleted_value).\
-                          order_by(column).limit(max_rows)
+    query_insert = select([table], where).order_by(column).limit(max_rows)
+    query_delete = select([column], where).order_by(column).limit(max_rows)
 
     insert_statement = db_utils.InsertFromSelect(shadow_table, query_insert)
     delete_statement = db_utils.DeleteFromSelect(table, query_delete, column)
+    conn = get_engine().connect()
     try:
         # Group the insert and delete in a transaction.
         with conn.begin():
@@ -5577,6 +6294,8 @@ def archive_deleted_rows_for_table(context, tablename, max_rows):
         msg = _("IntegrityError detected when archiving table %s") % tablename
         LOG.warn(msg)
         return rows_archived
+    finally:
+        conn.close()
 
     rows_archived = result_delete.rowcount
 
@@ -5584,26 +6303,50 @@ def archive_deleted_rows_for_table(context, tablename, max_rows):
 
 
 @require_admin_context
-def archive_deleted_rows(context, max_rows=None):
+def archive_deleted_rows(context, max_rows=None, deleted_before=None):
     """Move up to max_rows rows from production tables to the corresponding
     shadow tables.
 
     :returns: Number of rows archived.
     """
     # The context argument is only used for the decorator.
-    tablenames = []
-    for model_class in models.__dict__.itervalues():
-        if hasattr(model_class, "__tablename__"):
-            tablenames.append(model_class.__tablename__)
     rows_archived = 0
-    for tablename in tablenames:
-        rows_archived += archive_deleted_rows_for_table(context, tablename,
-                                         max_rows=max_rows - rows_archived)
-        if rows_archived >= max_rows:
-            break
+    for tablename in archive_tablenames(context):
+        if max_rows is not None:
+            if rows_archived >= max_rows:
+                break
+            table_max_rows = max_rows - rows_archived
+        else:
+            table_max_rows = None
+        rows_archived += archive_deleted_rows_for_table(
+            context, tablename, max_rows=table_max_rows,
+            deleted_before=deleted_before)
     return rows_archived
 
 
+@require_admin_context
+def purge_shadow_rows_for_table(context, tablename, deleted_before,
+                                max_rows=None):
+    """Delete up to max_rows rows deleted before deleted_before from the
+    shadow table of tablename, lowest key first.
+
+    :returns: number of rows purged
+    """
+    from nova.db.sqlalchemy import utils as db_utils
+
+    tables = _archive_tables(tablename)
+    if tables is None:
+        return 0
+    shadow_table = tables[1]
+    column = _archive_key(shadow_table)
+    query_delete = select([column],
+                          shadow_table.c.deleted_at < deleted_before).\
+                          order_by(column).limit(max_rows)
+    delete_statement = db_utils.DeleteFromSelect(shadow_table, query_delete,
+                                                 column)
+    return get_engine().execute(delete_statement).rowcount
+
+
 ####################
 
 
@@ -5656,6 +6399,7 @@ def instance_group_create(context, values, policies=None, metadata=None,
     return instance_group_get(context, uuid)
 
 
+@_read_only
 def instance_group_get(context, group_uuid):
     """Get a specific group by uuid."""
     group = _instance_group_get_query(context,
@@ -5740,11 +6484,13 @@ def instance_group_delete(context, group_uuid):
                     soft_delete()
 
 
+@_read_only
 def instance_group_get_all(context):
     """Get all groups."""
     return _instance_group_get_query(context, models.InstanceGroup).all()
 
 
+@_read_only
 def instance_group_get_all_by_project_id(context, project_id):
     """Get all groups."""
     return _instance_group_get_query(context, models.InstanceGroup).\
@@ -5829,6 +6575,7 @@ def instance_group_metadata_delete(context, group_uuid, key):
                                                       metadata_key=key)
 
 
+@_read_only
 def instance_group_metadata_get(context, group_uuid):
     id = _instance_group_id(context, group_uuid)
     rows = model_query(context,
@@ -5892,6 +6639,7 @@ def instance_group_member_delete(context, group_uuid, instance_id):
                                                     instance_id=instance_id)
 
 
+@_read_only
 def instance_group_members_get(context, group_uuid):
     id = _instance_group_id(context, group_uuid)
     instances = model_query(context,
@@ -5952,6 +6700,7 @@ def instance_group_policy_delete(context, group_uuid, policy):
                                                     policy=policy)
 
 
+@_read_only
 def instance_group_policies_get(context, group_uuid):
     id = _instance_group_id(context, group_uuid)
     policies = model_query(context,
@@ -5965,6 +6714,7 @@ def instance_group_policies_get(context, group_uuid):
 
 
 @require_admin_context
+@_read_only
 def pci_device_get_by_addr(context, node_id, dev_addr):
     pci_dev_ref = model_query(context, models.PciDevice).\
                         filter_by(compute_node_id=node_id).\
@@ -5976,6 +6726,7 @@ def pci_device_get_by_addr(context, node_id, dev_addr):
 
 
 @require_admin_context
+@_read_only
 def pci_device_get_by_id(context, id):
     pci_dev_ref = model_query(context, models.PciDevice).\
                         filter_by(id=id).\
@@ -5986,6 +6737,7 @@ def pci_device_get_by_id(context, id):
 
 
 @require_admin_context
+@_read_only
 def pci_device_get_all_by_node(context, node_id):
     return model_query(context, models.PciDevice).\
                        filter_by(compute_node_id=node_id).\
@@ -5993,6 +6745,7 @@ def pci_device_get_all_by_node(context, node_id):
 
 
 @require_context
+@_read_only
 def pci_device_get_all_by_instance_uuid(context, instance_uuid):
     return model_query(context, models.PciDevice).\
                        filter_by(status='allocated').\
@@ -0,0 +1,49 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Index, MetaData, Table
+
+
+# Based on instance_get_all_by_filters, which sorts the instances by
+# (sort_key, created_at, id) and is called with sort_key created_at by the
+# API, for a project or for all the projects, excluding deleted instances.
+INDEXES = [
+    ('instances_project_id_deleted_created_at_id_idx',
+     ['project_id', 'deleted', 'created_at', 'id']),
+    ('instances_deleted_created_at_id_idx',
+     ['deleted', 'created_at', 'id']),
+]
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    instances = Table('instances', meta, autoload=True)
+    for name, columns in INDEXES:
+        index = Index(name, *[instances.c[column] for column in columns])
+        index.create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    instances = Table('instances', meta, autoload=True)
+    for name, columns in INDEXES:
+        index = Index(name, *[instances.c[column] for column in columns])
+        index.drop(migrate_engine)
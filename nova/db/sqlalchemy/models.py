@@ -180,6 +180,10 @@ class Instance(BASE, NovaBase):
               'host', 'node', 'deleted'),
         Index('instances_host_deleted_cleaned_idx',
               'host', 'deleted', 'cleaned'),
+        Index('instances_project_id_deleted_created_at_id_idx',
+              'project_id', 'deleted', 'created_at', 'id'),
+        Index('instances_deleted_created_at_id_idx',
+              'deleted', 'created_at', 'id'),
     )
     injected_files = []
 
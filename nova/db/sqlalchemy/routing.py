@@ -0,0 +1,295 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Routing of the read-only DB API calls to the slave databases.
+
+When route_reads_to_slaves is set, the DB API calls declared read-only are
+run against one of the slave databases, picked at random among those that
+answer and do not lag too far behind the main database.  A read which fails
+on a slave database is run again against the main database.  The reads of a
+request which wrote to the main database in the last slave_sticky_time
+seconds are not routed, so that the request reads its own writes.  The
+writes are only remembered by the process which made them: the other
+services handling the same request may still read from a slave database.
+
+The lag of a slave database is the time between the last service heartbeat
+recorded in the main database and the last one replicated to the slave.
+"""
+
+import collections
+import datetime
+import functools
+import random
+import threading
+
+from oslo.config import cfg
+from sqlalchemy import exc as sqla_exc
+from sqlalchemy.sql import func
+
+from nova.db.sqlalchemy import models
+from nova.openstack.common.db import exception as db_exc
+from nova.openstack.common.db.sqlalchemy import session as db_session
+from nova.openstack.common.gettextutils import _
+from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
+
+routing_opts = [
+    cfg.BoolOpt('route_reads_to_slaves',
+                default=False,
+                help='Run the read-only DB API calls against the slave '
+                     'databases, falling back to the main database when they '
+                     'fail or lag behind'),
+    cfg.ListOpt('slave_connections',
+                default=[],
+                help='SQLAlchemy connection strings of the slave databases '
+                     'the read-only DB API calls are routed to, in addition '
+                     'to slave_connection',
+                secret=True),
+    cfg.IntOpt('slave_max_lag',
+               default=30,
+               help='Seconds a slave database may lag behind the main '
+                    'database before reads are no longer routed to it. 0 '
+                    'disables the check'),
+    cfg.IntOpt('slave_check_interval',
+               default=10,
+               help='Seconds between checks of the lag of a slave database, '
+                    'and before a slave database which failed is used again'),
+    cfg.IntOpt('slave_sticky_time',
+               default=10,
+               help='Seconds after a request wrote to the main database '
+                    'during which its reads from the same process are not '
+                    'routed to the slave databases'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(routing_opts, 'database')
+CONF.import_opt('slave_connection',
+                'nova.openstack.common.db.sqlalchemy.session',
+                group='database')
+
+LOG = logging.getLogger(__name__)
+
+# The slave database the read-only call running in this thread is routed to.
+_local = threading.local()
+
+# { request_id : time of its last write }, oldest first
+_WRITES = collections.OrderedDict()
+
+_SLAVES = None
+
+
+class Slave(object):
+    """A slave database, with its lag and whether it can be read from."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.usable = False
+        self.lag = None
+        self.checked_at = None
+        self._engine = None
+        self._maker = None
+
+    def __str__(self):
+        return self.connection.rsplit('@', 1)[-1]
+
+    def get_engine(self):
+        if self._engine is None:
+            self._engine = db_session.create_engine(self.connection)
+        return self._engine
+
+    def get_session(self, autocommit=True, expire_on_commit=False):
+        if self._maker is None:
+            self._maker = db_session.get_maker(self.get_engine(), autocommit,
+                                               expire_on_commit)
+        return self._maker()
+
+    def check(self):
+        """Tell whether the slave can be read from, measuring its lag every
+        slave_check_interval seconds.
+        """
+        interval = CONF.database.slave_check_interval
+        if (self.checked_at is not None and
+                not timeutils.is_older_than(self.checked_at, interval)):
+            return self.usable
+        self.checked_at = timeutils.utcnow()
+        try:
+            self.lag = _heartbeat_lag(self.get_session())
+        except (db_exc.DBError, sqla_exc.DBAPIError) as e:
+            LOG.warn(_("Slave database %(slave)s failed: %(error)s"),
+                     {'slave': self, 'error': e})
+            self.usable = False
+            return False
+        max_lag = CONF.database.slave_max_lag
+        self.usable = max_lag <= 0 or self.lag <= max_lag
+        if not self.usable:
+            LOG.warn(_("Slave database %(slave)s lags %(lag).0f seconds "
+                       "behind, reading from the main database"),
+                     {'slave': self, 'lag': self.lag})
+        return self.usable
+
+    def failed(self):
+        """Stop reading from the slave until its next check."""
+        self.usable = False
+        self.checked_at = timeutils.utcnow()
+
+
+def _heartbeat(session):
+    return session.query(func.max(models.Service.updated_at)).scalar()
+
+
+def _heartbeat_lag(slave_session):
+    """Return the seconds the last service heartbeat replicated to a slave
+    database lags behind the last one in the main database.
+    """
+    main = _heartbeat(db_session.get_session())
+    slave = _heartbeat(slave_session)
+    if main is None:
+        return 0
+    if slave is None:
+        return float('inf')
+    return max(timeutils.delta_seconds(slave, main), 0)
+
+
+def get_slaves():
+    """Return the slave databases."""
+    global _SLAVES
+    if _SLAVES is None:
+        connections = list(CONF.database.slave_connections)
+        if CONF.database.slave_connection:
+            connections.insert(0, CONF.database.slave_connection)
+        _SLAVES = [Slave(connection) for connection in connections]
+    return _SLAVES
+
+
+def cleanup():
+    """Forget the slave databases and the recent writes."""
+    global _SLAVES
+    for slave in _SLAVES or []:
+        if slave._engine is not None:
+            slave._engine.dispose()
+    _SLAVES = None
+    _WRITES.clear()
+
+
+def _record_write(context):
+    request_id = getattr(context, 'request_id', None)
+    if request_id is None:
+        return
+    now = timeutils.utcnow()
+    _WRITES.pop(request_id, None)
+    _WRITES[request_id] = now
+    oldest = now - datetime.timedelta(
+        seconds=CONF.database.slave_sticky_time)
+    while _WRITES:
+        request_id, written_at = next(_WRITES.iteritems())
+        if written_at >= oldest:
+            break
+        del _WRITES[request_id]
+
+
+def _wrote_recently(context):
+    written_at = _WRITES.get(getattr(context, 'request_id', None))
+    return (written_at is not None and
+            not timeutils.is_older_than(written_at,
+                                        CONF.database.slave_sticky_time))
+
+
+def _choose_slave(context):
+    if _wrote_recently(context):
+        return None
+    slaves = [slave for slave in get_slaves() if slave.check()]
+    if not slaves:
+        return None
+    return random.choice(slaves)
+
+
+def _read(f, context, *args, **kwargs):
+    if getattr(_local, 'slave', None) is not None:
+        return f(context, *args, **kwargs)
+    slave = _choose_slave(context)
+    if slave is None:
+        return f(context, *args, **kwargs)
+    _local.slave = slave
+    try:
+        return f(context, *args, **kwargs)
+    except (db_exc.DBError, sqla_exc.DBAPIError) as e:
+        LOG.warn(_("Reading from slave database %(slave)s failed, reading "
+                   "from the main database: %(error)s"),
+                 {'slave': slave, 'error': e})
+        slave.failed()
+    finally:
+        _local.slave = None
+    return f(context, *args, **kwargs)
+
+
+def _write(f, *args, **kwargs):
+    try:
+        return f(*args, **kwargs)
+    finally:
+        _record_write(args[0] if args else kwargs.get('context'))
+
+
+def get_session(**kwargs):
+    """Return a session of the slave database the current read-only call
+    is routed to, or else of the main database.
+    """
+    slave = getattr(_local, 'slave', None)
+    if slave is None:
+        return db_session.get_session(**kwargs)
+    return slave.get_session(kwargs.get('autocommit', True),
+                             kwargs.get('expire_on_commit', False))
+
+
+def get_engine(**kwargs):
+    """Return the engine of the slave database the current read-only call
+    is routed to, or else of the main database.
+    """
+    slave = getattr(_local, 'slave', None)
+    if slave is None:
+        return db_session.get_engine(**kwargs)
+    return slave.get_engine()
+
+
+def read_only(f):
+    """Decorator declaring a DB API call which only reads, and can be
+    routed to a slave database.
+    """
+    f.read_only = True
+    return f
+
+
+class Router(object):
+    """DB API backend routing the calls of another one."""
+
+    def __init__(self, backend):
+        self._backend = backend
+
+    def __getattr__(self, key):
+        attr = getattr(self._backend, key)
+        if not CONF.database.route_reads_to_slaves or not callable(attr):
+            return attr
+        # NOTE: DBAPI updates its tpool wrappers from these, which
+        # functools.partial objects lack the attributes for.
+        if getattr(attr, 'read_only', False):
+            @functools.wraps(attr)
+            def wrapper(*args, **kwargs):
+                return _read(attr, *args, **kwargs)
+        else:
+            @functools.wraps(attr)
+            def wrapper(*args, **kwargs):
+                return _write(attr, *args, **kwargs)
+        return wrapper
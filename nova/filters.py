@@ -17,6 +17,8 @@
 Filter support
 """
 
+import time
+
 from nova import loadables
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
@@ -47,6 +49,17 @@ class BaseFilter(object):
     # for each request rather than for each instance
     run_filter_once_per_request = False
 
+    # Set to true in a subclass if whether an object passes the filter
+    # can change when another object is chosen for an earlier instance
+    # of the request.  Subclasses overriding filter_all() to compare
+    # objects with each other should set it too.
+    depends_on_other_objects = False
+
+    # Names of the filter classes which must run before this one when they
+    # are enabled and the filters are ordered by cost, for filters relying
+    # on something those set or too costly to run on what those eliminate.
+    run_after = ()
+
     def run_filter_for_index(self, index):
         """Return True if the filter needs to be run for the "index-th"
         instance in a request.  Only need to override this if a filter
@@ -64,8 +77,94 @@ class BaseFilterHandler(loadables.BaseLoader):
     This class should be subclassed where one needs to use filters.
     """
 
+    # Set to true in a subclass to run the filters in the order expected
+    # to be the cheapest, going by their cost and selectivity in earlier
+    # runs, rather than in the order they are given.
+    auto_order_filters = False
+
+    # Weight of the latest run in the running averages of filter costs
+    filter_cost_decay = 0.2
+
+    def __init__(self, loadable_cls_type):
+        super(BaseFilterHandler, self).__init__(loadable_cls_type)
+        # { filter name : [seconds per object, fraction of objects kept] }
+        self.filter_costs = {}
+
+    def filter_ran(self, cls_name, num_in, num_out, seconds,
+                   filter_properties):
+        """Called after each filter ran, with the number of objects it
+        was given and kept and the time it took.  Subclasses overriding
+        this to collect statistics should call it too, to keep the
+        running averages used to order the filters.
+        """
+        if not num_in:
+            return
+        seconds_per_obj = seconds / num_in
+        kept = float(num_out) / num_in
+        cost = self.filter_costs.get(cls_name)
+        if cost is None:
+            self.filter_costs[cls_name] = [seconds_per_obj, kept]
+        else:
+            cost[0] += self.filter_cost_decay * (seconds_per_obj - cost[0])
+            cost[1] += self.filter_cost_decay * (kept - cost[1])
+
+    def _filter_rank(self, filter_cls):
+        cost = self.filter_costs.get(filter_cls.__name__)
+        if cost is None:
+            # Not run yet: run it early to learn what it costs.
+            return -1.0
+        seconds_per_obj, kept = cost
+        if kept >= 1.0:
+            return float('inf')
+        # Seconds spent per object eliminated
+        return seconds_per_obj / (1.0 - kept)
+
+    def _order_independent_filters(self, filter_classes):
+        pending = sorted(filter_classes, key=self._filter_rank)
+        pending_names = set(cls.__name__ for cls in pending)
+        ordered = []
+        while pending:
+            for i, filter_cls in enumerate(pending):
+                if not pending_names.intersection(filter_cls.run_after):
+                    break
+            else:
+                # Dependency loop: take the cheapest one.
+                i = 0
+            filter_cls = pending.pop(i)
+            pending_names.discard(filter_cls.__name__)
+            ordered.append(filter_cls)
+        return ordered
+
+    def order_filters(self, filter_classes):
+        """Return the filter classes cheapest and most selective first.
+
+        Filters are sorted by increasing time spent per object eliminated
+        in their previous runs, which is the cheapest order for filters
+        deciding on each object independently.  Filters which did not run
+        yet come first, in the order given.  A filter setting
+        depends_on_other_objects stays where it is, and no filter moves
+        across it.  A filter stays after the filters named in its
+        run_after.
+        """
+        ordered = []
+        independent = []
+        for filter_cls in filter_classes:
+            if filter_cls.depends_on_other_objects:
+                ordered.extend(self._order_independent_filters(independent))
+                ordered.append(filter_cls)
+                independent = []
+            else:
+                independent.append(filter_cls)
+        ordered.extend(self._order_independent_filters(independent))
+        if ordered != list(filter_classes):
+            LOG.debug(_("Running filters in the order %s"),
+                      ', '.join(cls.__name__ for cls in ordered))
+        return ordered
+
     def get_filtered_objects(self, filter_classes, objs,
             filter_properties, index=0):
+        if self.auto_order_filters:
+            filter_classes = self.order_filters(filter_classes)
         list_objs = list(objs)
         LOG.debug(_("Starting with %d host(s)"), len(list_objs))
         for filter_cls in filter_classes:
@@ -73,6 +172,8 @@ class BaseFilterHandler(loadables.BaseLoader):
             filter = filter_cls()
 
             if filter.run_filter_for_index(index):
+                start = time.time()
+                num_objs = len(list_objs)
                 objs = filter.filter_all(list_objs,
                                                filter_properties)
                 if objs is None:
@@ -80,10 +181,16 @@ class BaseFilterHandler(loadables.BaseLoader):
                           {'cls_name': cls_name})
                     return
                 list_objs = list(objs)
+                elapsed = time.time() - start
+                self.filter_ran(cls_name, num_objs, len(list_objs), elapsed,
+                                filter_properties)
                 if not list_objs:
-                    LOG.info(_("Filter %s returned 0 hosts"), cls_name)
+                    LOG.info(_("Filter %(cls_name)s returned 0 hosts in "
+                               "%(elapsed).4f seconds"),
+                             {'cls_name': cls_name, 'elapsed': elapsed})
                     break
                 LOG.debug(_("Filter %(cls_name)s returned "
-                            "%(obj_len)d host(s)"),
-                          {'cls_name': cls_name, 'obj_len': len(list_objs)})
+                            "%(obj_len)d host(s) in %(elapsed).4f seconds"),
+                          {'cls_name': cls_name, 'obj_len': len(list_objs),
+                           'elapsed': elapsed})
         return list_objs
@@ -17,6 +17,7 @@
 import collections
 import copy
 import functools
+import weakref
 
 import six
 
@@ -32,6 +33,12 @@ from nova.openstack.common import versionutils
 
 LOG = logging.getLogger('object')
 
+# Lazy-loads of the objects of lists done at once for all the objects of a
+# list, by list class name: the bulk loads, the objects they loaded, and
+# the lazy-loads of single objects they replaced
+bulk_load_counters = collections.defaultdict(
+    lambda: dict(bulk_loads=0, objects=0, coalesced=0))
+
 
 class NotSpecifiedSentinel:
     pass
@@ -60,7 +67,7 @@ def make_class_properties(cls):
         def getter(self, name=name):
             attrname = get_attrname(name)
             if not hasattr(self, attrname):
-                self.obj_load_attr(name)
+                self._obj_lazy_load(name)
             return getattr(self, attrname)
 
         def setter(self, value, name=name, field=field):
@@ -180,6 +187,10 @@ class NovaObject(object):
     fields = {}
     obj_extra_fields = []
 
+    # A weak reference to the list this object was last taken from, if the
+    # list can lazy-load an attribute for all its objects at once
+    _obj_list_ref = None
+
     def __init__(self, context=None, **kwargs):
         self._changed_fields = set()
         self._context = context
@@ -305,6 +316,19 @@ class NovaObject(object):
         raise NotImplementedError(
             _("Cannot load '%s' in the base class") % attrname)
 
+    def _obj_lazy_load(self, attrname):
+        """Load a missing attribute on first use.
+
+        If this object was taken from a list which can load the attribute
+        for all its objects at once, it is loaded that way, otherwise with
+        obj_load_attr().
+        """
+        obj_list = self._obj_list_ref and self._obj_list_ref()
+        if obj_list is not None:
+            obj_list.obj_load_objects_attr(attrname)
+        if not hasattr(self, get_attrname(attrname)):
+            self.obj_load_attr(attrname)
+
     def save(self, context):
         """Save the changed fields back to the store.
 
@@ -434,9 +458,54 @@ class ObjectListBase(object):
         'objects': fields.ListOfObjectsField('NovaObject'),
         }
 
+    # Whether _obj_load_objects_attr() can lazy-load an attribute for all
+    # the objects of the list at once
+    obj_bulk_lazy_load = False
+
+    def _obj_track(self, obj):
+        """Note that obj was taken from this list, so that its missing
+        attributes are loaded for all the objects of the list at once.
+        """
+        if self.obj_bulk_lazy_load and isinstance(obj, NovaObject):
+            obj._obj_list_ref = weakref.ref(self)
+        return obj
+
+    def obj_load_objects_attr(self, attrname):
+        """Lazy-load an attribute for all the objects of the list which
+        do not have it, with a single call.
+
+        This is a no-op unless more than one object misses the attribute,
+        or if _obj_load_objects_attr() cannot load it, in which case each
+        object loads it on its own.
+        """
+        objects = [obj for obj in self.objects
+                   if not obj.obj_attr_is_set(attrname)]
+        if len(objects) < 2:
+            return
+        if not self._obj_load_objects_attr(objects, attrname):
+            return
+        counters = bulk_load_counters[self.obj_name()]
+        counters['bulk_loads'] += 1
+        counters['objects'] += len(objects)
+        counters['coalesced'] += len(objects) - 1
+        LOG.debug(_("Lazy-loaded %(attrname)s for %(count)d objects of "
+                    "%(objname)s at once"),
+                  {'attrname': attrname, 'count': len(objects),
+                   'objname': self.obj_name()})
+
+    def _obj_load_objects_attr(self, objects, attrname):
+        """Load attrname for the given objects of the list, and return
+        True, or return False if it cannot be loaded that way.
+
+        Lists setting obj_bulk_lazy_load implement this.
+        """
+        return False
+
     def __iter__(self):
         """List iterator interface."""
-        return iter(self.objects)
+        if not self.obj_bulk_lazy_load:
+            return iter(self.objects)
+        return (self._obj_track(obj) for obj in self.objects)
 
     def __len__(self):
         """List length."""
@@ -451,7 +520,7 @@ class ObjectListBase(object):
             new_obj.obj_reset_changes()
             new_obj._context = self._context
             return new_obj
-        return self.objects[index]
+        return self._obj_track(self.objects[index])
 
     def __contains__(self, value):
         """List membership test."""
@@ -38,6 +38,10 @@ LOG = logging.getLogger(__name__)
 _INSTANCE_OPTIONAL_JOINED_FIELDS = ['metadata', 'system_metadata',
                                     'info_cache', 'security_groups',
                                     'pci_devices']
+# Joined fields which the DB layer reads with separate queries, and so can
+# also be read along with only some columns of the instances
+_INSTANCE_OPTIONAL_SEPARATE_FIELDS = ['metadata', 'system_metadata',
+                                      'pci_devices']
 # These are fields that are optional but don't translate to db columns
 _INSTANCE_OPTIONAL_NON_COLUMN_FIELDS = ['fault']
 
@@ -206,10 +210,13 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
         return base_name
 
     @staticmethod
-    def _from_db_object(context, instance, db_inst, expected_attrs=None):
+    def _from_db_object(context, instance, db_inst, expected_attrs=None,
+                        columns=None):
         """Method to help with migration to objects.
 
-        Converts a database entity to a formal object.
+        Converts a database entity to a formal object.  If columns is
+        given, db_inst is a dict of only some of the columns, and the other
+        fields are left unset.
         """
         if expected_attrs is None:
             expected_attrs = []
@@ -217,6 +224,8 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
         for field in instance.fields:
             if field in INSTANCE_OPTIONAL_ATTRS:
                 continue
+            elif columns is not None and field not in db_inst:
+                continue
             elif field == 'deleted':
                 instance.deleted = db_inst['deleted'] == db_inst['id']
             elif field == 'cleaned':
@@ -442,8 +451,30 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
                 self[field] = current[field]
         self.obj_reset_changes()
 
+    def _set_loaded_attr(self, attrname, value):
+        """Set a lazy-loaded attribute, which is not a change."""
+        self[attrname] = value
+        self._changed_fields.discard(attrname)
+        if attrname == 'metadata':
+            self._orig_metadata = dict(value)
+        elif attrname == 'system_metadata':
+            self._orig_system_metadata = dict(value)
+
+    def _is_lazy_column(self, attrname):
+        # Columns may be missing from instances read with only some of
+        # their columns.
+        return (attrname in self.fields and
+                attrname not in INSTANCE_OPTIONAL_ATTRS and
+                self.obj_attr_is_set('id'))
+
+    def _is_lazy_loadable(self, attrname):
+        return (self._context is not None and
+                (attrname in INSTANCE_OPTIONAL_ATTRS or
+                 self._is_lazy_column(attrname)))
+
     def obj_load_attr(self, attrname):
-        if attrname not in INSTANCE_OPTIONAL_ATTRS:
+        is_column = self._is_lazy_column(attrname)
+        if attrname not in INSTANCE_OPTIONAL_ATTRS and not is_column:
             raise exception.ObjectActionError(
                 action='obj_load_attr',
                 reason='attribute %s not lazy-loadable' % attrname)
@@ -456,6 +487,12 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
                    'name': self.obj_name(),
                    'uuid': self.uuid,
                    })
+        if is_column:
+            _load_instances_attr(self._context, [self], attrname)
+            if not self.obj_attr_is_set(attrname):
+                raise exception.InstanceNotFound(instance_id=self.uuid)
+            return
+
         # FIXME(comstud): This should be optimized to only load the attr.
         instance = self.__class__.get_by_uuid(self._context,
                                               uuid=self.uuid,
@@ -463,14 +500,28 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
 
         # NOTE(danms): Never allow us to recursively-load
         if instance.obj_attr_is_set(attrname):
-            self[attrname] = instance[attrname]
+            self._set_loaded_attr(attrname, instance[attrname])
         else:
             raise exception.ObjectActionError(
                 action='obj_load_attr',
                 reason='loading %s requires recursion' % attrname)
 
 
-def _make_instance_list(context, inst_list, db_inst_list, expected_attrs):
+def _load_instances_attr(context, instances, attrname):
+    """Lazy-load an attribute of some instances with a single call.
+
+    The instances which no longer exist are left without the attribute.
+    """
+    loaded = InstanceList.get_attr_by_uuids(
+            context, [inst.uuid for inst in instances], attrname)
+    values = dict((inst.uuid, inst[attrname]) for inst in loaded.objects)
+    for inst in instances:
+        if inst.uuid in values:
+            inst._set_loaded_attr(attrname, values[inst.uuid])
+
+
+def _make_instance_list(context, inst_list, db_inst_list, expected_attrs,
+                        columns=None):
     get_fault = expected_attrs and 'fault' in expected_attrs
     inst_faults = {}
     if get_fault:
@@ -483,43 +534,82 @@ def _make_instance_list(context, inst_list, db_inst_list, expected_attrs):
             if fault.instance_uuid not in inst_faults:
                 inst_faults[fault.instance_uuid] = fault
 
+    load_attrs = []
+    if columns is not None and expected_attrs:
+        # The joined fields not read along with the columns are loaded
+        # for all the instances at once below.
+        load_attrs = [attr for attr in _INSTANCE_OPTIONAL_JOINED_FIELDS
+                      if (attr in expected_attrs and
+                          attr not in _INSTANCE_OPTIONAL_SEPARATE_FIELDS)]
+        expected_attrs = [attr for attr in expected_attrs
+                          if attr not in load_attrs]
+
     inst_list.objects = []
     for db_inst in db_inst_list:
         inst_obj = Instance._from_db_object(context, Instance(), db_inst,
-                                            expected_attrs=expected_attrs)
+                                            expected_attrs=expected_attrs,
+                                            columns=columns)
         if get_fault:
             inst_obj.fault = inst_faults.get(inst_obj.uuid, None)
         inst_list.objects.append(inst_obj)
+
+    if load_attrs and inst_list.objects:
+        for attr in load_attrs:
+            _load_instances_attr(context, inst_list.objects, attr)
     inst_list.obj_reset_changes()
     return inst_list
 
 
+def _columns_to_join(expected_attrs, columns):
+    """Return the columns to join when reading instances, only reading
+    the expected ones when only some columns are read.
+    """
+    columns_to_join = _expected_cols(expected_attrs)
+    if columns is not None and columns_to_join is None:
+        columns_to_join = []
+    return columns_to_join
+
+
 class InstanceList(base.ObjectListBase, base.NovaObject):
     # Version 1.0: Initial version
     # Version 1.1: Added use_slave to get_by_host
-    VERSION = '1.1'
+    # Version 1.2: Added columns to get_by_filters and get_by_host
+    # Version 1.3: Added get_attr_by_uuids
+    # Version 1.4: Added get_statistics_by_host_and_node
+    VERSION = '1.4'
 
     fields = {
         'objects': fields.ListOfObjectsField('Instance'),
     }
 
+    # A missing attribute of an instance taken from the list is loaded for
+    # all the instances of the list at once
+    obj_bulk_lazy_load = True
+
+    # NOTE: If columns is given, only these columns of the instances are
+    # read, with their id and uuid, and their other fields are lazy-loaded
+    # for all the instances of the list at once when first used.
+
     @base.remotable_classmethod
     def get_by_filters(cls, context, filters,
                        sort_key='created_at', sort_dir='desc', limit=None,
-                       marker=None, expected_attrs=None):
+                       marker=None, expected_attrs=None, columns=None):
         db_inst_list = db.instance_get_all_by_filters(
             context, filters, sort_key, sort_dir, limit=limit, marker=marker,
-            columns_to_join=_expected_cols(expected_attrs))
+            columns_to_join=_columns_to_join(expected_attrs, columns),
+            columns=columns)
         return _make_instance_list(context, cls(), db_inst_list,
-                                   expected_attrs)
+                                   expected_attrs, columns=columns)
 
     @base.remotable_classmethod
-    def get_by_host(cls, context, host, expected_attrs=None, use_slave=False):
+    def get_by_host(cls, context, host, expected_attrs=None, use_slave=False,
+                    columns=None):
         db_inst_list = db.instance_get_all_by_host(
-            context, host, columns_to_join=_expected_cols(expected_attrs),
-            use_slave=use_slave)
+            context, host,
+            columns_to_join=_columns_to_join(expected_attrs, columns),
+            use_slave=use_slave, columns=columns)
         return _make_instance_list(context, cls(), db_inst_list,
-                                   expected_attrs)
+                                   expected_attrs, columns=columns)
 
     @base.remotable_classmethod
     def get_by_host_and_node(cls, context, host, node, expected_attrs=None):
@@ -528,6 +618,13 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
         return _make_instance_list(context, cls(), db_inst_list,
                                    expected_attrs)
 
+    @base.remotable_classmethod
+    def get_statistics_by_host_and_node(cls, context, host, node):
+        """Return the count of the instances of a node, and their vcpus,
+        memory_mb, root_gb and ephemeral_gb summed up.
+        """
+        return db.instance_statistics_by_host_and_node(context, host, node)
+
     @base.remotable_classmethod
     def get_by_host_and_not_type(cls, context, host, type_id=None,
                                  expected_attrs=None):
@@ -557,6 +654,51 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
     def get_by_security_group(cls, context, security_group):
         return cls.get_by_security_group_id(context, security_group.id)
 
+    @base.remotable_classmethod
+    def get_attr_by_uuids(cls, context, uuids, attrname):
+        """Return the instances with the given uuids, with only their uuid
+        and the lazy-loadable attribute attrname set.
+        """
+        inst_list = cls()
+        inst_list.objects = []
+        if attrname == 'fault':
+            # Keep the latest fault of each instance
+            faults = {}
+            fault_list = instance_fault.InstanceFaultList
+            for fault in fault_list.get_by_instance_uuids(context, uuids):
+                faults.setdefault(fault.instance_uuid, fault)
+            for uuid in uuids:
+                inst_obj = Instance(uuid=uuid, fault=faults.get(uuid))
+                inst_obj._context = context
+                inst_list.objects.append(inst_obj)
+            inst_list.obj_reset_changes()
+            return inst_list
+
+        if attrname in _INSTANCE_OPTIONAL_JOINED_FIELDS:
+            expected_attrs = [attrname]
+            columns = None
+            if attrname in _INSTANCE_OPTIONAL_SEPARATE_FIELDS:
+                columns = []
+        else:
+            expected_attrs = []
+            columns = [attrname]
+        db_inst_list = db.instance_get_all_by_filters(
+                context, {'uuid': uuids}, columns_to_join=expected_attrs,
+                columns=columns)
+        for db_inst in db_inst_list:
+            inst_obj = Instance._from_db_object(context, Instance(), db_inst,
+                                                expected_attrs,
+                                                columns=columns)
+            inst_list.objects.append(inst_obj)
+        inst_list.obj_reset_changes()
+        return inst_list
+
+    def _obj_load_objects_attr(self, objects, attrname):
+        if not all(inst._is_lazy_loadable(attrname) for inst in objects):
+            return False
+        _load_instances_attr(objects[0]._context, objects, attrname)
+        return True
+
     def fill_faults(self):
         """Batch query the database for our instances' faults.
 
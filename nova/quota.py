@@ -23,6 +23,7 @@ import datetime
 from oslo.config import cfg
 import six
 
+from nova import context as nova_context
 from nova import db
 from nova import exception
 from nova.openstack.common.gettextutils import _
@@ -81,19 +82,131 @@ quota_opts = [
                help='number of seconds between subsequent usage refreshes'),
     cfg.StrOpt('quota_driver',
                default='nova.quota.DbQuotaDriver',
-               help='default driver to use for quota checks'),
+               help='default driver to use for quota checks. '
+                    'nova.quota.ConditionalDbQuotaDriver reserves resources '
+                    'with conditional updates of the usages rather than '
+                    'locking them'),
+    cfg.IntOpt('quota_limits_cache_ttl',
+               default=0,
+               help='Number of seconds the database quota driver keeps the '
+                    'quota limits of projects, users and quota classes in '
+                    'memory. They are dropped earlier when changed through '
+                    'the API of the same process. 0 disables the cache'),
     ]
 
 CONF = cfg.CONF
 CONF.register_opts(quota_opts)
 
 
+class _LimitsCache(object):
+    """Quota limits read from the database, kept for
+    quota_limits_cache_ttl seconds, with counts of the lookups served from
+    memory and from the database.
+    """
+
+    def __init__(self):
+        # { key : (time loaded, limits) }, where key is ('default',),
+        # ('class', quota_class), ('project', project_id) or
+        # ('user', project_id, user_id)
+        self._limits = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, load, authorize=None):
+        """Return a copy of the limits cached under key, calling load() to
+        read them if they are missing or too old.  authorize() is called
+        before returning cached limits, to check access as load() does.
+        """
+        ttl = CONF.quota_limits_cache_ttl
+        if ttl <= 0:
+            return load()
+        entry = self._limits.get(key)
+        if entry is not None and not timeutils.is_older_than(entry[0], ttl):
+            if authorize is not None:
+                authorize()
+            self.hits += 1
+        else:
+            self.misses += 1
+            entry = self._limits[key] = (timeutils.utcnow(), load())
+            LOG.debug(_("Loaded quota limits %(key)s, cache hit rate "
+                        "%(rate).1f%% (%(hits)d hits, %(misses)d misses)"),
+                      dict(self.stats(), key=key))
+        return dict(entry[1])
+
+    def invalidate(self, project_id=None, user_id=None, quota_class=None):
+        """Drop the limits of a project and its users, of a user, or of a
+        quota class, or all of them if nothing is given.
+        """
+        if project_id is None and quota_class is None:
+            self._limits.clear()
+            return
+        for key in self._limits.keys():
+            if quota_class is not None:
+                drop = (key == ('class', quota_class) or
+                        (key == ('default',) and
+                         quota_class == 'default'))
+            elif user_id is not None:
+                drop = key == ('user', project_id, user_id)
+            else:
+                drop = key[0] in ('project', 'user') and key[1] == project_id
+            if drop:
+                del self._limits[key]
+
+    def stats(self):
+        """Return the hits, misses and hit rate in percent."""
+        lookups = self.hits + self.misses
+        return dict(hits=self.hits, misses=self.misses,
+                    rate=100.0 * self.hits / lookups if lookups else 0.0)
+
+
 class DbQuotaDriver(object):
     """
     Driver to perform necessary checks to enforce quotas and obtain
     quota information.  The default driver utilizes the local
     database.
     """
+
+    def __init__(self):
+        self._limits_cache = _LimitsCache()
+
+    def _get_default_limits(self, context):
+        return self._limits_cache.get(
+            ('default',), lambda: db.quota_class_get_default(context))
+
+    def _get_class_limits(self, context, quota_class):
+        return self._limits_cache.get(
+            ('class', quota_class),
+            lambda: db.quota_class_get_all_by_name(context, quota_class),
+            lambda: nova_context.authorize_quota_class_context(context,
+                                                               quota_class))
+
+    def _get_project_limits(self, context, project_id):
+        return self._limits_cache.get(
+            ('project', project_id),
+            lambda: db.quota_get_all_by_project(context, project_id),
+            lambda: nova_context.authorize_project_context(context,
+                                                           project_id))
+
+    def _get_user_limits(self, context, project_id, user_id):
+        return self._limits_cache.get(
+            ('user', project_id, user_id),
+            lambda: db.quota_get_all_by_project_and_user(context, project_id,
+                                                         user_id),
+            lambda: nova_context.authorize_project_context(context,
+                                                           project_id))
+
+    def limits_changed(self, project_id=None, user_id=None,
+                       quota_class=None):
+        """Drop the cached limits of a project and its users, of a user,
+        or of a quota class, or all of them if nothing is given.
+        """
+        self._limits_cache.invalidate(project_id=project_id, user_id=user_id,
+                                      quota_class=quota_class)
+
+    def get_limits_cache_stats(self):
+        """Return the hits, misses and hit rate of the limits cache."""
+        return self._limits_cache.stats()
+
     def get_by_project_and_user(self, context, project_id, user_id, resource):
         """Get a specific quota by project and user."""
 
@@ -119,7 +232,7 @@ class DbQuotaDriver(object):
         """
 
         quotas = {}
-        default_quotas = db.quota_class_get_default(context)
+        default_quotas = self._get_default_limits(context)
         for resource in resources.values():
             quotas[resource.name] = default_quotas.get(resource.name,
                                                        resource.default)
@@ -142,7 +255,7 @@ class DbQuotaDriver(object):
         """
 
         quotas = {}
-        class_quotas = db.quota_class_get_all_by_name(context, quota_class)
+        class_quotas = self._get_class_limits(context, quota_class)
         for resource in resources.values():
             if defaults or resource.name in class_quotas:
                 quotas[resource.name] = class_quotas.get(resource.name,
@@ -161,7 +274,7 @@ class DbQuotaDriver(object):
         if project_id == context.project_id:
             quota_class = context.quota_class
         if quota_class:
-            class_quotas = db.quota_class_get_all_by_name(context, quota_class)
+            class_quotas = self._get_class_limits(context, quota_class)
         else:
             class_quotas = {}
 
@@ -221,10 +334,9 @@ class DbQuotaDriver(object):
         :param usages: If True, the current in_use and reserved counts
                        will also be returned.
         """
-        user_quotas = db.quota_get_all_by_project_and_user(context,
-                                                           project_id, user_id)
+        user_quotas = self._get_user_limits(context, project_id, user_id)
         # Use the project quota for default user quota.
-        proj_quotas = db.quota_get_all_by_project(context, project_id)
+        proj_quotas = self._get_project_limits(context, project_id)
         for key, value in proj_quotas.iteritems():
             if key not in user_quotas.keys():
                 user_quotas[key] = value
@@ -261,7 +373,7 @@ class DbQuotaDriver(object):
         :param remains: If True, the current remains of the project will
                         will be returned.
         """
-        project_quotas = db.quota_get_all_by_project(context, project_id)
+        project_quotas = self._get_project_limits(context, project_id)
         project_usages = None
         if usages:
             project_usages = db.quota_usage_get_all_by_project(context,
@@ -494,10 +606,13 @@ class DbQuotaDriver(object):
         #            which means access to the session.  Since the
         #            session isn't available outside the DBAPI, we
         #            have to do the work there.
-        return db.quota_reserve(context, resources, quotas, user_quotas,
-                                deltas, expire,
-                                CONF.until_refresh, CONF.max_age,
-                                project_id=project_id, user_id=user_id)
+        return self._quota_reserve(context, resources, quotas, user_quotas,
+                                   deltas, expire,
+                                   CONF.until_refresh, CONF.max_age,
+                                   project_id=project_id, user_id=user_id)
+
+    def _quota_reserve(self, *args, **kwargs):
+        return db.quota_reserve(*args, **kwargs)
 
     def commit(self, context, reservations, project_id=None, user_id=None):
         """Commit reservations.
@@ -519,8 +634,11 @@ class DbQuotaDriver(object):
         if user_id is None:
             user_id = context.user_id
 
-        db.reservation_commit(context, reservations, project_id=project_id,
-                              user_id=user_id)
+        self._reservation_commit(context, reservations,
+                                 project_id=project_id, user_id=user_id)
+
+    def _reservation_commit(self, *args, **kwargs):
+        db.reservation_commit(*args, **kwargs)
 
     def rollback(self, context, reservations, project_id=None, user_id=None):
         """Roll back reservations.
@@ -542,8 +660,11 @@ class DbQuotaDriver(object):
         if user_id is None:
             user_id = context.user_id
 
-        db.reservation_rollback(context, reservations, project_id=project_id,
-                                user_id=user_id)
+        self._reservation_rollback(context, reservations,
+                                   project_id=project_id, user_id=user_id)
+
+    def _reservation_rollback(self, *args, **kwargs):
+        db.reservation_rollback(*args, **kwargs)
 
     def usage_reset(self, context, resources):
         """
@@ -586,6 +707,7 @@ class DbQuotaDriver(object):
         """
 
         db.quota_destroy_all_by_project_and_user(context, project_id, user_id)
+        self.limits_changed(project_id=project_id, user_id=user_id)
 
     def destroy_all_by_project(self, context, project_id):
         """
@@ -597,6 +719,7 @@ class DbQuotaDriver(object):
         """
 
         db.quota_destroy_all_by_project(context, project_id)
+        self.limits_changed(project_id=project_id)
 
     def expire(self, context):
         """Expire reservations.
@@ -610,6 +733,38 @@ class DbQuotaDriver(object):
         db.reservation_expire(context)
 
 
+class ConditionalDbQuotaDriver(DbQuotaDriver):
+    """
+    Driver keeping the quota usages in the local database like
+    DbQuotaDriver, but reserving resources with conditional updates of
+    the usages instead of locking all the usages of the project.  This
+    spares the bursts of reservations in a single project from waiting
+    on each other and from deadlocks.
+
+    The usages must not be changed by DbQuotaDriver at the same time.
+    """
+
+    def _quota_reserve(self, *args, **kwargs):
+        return db.quota_reserve_conditional(*args, **kwargs)
+
+    def _reservation_commit(self, *args, **kwargs):
+        db.reservation_commit_conditional(*args, **kwargs)
+
+    def _reservation_rollback(self, *args, **kwargs):
+        db.reservation_rollback_conditional(*args, **kwargs)
+
+    def expire(self, context):
+        """Expire reservations.
+
+        Explores all currently existing reservations and rolls back
+        any that have expired.
+
+        :param context: The request context, for access checks.
+        """
+
+        db.reservation_expire_conditional(context)
+
+
 class NoopQuotaDriver(object):
     """Driver that turns quotas calls into no-ops and pretends that quotas
     for all resources are unlimited.  This can be used if you do not
@@ -889,6 +1044,15 @@ class NoopQuotaDriver(object):
         """
         pass
 
+    def limits_changed(self, project_id=None, user_id=None,
+                       quota_class=None):
+        """Drop the cached limits of a project, a user or a quota class."""
+        pass
+
+    def get_limits_cache_stats(self):
+        """Return the hits, misses and hit rate of the limits cache."""
+        return dict(hits=0, misses=0, rate=0.0)
+
 
 class BaseResource(object):
     """Describe a single resource for quota checking."""
@@ -1374,6 +1538,32 @@ class QuotaEngine(object):
 
         self._driver.expire(context)
 
+    def limits_changed(self, project_id=None, user_id=None,
+                       quota_class=None):
+        """Drop the limits the driver caches, after quotas were set.
+
+        :param project_id: The project whose quotas, or the quotas of one
+                           of whose users, were set.
+        :param user_id: The user whose quotas were set.
+        :param quota_class: The quota class whose quotas were set.
+        """
+
+        # NOTE: Out-of-tree quota drivers may not cache limits at all.
+        limits_changed = getattr(self._driver, 'limits_changed', None)
+        if limits_changed is not None:
+            limits_changed(project_id=project_id, user_id=user_id,
+                           quota_class=quota_class)
+
+    def get_limits_cache_stats(self):
+        """Return the hits, misses and hit rate of the driver's limits
+        cache, all zero if the driver has no such cache.
+        """
+
+        get_stats = getattr(self._driver, 'get_limits_cache_stats', None)
+        if get_stats is None:
+            return dict(hits=0, misses=0, rate=0.0)
+        return get_stats()
+
     @property
     def resources(self):
         return sorted(self._resources.keys())
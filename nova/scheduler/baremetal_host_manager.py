@@ -29,6 +29,7 @@ class BaremetalNodeState(host_manager.HostState):
 
     def update_from_compute_node(self, compute):
         """Update information about a host from its compute_node info."""
+        self.generation += 1
         all_ram_mb = compute['memory_mb']
 
         free_disk_mb = compute['free_disk_gb'] * 1024
@@ -41,6 +42,7 @@ class BaremetalNodeState(host_manager.HostState):
         self.vcpus_used = compute['vcpus_used']
 
     def consume_from_instance(self, instance):
+        self.generation += 1
         self.free_ram_mb = 0
         self.free_disk_mb = 0
         self.vcpus_used = self.vcpus_total
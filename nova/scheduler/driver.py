@@ -111,6 +111,10 @@ class Scheduler(object):
         self.host_manager.update_service_capabilities(service_name,
                 host, capabilities)
 
+    def aggregates_changed(self):
+        """Process a notification that host aggregates were changed."""
+        self.host_manager.aggregates_changed()
+
     def hosts_up(self, context, topic):
         """Return the list of hosts that have a running service for topic."""
 
@@ -19,6 +19,7 @@ You can customize this scheduler by specifying your own Host Filters and
 Weighing Functions.
 """
 
+import heapq
 import random
 
 from oslo.config import cfg
@@ -31,7 +32,9 @@ from nova.openstack.common import log as logging
 from nova.pci import pci_request
 from nova.scheduler import driver
 from nova.scheduler import scheduler_options
+from nova.scheduler import stats as scheduler_stats
 from nova.scheduler import utils as scheduler_utils
+from nova.scheduler import weights
 
 
 CONF = cfg.CONF
@@ -47,7 +50,25 @@ filter_scheduler_opts = [
                     'chosen from. A value of 1 chooses the '
                     'first host returned by the weighing functions. '
                     'This value must be at least 1. Any value less than 1 '
-                    'will be ignored, and 1 will be used instead')
+                    'will be ignored, and 1 will be used instead'),
+    cfg.BoolOpt('scheduler_batch_placement',
+                default=False,
+                help='When a request is for several instances, filter and '
+                     'weigh all the hosts only for the first instance, '
+                     'then only re-check the host chosen for each '
+                     'instance. Only used when none of the enabled filters '
+                     'and weighers depends on other hosts than the one '
+                     'being checked'),
+    cfg.BoolOpt('scheduler_reserve_resources',
+                default=False,
+                help='Reserve the resources of each instance on the compute '
+                     'node chosen for it in the database, before sending '
+                     'the instance to it. A compute node left without room '
+                     'by concurrent schedulers is then replaced with the '
+                     'next best host, instead of failing to claim the '
+                     'resources and rescheduling the instance. Reservations '
+                     'last until the compute node next reports its resource '
+                     'usage'),
 ]
 
 CONF.register_opts(filter_scheduler_opts)
@@ -145,6 +166,12 @@ class FilterScheduler(driver.Scheduler):
 
         # Couldn't fulfill the request_spec
         if len(selected_hosts) < num_instances:
+            # None of the instances are built, so do not keep their
+            # resources from other requests.
+            elevated = context.elevated()
+            for host in selected_hosts:
+                self._release_resources(elevated, host.obj,
+                                        request_spec['instance_properties'])
             raise exception.NoValidHost(reason='')
 
         dests = [dict(host=host.obj.host, nodename=host.obj.nodename,
@@ -312,6 +339,9 @@ class FilterScheduler(driver.Scheduler):
 
         self.populate_filter_properties(request_spec,
                                         filter_properties)
+        if CONF.scheduler_profile_requests:
+            filter_properties['scheduler_profile'] = (
+                    scheduler_stats.new_profile())
 
         # Find our local list of acceptable hosts by repeatedly
         # filtering and weighing our options. Each time we choose a
@@ -323,12 +353,68 @@ class FilterScheduler(driver.Scheduler):
         # are being scanned in a filter or weighing function.
         hosts = self.host_manager.get_all_host_states(elevated)
 
-        selected_hosts = []
         if instance_uuids:
             num_instances = len(instance_uuids)
         else:
             num_instances = request_spec.get('num_instances', 1)
-        for num in xrange(num_instances):
+        selected_hosts = self._choose_hosts(elevated, hosts,
+                filter_properties, instance_properties, num_instances,
+                update_group_hosts)
+
+        if (len(selected_hosts) < num_instances and
+                self.host_manager.is_sharded()):
+            LOG.debug(_("Not enough hosts in the share of this scheduler, "
+                        "considering the hosts of every scheduler"))
+            hosts = self.host_manager.get_all_host_states(elevated,
+                                                          all_shards=True)
+            selected_hosts += self._choose_hosts(elevated, hosts,
+                    filter_properties, instance_properties,
+                    num_instances - len(selected_hosts), update_group_hosts)
+
+        # NOTE: the profile only matters to this scheduler, don't send it
+        # to the compute nodes along with the filter properties
+        profile = filter_properties.pop('scheduler_profile', None)
+        if profile is not None:
+            LOG.debug(_("Scheduler profile: %(profile)s"),
+                      {'profile': profile})
+        return selected_hosts
+
+    def _choose_hosts(self, context, hosts, filter_properties,
+                      instance_properties, num_instances, update_group_hosts):
+        """Choose a host for each of num_instances instances."""
+        if (CONF.scheduler_batch_placement and num_instances > 1 and
+                self.host_manager.hosts_are_independent()):
+            return self._schedule_batch(context, hosts, filter_properties,
+                    instance_properties, num_instances, update_group_hosts)
+        return self._schedule_in_turn(context, hosts, filter_properties,
+                instance_properties, num_instances, update_group_hosts)
+
+    def _reserve_resources(self, context, host_state, instance_properties):
+        """Return whether the resources of the instance could be reserved
+        on the host, if scheduler_reserve_resources is enabled.
+        """
+        if not CONF.scheduler_reserve_resources:
+            return True
+        return self.host_manager.reserve_resources(context, host_state,
+                                                   instance_properties)
+
+    def _release_resources(self, context, host_state, instance_properties):
+        """Release the resources of the instance reserved on the host by
+        _reserve_resources().
+        """
+        if CONF.scheduler_reserve_resources:
+            self.host_manager.release_resources(context, host_state,
+                                                instance_properties)
+
+    def _schedule_in_turn(self, context, hosts, filter_properties,
+                          instance_properties, num_instances,
+                          update_group_hosts):
+        """Choose a host for each of num_instances instances, filtering
+        and weighing the hosts again for each instance.
+        """
+        selected_hosts = []
+        num = 0
+        while num < num_instances:
             # Filter local hosts based on requirements ...
             hosts = self.host_manager.get_filtered_hosts(hosts,
                     filter_properties, index=num)
@@ -338,19 +424,22 @@ class FilterScheduler(driver.Scheduler):
 
             LOG.debug(_("Filtered %(hosts)s"), {'hosts': hosts})
 
+            # Only the hosts a choice is made from need to be sorted.
+            scheduler_host_subset_size = max(
+                    CONF.scheduler_host_subset_size, 1)
             weighed_hosts = self.host_manager.get_weighed_hosts(hosts,
-                    filter_properties)
+                    filter_properties, limit=scheduler_host_subset_size)
 
             LOG.debug(_("Weighed %(hosts)s"), {'hosts': weighed_hosts})
 
-            scheduler_host_subset_size = CONF.scheduler_host_subset_size
-            if scheduler_host_subset_size > len(weighed_hosts):
-                scheduler_host_subset_size = len(weighed_hosts)
-            if scheduler_host_subset_size < 1:
-                scheduler_host_subset_size = 1
-
             chosen_host = random.choice(
                 weighed_hosts[0:scheduler_host_subset_size])
+            if not self._reserve_resources(context, chosen_host.obj,
+                                           instance_properties):
+                # Another scheduler took the room left on the host.
+                hosts = [host_state for host_state in hosts
+                         if host_state is not chosen_host.obj]
+                continue
             selected_hosts.append(chosen_host)
 
             # Now consume the resources so the filter/weights
@@ -358,4 +447,82 @@ class FilterScheduler(driver.Scheduler):
             chosen_host.obj.consume_from_instance(instance_properties)
             if update_group_hosts is True:
                 filter_properties['group_hosts'].append(chosen_host.obj.host)
+            num += 1
+        return selected_hosts
+
+    def _schedule_batch(self, context, hosts, filter_properties,
+                        instance_properties, num_instances,
+                        update_group_hosts):
+        """Choose a host for each of num_instances instances, filtering
+        and weighing all the hosts only once.
+
+        Only the host chosen for an instance has its resources consumed,
+        so as long as the filters and weighers look at one host at a time
+        it is the only host which has to be filtered and weighed again
+        before choosing the next one.  The other hosts are kept in a heap
+        ordered the way get_weighed_hosts() sorts them, which gives the
+        same choices as filtering and weighing every host for each
+        instance.
+        """
+        hosts = self.host_manager.get_filtered_hosts(hosts,
+                filter_properties, index=0)
+        if not hosts:
+            return []
+
+        LOG.debug(_("Filtered %(hosts)s"), {'hosts': hosts})
+
+        weighed_hosts = self.host_manager.get_weighed_hosts(hosts,
+                filter_properties)
+
+        LOG.debug(_("Weighed %(hosts)s"), {'hosts': weighed_hosts})
+
+        # Hosts with the same weight are ordered by their position in the
+        # filtered list, as with the stable sort of get_weighed_hosts().
+        positions = dict((id(host_state), position)
+                         for position, host_state in enumerate(hosts))
+        heap = [(-weighed_host.weight, positions[id(weighed_host.obj)],
+                 weighed_host.obj) for weighed_host in weighed_hosts]
+        heapq.heapify(heap)
+
+        scheduler_host_subset_size = max(CONF.scheduler_host_subset_size, 1)
+        selected_hosts = []
+        num = 0
+        while num < num_instances:
+            best_hosts = [heapq.heappop(heap) for i in
+                          xrange(min(scheduler_host_subset_size, len(heap)))]
+            if not best_hosts:
+                # Can't get any more locally.
+                break
+
+            chosen = random.choice(best_hosts)
+            for entry in best_hosts:
+                if entry is not chosen:
+                    heapq.heappush(heap, entry)
+            weight, position, host_state = chosen
+            if not self._reserve_resources(context, host_state,
+                                           instance_properties):
+                # Another scheduler took the room left on the host.
+                continue
+            selected_hosts.append(weights.WeighedHost(host_state, -weight))
+            num += 1
+
+            # Now consume the resources so the filter/weights
+            # will change for the next instance.
+            host_state.consume_from_instance(instance_properties)
+            if update_group_hosts is True:
+                filter_properties['group_hosts'].append(host_state.host)
+
+            if num == num_instances:
+                break
+            # Filter and weigh the chosen host again before putting it
+            # back with the others.
+            hosts = self.host_manager.get_filtered_hosts([host_state],
+                    filter_properties, index=num)
+            if hosts is None:
+                break
+            if hosts:
+                weighed_host = self.host_manager.get_weighed_hosts(hosts,
+                        filter_properties)[0]
+                heapq.heappush(heap, (-weighed_host.weight, position,
+                                      host_state))
         return selected_hosts
@@ -17,7 +17,35 @@
 Scheduler host filters
 """
 
+import time
+
+from oslo.config import cfg
+
 from nova import filters
+from nova.openstack.common.gettextutils import _
+from nova.openstack.common import log as logging
+from nova.scheduler import host_columns
+
+filters_opts = [
+    cfg.BoolOpt('scheduler_auto_order_filters',
+                default=False,
+                help='Run the host filters cheapest and most selective '
+                     'first, going by the time they took and the hosts they '
+                     'eliminated in earlier requests, instead of in the '
+                     'order of scheduler_default_filters'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(filters_opts)
+
+LOG = logging.getLogger(__name__)
+
+# Filters deciding on the service and the free resources of the HostState
+# only.  The costlier filters list them in their run_after, so that when the
+# filters are ordered by cost they are only given the hosts these keep, even
+# before their own cost is known.
+RESOURCE_FILTERS = ('RetryFilter', 'ComputeFilter', 'RamFilter',
+                    'CoreFilter', 'DiskFilter')
 
 
 class BaseHostFilter(filters.BaseFilter):
@@ -32,10 +60,130 @@ class BaseHostFilter(filters.BaseFilter):
         """
         raise NotImplementedError()
 
+    def host_signature(self, host_state, filter_properties):
+        """Return a hashable value summarizing what host_passes() looks at
+        in the HostState, or None.
+
+        Override this in a subclass whose verdict only depends on part of
+        the HostState, such as its aggregates: within a request, hosts
+        with the same signature get the verdict of the first of them
+        without calling host_passes() again.
+        """
+        return None
+
+    def filter_all(self, filter_obj_list, filter_properties):
+        if (self.host_signature.im_func is
+                BaseHostFilter.host_signature.im_func):
+            return super(BaseHostFilter, self).filter_all(filter_obj_list,
+                                                          filter_properties)
+        return self._filter_all_memoized(filter_obj_list, filter_properties)
+
+    def _filter_all_memoized(self, filter_obj_list, filter_properties):
+        verdicts = {}
+        for obj in filter_obj_list:
+            signature = self.host_signature(obj, filter_properties)
+            if signature is None:
+                passes = self._filter_one(obj, filter_properties)
+            else:
+                passes = verdicts.get(signature)
+                if passes is None:
+                    passes = self._filter_one(obj, filter_properties)
+                    verdicts[signature] = passes
+            if passes:
+                yield obj
+
+    def host_passes_columns(self, columns, filter_properties):
+        """Return a boolean array telling which hosts pass the filter.
+
+        :param columns: HostStateColumns of the hosts to filter
+
+        Override this in a subclass which can evaluate host_passes() as
+        vectorized operations over the columns.  Returning None makes the
+        filter fall back to host_passes() for each host.
+        """
+        return None
+
 
 class HostFilterHandler(filters.BaseFilterHandler):
-    def __init__(self):
+    def __init__(self, stats=None):
         super(HostFilterHandler, self).__init__(BaseHostFilter)
+        # SchedulerStats to record the filter runs in
+        self.stats = stats
+
+    @property
+    def auto_order_filters(self):
+        return CONF.scheduler_auto_order_filters
+
+    def filter_ran(self, cls_name, num_in, num_out, seconds,
+                   filter_properties):
+        super(HostFilterHandler, self).filter_ran(cls_name, num_in, num_out,
+                                                  seconds, filter_properties)
+        if self.stats is not None:
+            self.stats.record_filter(cls_name, num_in, num_out, seconds,
+                                     filter_properties)
+
+    def get_filtered_objects(self, filter_classes, objs,
+            filter_properties, index=0):
+        if not host_columns.enabled():
+            return super(HostFilterHandler, self).get_filtered_objects(
+                    filter_classes, objs, filter_properties, index)
+
+        if self.auto_order_filters:
+            filter_classes = self.order_filters(filter_classes)
+        if isinstance(objs, host_columns.HostStateColumns):
+            columns = objs
+        else:
+            columns = host_columns.HostStateColumns(objs)
+        LOG.debug(_("Starting with %d host(s)"), len(columns))
+        # NOTE: Filters only ever remove hosts, so the ones which can be
+        #       evaluated over the columns run first, in a single pass, and
+        #       the others then run one host at a time on what is left.
+        mask = columns.all_pass()
+        host_filters = []
+        for filter_cls in filter_classes:
+            filter = filter_cls()
+            if not filter.run_filter_for_index(index):
+                continue
+            start = time.time()
+            filter_mask = filter.host_passes_columns(columns,
+                                                     filter_properties)
+            if filter_mask is None:
+                host_filters.append(filter)
+                continue
+            num_in = int(mask.sum())
+            mask &= filter_mask
+            num_out = int(mask.sum())
+            elapsed = time.time() - start
+            self.filter_ran(filter_cls.__name__, num_in, num_out, elapsed,
+                            filter_properties)
+            LOG.debug(_("Filter %(cls_name)s returned %(obj_len)d host(s) "
+                        "in %(elapsed).4f seconds"),
+                      {'cls_name': filter_cls.__name__, 'obj_len': num_out,
+                       'elapsed': elapsed})
+
+        list_objs = columns.select(mask)
+        for filter in host_filters:
+            if not list_objs:
+                break
+            cls_name = filter.__class__.__name__
+            start = time.time()
+            num_in = len(list_objs)
+            objs = filter.filter_all(list_objs, filter_properties)
+            if objs is None:
+                LOG.debug(_("Filter %(cls_name)s says to stop filtering"),
+                          {'cls_name': cls_name})
+                return
+            list_objs = list(objs)
+            elapsed = time.time() - start
+            self.filter_ran(cls_name, num_in, len(list_objs), elapsed,
+                            filter_properties)
+            LOG.debug(_("Filter %(cls_name)s returned %(obj_len)d host(s) "
+                        "in %(elapsed).4f seconds"),
+                      {'cls_name': cls_name, 'obj_len': len(list_objs),
+                       'elapsed': elapsed})
+        if not list_objs:
+            LOG.info(_("Filters returned 0 hosts"))
+        return list_objs
 
 
 def all_filters():
@@ -120,6 +120,10 @@ class GroupAffinityFilter(AffinityFilter):
     """Schedule the instance on to host from a set of group hosts.
     """
 
+    # Once a host is chosen for the first instance of the group, every
+    # other host stops passing.
+    depends_on_other_objects = True
+
     def host_passes(self, host_state, filter_properties):
         group_hosts = filter_properties.get('group_hosts', [])
         LOG.debug(_("Group affinity: check if %(host)s in "
@@ -14,11 +14,11 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-from nova import db
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
 from nova.scheduler import filters
 from nova.scheduler.filters import extra_specs_ops
+from nova.scheduler.filters import utils
 
 
 LOG = logging.getLogger(__name__)
@@ -29,9 +29,16 @@ _SCOPE = 'aggregate_instance_extra_specs'
 class AggregateInstanceExtraSpecsFilter(filters.BaseHostFilter):
     """AggregateInstanceExtraSpecsFilter works with InstanceType records."""
 
+    # Matching the extra specs against the aggregate metadata is costlier
+    # than checking the resources
+    run_after = filters.RESOURCE_FILTERS
+
     # Aggregate data and instance type does not change within a request
     run_filter_once_per_request = True
 
+    def host_signature(self, host_state, filter_properties):
+        return host_state.aggregate_ids
+
     def host_passes(self, host_state, filter_properties):
         """Return a list of hosts that can create instance_type
 
@@ -42,8 +49,8 @@ class AggregateInstanceExtraSpecsFilter(filters.BaseHostFilter):
         if 'extra_specs' not in instance_type:
             return True
 
-        context = filter_properties['context'].elevated()
-        metadata = db.aggregate_metadata_get_by_host(context, host_state.host)
+        metadata = utils.aggregate_metadata_get_by_host(host_state,
+                                                        filter_properties)
 
         for key, req in instance_type['extra_specs'].iteritems():
             # Either not scope format, or aggregate_instance_extra_specs scope
@@ -15,8 +15,8 @@
 
 from oslo.config import cfg
 
-from nova import db
 from nova.scheduler import filters
+from nova.scheduler.filters import utils
 
 CONF = cfg.CONF
 CONF.import_opt('default_availability_zone', 'nova.availability_zones')
@@ -33,15 +33,18 @@ class AvailabilityZoneFilter(filters.BaseHostFilter):
     # Availability zones do not change within a request
     run_filter_once_per_request = True
 
+    def host_signature(self, host_state, filter_properties):
+        return host_state.aggregate_ids
+
     def host_passes(self, host_state, filter_properties):
         spec = filter_properties.get('request_spec', {})
         props = spec.get('instance_properties', {})
         availability_zone = props.get('availability_zone')
 
         if availability_zone:
-            context = filter_properties['context'].elevated()
-            metadata = db.aggregate_metadata_get_by_host(
-                         context, host_state.host, key='availability_zone')
+            metadata = utils.aggregate_metadata_get_by_host(
+                         host_state, filter_properties,
+                         key='availability_zone')
             if 'availability_zone' in metadata:
                 return availability_zone in metadata['availability_zone']
             else:
@@ -25,6 +25,9 @@ LOG = logging.getLogger(__name__)
 class ComputeCapabilitiesFilter(filters.BaseHostFilter):
     """HostFilter hard-coded to work with InstanceType records."""
 
+    # Matching the extra specs is costlier than checking the resources
+    run_after = filters.RESOURCE_FILTERS
+
     # Instance type and host capabilities do not change within a request
     run_filter_once_per_request = True
 
@@ -17,10 +17,10 @@
 
 from oslo.config import cfg
 
-from nova import db
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
 from nova.scheduler import filters
+from nova.scheduler.filters import utils
 
 LOG = logging.getLogger(__name__)
 
@@ -70,6 +70,22 @@ class CoreFilter(BaseCoreFilter):
     def _get_cpu_allocation_ratio(self, host_state, filter_properties):
         return CONF.cpu_allocation_ratio
 
+    def host_passes_columns(self, columns, filter_properties):
+        """Vectorized host_passes()."""
+        instance_type = filter_properties.get('instance_type')
+        if not instance_type:
+            return columns.all_pass()
+        vcpus_total = columns.get('vcpus_total')
+        vcpus_used = columns.get('vcpus_used')
+        if vcpus_total is None or vcpus_used is None:
+            return None
+
+        vcpus_limit = vcpus_total * CONF.cpu_allocation_ratio
+        columns.set_limit('vcpu', vcpus_limit, where=vcpus_limit > 0)
+        # Hosts not reporting their VCPUs pass, as in host_passes()
+        return ((vcpus_total == 0) |
+                (vcpus_limit - vcpus_used >= instance_type['vcpus']))
+
 
 class AggregateCoreFilter(BaseCoreFilter):
     """AggregateCoreFilter with per-aggregate CPU subscription flag.
@@ -78,12 +94,10 @@ class AggregateCoreFilter(BaseCoreFilter):
     """
 
     def _get_cpu_allocation_ratio(self, host_state, filter_properties):
-        context = filter_properties['context'].elevated()
-        # TODO(uni): DB query in filter is a performance hit, especially for
-        # system with lots of hosts. Will need a general solution here to fix
-        # all filters with aggregate DB call things.
-        metadata = db.aggregate_metadata_get_by_host(
-                     context, host_state.host, key='cpu_allocation_ratio')
+        # NOTE: Without scheduler_aggregate_metadata_cache, this is a DB
+        # query for each host.
+        metadata = utils.aggregate_metadata_get_by_host(
+                     host_state, filter_properties, key='cpu_allocation_ratio')
         aggregate_vals = metadata.get('cpu_allocation_ratio', set())
         num_values = len(aggregate_vals)
 
@@ -56,3 +56,21 @@ class DiskFilter(filters.BaseHostFilter):
         disk_gb_limit = disk_mb_limit / 1024
         host_state.limits['disk_gb'] = disk_gb_limit
         return True
+
+    def host_passes_columns(self, columns, filter_properties):
+        """Vectorized host_passes()."""
+        instance_type = filter_properties.get('instance_type')
+        free_disk_mb = columns.get('free_disk_mb')
+        total_usable_disk_gb = columns.get('total_usable_disk_gb')
+        if (not instance_type or free_disk_mb is None or
+                total_usable_disk_gb is None):
+            return None
+        requested_disk = (1024 * (instance_type['root_gb'] +
+                                  instance_type['ephemeral_gb']) +
+                          instance_type['swap'])
+
+        total_usable_disk_mb = total_usable_disk_gb * 1024
+        disk_mb_limit = total_usable_disk_mb * CONF.disk_allocation_ratio
+        usable_disk_mb = disk_mb_limit - (total_usable_disk_mb - free_disk_mb)
+        columns.set_limit('disk_gb', disk_mb_limit / 1024)
+        return usable_disk_mb >= requested_disk
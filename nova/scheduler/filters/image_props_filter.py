@@ -95,6 +95,11 @@ class ImagePropertiesFilter(filters.BaseHostFilter):
                    'hypervisor_version': hypervisor_version})
         return False
 
+    def host_signature(self, host_state, filter_properties):
+        supp_instances = host_state.supported_instances or ()
+        return (tuple(tuple(supp_inst) for supp_inst in supp_instances),
+                host_state.hypervisor_version)
+
     def host_passes(self, host_state, filter_properties):
         """Check if host passes specified image properties.
 
@@ -45,3 +45,10 @@ class IoOpsFilter(filters.BaseHostFilter):
                         {'host_state': host_state,
                          'max_io_ops': max_io_ops})
         return passes
+
+    def host_passes_columns(self, columns, filter_properties):
+        """Vectorized host_passes()."""
+        num_io_ops = columns.get('num_io_ops')
+        if num_io_ops is None:
+            return None
+        return num_io_ops < CONF.max_io_ops_per_host
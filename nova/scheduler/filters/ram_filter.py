@@ -16,10 +16,10 @@
 
 from oslo.config import cfg
 
-from nova import db
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
 from nova.scheduler import filters
+from nova.scheduler.filters import utils
 
 LOG = logging.getLogger(__name__)
 
@@ -71,6 +71,20 @@ class RamFilter(BaseRamFilter):
     def _get_ram_allocation_ratio(self, host_state, filter_properties):
         return CONF.ram_allocation_ratio
 
+    def host_passes_columns(self, columns, filter_properties):
+        """Vectorized host_passes()."""
+        instance_type = filter_properties.get('instance_type')
+        free_ram_mb = columns.get('free_ram_mb')
+        total_usable_ram_mb = columns.get('total_usable_ram_mb')
+        if (not instance_type or free_ram_mb is None or
+                total_usable_ram_mb is None):
+            return None
+
+        memory_mb_limit = total_usable_ram_mb * CONF.ram_allocation_ratio
+        usable_ram = memory_mb_limit - (total_usable_ram_mb - free_ram_mb)
+        columns.set_limit('memory_mb', memory_mb_limit)
+        return usable_ram >= instance_type['memory_mb']
+
 
 class AggregateRamFilter(BaseRamFilter):
     """AggregateRamFilter with per-aggregate ram subscription flag.
@@ -79,12 +93,10 @@ class AggregateRamFilter(BaseRamFilter):
     """
 
     def _get_ram_allocation_ratio(self, host_state, filter_properties):
-        context = filter_properties['context'].elevated()
-        # TODO(uni): DB query in filter is a performance hit, especially for
-        # system with lots of hosts. Will need a general solution here to fix
-        # all filters with aggregate DB call things.
-        metadata = db.aggregate_metadata_get_by_host(
-                     context, host_state.host, key='ram_allocation_ratio')
+        # NOTE: Without scheduler_aggregate_metadata_cache, this is a DB
+        # query for each host.
+        metadata = utils.aggregate_metadata_get_by_host(
+                     host_state, filter_properties, key='ram_allocation_ratio')
         aggregate_vals = metadata.get('ram_allocation_ratio', set())
         num_values = len(aggregate_vals)
 
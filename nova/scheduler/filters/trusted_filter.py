@@ -281,6 +281,10 @@ class ComputeAttestation(object):
 class TrustedFilter(filters.BaseHostFilter):
     """Trusted filter to support Trusted Compute Pools."""
 
+    # Hosts which are down or full are not worth asking the attestation
+    # service about
+    run_after = filters.RESOURCE_FILTERS
+
     def __init__(self):
         self.compute_attestation = ComputeAttestation()
 
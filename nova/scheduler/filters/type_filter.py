@@ -16,6 +16,7 @@
 
 from nova import db
 from nova.scheduler import filters
+from nova.scheduler.filters import utils
 
 
 class TypeAffinityFilter(filters.BaseHostFilter):
@@ -49,10 +50,12 @@ class AggregateTypeAffinityFilter(filters.BaseHostFilter):
     # Aggregate data does not change within a request
     run_filter_once_per_request = True
 
+    def host_signature(self, host_state, filter_properties):
+        return host_state.aggregate_ids
+
     def host_passes(self, host_state, filter_properties):
         instance_type = filter_properties.get('instance_type')
-        context = filter_properties['context'].elevated()
-        metadata = db.aggregate_metadata_get_by_host(
-                     context, host_state.host, key='instance_type')
+        metadata = utils.aggregate_metadata_get_by_host(
+                     host_state, filter_properties, key='instance_type')
         return (len(metadata) == 0 or
                 instance_type['name'] in metadata['instance_type'])
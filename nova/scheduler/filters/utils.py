@@ -0,0 +1,37 @@
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Helpers shared by the host filters."""
+
+from nova import db
+
+
+def aggregate_metadata_get_by_host(host_state, filter_properties, key=None):
+    """Return the metadata of the aggregates of the host, as
+    db.aggregate_metadata_get_by_host() does.
+
+    The metadata cached in the HostState by the HostManager is used when
+    there is some, and must not be modified.
+    """
+    metadata = host_state.aggregate_metadata
+    if metadata is None:
+        context = filter_properties['context'].elevated()
+        return db.aggregate_metadata_get_by_host(context, host_state.host,
+                                                 key=key)
+    if key is None:
+        return metadata
+    if key not in metadata:
+        return {}
+    return {key: metadata[key]}
@@ -0,0 +1,56 @@
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Consistent hash ring, to share keys such as host names between members
+such as schedulers.
+"""
+
+import bisect
+import hashlib
+
+from nova import utils
+
+
+class HashRing(object):
+    """Consistent hash ring of a set of members.
+
+    Every member is placed at a number of points on the ring, and a key
+    belongs to the member at the first point following the hash of the
+    key.  Adding or removing a member only moves the keys of that member.
+    """
+
+    def __init__(self, members, replicas=64):
+        self.members = frozenset(members)
+        points = []
+        for member in self.members:
+            for i in xrange(replicas):
+                points.append((self._hash('%s-%d' % (member, i)), member))
+        points.sort()
+        self._hashes = [point for point, member in points]
+        self._members = [member for point, member in points]
+
+    @staticmethod
+    def _hash(key):
+        return int(hashlib.md5(utils.utf8(key)).hexdigest()[:8], 16)
+
+    def get_member(self, key):
+        """Return the member the key belongs to, or None if the ring has
+        no member.
+        """
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, self._hash(key))
+        return self._members[index % len(self._members)]
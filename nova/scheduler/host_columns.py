@@ -0,0 +1,179 @@
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Columnar view of HostStates, so that host filters can be evaluated as
+vectorized operations over all the hosts at once.
+"""
+
+import itertools
+import operator
+
+from oslo.config import cfg
+
+from nova.openstack.common import importutils
+
+numpy = importutils.try_import('numpy')
+
+host_columns_opts = [
+    cfg.BoolOpt('scheduler_columnar_filters',
+                default=False,
+                help='Evaluate the host filters and weighers which support '
+                     'it (such as RamFilter, CoreFilter, DiskFilter, '
+                     'NumInstancesFilter, IoOpsFilter and RAMWeigher) over '
+                     'all the hosts at once with NumPy, before running the '
+                     'other filters and weighers host by host. Ignored if '
+                     'NumPy is not installed'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(host_columns_opts)
+
+
+def enabled():
+    """Return whether the filters and weighers should be evaluated over
+    columns.
+    """
+    return CONF.scheduler_columnar_filters and numpy is not None
+
+
+def normalize(values, minval=None, maxval=None):
+    """Array version of nova.weights.normalize()."""
+    if maxval is None:
+        maxval = values.max()
+    if minval is None:
+        minval = values.min()
+    maxval = float(maxval)
+    minval = float(minval)
+    if minval == maxval:
+        return numpy.zeros(len(values))
+    return (values - minval) / (maxval - minval)
+
+
+def top(values, limit=None):
+    """Return the indexes of the limit highest values, highest first.
+
+    Equal values keep their relative order, as with a stable sort.  Only
+    the values which can make it to the top are sorted.
+    """
+    if limit is not None and limit < len(values):
+        kth = len(values) - limit
+        threshold = numpy.partition(values, kth)[kth]
+        indexes = numpy.flatnonzero(values >= threshold)
+    else:
+        indexes = numpy.arange(len(values))
+    order = numpy.argsort(-values[indexes], kind='mergesort')
+    return indexes[order][:limit]
+
+
+class HostStateColumns(object):
+    """Arrays of HostState attributes, one entry per host.
+
+    Columns are only built the first time a filter asks for them, and
+    refresh() only re-reads the hosts whose generation changed, so that
+    the same HostStateColumns can be kept from one request to the next.
+    """
+
+    def __init__(self, host_states):
+        self.host_states = list(host_states)
+        self._generations = self._read('generation')
+        self._columns = {}
+        # { limit name : (values, mask of the hosts it applies to) }
+        self._limits = {}
+
+    def __len__(self):
+        return len(self.host_states)
+
+    def __iter__(self):
+        return iter(self.host_states)
+
+    def _read(self, name):
+        return numpy.fromiter(
+                map(operator.attrgetter(name), self.host_states),
+                dtype=numpy.float64, count=len(self.host_states))
+
+    def matches(self, host_states):
+        """Return whether these columns are for exactly these hosts."""
+        return (len(host_states) == len(self.host_states) and
+                all(map(operator.is_, host_states, self.host_states)))
+
+    def refresh(self):
+        """Re-read the columns of the hosts changed since they were read,
+        and forget the limits recorded by previous filters.
+        """
+        self._limits = {}
+        generations = self._read('generation')
+        changed = numpy.flatnonzero(generations != self._generations)
+        if not len(changed):
+            return
+        self._generations = generations
+        for name, column in self._columns.items():
+            try:
+                for i in changed:
+                    column[i] = getattr(self.host_states[i], name)
+            except (AttributeError, TypeError, ValueError):
+                # Read the whole column again next time it is needed.
+                del self._columns[name]
+
+    def get(self, name):
+        """Return an array of the given attribute of every host, or None
+        if a host does not have a numeric value for it.
+        """
+        column = self._columns.get(name)
+        if column is None:
+            try:
+                column = self._read(name)
+            except (AttributeError, TypeError, ValueError):
+                return None
+            self._columns[name] = column
+        return column
+
+    def array(self, values):
+        """Return an array of one value for every host."""
+        return numpy.fromiter(values, dtype=numpy.float64,
+                              count=len(self.host_states))
+
+    def zeros(self):
+        """Return an array of zeros, one for every host."""
+        return numpy.zeros(len(self.host_states))
+
+    def all_pass(self):
+        """Return a mask letting every host through."""
+        return numpy.ones(len(self.host_states), dtype=bool)
+
+    def set_limit(self, name, values, where=None):
+        """Record an oversubscription limit to be set in the HostState
+        limits of the hosts that pass the filters.
+
+        :param values: array of the limit of every host
+        :param where: optional mask of the hosts the limit applies to
+        """
+        self._limits[name] = (values, where)
+
+    def select(self, mask):
+        """Return the HostStates passing the mask and set their limits."""
+        indexes = numpy.flatnonzero(mask)
+        selected = [self.host_states[i] for i in indexes.tolist()]
+        for name, (values, where) in self._limits.iteritems():
+            if where is None:
+                hosts = selected
+                values = values[indexes]
+            else:
+                where = where[indexes]
+                hosts = itertools.compress(selected, where.tolist())
+                values = values[indexes[where]]
+            for host_state, value in itertools.izip(hosts, values.tolist()):
+                host_state.limits[name] = value
+        return selected
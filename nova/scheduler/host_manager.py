@@ -33,7 +33,11 @@ from nova.openstack.common import timeutils
 from nova.pci import pci_request
 from nova.pci import pci_stats
 from nova.scheduler import filters
+from nova.scheduler import hash_ring
+from nova.scheduler import host_columns
+from nova.scheduler import stats as scheduler_stats
 from nova.scheduler import weights
+from nova import servicegroup
 
 host_manager_opts = [
     cfg.MultiStrOpt('scheduler_available_filters',
@@ -56,10 +60,64 @@ host_manager_opts = [
     cfg.ListOpt('scheduler_weight_classes',
                 default=['nova.scheduler.weights.all_weighers'],
                 help='Which weight class names to use for weighing hosts'),
+    cfg.BoolOpt('scheduler_weight_normalization',
+                default=False,
+                help='Normalize the weights given by each weigher between '
+                     '0 and 1 before applying its multiplier, so that the '
+                     'multipliers of different weighers are comparable'),
+    cfg.BoolOpt('scheduler_host_state_cache',
+                default=False,
+                help='Keep host states cached between scheduling requests '
+                     'and only refresh the compute nodes that changed since '
+                     'the last refresh, instead of reloading every compute '
+                     'node on each request'),
+    cfg.IntOpt('scheduler_host_state_max_staleness',
+               default=5,
+               help='Maximum age in seconds of the cached host states before '
+                    'the compute nodes updated since the last refresh are '
+                    'reloaded. Resources consumed by this scheduler are '
+                    'applied to the cache in the meantime. Only used when '
+                    'scheduler_host_state_cache is enabled'),
+    cfg.IntOpt('scheduler_host_state_full_sync_interval',
+               default=300,
+               help='Interval in seconds between full reloads of the cached '
+                    'host states. Only used when scheduler_host_state_cache '
+                    'is enabled'),
+    cfg.BoolOpt('scheduler_aggregate_metadata_cache',
+                default=False,
+                help='Load the metadata of all the host aggregates at once '
+                     'and keep it until an aggregate is changed through the '
+                     'API, instead of having the aggregate filters query '
+                     'the database for each host'),
+    cfg.IntOpt('scheduler_aggregate_metadata_max_age',
+               default=60,
+               help='Maximum age in seconds of the cached aggregate '
+                    'metadata, in case a notification of an aggregate '
+                    'change was missed. Only used when '
+                    'scheduler_aggregate_metadata_cache is enabled'),
+    cfg.BoolOpt('scheduler_sharding',
+                default=False,
+                help='Share the compute hosts between the running '
+                     'schedulers by consistent hashing of their host names, '
+                     'so that each scheduler only tracks and considers its '
+                     'own hosts. Requests which cannot be placed on the '
+                     'hosts of a scheduler fall back to every host'),
+    cfg.IntOpt('scheduler_shard_replicas',
+               default=64,
+               help='Number of points of each scheduler on the hash ring '
+                    'the compute hosts are shared with. Only used when '
+                    'scheduler_sharding is enabled'),
+    cfg.IntOpt('scheduler_shard_refresh_interval',
+               default=10,
+               help='Interval in seconds between checks of the running '
+                    'schedulers the compute hosts are shared between. Only '
+                    'used when scheduler_sharding is enabled'),
     ]
 
 CONF = cfg.CONF
 CONF.register_opts(host_manager_opts)
+CONF.import_opt('host', 'nova.netconf')
+CONF.import_opt('scheduler_topic', 'nova.scheduler.rpcapi')
 
 LOG = logging.getLogger(__name__)
 
@@ -130,6 +188,7 @@ class HostState(object):
         self.num_io_ops = 0
 
         # Other information
+        self.compute_node_id = None
         self.host_ip = None
         self.hypervisor_type = None
         self.hypervisor_version = None
@@ -143,7 +202,15 @@ class HostState(object):
         # Generic metrics from compute nodes
         self.metrics = {}
 
+        # Aggregates of the host, when cached by the HostManager:
+        # ids of the aggregates and their metadata, { key : set(values) }
+        self.aggregate_ids = None
+        self.aggregate_metadata = None
+
         self.updated = None
+        # Bumped on every change of the resources above, so that copies of
+        # them such as HostStateColumns know when to refresh.
+        self.generation = 0
 
     def update_capabilities(self, capabilities=None, service=None):
         # Read-only capability dicts
@@ -180,6 +247,7 @@ class HostState(object):
         if (self.updated and compute['updated_at']
                 and self.updated > compute['updated_at']):
             return
+        self.generation += 1
         all_ram_mb = compute['memory_mb']
 
         # Assume virtual size is all consumed by instances if use qcow2 disk.
@@ -202,6 +270,7 @@ class HostState(object):
         else:
             self.pci_stats = None
 
+        self.compute_node_id = compute.get('id')
         # All virt drivers report host_ip
         self.host_ip = compute['host_ip']
         self.hypervisor_type = compute.get('hypervisor_type')
@@ -256,6 +325,7 @@ class HostState(object):
 
     def consume_from_instance(self, instance):
         """Incrementally update host state from an instance."""
+        self.generation += 1
         disk_mb = (instance['root_gb'] + instance['ephemeral_gb']) * 1024
         ram_mb = instance['memory_mb']
         vcpus = instance['vcpus']
@@ -322,10 +392,24 @@ class HostManager(object):
         # { (host, hypervisor_hostname) : { <service> : { cap k : v }}}
         self.service_states = {}
         self.host_state_map = {}
-        self.filter_handler = filters.HostFilterHandler()
+        # Bookkeeping for the incremental host state cache
+        self._last_full_sync = None
+        self._last_sync = None
+        self._compute_watermark = None
+        self._service_watermark = None
+        self._host_columns = None
+        # { host : (aggregate ids, aggregate metadata) }
+        self._host_aggregates = None
+        self._host_aggregates_loaded = None
+        # Hash ring of the schedulers sharing the hosts, if sharding
+        self._shard_ring = None
+        self._shard_refreshed = None
+        self.servicegroup_api = servicegroup.API()
+        self.stats = scheduler_stats.SchedulerStats()
+        self.filter_handler = filters.HostFilterHandler(self.stats)
         self.filter_classes = self.filter_handler.get_matching_classes(
                 CONF.scheduler_available_filters)
-        self.weight_handler = weights.HostWeightHandler()
+        self.weight_handler = weights.HostWeightHandler(self.stats)
         self.weight_classes = self.weight_handler.get_matching_classes(
                 CONF.scheduler_weight_classes)
 
@@ -426,13 +510,83 @@ class HostManager(object):
                     return name_to_cls_map.values()
             hosts = name_to_cls_map.itervalues()
 
+        if host_columns.enabled():
+            hosts = self._get_host_columns(hosts)
         return self.filter_handler.get_filtered_objects(filter_classes,
                 hosts, filter_properties, index)
 
-    def get_weighed_hosts(self, hosts, weight_properties):
-        """Weigh the hosts."""
+    def _get_host_columns(self, host_states):
+        """Return the HostStateColumns of these hosts.
+
+        The columns of all the hosts are kept from one request to the next,
+        and only refreshed for the hosts which changed in between.
+        """
+        host_states = list(host_states)
+        columns = self._host_columns
+        if columns is not None and columns.matches(host_states):
+            columns.refresh()
+            return columns
+        columns = host_columns.HostStateColumns(host_states)
+        if len(host_states) == len(self.host_state_map):
+            self._host_columns = columns
+        return columns
+
+    def hosts_are_independent(self, filter_class_names=None):
+        """Return whether the filters and weighers in use only ever look
+        at one host at a time, so that choosing a host for an instance
+        cannot change the verdict or weight of the other hosts.
+        """
+        if CONF.scheduler_weight_normalization:
+            # Consuming resources on a host can move the bounds the
+            # weights of every host are normalized with.
+            return False
+        filter_classes = self._choose_host_filters(filter_class_names)
+        return not any(cls.depends_on_other_objects
+                       for cls in filter_classes + self.weight_classes)
+
+    def get_weighed_hosts(self, hosts, weight_properties, limit=None):
+        """Weigh the hosts.
+
+        :param limit: only return the limit highest weighed hosts
+        """
         return self.weight_handler.get_weighed_objects(self.weight_classes,
-                hosts, weight_properties)
+                hosts, weight_properties, limit=limit,
+                normalize_weights=CONF.scheduler_weight_normalization)
+
+    def reserve_resources(self, context, host_state, instance):
+        """Reserve the resources of an instance on the compute node of a
+        HostState, within the limits the filters set in the HostState.
+
+        Other schedulers then see the resources as used until the compute
+        node next reports its usage, which it does when claiming the
+        instance and in its periodic resource audit.
+
+        Returns False if the compute node has no room left for the
+        instance, such as when another scheduler took it first.
+        """
+        if host_state.compute_node_id is None:
+            return True
+        reserved = db.compute_node_reserve(context,
+                host_state.compute_node_id, instance['memory_mb'],
+                instance['vcpus'],
+                instance['root_gb'] + instance['ephemeral_gb'],
+                limits=host_state.limits)
+        self.stats.record_reservation(reserved)
+        if not reserved:
+            LOG.debug(_("%(host_state)s has no room left for the "
+                        "instance"), {'host_state': host_state})
+        return reserved
+
+    def release_resources(self, context, host_state, instance):
+        """Release the resources of an instance reserved on the compute
+        node of a HostState by reserve_resources(), when the instance is
+        not going to be built there.
+        """
+        if host_state.compute_node_id is None:
+            return
+        db.compute_node_release(context, host_state.compute_node_id,
+                instance['memory_mb'], instance['vcpus'],
+                instance['root_gb'] + instance['ephemeral_gb'])
 
     def update_service_capabilities(self, service_name, host, capabilities):
         """Update the per-service capabilities based on this notification."""
@@ -452,42 +606,259 @@ class HostManager(object):
         capab_copy["timestamp"] = timeutils.utcnow()  # Reported time
         self.service_states[state_key] = capab_copy
 
-    def get_all_host_states(self, context):
-        """Returns a list of HostStates that represents all the hosts
-        the HostManager knows about. Also, each of the consumable resources
-        in HostState are pre-populated and adjusted based on data in the db.
-        """
+    def _update_host_state_from_compute(self, compute):
+        """Create or update the HostState of a compute node.
 
+        Returns the (host, node) key of the HostState, or None if the
+        compute node has no service.
+        """
+        service = compute['service']
+        if not service:
+            LOG.warn(_("No service for compute ID %s") % compute['id'])
+            return None
+        host = service['host']
+        if not self.in_shard(host):
+            return None
+        node = compute.get('hypervisor_hostname')
+        state_key = (host, node)
+        capabilities = self.service_states.get(state_key, None)
+        host_state = self.host_state_map.get(state_key)
+        if host_state:
+            host_state.update_capabilities(capabilities,
+                                           dict(service.iteritems()))
+        else:
+            host_state = self.host_state_cls(host, node,
+                    capabilities=capabilities,
+                    service=dict(service.iteritems()))
+            self.host_state_map[state_key] = host_state
+        host_state.update_from_compute_node(compute)
+        return state_key
+
+    def _remove_dead_host_state(self, state_key):
+        host, node = state_key
+        LOG.info(_("Removing dead compute node %(host)s:%(node)s "
+                   "from scheduler") % {'host': host, 'node': node})
+        del self.host_state_map[state_key]
+
+    @staticmethod
+    def _advance_watermark(watermark, row):
+        """Return the most recent of watermark and the changes of a row."""
+        for field in ('created_at', 'updated_at', 'deleted_at'):
+            changed_at = row.get(field)
+            if changed_at and (watermark is None or changed_at > watermark):
+                watermark = changed_at
+        return watermark
+
+    def _sync_all_host_states(self, context):
+        """Reload the HostStates of every compute node from the db."""
         # Get resource usage across the available compute nodes:
         compute_nodes = db.compute_node_get_all(context)
         seen_nodes = set()
+        compute_watermark = service_watermark = None
         for compute in compute_nodes:
+            compute_watermark = self._advance_watermark(compute_watermark,
+                                                        compute)
+            if compute['service']:
+                service_watermark = self._advance_watermark(
+                        service_watermark, compute['service'])
+            state_key = self._update_host_state_from_compute(compute)
+            if state_key:
+                seen_nodes.add(state_key)
+
+        # remove compute nodes from host_state_map if they are not active
+        dead_nodes = set(self.host_state_map.keys()) - seen_nodes
+        for state_key in dead_nodes:
+            self._remove_dead_host_state(state_key)
+
+        self._compute_watermark = compute_watermark
+        self._service_watermark = service_watermark
+        self._last_full_sync = self._last_sync = timeutils.utcnow()
+
+    def _sync_changed_host_states(self, context):
+        """Reload only the compute nodes and services changed since the
+        last sync.
+        """
+        # NOTE: The watermarks are inclusive, so rows sharing the timestamp
+        #       of the last change seen are reloaded rather than missed.
+        compute_nodes = db.compute_node_get_all(context,
+                updated_since=self._compute_watermark)
+        for compute in compute_nodes:
+            self._compute_watermark = self._advance_watermark(
+                    self._compute_watermark, compute)
+            if not compute.get('deleted'):
+                self._update_host_state_from_compute(compute)
+                continue
             service = compute['service']
-            if not service:
-                LOG.warn(_("No service for compute ID %s") % compute['id'])
+            if service:
+                state_key = (service['host'],
+                             compute.get('hypervisor_hostname'))
+                if state_key in self.host_state_map:
+                    self._remove_dead_host_state(state_key)
+
+        # NOTE: Services have to be refreshed as well, as their heartbeats
+        #       are what tells whether a compute node is still alive.
+        services = {}
+        for service in db.service_get_all_by_binary(context, 'nova-compute',
+                updated_since=self._service_watermark):
+            self._service_watermark = self._advance_watermark(
+                    self._service_watermark, service)
+            services[service['id']] = service
+        if services:
+            for state_key, host_state in self.host_state_map.items():
+                service = services.get(host_state.service.get('id'))
+                if service is None:
+                    continue
+                if service['deleted']:
+                    self._remove_dead_host_state(state_key)
+                    continue
+                host_state.update_capabilities(
+                        self.service_states.get(state_key, None),
+                        dict(service.iteritems()))
+
+        self._last_sync = timeutils.utcnow()
+
+    def is_sharded(self):
+        """Return whether this scheduler only considers its share of the
+        hosts.
+        """
+        return (self._shard_ring is not None and
+                len(self._shard_ring.members) > 1)
+
+    def in_shard(self, host):
+        """Return whether a host is in the share of this scheduler."""
+        return (self._shard_ring is None or
+                self._shard_ring.get_member(host) == CONF.host)
+
+    def _update_shard(self):
+        """Rebuild the hash ring of the schedulers sharing the hosts when
+        they changed, checking them at most every
+        scheduler_shard_refresh_interval seconds.
+
+        Hosts move between shards when the ring changes, so the next
+        request reloads every host state.
+        """
+        if not CONF.scheduler_sharding:
+            if self._shard_ring is not None:
+                self._shard_ring = None
+                self._last_full_sync = None
+            return
+        if (self._shard_refreshed is not None and
+                not timeutils.is_older_than(self._shard_refreshed,
+                        CONF.scheduler_shard_refresh_interval)):
+            return
+        members = set(self.servicegroup_api.get_all(CONF.scheduler_topic)
+                      or [])
+        # This scheduler takes its share before its first heartbeat too.
+        members.add(CONF.host)
+        self._shard_refreshed = timeutils.utcnow()
+        if (self._shard_ring is not None and
+                self._shard_ring.members == members):
+            return
+        LOG.info(_("Sharing the hosts between schedulers %s"),
+                 ', '.join(sorted(members)))
+        self._shard_ring = hash_ring.HashRing(members,
+                                              CONF.scheduler_shard_replicas)
+        self._last_full_sync = None
+
+    def _load_other_shards(self, context):
+        """Return new HostStates of the compute nodes which are not in the
+        share of this scheduler.
+        """
+        host_states = []
+        for compute in db.compute_node_get_all(context):
+            service = compute['service']
+            if not service or self.in_shard(service['host']):
                 continue
             host = service['host']
             node = compute.get('hypervisor_hostname')
-            state_key = (host, node)
-            capabilities = self.service_states.get(state_key, None)
-            host_state = self.host_state_map.get(state_key)
-            if host_state:
-                host_state.update_capabilities(capabilities,
-                                               dict(service.iteritems()))
-            else:
-                host_state = self.host_state_cls(host, node,
-                        capabilities=capabilities,
-                        service=dict(service.iteritems()))
-                self.host_state_map[state_key] = host_state
+            host_state = self.host_state_cls(host, node,
+                    capabilities=self.service_states.get((host, node), None),
+                    service=dict(service.iteritems()))
             host_state.update_from_compute_node(compute)
-            seen_nodes.add(state_key)
+            host_states.append(host_state)
+        return host_states
 
-        # remove compute nodes from host_state_map if they are not active
-        dead_nodes = set(self.host_state_map.keys()) - seen_nodes
-        for state_key in dead_nodes:
-            host, node = state_key
-            LOG.info(_("Removing dead compute node %(host)s:%(node)s "
-                       "from scheduler") % {'host': host, 'node': node})
-            del self.host_state_map[state_key]
+    def get_all_host_states(self, context, all_shards=False):
+        """Returns a list of HostStates that represents all the hosts
+        the HostManager knows about. Also, each of the consumable resources
+        in HostState are pre-populated and adjusted based on data in the db.
+
+        If scheduler_host_state_cache is enabled, the HostStates are only
+        reloaded from the db once they are older than
+        scheduler_host_state_max_staleness, and then only for the compute
+        nodes changed since the previous load.  Resources consumed in the
+        meantime are kept in the cached HostStates.
 
-        return self.host_state_map.itervalues()
+        If scheduler_sharding is enabled, only the hosts in the share of
+        this scheduler are tracked and returned, unless all_shards is set,
+        in which case the other hosts are loaded for this request only.
+        """
+        self._update_shard()
+        if not CONF.scheduler_host_state_cache:
+            self._sync_all_host_states(context)
+        elif (self._last_full_sync is None or
+                self._compute_watermark is None or
+                timeutils.is_older_than(self._last_full_sync,
+                        CONF.scheduler_host_state_full_sync_interval)):
+            self._sync_all_host_states(context)
+        elif timeutils.is_older_than(self._last_sync,
+                CONF.scheduler_host_state_max_staleness):
+            self._sync_changed_host_states(context)
+
+        host_states = self.host_state_map.values()
+        if all_shards and self.is_sharded():
+            host_states.extend(self._load_other_shards(context))
+        if CONF.scheduler_aggregate_metadata_cache:
+            self._update_host_aggregates(context, host_states)
+        return iter(host_states)
+
+    def aggregates_changed(self):
+        """Drop the cached aggregate metadata, to reload it on the next
+        request.
+        """
+        self._host_aggregates_loaded = None
+
+    def _load_host_aggregates(self, context):
+        """Return the ids and metadata of the aggregates of each host.
+
+        Hosts in the same aggregates share the same metadata dict, with the
+        values of every key as db.aggregate_metadata_get_by_host() returns
+        them.
+        """
+        aggregates = {}
+        host_aggregate_ids = collections.defaultdict(set)
+        for aggregate in db.aggregate_get_all(context):
+            aggregates[aggregate['id']] = aggregate
+            for host in aggregate.hosts:
+                host_aggregate_ids[host].add(aggregate['id'])
+
+        metadata_by_ids = {}
+        host_aggregates = {}
+        for host, aggregate_ids in host_aggregate_ids.iteritems():
+            aggregate_ids = frozenset(aggregate_ids)
+            metadata = metadata_by_ids.get(aggregate_ids)
+            if metadata is None:
+                metadata = collections.defaultdict(set)
+                for aggregate_id in aggregate_ids:
+                    metadetails = aggregates[aggregate_id].metadetails
+                    for key, value in metadetails.iteritems():
+                        metadata[key].add(value)
+                metadata = metadata_by_ids[aggregate_ids] = dict(metadata)
+            host_aggregates[host] = (aggregate_ids, metadata)
+        return host_aggregates
+
+    def _update_host_aggregates(self, context, host_states):
+        """Set the cached aggregates of the HostStates, reloading them
+        first if they are too old.
+        """
+        if (self._host_aggregates_loaded is None or
+                timeutils.is_older_than(self._host_aggregates_loaded,
+                        CONF.scheduler_aggregate_metadata_max_age)):
+            self._host_aggregates = self._load_host_aggregates(context)
+            self._host_aggregates_loaded = timeutils.utcnow()
+
+        no_aggregates = (frozenset(), {})
+        for host_state in host_states:
+            (host_state.aggregate_ids,
+             host_state.aggregate_metadata) = self._host_aggregates.get(
+                    host_state.host, no_aggregates)
@@ -50,6 +50,7 @@ scheduler_driver_opt = cfg.StrOpt('scheduler_driver',
 
 CONF = cfg.CONF
 CONF.register_opt(scheduler_driver_opt)
+CONF.import_opt('scheduler_stats_interval', 'nova.scheduler.stats')
 
 QUOTAS = quota.QUOTAS
 
@@ -57,7 +58,7 @@ QUOTAS = quota.QUOTAS
 class SchedulerManager(manager.Manager):
     """Chooses a host to run instances on."""
 
-    RPC_API_VERSION = '2.9'
+    RPC_API_VERSION = '2.10'
 
     def __init__(self, scheduler_driver=None, *args, **kwargs):
         if not scheduler_driver:
@@ -81,6 +82,10 @@ class SchedulerManager(manager.Manager):
             self.driver.update_service_capabilities(service_name, host,
                                                     capability)
 
+    def aggregates_changed(self, context):
+        """Process a notification that host aggregates were changed."""
+        self.driver.aggregates_changed()
+
     def create_volume(self, context, volume_id, snapshot_id,
                       reservations=None, image_id=None):
         #function removed in RPC API 2.3
@@ -272,6 +277,10 @@ class SchedulerManager(manager.Manager):
     def _expire_reservations(self, context):
         QUOTAS.expire(context)
 
+    @periodic_task.periodic_task(spacing=CONF.scheduler_stats_interval)
+    def _report_scheduler_stats(self, context):
+        self.driver.host_manager.stats.report(context)
+
     # NOTE(russellb) This method can be removed in 3.0 of this API.  It is
     # deprecated in favor of the method in the base API.
     def get_backdoor_port(self, context):
@@ -77,6 +77,8 @@ class SchedulerAPI(rpcclient.RpcProxy):
         handle the version_cap being set to 2.9.
 
         ... - Deprecated live_migration() call, moved to conductor
+
+        2.10 - Add aggregates_changed()
     '''
 
     #
@@ -145,6 +147,13 @@ class SchedulerAPI(rpcclient.RpcProxy):
                    service_name=service_name, host=host,
                    capabilities=capabilities)
 
+    def aggregates_changed(self, ctxt):
+        if not self.client.can_send_version('2.10'):
+            # Older schedulers do not cache aggregates.
+            return
+        cctxt = self.client.prepare(fanout=True, version='2.10')
+        cctxt.cast(ctxt, 'aggregates_changed')
+
     def select_hosts(self, ctxt, request_spec, filter_properties):
         cctxt = self.client.prepare(version='2.6')
         return cctxt.call(ctxt, 'select_hosts',
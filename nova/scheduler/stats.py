@@ -0,0 +1,136 @@
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Statistics about the time spent in each host filter and weigher, and the
+hosts each filter eliminates.
+"""
+
+from oslo.config import cfg
+
+from nova import notifier
+from nova.openstack.common.gettextutils import _
+from nova.openstack.common import log as logging
+
+stats_opts = [
+    cfg.IntOpt('scheduler_stats_interval',
+               default=600,
+               help='Interval in seconds between summaries of the time '
+                    'spent in each host filter and weigher and of the hosts '
+                    'each filter eliminated. Summaries are logged and sent '
+                    'as scheduler.stats notifications. A negative value '
+                    'disables them'),
+    cfg.BoolOpt('scheduler_profile_requests',
+                default=False,
+                help='For debugging, record the time spent in each host '
+                     'filter and weigher for each request, and the hosts '
+                     'each filter eliminated. The profile is only logged, '
+                     'at debug level, and is not sent to the compute nodes'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(stats_opts)
+
+LOG = logging.getLogger(__name__)
+
+
+class SchedulerStats(object):
+    """Totals of the filter and weigher runs since the last report."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # { filter name : { 'runs', 'seconds', 'hosts_in', 'hosts_out' } }
+        self.filters = {}
+        # { weigher name : { 'runs', 'seconds', 'hosts' } }
+        self.weighers = {}
+        # Reservations made on compute nodes, and refused because the
+        # compute node had no room left, each sparing a reschedule
+        self.reservations = dict(reserved=0, refused=0)
+
+    def record_filter(self, name, hosts_in, hosts_out, seconds,
+                      filter_properties=None):
+        """Record a run of a filter, and add it to the profile of the
+        request if there is one.
+        """
+        totals = self.filters.get(name)
+        if totals is None:
+            totals = self.filters[name] = dict(runs=0, seconds=0.0,
+                                               hosts_in=0, hosts_out=0)
+        totals['runs'] += 1
+        totals['seconds'] += seconds
+        totals['hosts_in'] += hosts_in
+        totals['hosts_out'] += hosts_out
+
+        profile = (filter_properties or {}).get('scheduler_profile')
+        if profile is not None:
+            profile['filters'].append(dict(name=name, seconds=seconds,
+                                           hosts_in=hosts_in,
+                                           hosts_out=hosts_out))
+
+    def record_weigher(self, name, hosts, seconds, weight_properties=None):
+        """Record a run of a weigher, and add it to the profile of the
+        request if there is one.
+        """
+        totals = self.weighers.get(name)
+        if totals is None:
+            totals = self.weighers[name] = dict(runs=0, seconds=0.0,
+                                                hosts=0)
+        totals['runs'] += 1
+        totals['seconds'] += seconds
+        totals['hosts'] += hosts
+
+        profile = (weight_properties or {}).get('scheduler_profile')
+        if profile is not None:
+            profile['weighers'].append(dict(name=name, seconds=seconds,
+                                            hosts=hosts))
+
+    def record_reservation(self, reserved):
+        """Record a reservation of resources on a compute node."""
+        if reserved:
+            self.reservations['reserved'] += 1
+        else:
+            self.reservations['refused'] += 1
+
+    def report(self, context):
+        """Log and notify the totals since the last report, then start
+        over.
+        """
+        payload = dict(filters=self.filters, weighers=self.weighers,
+                       reservations=self.reservations)
+        self.reset()
+        if (not payload['filters'] and not payload['weighers'] and
+                not any(payload['reservations'].values())):
+            return
+
+        for name, totals in sorted(payload['filters'].iteritems()):
+            LOG.info(_("Filter %(name)s: %(runs)d runs in %(seconds).3f "
+                       "seconds, %(hosts_in)d hosts in, %(hosts_out)d hosts "
+                       "out"), dict(totals, name=name))
+        for name, totals in sorted(payload['weighers'].iteritems()):
+            LOG.info(_("Weigher %(name)s: %(runs)d runs in %(seconds).3f "
+                       "seconds, %(hosts)d hosts"), dict(totals, name=name))
+        if any(payload['reservations'].values()):
+            LOG.info(_("Reservations: %(reserved)d made, %(refused)d refused "
+                       "for lack of room, avoiding as many reschedules"),
+                     payload['reservations'])
+        notifier.get_notifier('scheduler').info(context, 'scheduler.stats',
+                                                payload)
+
+
+def new_profile():
+    """Return an empty profile of a request, for filter_properties."""
+    return dict(filters=[], weighers=[])
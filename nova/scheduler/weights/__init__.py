@@ -17,8 +17,11 @@
 Scheduler host weights
 """
 
+import time
+
 from oslo.config import cfg
 
+from nova.scheduler import host_columns
 from nova import weights
 
 CONF = cfg.CONF
@@ -37,14 +40,81 @@ class WeighedHost(weights.WeighedObject):
 
 class BaseHostWeigher(weights.BaseWeigher):
     """Base class for host weights."""
-    pass
+
+    def weigh_columns(self, columns, weight_properties):
+        """Return an array of the weight of every host, before applying
+        the multiplier.
+
+        :param columns: HostStateColumns of the hosts to weigh
+
+        Override this in a subclass which can evaluate _weigh_object() as
+        vectorized operations over the columns.  Returning None makes the
+        weigher fall back to weighing each host.
+        """
+        return None
 
 
 class HostWeightHandler(weights.BaseWeightHandler):
     object_class = WeighedHost
 
-    def __init__(self):
+    def __init__(self, stats=None):
         super(HostWeightHandler, self).__init__(BaseHostWeigher)
+        # SchedulerStats to record the weigher runs in
+        self.stats = stats
+
+    def weigher_ran(self, cls_name, num_objs, seconds, weighing_properties):
+        if self.stats is not None:
+            self.stats.record_weigher(cls_name, num_objs, seconds,
+                                      weighing_properties)
+
+    def get_weighed_objects(self, weigher_classes, obj_list,
+            weighing_properties, limit=None, normalize_weights=False):
+        if not host_columns.enabled():
+            return super(HostWeightHandler, self).get_weighed_objects(
+                    weigher_classes, obj_list, weighing_properties,
+                    limit=limit, normalize_weights=normalize_weights)
+
+        if isinstance(obj_list, host_columns.HostStateColumns):
+            columns = obj_list
+        else:
+            columns = host_columns.HostStateColumns(obj_list)
+        if not len(columns):
+            return []
+
+        totals = columns.zeros()
+        for weigher_cls in weigher_classes:
+            start = time.time()
+            totals += self._weigh_columns(weigher_cls(), columns,
+                                          weighing_properties,
+                                          normalize_weights)
+            self.weigher_ran(weigher_cls.__name__, len(columns),
+                             time.time() - start, weighing_properties)
+
+        host_states = columns.host_states
+        totals_list = totals.tolist()
+        return [self.object_class(host_states[i], totals_list[i])
+                for i in host_columns.top(totals, limit).tolist()]
+
+    def _weigh_columns(self, weigher, columns, weighing_properties,
+                       normalize_weights):
+        """Return an array of the weights given by a weigher, multiplier
+        applied.
+        """
+        weights = weigher.weigh_columns(columns, weighing_properties)
+        if weights is None and not normalize_weights:
+            # Let the weigher apply its multiplier itself, in case it
+            # overrides weigh_objects().
+            weighed_objs = [self.object_class(host_state, 0.0)
+                            for host_state in columns]
+            weigher.weigh_objects(weighed_objs, weighing_properties)
+            return columns.array(x.weight for x in weighed_objs)
+        if weights is None:
+            weights = columns.array(weigher.get_weights(
+                    columns.host_states, weighing_properties))
+        if normalize_weights:
+            weights = host_columns.normalize(weights, weigher.minval,
+                                             weigher.maxval)
+        return weigher._weight_multiplier() * weights
 
 
 def all_weighers():
@@ -69,6 +69,10 @@ def fake_get_host_availability_zone(context, host):
     return host
 
 
+def fake_get_hosts_availability_zones(context, hosts):
+    return dict((host, host) for host in hosts)
+
+
 def fake_get_no_host_availability_zone(context, host):
     return None
 
@@ -85,6 +89,8 @@ class ExtendedServerAttributesTest(test.TestCase):
         self.stubs.Set(compute.api.API, 'get_all', fake_compute_get_all)
         self.stubs.Set(availability_zones, 'get_host_availability_zone',
                        fake_get_host_availability_zone)
+        self.stubs.Set(availability_zones, 'get_hosts_availability_zones',
+                       fake_get_hosts_availability_zones)
         return_server = fakes.fake_instance_get()
         self.stubs.Set(db, 'instance_get_by_uuid', return_server)
 
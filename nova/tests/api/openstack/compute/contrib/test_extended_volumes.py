@@ -47,6 +47,11 @@ def fake_compute_get_instance_bdms(*args, **kwargs):
     return [{'volume_id': UUID1}, {'volume_id': UUID2}]
 
 
+def fake_compute_get_instances_bdms(self, context, instances, legacy=True):
+    return dict((instance['uuid'], fake_compute_get_instance_bdms())
+                for instance in instances)
+
+
 class ExtendedVolumesTest(test.TestCase):
     content_type = 'application/json'
     prefix = 'os-extended-volumes:'
@@ -58,6 +63,8 @@ class ExtendedVolumesTest(test.TestCase):
         self.stubs.Set(compute.api.API, 'get_all', fake_compute_get_all)
         self.stubs.Set(compute.api.API, 'get_instance_bdms',
                        fake_compute_get_instance_bdms)
+        self.stubs.Set(compute.api.API, 'get_instances_bdms',
+                       fake_compute_get_instances_bdms)
         self.flags(
             osapi_compute_extension=[
                 'nova.api.openstack.compute.contrib.select_extensions'],
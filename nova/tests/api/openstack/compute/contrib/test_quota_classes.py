@@ -18,6 +18,7 @@ import webob
 
 from nova.api.openstack.compute.contrib import quota_classes
 from nova.api.openstack import wsgi
+from nova import quota
 from nova import test
 from nova.tests.api.openstack import fakes
 
@@ -105,6 +106,20 @@ class QuotaClassSetsTest(test.TestCase):
 
         self.assertEqual(res_dict, body)
 
+    def test_quotas_update_with_limits_cache(self):
+        self.flags(quota_limits_cache_ttl=60)
+        self.addCleanup(quota.QUOTAS.limits_changed)
+        body = {'quota_class_set': {'instances': 50, 'cores': 50}}
+
+        req = fakes.HTTPRequest.blank(
+            '/v2/fake4/os-quota-class-sets/test_class',
+            use_admin_context=True)
+        self.controller.show(req, 'test_class')
+        res_dict = self.controller.update(req, 'test_class', body)
+
+        self.assertEqual(res_dict['quota_class_set']['instances'], 50)
+        self.assertEqual(res_dict['quota_class_set']['cores'], 50)
+
     def test_quotas_update_as_user(self):
         body = {'quota_class_set': {'instances': 50, 'cores': 50,
                                     'ram': 51200, 'floating_ips': 10,
@@ -135,6 +135,23 @@ class QuotaSetsTest(test.TestCase):
 
         self.assertEqual(res_dict, body)
 
+    def test_quotas_update_with_limits_cache(self):
+        self.flags(quota_limits_cache_ttl=60)
+        self.addCleanup(quota.QUOTAS.limits_changed)
+        self.ext_mgr.is_loaded('os-user-quotas').AndReturn(True)
+        self.ext_mgr.is_loaded('os-extended-quotas').AndReturn(True)
+        self.ext_mgr.is_loaded('os-user-quotas').AndReturn(True)
+        self.mox.ReplayAll()
+        body = {'quota_set': {'instances': 50, 'cores': 50}}
+
+        req = fakes.HTTPRequest.blank('/v2/fake4/os-quota-sets/update_me',
+                                      use_admin_context=True)
+        self.controller.show(req, 'update_me')
+        res_dict = self.controller.update(req, 'update_me', body)
+
+        self.assertEqual(res_dict['quota_set']['instances'], 50)
+        self.assertEqual(res_dict['quota_set']['cores'], 50)
+
     def test_quotas_update_zero_value_as_admin(self):
         self.ext_mgr.is_loaded('os-extended-quotas').AndReturn(True)
         self.ext_mgr.is_loaded('os-user-quotas').AndReturn(True)
@@ -56,6 +56,11 @@ def fake_compute_get_instance_bdms(*args, **kwargs):
     return [{'volume_id': UUID1}, {'volume_id': UUID2}]
 
 
+def fake_compute_get_instances_bdms(self, context, instances, legacy=True):
+    return dict((instance['uuid'], fake_compute_get_instance_bdms())
+                for instance in instances)
+
+
 def fake_attach_volume(self, context, instance, volume_id, device):
     pass
 
@@ -124,6 +129,8 @@ class ExtendedVolumesTest(test.TestCase):
         self.stubs.Set(compute.api.API, 'get_all', fake_compute_get_all)
         self.stubs.Set(compute.api.API, 'get_instance_bdms',
                        fake_compute_get_instance_bdms)
+        self.stubs.Set(compute.api.API, 'get_instances_bdms',
+                       fake_compute_get_instances_bdms)
         self.stubs.Set(volume.cinder.API, 'get', fake_volume_get)
         self.stubs.Set(compute.api.API, 'detach_volume', fake_detach_volume)
         self.stubs.Set(compute.api.API, 'attach_volume', fake_attach_volume)
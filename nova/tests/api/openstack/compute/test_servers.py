@@ -22,11 +22,13 @@ import datetime
 import testtools
 import urlparse
 import uuid
+import weakref
 
 import iso8601
 from lxml import etree
 import mox
 from oslo.config import cfg
+from sqlalchemy import event as sqla_event
 import webob
 
 from nova.api.openstack import compute
@@ -35,6 +37,7 @@ from nova.api.openstack.compute import servers
 from nova.api.openstack.compute import views
 from nova.api.openstack import extensions
 from nova.api.openstack import xmlutil
+from nova import availability_zones
 from nova import block_device
 from nova.compute import api as compute_api
 from nova.compute import flavors
@@ -48,6 +51,7 @@ from nova.image import glance
 from nova.network import manager
 from nova.network.neutronv2 import api as neutron_api
 from nova.objects import instance as instance_obj
+from nova.openstack.common.db.sqlalchemy import session as db_session
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import jsonutils
 from nova.openstack.common import policy as common_policy
@@ -659,7 +663,7 @@ class ServersControllerTest(ControllerTest):
     def test_tenant_id_filter_converts_to_project_id_for_admin(self):
         def fake_get_all(context, filters=None, sort_key=None,
                          sort_dir='desc', limit=None, marker=None,
-                         columns_to_join=None):
+                         columns_to_join=None, columns=None):
             self.assertIsNotNone(filters)
             self.assertEqual(filters['project_id'], 'newfake')
             self.assertFalse(filters.get('tenant_id'))
@@ -678,7 +682,7 @@ class ServersControllerTest(ControllerTest):
     def test_all_tenants_param_normal(self):
         def fake_get_all(context, filters=None, sort_key=None,
                          sort_dir='desc', limit=None, marker=None,
-                         columns_to_join=None):
+                         columns_to_join=None, columns=None):
             self.assertNotIn('project_id', filters)
             return [fakes.stub_instance(100)]
 
@@ -694,7 +698,7 @@ class ServersControllerTest(ControllerTest):
     def test_all_tenants_param_one(self):
         def fake_get_all(context, filters=None, sort_key=None,
                          sort_dir='desc', limit=None, marker=None,
-                         columns_to_join=None):
+                         columns_to_join=None, columns=None):
             self.assertNotIn('project_id', filters)
             return [fakes.stub_instance(100)]
 
@@ -710,7 +714,7 @@ class ServersControllerTest(ControllerTest):
     def test_all_tenants_param_zero(self):
         def fake_get_all(context, filters=None, sort_key=None,
                          sort_dir='desc', limit=None, marker=None,
-                         columns_to_join=None):
+                         columns_to_join=None, columns=None):
             self.assertNotIn('all_tenants', filters)
             return [fakes.stub_instance(100)]
 
@@ -726,7 +730,7 @@ class ServersControllerTest(ControllerTest):
     def test_all_tenants_param_false(self):
         def fake_get_all(context, filters=None, sort_key=None,
                          sort_dir='desc', limit=None, marker=None,
-                         columns_to_join=None):
+                         columns_to_join=None, columns=None):
             self.assertNotIn('all_tenants', filters)
             return [fakes.stub_instance(100)]
 
@@ -742,7 +746,7 @@ class ServersControllerTest(ControllerTest):
     def test_all_tenants_param_invalid(self):
         def fake_get_all(context, filters=None, sort_key=None,
                          sort_dir='desc', limit=None, marker=None,
-                         columns_to_join=None):
+                         columns_to_join=None, columns=None):
             self.assertNotIn('all_tenants', filters)
             return [fakes.stub_instance(100)]
 
@@ -757,7 +761,7 @@ class ServersControllerTest(ControllerTest):
     def test_admin_restricted_tenant(self):
         def fake_get_all(context, filters=None, sort_key=None,
                          sort_dir='desc', limit=None, marker=None,
-                         columns_to_join=None):
+                         columns_to_join=None, columns=None):
             self.assertIsNotNone(filters)
             self.assertEqual(filters['project_id'], 'fake')
             return [fakes.stub_instance(100)]
@@ -774,7 +778,7 @@ class ServersControllerTest(ControllerTest):
     def test_all_tenants_pass_policy(self):
         def fake_get_all(context, filters=None, sort_key=None,
                          sort_dir='desc', limit=None, marker=None,
-                         columns_to_join=None):
+                         columns_to_join=None, columns=None):
             self.assertIsNotNone(filters)
             self.assertNotIn('project_id', filters)
             return [fakes.stub_instance(100)]
@@ -799,7 +803,7 @@ class ServersControllerTest(ControllerTest):
     def test_all_tenants_fail_policy(self):
         def fake_get_all(context, filters=None, sort_key=None,
                          sort_dir='desc', limit=None, marker=None,
-                         columns_to_join=None):
+                         columns_to_join=None, columns=None):
             self.assertIsNotNone(filters)
             return [fakes.stub_instance(100)]
 
@@ -4580,6 +4584,76 @@ class ServersAllExtensionsTestCase(test.TestCase):
         self.assertEqual(422, res.status_int)
 
 
+# The statements run against the test database while a test counts them.
+# The listener stays registered on the engine, which outlives the tests.
+_recorded_statements = None
+_listening_engines = weakref.WeakKeyDictionary()
+
+
+def _record_statement(conn, cursor, statement, *args):
+    if _recorded_statements is not None:
+        _recorded_statements.append(statement)
+
+
+class ServersDetailQueryCountTestCase(test.TestCase):
+    """
+    Count the queries run to list servers in detail, with the default API
+    router and all extensions enabled, against the test database.
+    """
+
+    def setUp(self):
+        super(ServersDetailQueryCountTestCase, self).setUp()
+        self.app = compute.APIRouter()
+        self.context = context.RequestContext('fake', 'fake')
+        self.flavor = flavors.get_default_flavor()
+        availability_zones.reset_cache()
+        self.addCleanup(availability_zones.reset_cache)
+        engine = db_session.get_engine()
+        if engine not in _listening_engines:
+            sqla_event.listen(engine, 'before_cursor_execute',
+                              _record_statement)
+            _listening_engines[engine] = True
+
+    def _create_server(self, i):
+        sys_meta = flavors.save_flavor_info({}, self.flavor)
+        instance = db.instance_create(self.context, {
+            'project_id': 'fake', 'user_id': 'fake',
+            'host': 'host%d' % i, 'vm_state': vm_states.ACTIVE,
+            'image_ref': '1', 'instance_type_id': self.flavor['id'],
+            'system_metadata': sys_meta})
+        db.instance_info_cache_update(self.context, instance['uuid'],
+                                      {'network_info': '[]'})
+        db.block_device_mapping_create(self.context, {
+            'instance_uuid': instance['uuid'], 'volume_id': 'volume%d' % i,
+            'source_type': 'volume', 'destination_type': 'volume',
+            'device_name': '/dev/vdb'}, legacy=False)
+
+    def _list_servers_in_detail(self):
+        global _recorded_statements
+        req = fakes.HTTPRequest.blank('/fake/servers/detail')
+        _recorded_statements = []
+        try:
+            res = req.get_response(self.app)
+            statements = _recorded_statements
+        finally:
+            _recorded_statements = None
+        self.assertEqual(200, res.status_int)
+        return jsonutils.loads(res.body)['servers'], statements
+
+    def test_detail_query_count(self):
+        self._create_server(0)
+        servers, statements_for_one = self._list_servers_in_detail()
+        self.assertEqual(1, len(servers))
+        for i in range(1, 4):
+            self._create_server(i)
+        servers, statements_for_four = self._list_servers_in_detail()
+        self.assertEqual(4, len(servers))
+        self.assertEqual(len(statements_for_one), len(statements_for_four))
+        for server in servers:
+            self.assertEqual(1, len(server['os-extended-volumes:'
+                                            'volumes_attached']))
+
+
 class ServersUnprocessableEntityTestCase(test.TestCase):
     """
     Tests of places we throw 422 Unprocessable Entity from
@@ -119,6 +119,22 @@ class RequestTest(test.NoDBTestCase):
                  'id1': compute_nodes[1],
                  'id2': compute_nodes[2]})
 
+    def test_prefetch_db_items(self):
+        request = wsgi.Request.blank('/foo')
+        loads = []
+
+        def load(uuids):
+            loads.append(sorted(uuids))
+            return dict((uuid, [uuid]) for uuid in uuids if uuid != 'uuid2')
+
+        request.prefetch_db_instance_bdms(['uuid0', 'uuid1'], load)
+        request.prefetch_db_instance_bdms(['uuid0', 'uuid1', 'uuid2'], load)
+        request.prefetch_db_instance_bdms(['uuid1', 'uuid2'], load)
+        self.assertEqual([['uuid0', 'uuid1'], ['uuid2']], loads)
+        self.assertEqual(request.get_db_instance_bdms('uuid0'), ['uuid0'])
+        self.assertEqual(request.get_db_instance_bdms('uuid1'), ['uuid1'])
+        self.assertIsNone(request.get_db_instance_bdms('uuid2'))
+
     def test_from_request(self):
         self.stubs.Set(gettextutils, 'get_available_languages',
                        fakes.fake_get_available_languages)
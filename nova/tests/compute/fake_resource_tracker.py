@@ -25,7 +25,7 @@ class FakeResourceTracker(resource_tracker.ResourceTracker):
         self.compute_node = values
         self.compute_node['id'] = 1
 
-    def _update(self, context, values, prune_stats=False):
+    def _update(self, context, values, prune_stats=False, always=()):
         self.compute_node.update(values)
 
     def _get_service(self, context):
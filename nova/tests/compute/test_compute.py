@@ -4991,7 +4991,8 @@ class ComputeTestCase(BaseTestCase):
                 'get_nw_info': 0, 'expected_instance': None}
 
         def fake_instance_get_all_by_host(context, host,
-                                          columns_to_join, use_slave=False):
+                                          columns_to_join, use_slave=False,
+                                          columns=None):
             call_info['get_all_by_host'] += 1
             self.assertEqual([], columns_to_join)
             return instances[:]
@@ -5693,6 +5694,7 @@ class ComputeTestCase(BaseTestCase):
         self.compute.handle_events(event.LifecycleEvent(uuid, lifecycle_event))
         self.mox.VerifyAll()
         self.mox.UnsetStubs()
+        self.assertEqual(power_state, self.compute._power_states.get(uuid))
 
     def test_lifecycle_events(self):
         self._test_lifecycle_event(event.EVENT_LIFECYCLE_STOPPED,
@@ -8270,6 +8272,17 @@ class ComputeAPIAggrTestCase(BaseTestCase):
                         matchers.DictMatches({'availability_zone': 'fake_zone',
                         'foo_key2': 'foo_value2'}))
 
+    def test_update_aggregate_metadata_notifies_scheduler(self):
+        # Ensure the schedulers are told to reload aggregate metadata.
+        aggr = self.api.create_aggregate(self.context, 'fake_aggregate',
+                                         'fake_zone')
+        self.mox.StubOutWithMock(self.api.scheduler_rpcapi,
+                                 'aggregates_changed')
+        self.api.scheduler_rpcapi.aggregates_changed(self.context)
+        self.mox.ReplayAll()
+        self.api.update_aggregate_metadata(self.context, aggr['id'],
+                                           {'foo_key1': 'foo_value1'})
+
     def test_delete_aggregate(self):
         # Ensure we can delete an aggregate.
         fake_notifier.NOTIFICATIONS = []
@@ -156,7 +156,7 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
             context.get_admin_context().AndReturn(fake_context)
             db.instance_get_all_by_host(
                     fake_context, our_host, columns_to_join=['info_cache'],
-                    use_slave=False
+                    use_slave=False, columns=None
                     ).AndReturn(startup_instances)
             if defer_iptables_apply:
                 self.compute.driver.filter_defer_apply_on()
@@ -223,7 +223,7 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         context.get_admin_context().AndReturn(fake_context)
         db.instance_get_all_by_host(fake_context, our_host,
                                     columns_to_join=['info_cache'],
-                                    use_slave=False
+                                    use_slave=False, columns=None
                                     ).AndReturn([])
         self.compute.init_virt_events()
 
@@ -343,7 +343,7 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
                 {'uuid': [inst['uuid'] for
                           inst in driver_instances]},
                 'created_at', 'desc', columns_to_join=None,
-                limit=None, marker=None).AndReturn(
+                limit=None, marker=None, columns=None).AndReturn(
                         driver_instances)
 
         self.mox.ReplayAll()
@@ -383,7 +383,7 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         db.instance_get_all_by_filters(
                 fake_context, filters,
                 'created_at', 'desc', columns_to_join=None,
-                limit=None, marker=None).AndReturn(all_instances)
+                limit=None, marker=None, columns=None).AndReturn(all_instances)
 
         self.mox.ReplayAll()
 
@@ -422,6 +422,190 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         self.mox.StubOutWithMock(instance, 'save')
         return instance
 
+    def test_sync_power_states_out_of_sync(self):
+        instances = []
+        for i, (ps, vs, ts) in enumerate((
+                (power_state.RUNNING, vm_states.ACTIVE, None),
+                (power_state.RUNNING, vm_states.ACTIVE, None),
+                (power_state.SHUTDOWN, vm_states.STOPPED, None),
+                (power_state.RUNNING, vm_states.ACTIVE,
+                 task_states.REBOOTING))):
+            instance = instance_obj.Instance()
+            instance.uuid = 'fake-uuid-%d' % i
+            instance.power_state = ps
+            instance.vm_state = vs
+            instance.task_state = ts
+            instances.append(instance)
+
+        self.mox.StubOutWithMock(instance_obj.InstanceList, 'get_by_host')
+        self.mox.StubOutWithMock(self.compute.driver, 'get_num_instances')
+        self.mox.StubOutWithMock(self.compute.driver, 'get_power_states')
+        self.mox.StubOutWithMock(self.compute, '_sync_instance_power_state')
+        instance_obj.InstanceList.get_by_host(
+            self.context, self.compute.host, use_slave=True,
+            columns=['host', 'node', 'power_state', 'vm_state',
+                     'task_state']).AndReturn(instances)
+        self.compute.driver.get_num_instances().AndReturn(4)
+        # The instance with a pending task is not looked at.
+        self.compute.driver.get_power_states(instances[:3]).AndReturn(
+            {'fake-uuid-0': power_state.RUNNING,
+             'fake-uuid-1': power_state.SHUTDOWN,
+             'fake-uuid-2': power_state.SHUTDOWN})
+        self.compute._sync_instance_power_state(self.context, instances[1],
+                                                power_state.SHUTDOWN,
+                                                use_slave=True)
+        self.mox.ReplayAll()
+        self.compute._sync_power_states(self.context)
+
+    def test_sync_power_states_error(self):
+        instances = []
+        for i in range(2):
+            instance = instance_obj.Instance()
+            instance.uuid = 'fake-uuid-%d' % i
+            instance.power_state = power_state.RUNNING
+            instance.vm_state = vm_states.ACTIVE
+            instance.task_state = None
+            instances.append(instance)
+
+        self.mox.StubOutWithMock(instance_obj.InstanceList, 'get_by_host')
+        self.mox.StubOutWithMock(self.compute.driver, 'get_power_states')
+        self.mox.StubOutWithMock(self.compute, '_sync_instance_power_state')
+        instance_obj.InstanceList.get_by_host(
+            self.context, self.compute.host, use_slave=True,
+            columns=mox.IgnoreArg()).AndReturn(instances)
+        self.compute.driver.get_power_states(instances).AndReturn(
+            {'fake-uuid-0': power_state.NOSTATE,
+             'fake-uuid-1': power_state.SHUTDOWN})
+        # An error syncing an instance does not stop the others.
+        self.compute._sync_instance_power_state(
+            self.context, instances[0], power_state.NOSTATE,
+            use_slave=True).AndRaise(test.TestingException())
+        self.compute._sync_instance_power_state(
+            self.context, instances[1], power_state.SHUTDOWN,
+            use_slave=True)
+        self.mox.ReplayAll()
+        self.compute._sync_power_states(self.context)
+
+    def _stub_power_state_reads(self, instances, capabilities):
+        reads = []
+
+        def fake_get_power_states(to_read):
+            reads.append([instance.uuid for instance in to_read])
+            return dict((instance.uuid, power_state.RUNNING)
+                        for instance in to_read)
+
+        self.stubs.Set(instance_obj.InstanceList, 'get_by_host',
+                       classmethod(lambda *a, **k: instances))
+        self.stubs.Set(self.compute.driver, 'get_num_instances',
+                       lambda: len(instances))
+        self.stubs.Set(self.compute.driver, 'get_power_states',
+                       fake_get_power_states)
+        self.stubs.Set(self.compute.driver, 'capabilities', capabilities)
+        return reads
+
+    def _get_power_state_instances(self, count):
+        instances = []
+        for i in range(count):
+            instance = instance_obj.Instance()
+            instance.uuid = 'fake-uuid-%d' % i
+            instance.power_state = power_state.RUNNING
+            instance.vm_state = vm_states.ACTIVE
+            instance.task_state = None
+            instances.append(instance)
+        return instances
+
+    def test_sync_power_states_audit_interval(self):
+        self.flags(sync_power_state_audit_interval=3)
+        instances = self._get_power_state_instances(2)
+        reads = self._stub_power_state_reads(
+            instances, {'supports_lifecycle_events': True})
+
+        self.compute._sync_power_states(self.context)
+        instances.append(self._get_power_state_instances(3)[2])
+        self.compute._sync_power_states(self.context)
+        self.compute._sync_power_states(self.context)
+        self.compute._sync_power_states(self.context)
+
+        # Between the audits only the instances new to the table are read.
+        self.assertEqual([['fake-uuid-0', 'fake-uuid-1'],
+                          ['fake-uuid-2'],
+                          ['fake-uuid-0', 'fake-uuid-1', 'fake-uuid-2']],
+                         reads)
+
+    def test_sync_power_states_without_lifecycle_events(self):
+        self.flags(sync_power_state_audit_interval=3)
+        instances = self._get_power_state_instances(1)
+        reads = self._stub_power_state_reads(
+            instances, {'supports_lifecycle_events': False})
+
+        self.compute._sync_power_states(self.context)
+        self.compute._sync_power_states(self.context)
+
+        self.assertEqual([['fake-uuid-0'], ['fake-uuid-0']], reads)
+
+    def test_sync_power_states_uses_event_power_states(self):
+        self.flags(sync_power_state_audit_interval=3)
+        instances = self._get_power_state_instances(2)
+        self._stub_power_state_reads(
+            instances, {'supports_lifecycle_events': True})
+        synced = []
+        self.stubs.Set(self.compute, '_sync_instance_power_state',
+                       lambda context, instance, vm_power_state, **kw:
+                       synced.append((instance.uuid, vm_power_state)))
+        self.compute._sync_power_states(self.context)
+        self.compute._power_states['fake-uuid-1'] = power_state.SHUTDOWN
+        # The instance left the host.
+        self.compute._power_states['fake-uuid-2'] = power_state.RUNNING
+
+        self.compute._sync_power_states(self.context)
+
+        self.assertEqual([('fake-uuid-1', power_state.SHUTDOWN)], synced)
+        self.assertEqual({'fake-uuid-0': power_state.RUNNING,
+                          'fake-uuid-1': power_state.SHUTDOWN},
+                         self.compute._power_states)
+
+    def test_read_power_states_keeps_event_power_states(self):
+        instances = self._get_power_state_instances(2)
+
+        def fake_get_power_states(to_read):
+            # An event arrives while the power states are being read.
+            self.compute._power_states['fake-uuid-0'] = power_state.SHUTDOWN
+            return {'fake-uuid-0': power_state.RUNNING}
+
+        self.stubs.Set(self.compute.driver, 'get_power_states',
+                       fake_get_power_states)
+        self.compute._power_states['fake-uuid-1'] = power_state.RUNNING
+
+        self.compute._read_power_states(instances)
+
+        self.assertEqual({'fake-uuid-0': power_state.SHUTDOWN},
+                         self.compute._power_states)
+
+    def test_power_state_out_of_sync(self):
+        instance = instance_obj.Instance()
+        for db_ps, vs, vm_ps, out_of_sync in (
+                (power_state.RUNNING, vm_states.ACTIVE,
+                 power_state.RUNNING, False),
+                (power_state.RUNNING, vm_states.ACTIVE,
+                 power_state.SHUTDOWN, True),
+                (power_state.PAUSED, vm_states.ACTIVE,
+                 power_state.PAUSED, True),
+                (power_state.SHUTDOWN, vm_states.STOPPED,
+                 power_state.SHUTDOWN, False),
+                (power_state.RUNNING, vm_states.STOPPED,
+                 power_state.RUNNING, True),
+                (power_state.RUNNING, vm_states.DELETED,
+                 power_state.RUNNING, True),
+                (power_state.NOSTATE, vm_states.DELETED,
+                 power_state.NOSTATE, False),
+                (power_state.PAUSED, vm_states.PAUSED,
+                 power_state.PAUSED, False)):
+            instance.power_state = db_ps
+            instance.vm_state = vs
+            self.assertEqual(out_of_sync,
+                             self.compute._power_state_out_of_sync(instance,
+                                                                   vm_ps))
+
     def test_sync_instance_power_state_match(self):
         instance = self._get_sync_instance(power_state.RUNNING,
                                            vm_states.ACTIVE)
@@ -1029,3 +1029,139 @@ class OrphanTestCase(BaseTrackerTestCase):
         orphans = self.tracker._find_orphaned_instances()
 
         self.assertEqual(2, len(orphans))
+
+
+class IncrementalAuditTestCase(BaseTrackerTestCase):
+    def setUp(self):
+        self.flags(resource_audit_interval=3)
+        self.audits = 0
+        self.written = []
+        super(IncrementalAuditTestCase, self).setUp()
+        self.stubs.Set(db, 'instance_statistics_by_host_and_node',
+                       self._fake_instance_statistics_by_host_and_node)
+        get_available_resource = self.tracker.driver.get_available_resource
+
+        def fake_get_available_resource(nodename):
+            self.audits += 1
+            return get_available_resource(nodename)
+
+        self.stubs.Set(self.tracker.driver, 'get_available_resource',
+                       fake_get_available_resource)
+
+    def _fake_compute_node_update(self, ctx, compute_node_id, values,
+            prune_stats=False):
+        self.written.append(sorted(values))
+        return super(IncrementalAuditTestCase,
+                     self)._fake_compute_node_update(ctx, compute_node_id,
+                                                     values, prune_stats)
+
+    def _fake_instance_statistics_by_host_and_node(self, ctx, host, node):
+        instances = [i for i in self._instances.values()
+                     if i['host'] == host and i['node'] == node and
+                     i['vm_state'] != vm_states.DELETED]
+        statistics = {'count': len(instances)}
+        for field in ('vcpus', 'memory_mb', 'root_gb', 'ephemeral_gb'):
+            statistics[field] = sum(i[field] for i in instances)
+        return statistics
+
+    def test_audit_every_interval(self):
+        instance = self._fake_instance(memory_mb=3, root_gb=1,
+                                       ephemeral_gb=1)
+        self.tracker.instance_claim(self.context, instance, self.limits)
+
+        self.tracker.update_available_resource(self.context)
+        self.tracker.update_available_resource(self.context)
+        self.assertEqual(0, self.audits)
+        self._assert(3 + FAKE_VIRT_MEMORY_OVERHEAD, 'memory_mb_used')
+
+        self.tracker.update_available_resource(self.context)
+        self.assertEqual(1, self.audits)
+        self._assert(3 + FAKE_VIRT_MEMORY_OVERHEAD, 'memory_mb_used')
+
+    def test_audit_when_not_reconciled(self):
+        self._fake_instance(memory_mb=3, root_gb=1, ephemeral_gb=1,
+                            host=self.host, node='fakenode')
+
+        self.tracker.update_available_resource(self.context)
+        self.assertEqual(1, self.audits)
+        self._assert(3 + FAKE_VIRT_MEMORY_OVERHEAD, 'memory_mb_used')
+
+        self.tracker.update_available_resource(self.context)
+        self.assertEqual(1, self.audits)
+
+    def test_delete_reconciled(self):
+        instance = self._fake_instance(memory_mb=3, root_gb=1,
+                                       ephemeral_gb=1)
+        self.tracker.instance_claim(self.context, instance, self.limits)
+
+        instance['vm_state'] = vm_states.DELETED
+        self.tracker.update_usage(self.context, instance)
+        self._assert(0, 'memory_mb_used')
+        self.tracker.update_available_resource(self.context)
+        self.assertEqual(0, self.audits)
+
+    def test_update_writes_changed_values(self):
+        instance = self._fake_instance(memory_mb=3, root_gb=1,
+                                       ephemeral_gb=1)
+        self.tracker.instance_claim(self.context, instance, self.limits)
+
+        written = self.written[-1]
+        self.assertIn('memory_mb_used', written)
+        self.assertIn('stats', written)
+        self.assertNotIn('memory_mb', written)
+        self.assertNotIn('cpu_info', written)
+
+    def test_reconciled_drops_reservations(self):
+        instance = self._fake_instance(memory_mb=3, root_gb=1,
+                                       ephemeral_gb=1)
+        self.tracker.instance_claim(self.context, instance, self.limits)
+
+        # The scheduler reserves resources for an instance which never
+        # claims them.
+        self.compute = dict(self.compute)
+        self.compute['memory_mb_used'] += 512
+        self.compute['free_ram_mb'] -= 512
+        self.compute['vcpus_used'] += 1
+
+        self.tracker.update_available_resource(self.context)
+        self.assertEqual(0, self.audits)
+        written = self.written[-1]
+        for field in resource_tracker.AUDITED_USAGE_FIELDS:
+            self.assertIn(field, written)
+        self.assertEqual(3 + FAKE_VIRT_MEMORY_OVERHEAD,
+                         self.compute['memory_mb_used'])
+        self.assertEqual(FAKE_VIRT_MEMORY_MB - 3 - FAKE_VIRT_MEMORY_OVERHEAD,
+                         self.compute['free_ram_mb'])
+        self.assertEqual(1, self.compute['vcpus_used'])
+
+    def test_claim_keeps_unwritten_usage(self):
+        # The scheduler reserves disk for an instance which did not claim
+        # it yet.
+        self.compute = dict(self.compute)
+        self.compute['local_gb_used'] += 5
+        self.compute['free_disk_gb'] -= 5
+
+        # A claim which leaves the disk usage unchanged does not write it,
+        # nor take the reserved disk as its own usage.
+        instance = self._fake_instance(memory_mb=3, root_gb=0,
+                                       ephemeral_gb=0)
+        self.tracker.instance_claim(self.context, instance, self.limits)
+        self.assertNotIn('local_gb_used', self.written[-1])
+        self.assertEqual(5, self.compute['local_gb_used'])
+        self._assert(0, 'local_gb_used')
+        self._assert(FAKE_VIRT_LOCAL_GB, 'free_disk_gb')
+
+        # The reserved disk is dropped on the next update.
+        self.tracker.update_available_resource(self.context)
+        self.assertEqual(0, self.audits)
+        self.assertEqual(0, self.compute['local_gb_used'])
+        self.assertEqual(FAKE_VIRT_LOCAL_GB, self.compute['free_disk_gb'])
+
+    def test_audit_writes_usage(self):
+        self.flags(resource_audit_interval=1)
+        self.tracker.update_available_resource(self.context)
+
+        written = self.written[-1]
+        for field in resource_tracker.AUDITED_USAGE_FIELDS:
+            self.assertIn(field, written)
+        self.assertNotIn('memory_mb', written)
@@ -47,6 +47,7 @@ from nova.db.sqlalchemy import utils as db_utils
 from nova import exception
 from nova.openstack.common.db import exception as db_exc
 from nova.openstack.common.db.sqlalchemy import session as db_session
+from nova.openstack.common.db.sqlalchemy import utils as sqlalchemyutils
 from nova.openstack.common import timeutils
 from nova.openstack.common import uuidutils
 from nova import quota
@@ -167,6 +168,73 @@ class DecoratorTestCase(test.TestCase):
     def test_require_admin_context_decorator_wraps_functions_properly(self):
         self._test_decorator_wraps_helper(sqlalchemy_api.require_admin_context)
 
+    def test_retry_on_deadlock_decorator_wraps_functions_properly(self):
+        self._test_decorator_wraps_helper(sqlalchemy_api._retry_on_deadlock)
+
+
+class RetryOnDeadlockTestCase(test.TestCase):
+    def setUp(self):
+        super(RetryOnDeadlockTestCase, self).setUp()
+        self.flags(db_deadlock_max_retries=3,
+                   db_deadlock_retry_interval=0.1,
+                   db_deadlock_max_retry_interval=0.3)
+        self.sleeps = []
+        self.stubs.Set(sqlalchemy_api.time, 'sleep', self.sleeps.append)
+        self.addCleanup(sqlalchemy_api.deadlock_retry_counters.pop,
+                        'deadlocking', None)
+
+    def _deadlocking(self, deadlocks):
+        calls = []
+
+        @sqlalchemy_api._retry_on_deadlock
+        def deadlocking():
+            calls.append(None)
+            if len(calls) <= deadlocks:
+                raise db_exc.DBDeadlock()
+            return 'done'
+        return deadlocking, calls
+
+    def test_retry_on_deadlock(self):
+        deadlocking, calls = self._deadlocking(3)
+
+        self.assertEqual(deadlocking(), 'done')
+        self.assertEqual(len(calls), 4)
+        self.assertEqual(len(self.sleeps), 3)
+        for delay, interval in zip(self.sleeps, [0.1, 0.2, 0.3]):
+            self.assertTrue(0 <= delay <= interval)
+        counters = sqlalchemy_api.deadlock_retry_counters['deadlocking']
+        self.assertEqual(counters['calls'], 1)
+        self.assertEqual(counters['deadlocks'], 3)
+        self.assertEqual(counters['failures'], 0)
+        self.assertEqual(sum(counters['latency']), 1)
+
+    def test_retry_on_deadlock_gives_up(self):
+        deadlocking, calls = self._deadlocking(4)
+
+        self.assertRaises(db_exc.DBDeadlock, deadlocking)
+        self.assertEqual(len(calls), 4)
+        self.assertEqual(len(self.sleeps), 3)
+        counters = sqlalchemy_api.deadlock_retry_counters['deadlocking']
+        self.assertEqual(counters['deadlocks'], 4)
+        self.assertEqual(counters['failures'], 1)
+        self.assertEqual(sum(counters['latency']), 1)
+
+    def test_retry_on_deadlock_forever(self):
+        self.flags(db_deadlock_max_retries=-1)
+        deadlocking, calls = self._deadlocking(1100)
+
+        self.assertEqual(deadlocking(), 'done')
+        self.assertEqual(len(self.sleeps), 1100)
+        self.assertTrue(all(0 <= delay <= 0.3 for delay in self.sleeps))
+
+    def test_retry_on_deadlock_disabled(self):
+        self.flags(db_deadlock_max_retries=0)
+        deadlocking, calls = self._deadlocking(1)
+
+        self.assertRaises(db_exc.DBDeadlock, deadlocking)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.sleeps, [])
+
 
 def _get_fake_aggr_values():
     return {'name': 'fake_aggregate'}
@@ -978,6 +1046,106 @@ class ReservationTestCase(test.TestCase, ModelsObjectComparatorMixin):
                                             self.ctxt, 'project1', 'user1'))
 
 
+class QuotaReserveConditionalTestCase(test.TestCase):
+
+    """Tests for db.api.quota_reserve_conditional() and the
+    reservation_*_conditional() methods.
+    """
+
+    def setUp(self):
+        super(QuotaReserveConditionalTestCase, self).setUp()
+        self.ctxt = context.get_admin_context()
+        self.resources = {
+            'instances': quota.ReservableResource('instances',
+                                                  '_sync_instances'),
+            'cores': quota.ReservableResource('cores', '_sync_instances'),
+            'fixed_ips': quota.ReservableResource('fixed_ips',
+                                                  '_sync_fixed_ips'),
+            }
+        self.quotas = dict(instances=5, cores=10, fixed_ips=5)
+
+    def _reserve(self, user_id='user1', user_quotas=None, **deltas):
+        # Like DbQuotaDriver, only pass the quotas of the deltas.
+        user_quotas = user_quotas or self.quotas
+        expire = timeutils.utcnow() + datetime.timedelta(days=1)
+        return db.quota_reserve_conditional(
+                self.ctxt, self.resources,
+                dict((res, self.quotas[res]) for res in deltas),
+                dict((res, user_quotas[res]) for res in deltas),
+                deltas, expire, 0, 0, project_id='project1', user_id=user_id)
+
+    def _assertUsages(self, expected, user_id='user1'):
+        usages = db.quota_usage_get_all_by_project_and_user(
+                self.ctxt, 'project1', user_id)
+        self.assertEqual(expected,
+                         dict((res, (usages[res]['in_use'],
+                                     usages[res]['reserved']))
+                              for res in expected))
+
+    def test_reserve(self):
+        reservations = self._reserve(instances=2, cores=4, fixed_ips=1)
+        self.assertEqual(3, len(reservations))
+        self._assertUsages(dict(instances=(0, 2), cores=(0, 4),
+                                fixed_ips=(0, 1)))
+
+    def test_reserve_over_quota(self):
+        self._reserve(instances=2, cores=8)
+        exc = self.assertRaises(exception.OverQuota, self._reserve,
+                                instances=2, cores=4)
+        self.assertEqual(['cores'], exc.kwargs['overs'])
+        self.assertEqual(2, exc.kwargs['headroom']['cores'])
+        # The reservation of instances was rolled back.
+        self._assertUsages(dict(instances=(0, 2), cores=(0, 8)))
+
+    def test_reserve_over_project_quota(self):
+        self._reserve(instances=3)
+        self.assertRaises(exception.OverQuota, self._reserve,
+                          user_id='user2', instances=3)
+        self._assertUsages(dict(instances=(0, 0)), 'user2')
+        self._reserve(user_id='user2', instances=2)
+        self._assertUsages(dict(instances=(0, 2)), 'user2')
+
+    def test_reserve_over_user_quota(self):
+        user_quotas = dict(self.quotas, instances=1)
+        self.assertRaises(exception.OverQuota, self._reserve,
+                          user_quotas=user_quotas, instances=2)
+        self._reserve(user_quotas=user_quotas, instances=1)
+
+    def test_reserve_unlimited(self):
+        self.quotas['instances'] = -1
+        self._reserve(instances=100)
+        self._assertUsages(dict(instances=(0, 100)))
+
+    def test_reserve_reduction(self):
+        self._reserve(instances=5)
+        self._reserve(instances=-1)
+        self._assertUsages(dict(instances=(0, 5)))
+
+    def test_commit(self):
+        reservations = self._reserve(instances=2, cores=4)
+        db.reservation_commit_conditional(self.ctxt, reservations)
+        self._assertUsages(dict(instances=(2, 0), cores=(4, 0)))
+        # Committing again changes nothing.
+        db.reservation_commit_conditional(self.ctxt, reservations)
+        self._assertUsages(dict(instances=(2, 0), cores=(4, 0)))
+
+    def test_rollback(self):
+        reservations = self._reserve(instances=2, cores=4)
+        db.reservation_rollback_conditional(self.ctxt, reservations)
+        db.reservation_rollback_conditional(self.ctxt, reservations)
+        self._assertUsages(dict(instances=(0, 0), cores=(0, 0)))
+
+    def test_expire(self):
+        self._reserve(instances=2)
+        db.reservation_expire_conditional(self.ctxt)
+        self._assertUsages(dict(instances=(0, 2)))
+        timeutils.set_time_override(timeutils.utcnow() +
+                                    datetime.timedelta(days=2))
+        self.addCleanup(timeutils.clear_time_override)
+        db.reservation_expire_conditional(self.ctxt)
+        self._assertUsages(dict(instances=(0, 0)))
+
+
 class SecurityGroupRuleTestCase(test.TestCase, ModelsObjectComparatorMixin):
     def setUp(self):
         super(SecurityGroupRuleTestCase, self).setUp()
@@ -1681,12 +1849,167 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
             self.assertTrue(result[1]['cleaned'])
             self.assertFalse(result[0]['cleaned'])
 
+    def _get_all_pages(self, limit, **kwargs):
+        uuids = []
+        marker = None
+        while True:
+            result = db.instance_get_all_by_filters(self.ctxt, {},
+                                                    limit=limit,
+                                                    marker=marker, **kwargs)
+            uuids.extend(instance['uuid'] for instance in result)
+            if len(result) < limit:
+                return uuids
+            marker = result[-1]['uuid']
+
+    def test_instance_get_all_by_filters_paginate_ties(self):
+        created_at = datetime.datetime(2013, 1, 1)
+        instances = []
+        for i in range(7):
+            instances.append(self.create_instance_with_args(
+                    created_at=created_at + datetime.timedelta(i // 3),
+                    display_name='name%d' % (i % 2)))
+
+        for sort_key in ('created_at', 'display_name'):
+            for sort_dir in ('asc', 'desc'):
+                expected = db.instance_get_all_by_filters(self.ctxt, {},
+                                                          sort_key, sort_dir)
+                expected = [instance['uuid'] for instance in expected]
+                self.assertEqual(sorted(expected),
+                                 sorted(inst['uuid'] for inst in instances))
+                for limit in (1, 2, 3):
+                    self.assertEqual(expected,
+                                     self._get_all_pages(limit,
+                                                         sort_key=sort_key,
+                                                         sort_dir=sort_dir))
+
+    def test_instance_get_all_by_filters_paginate_null(self):
+        launched_at = datetime.datetime(2013, 1, 1)
+        for i in range(5):
+            self.create_instance_with_args(
+                    launched_at=launched_at if i % 2 else None)
+
+        for sort_dir in ('asc', 'desc'):
+            expected = db.instance_get_all_by_filters(self.ctxt, {},
+                                                      'launched_at', sort_dir)
+            expected = [instance['uuid'] for instance in expected]
+            self.assertEqual(5, len(expected))
+            for limit in (1, 2):
+                self.assertEqual(expected,
+                                 self._get_all_pages(limit,
+                                                     sort_key='launched_at',
+                                                     sort_dir=sort_dir))
+
+    def test_instance_get_all_by_filters_chunked(self):
+        created_at = datetime.datetime(2013, 1, 1)
+        for i in range(5):
+            self.create_instance_with_args(
+                    created_at=created_at + datetime.timedelta(i // 2))
+        expected = db.instance_get_all_by_filters(self.ctxt, {})
+        expected = [instance['uuid'] for instance in expected]
+
+        for chunk_size in (1, 2, 5, 6):
+            columns_to_join = ['metadata', 'info_cache']
+            chunks = list(db.instance_get_all_by_filters_chunked(
+                    self.ctxt, {}, chunk_size,
+                    columns_to_join=columns_to_join))
+            self.assertEqual(['metadata', 'info_cache'], columns_to_join)
+            self.assertEqual((5 + chunk_size - 1) // chunk_size, len(chunks))
+            self.assertTrue(all(len(chunk) <= chunk_size
+                                for chunk in chunks))
+            self.assertEqual(expected, [instance['uuid']
+                                        for chunk in chunks
+                                        for instance in chunk])
+            self.assertEqual(2, len(chunks[0][0]['metadata']))
+
+    def test_instance_get_all_by_filters_chunked_null(self):
+        launched_at = datetime.datetime(2013, 1, 1)
+        for i in range(5):
+            self.create_instance_with_args(
+                    launched_at=launched_at if i % 2 else None)
+
+        for sort_dir in ('asc', 'desc'):
+            expected = db.instance_get_all_by_filters(self.ctxt, {},
+                                                      'launched_at', sort_dir)
+            expected = [instance['uuid'] for instance in expected]
+            for chunk_size in (1, 2):
+                chunks = db.instance_get_all_by_filters_chunked(
+                        self.ctxt, {}, chunk_size, sort_key='launched_at',
+                        sort_dir=sort_dir)
+                self.assertEqual(expected, [instance['uuid']
+                                            for chunk in chunks
+                                            for instance in chunk])
+
+    def test_instance_get_all_by_filters_chunked_empty(self):
+        self.assertEqual([], list(db.instance_get_all_by_filters_chunked(
+                self.ctxt, {}, 2)))
+
+    def test_instance_get_all_by_filters_columns(self):
+        inst = self.create_instance_with_args(display_name='foo')
+        result = db.instance_get_all_by_filters(self.ctxt, {}, 'created_at',
+                                                'desc', columns=['host'],
+                                                columns_to_join=['metadata'])
+        self.assertEqual(1, len(result))
+        self.assertEqual(set(['id', 'uuid', 'host', 'created_at',
+                              'metadata', 'system_metadata']),
+                         set(result[0].keys()))
+        self.assertEqual(inst['uuid'], result[0]['uuid'])
+        self.assertEqual('h1', result[0]['host'])
+        self.assertEqual(2, len(result[0]['metadata']))
+
+    def test_instance_get_all_by_filters_unknown_column(self):
+        self.assertRaises(exception.InvalidInput,
+                          db.instance_get_all_by_filters, self.ctxt, {},
+                          'created_at', 'desc', columns=['foo'])
+
+    def test_instance_get_all_by_filters_paginate_other_project(self):
+        instance = self.create_instance_with_args(project_id='project2')
+        ctxt = context.RequestContext('user1', 'project1')
+        self.assertRaises(exception.MarkerNotFound,
+                          db.instance_get_all_by_filters,
+                          ctxt, {}, 'created_at', 'desc',
+                          marker=instance['uuid'])
+
+    def test_instance_get_all_by_filters_paginate_invalid_sort_key(self):
+        instance = self.create_instance_with_args()
+        self.assertRaises(sqlalchemyutils.InvalidSortKey,
+                          db.instance_get_all_by_filters,
+                          self.ctxt, {}, 'foo', 'desc',
+                          marker=instance['uuid'])
+
     def test_instance_get_all_by_host_and_node_no_join(self):
         instance = self.create_instance_with_args()
         result = db.instance_get_all_by_host_and_node(self.ctxt, 'h1', 'n1')
         self.assertEqual(result[0]['uuid'], instance['uuid'])
         self.assertEqual(result[0]['system_metadata'], [])
 
+    def test_instance_statistics_by_host_and_node(self):
+        self.create_instance_with_args(vcpus=2, memory_mb=512, root_gb=10,
+                                       ephemeral_gb=1)
+        self.create_instance_with_args(vcpus=1, memory_mb=256, root_gb=5,
+                                       ephemeral_gb=0)
+        self.create_instance_with_args(vcpus=4, vm_state=vm_states.DELETED)
+        self.create_instance_with_args(vcpus=8, node='n2')
+        result = db.instance_statistics_by_host_and_node(self.ctxt,
+                                                         'h1', 'n1')
+        self.assertEqual({'count': 2, 'vcpus': 3, 'memory_mb': 768,
+                          'root_gb': 15, 'ephemeral_gb': 1}, result)
+
+    def test_instance_statistics_by_host_and_node_empty(self):
+        result = db.instance_statistics_by_host_and_node(self.ctxt,
+                                                         'h1', 'n1')
+        self.assertEqual({'count': 0, 'vcpus': 0, 'memory_mb': 0,
+                          'root_gb': 0, 'ephemeral_gb': 0}, result)
+
+    def test_instance_get_all_by_host_columns(self):
+        instance = self.create_instance_with_args()
+        self.create_instance_with_args(host='h2')
+        result = db.instance_get_all_by_host(self.ctxt, 'h1',
+                                             columns_to_join=[],
+                                             columns=['node'])
+        self.assertEqual([{'id': instance['id'], 'uuid': instance['uuid'],
+                           'node': 'n1', 'metadata': [],
+                           'system_metadata': []}], result)
+
     def test_instance_get_all_hung_in_rebooting(self):
         # Ensure no instances are returned.
         results = db.instance_get_all_hung_in_rebooting(self.ctxt, 10)
@@ -1765,6 +2088,29 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self.assertEqual('building', old_ref['vm_state'])
         self.assertEqual('needscoffee', new_ref['vm_state'])
 
+    def test_instance_update_and_get_original_deadlock(self):
+        instance = self.create_instance_with_args(vm_state='building')
+        real_instance_update = sqlalchemy_api._instance_update
+        attempts = []
+
+        def fake_instance_update(context, instance_uuid, values, **kwargs):
+            attempts.append(dict(values))
+            if len(attempts) == 1:
+                values.pop('expected_vm_state')
+                raise db_exc.DBDeadlock()
+            return real_instance_update(context, instance_uuid, values,
+                                        **kwargs)
+
+        self.stubs.Set(sqlalchemy_api, '_instance_update',
+                       fake_instance_update)
+        self.stubs.Set(sqlalchemy_api.time, 'sleep', lambda delay: None)
+        values = {'vm_state': 'needscoffee', 'expected_vm_state': 'building'}
+        (old_ref, new_ref) = db.instance_update_and_get_original(self.ctxt,
+                            instance['uuid'], values)
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(attempts[0], attempts[1])
+        self.assertEqual('needscoffee', new_ref['vm_state'])
+
     def test_instance_update_and_get_original_metadata(self):
         instance = self.create_instance_with_args()
         columns_to_join = ['metadata']
@@ -2055,6 +2401,36 @@ class ServiceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         real = db.service_get_all_by_topic(self.ctxt, 't1')
         self._assertEqualListsOfObjects(expected, real)
 
+    def test_service_get_all_by_binary(self):
+        values = [
+            {'host': 'host1', 'topic': 't1', 'binary': 'b1'},
+            {'host': 'host2', 'topic': 't1', 'binary': 'b1'},
+            {'host': 'host3', 'topic': 't2', 'binary': 'b2'}
+        ]
+        services = [self._create_service(vals) for vals in values]
+        real = db.service_get_all_by_binary(self.ctxt, 'b1')
+        self._assertEqualListsOfObjects(services[:2], real)
+
+    def test_service_get_all_by_binary_updated_since(self):
+        since = timeutils.utcnow() - datetime.timedelta(seconds=1)
+        old = self._create_service({'host': 'host1', 'topic': 't1',
+                                    'binary': 'b1'})
+        db.service_update(self.ctxt, old['id'],
+                          {'updated_at': since - datetime.timedelta(days=1),
+                           'created_at': since - datetime.timedelta(days=1)})
+        new = self._create_service({'host': 'host2', 'topic': 't1',
+                                    'binary': 'b1'})
+        deleted = self._create_service({'host': 'host3', 'topic': 't1',
+                                        'binary': 'b1'})
+        db.service_destroy(self.ctxt, deleted['id'])
+
+        real = db.service_get_all_by_binary(self.ctxt, 'b1',
+                                            updated_since=since)
+        self.assertEqual(set([new['id'], deleted['id']]),
+                         set(service['id'] for service in real))
+        self.assertTrue([service['deleted'] for service in real
+                         if service['id'] == deleted['id']][0])
+
     def test_service_get_all_by_host(self):
         values = [
             {'host': 'host1', 'topic': 't11', 'binary': 'b11'},
@@ -4377,6 +4753,24 @@ class BlockDeviceMappingTestCase(test.TestCase):
         bmd = db.block_device_mapping_get_all_by_instance(self.ctxt, uuid2)
         self.assertEqual(len(bmd), 2)
 
+    def test_block_device_mapping_get_all_by_instance_uuids(self):
+        uuid1 = self.instance['uuid']
+        uuid2 = db.instance_create(self.ctxt, {})['uuid']
+        uuid3 = db.instance_create(self.ctxt, {})['uuid']
+
+        for values in [{'instance_uuid': uuid1, 'device_name': 'first'},
+                       {'instance_uuid': uuid2, 'device_name': 'second'},
+                       {'instance_uuid': uuid3, 'device_name': 'third'}]:
+            self._create_bdm(values)
+
+        bdms = db.block_device_mapping_get_all_by_instance_uuids(
+            self.ctxt, [uuid1, uuid2])
+        self.assertEqual(sorted(bdm['device_name'] for bdm in bdms),
+                         ['first', 'second'])
+        self.assertEqual(
+            db.block_device_mapping_get_all_by_instance_uuids(self.ctxt, []),
+            [])
+
     def test_block_device_mapping_destroy(self):
         bdm = self._create_bdm({})
         db.block_device_mapping_destroy(self.ctxt, bdm['id'])
@@ -5380,6 +5774,41 @@ class ComputeNodeTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self._assertEqualListsOfObjects(expected, result,
                                         ignored_keys=['stats'])
 
+    def test_compute_node_get_all_updated_since(self):
+        timeutils.set_time_override(timeutils.utcnow() +
+                                    datetime.timedelta(days=1))
+        self.addCleanup(timeutils.clear_time_override)
+        service_data = self.service_dict.copy()
+        service_data['host'] = 'host2'
+        service = db.service_create(self.ctxt, service_data)
+        compute_node_data = self.compute_node_dict.copy()
+        compute_node_data['service_id'] = service['id']
+        compute_node_data['hypervisor_hostname'] = 'node2'
+        compute_node_data['stats'] = self.stats.copy()
+        node = db.compute_node_create(self.ctxt, compute_node_data)
+
+        since = timeutils.utcnow() + datetime.timedelta(seconds=10)
+        self.assertEqual([], db.compute_node_get_all(self.ctxt,
+                                                     updated_since=since))
+
+        timeutils.advance_time_seconds(20)
+        db.compute_node_update(self.ctxt, node['id'],
+                               {'stats': {'num_instances': 5}})
+        nodes = db.compute_node_get_all(self.ctxt, updated_since=since)
+        self.assertEqual(1, len(nodes))
+        self.assertEqual(node['id'], nodes[0]['id'])
+        self.assertEqual('host2', nodes[0]['service']['host'])
+        self.assertEqual('5', self._stats_as_dict(
+                nodes[0]['stats'])['num_instances'])
+
+    def test_compute_node_get_all_updated_since_deleted(self):
+        since = timeutils.utcnow() - datetime.timedelta(seconds=1)
+        db.compute_node_delete(self.ctxt, self.item['id'])
+        nodes = db.compute_node_get_all(self.ctxt, True, updated_since=since)
+        self.assertEqual(1, len(nodes))
+        self.assertTrue(nodes[0]['deleted'])
+        self.assertIsNotNone(nodes[0]['deleted_at'])
+
     def test_compute_node_get(self):
         compute_node_id = self.item['id']
         node = db.compute_node_get(self.ctxt, compute_node_id)
@@ -5404,6 +5833,44 @@ class ComputeNodeTestCase(test.TestCase, ModelsObjectComparatorMixin):
         new_stats = self._stats_as_dict(item_updated['stats'])
         self._stats_equal(stats, new_stats)
 
+    def test_compute_node_reserve(self):
+        limits = {'memory_mb': 1536, 'vcpu': 4, 'disk_gb': 2048}
+        self.assertTrue(db.compute_node_reserve(self.ctxt, self.item['id'],
+                                                1024, 2, 1024, limits))
+        node = db.compute_node_get(self.ctxt, self.item['id'])
+        self.assertEqual(1024, node['memory_mb_used'])
+        self.assertEqual(0, node['free_ram_mb'])
+        self.assertEqual(2, node['vcpus_used'])
+        self.assertEqual(1024, node['local_gb_used'])
+        self.assertEqual(1024, node['free_disk_gb'])
+
+        # Only 512MB of RAM are left within the limits.
+        self.assertFalse(db.compute_node_reserve(self.ctxt, self.item['id'],
+                                                 1024, 1, 0, limits))
+        self.assertTrue(db.compute_node_reserve(self.ctxt, self.item['id'],
+                                                512, 1, 0, limits))
+        node = db.compute_node_get(self.ctxt, self.item['id'])
+        self.assertEqual(1536, node['memory_mb_used'])
+        self.assertEqual(-512, node['free_ram_mb'])
+
+    def test_compute_node_reserve_without_limits(self):
+        self.assertTrue(db.compute_node_reserve(self.ctxt, self.item['id'],
+                                                4096, 8, 0))
+        self.assertFalse(db.compute_node_reserve(self.ctxt, 9999,
+                                                 512, 1, 0))
+
+    def test_compute_node_release(self):
+        self.assertTrue(db.compute_node_reserve(self.ctxt, self.item['id'],
+                                                1024, 2, 1024))
+        self.assertTrue(db.compute_node_release(self.ctxt, self.item['id'],
+                                                1024, 2, 1024))
+        node = db.compute_node_get(self.ctxt, self.item['id'])
+        for field in ('memory_mb_used', 'free_ram_mb', 'vcpus_used',
+                      'local_gb_used', 'free_disk_gb'):
+            self.assertEqual(self.item[field], node[field])
+        self.assertFalse(db.compute_node_release(self.ctxt, 9999,
+                                                 512, 1, 0))
+
     def test_compute_node_delete(self):
         compute_node_id = self.item['id']
         db.compute_node_delete(self.ctxt, compute_node_id)
@@ -6406,6 +6873,63 @@ class ArchiveTestCase(test.TestCase):
         si_rows = self.conn.execute(qsi).fetchall()
         self.assertEqual(len(siim_rows) + len(si_rows), 8)
 
+    def _create_deleted_mappings(self, deleted_ats):
+        for uuidstr, deleted_at in zip(self.uuidstrs, deleted_ats):
+            ins_stmt = self.instance_id_mappings.insert().values(
+                uuid=uuidstr, deleted=1, deleted_at=deleted_at)
+            self.conn.execute(ins_stmt)
+
+    def test_archive_deleted_rows_deleted_before(self):
+        now = timeutils.utcnow()
+        old = now - datetime.timedelta(days=2)
+        self._create_deleted_mappings([old, old, now, now])
+
+        num = db.archive_deleted_rows_for_table(
+            self.context, 'instance_id_mappings',
+            deleted_before=now - datetime.timedelta(days=1))
+        self.assertEqual(num, 2)
+        qsiim = select([self.shadow_instance_id_mappings.c.uuid]).\
+                where(self.shadow_instance_id_mappings.c.uuid.in_(
+                                                            self.uuidstrs))
+        rows = self.conn.execute(qsiim).fetchall()
+        self.assertEqual(sorted(row[0] for row in rows),
+                         sorted(self.uuidstrs[:2]))
+
+    def test_archive_deleted_rows_unlimited(self):
+        self._create_deleted_mappings([None] * 4)
+        db.archive_deleted_rows(self.context)
+        qiim = select([self.instance_id_mappings]).where(
+                         self.instance_id_mappings.c.uuid.in_(self.uuidstrs))
+        self.assertEqual(self.conn.execute(qiim).fetchall(), [])
+
+    def test_archive_tablenames_dependent_first(self):
+        tablenames = db.archive_tablenames(self.context)
+        self.assertTrue(tablenames.index('consoles') <
+                        tablenames.index('console_pools'))
+        self.assertTrue(tablenames.index('instance_metadata') <
+                        tablenames.index('instances'))
+
+    def test_purge_shadow_rows_for_table(self):
+        now = timeutils.utcnow()
+        old = now - datetime.timedelta(days=2)
+        self._create_deleted_mappings([old, old, old, now])
+        db.archive_deleted_rows_for_table(self.context,
+                                          'instance_id_mappings')
+
+        num = db.purge_shadow_rows_for_table(
+            self.context, 'instance_id_mappings',
+            now - datetime.timedelta(days=1), max_rows=2)
+        self.assertEqual(num, 2)
+        num = db.purge_shadow_rows_for_table(
+            self.context, 'instance_id_mappings',
+            now - datetime.timedelta(days=1), max_rows=2)
+        self.assertEqual(num, 1)
+        qsiim = select([self.shadow_instance_id_mappings.c.uuid]).\
+                where(self.shadow_instance_id_mappings.c.uuid.in_(
+                                                            self.uuidstrs))
+        rows = self.conn.execute(qsiim).fetchall()
+        self.assertEqual([row[0] for row in rows], [self.uuidstrs[3]])
+
 
 class InstanceGroupDBApiTestCase(test.TestCase, ModelsObjectComparatorMixin):
     def setUp(self):
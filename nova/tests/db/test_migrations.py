@@ -3350,6 +3350,21 @@ class TestNovaMigrations(BaseWalkMigrationTestCase, CommonTestsMixIn):
     def _post_downgrade_228(self, engine):
         self.assertColumnNotExists(engine, 'compute_nodes', 'metrics')
 
+    def _check_229(self, engine, data):
+        self.assertIndexMembers(engine, 'instances',
+                'instances_project_id_deleted_created_at_id_idx',
+                ['project_id', 'deleted', 'created_at', 'id'])
+        self.assertIndexMembers(engine, 'instances',
+                'instances_deleted_created_at_id_idx',
+                ['deleted', 'created_at', 'id'])
+
+    def _post_downgrade_229(self, engine):
+        t = db_utils.get_table(engine, 'instances')
+        index_names = [idx.name for idx in t.indexes]
+        self.assertNotIn('instances_project_id_deleted_created_at_id_idx',
+                         index_names)
+        self.assertNotIn('instances_deleted_created_at_id_idx', index_names)
+
 
 class TestBaremetalMigrations(BaseWalkMigrationTestCase, CommonTestsMixIn):
     """Test sqlalchemy-migrate migrations."""
@@ -0,0 +1,154 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the routing of the read-only DB API calls to slave databases,
+with a sqlite file standing for the slave database.
+"""
+
+import datetime
+import os
+
+from eventlet import tpool
+import fixtures
+
+from nova import context
+from nova import db
+from nova.db.sqlalchemy import models
+from nova.db.sqlalchemy import routing
+from nova import exception
+from nova.openstack.common.db import api as db_api
+from nova.openstack.common import timeutils
+from nova import test
+
+
+class RoutingTestCase(test.TestCase):
+    def setUp(self):
+        super(RoutingTestCase, self).setUp()
+        self.useFixture(test.TimeOverride())
+        tempdir = self.useFixture(fixtures.TempDir()).path
+        self.flags(route_reads_to_slaves=True,
+                   slave_connections=['sqlite:///%s' %
+                                      os.path.join(tempdir, 'slave.db')],
+                   slave_max_lag=30,
+                   group='database')
+        self.addCleanup(routing.cleanup)
+        self.slave = routing.get_slaves()[0]
+        self.slave_engine = self.slave.get_engine()
+        for model in (models.Service, models.Instance,
+                      models.InstanceMetadata, models.InstanceSystemMetadata,
+                      models.InstanceInfoCache, models.SecurityGroup,
+                      models.SecurityGroupInstanceAssociation,
+                      models.SecurityGroupIngressRule):
+            model.__table__.create(self.slave_engine)
+
+    def _create_slave_instance(self):
+        self.slave_engine.execute(models.Instance.__table__.insert(),
+                                  uuid='fake-uuid', deleted=0)
+
+    def _create_services(self, main_time, slave_time):
+        db.service_create(context.get_admin_context(),
+                          {'host': 'fake-host', 'topic': 'compute',
+                           'binary': 'nova-compute', 'updated_at': main_time})
+        self.slave_engine.execute(models.Service.__table__.insert(),
+                                  host='fake-host', deleted=0,
+                                  updated_at=slave_time)
+
+    def test_read_routed_to_slave(self):
+        self._create_slave_instance()
+        ctxt = context.get_admin_context()
+
+        instance = db.instance_get_by_uuid(ctxt, 'fake-uuid')
+        self.assertEqual(instance['uuid'], 'fake-uuid')
+        self.assertTrue(self.slave.usable)
+
+    def test_read_not_routed_when_disabled(self):
+        self.flags(route_reads_to_slaves=False, group='database')
+        self._create_slave_instance()
+
+        self.assertRaises(exception.InstanceNotFound, db.instance_get_by_uuid,
+                          context.get_admin_context(), 'fake-uuid')
+
+    def test_read_your_writes(self):
+        ctxt = context.get_admin_context()
+        instance = db.instance_create(ctxt, {})
+
+        self.assertEqual(
+            db.instance_get_by_uuid(ctxt, instance['uuid'])['id'],
+            instance['id'])
+        self.assertRaises(exception.InstanceNotFound, db.instance_get_by_uuid,
+                          context.get_admin_context(), instance['uuid'])
+        timeutils.advance_time_seconds(11)
+        self.assertRaises(exception.InstanceNotFound, db.instance_get_by_uuid,
+                          ctxt, instance['uuid'])
+
+    def test_routed_with_tpool(self):
+        self.flags(use_tpool=True, group='database')
+        self.stubs.Set(tpool, 'execute',
+                       lambda f, *args, **kwargs: f(*args, **kwargs))
+        dbapi = db_api.DBAPI(
+                backend_mapping={'sqlalchemy': 'nova.db.sqlalchemy.api'})
+        self._create_slave_instance()
+        ctxt = context.get_admin_context()
+
+        self.assertEqual(dbapi.instance_get_by_uuid(ctxt, 'fake-uuid')['uuid'],
+                         'fake-uuid')
+        instance = dbapi.instance_create(ctxt, {})
+        self.assertEqual(
+            dbapi.instance_get_by_uuid(ctxt, instance['uuid'])['id'],
+            instance['id'])
+
+    def test_read_falls_back_to_main(self):
+        models.Instance.__table__.drop(self.slave_engine)
+        ctxt = context.get_admin_context()
+        instance = db.instance_create(ctxt, {})
+
+        self.assertEqual(
+            db.instance_get_by_uuid(context.get_admin_context(),
+                                    instance['uuid'])['id'],
+            instance['id'])
+        self.assertFalse(self.slave.usable)
+
+    def test_slave_failed(self):
+        models.Service.__table__.drop(self.slave_engine)
+        self._create_slave_instance()
+
+        self.assertRaises(exception.InstanceNotFound, db.instance_get_by_uuid,
+                          context.get_admin_context(), 'fake-uuid')
+        self.assertFalse(self.slave.usable)
+
+    def test_slave_lagging(self):
+        now = timeutils.utcnow()
+        self._create_services(now, now - datetime.timedelta(seconds=40))
+        self._create_slave_instance()
+
+        self.assertRaises(exception.InstanceNotFound, db.instance_get_by_uuid,
+                          context.get_admin_context(), 'fake-uuid')
+        self.assertEqual(self.slave.lag, 40)
+        self.assertFalse(self.slave.usable)
+
+    def test_slave_lagging_checked_again(self):
+        now = timeutils.utcnow()
+        self._create_services(now, now - datetime.timedelta(seconds=40))
+        self._create_slave_instance()
+        self.assertFalse(self.slave.check())
+        self.slave_engine.execute(models.Service.__table__.update().
+                                  values(updated_at=now))
+
+        self.assertFalse(self.slave.check())
+        timeutils.advance_time_seconds(11)
+        self.assertTrue(self.slave.check())
+        self.assertEqual(self.slave.lag, 0)
@@ -20,10 +20,12 @@ import mox
 import netaddr
 
 from nova.cells import rpcapi as cells_rpcapi
+from nova import context
 from nova import db
 from nova import exception
 from nova.network import model as network_model
 from nova import notifications
+from nova.objects import base
 from nova.objects import instance
 from nova.objects import instance_info_cache
 from nova.objects import security_group
@@ -730,7 +732,8 @@ class _TestInstanceListObject(object):
         self.mox.StubOutWithMock(db, 'instance_get_all_by_filters')
         db.instance_get_all_by_filters(self.context, {'foo': 'bar'}, 'uuid',
                                        'asc', limit=None, marker=None,
-                                       columns_to_join=['metadata']).AndReturn(
+                                       columns_to_join=['metadata'],
+                                       columns=None).AndReturn(
                                            fakes)
         self.mox.ReplayAll()
         inst_list = instance.InstanceList.get_by_filters(
@@ -751,7 +754,8 @@ class _TestInstanceListObject(object):
         db.instance_get_all_by_filters(self.context,
                                        {'deleted': True, 'cleaned': False},
                                        'uuid', 'asc', limit=None, marker=None,
-                                       columns_to_join=['metadata']).AndReturn(
+                                       columns_to_join=['metadata'],
+                                       columns=None).AndReturn(
                                            [fakes[1]])
         self.mox.ReplayAll()
         inst_list = instance.InstanceList.get_by_filters(
@@ -769,7 +773,8 @@ class _TestInstanceListObject(object):
         self.mox.StubOutWithMock(db, 'instance_get_all_by_host')
         db.instance_get_all_by_host(self.context, 'foo',
                                     columns_to_join=None,
-                                    use_slave=False).AndReturn(fakes)
+                                    use_slave=False,
+                                    columns=None).AndReturn(fakes)
         self.mox.ReplayAll()
         inst_list = instance.InstanceList.get_by_host(self.context, 'foo')
         for i in range(0, len(fakes)):
@@ -833,7 +838,7 @@ class _TestInstanceListObject(object):
         self.mox.StubOutWithMock(db, 'instance_fault_get_by_instance_uuids')
         db.instance_get_all_by_host(self.context, 'host',
                                     columns_to_join=[],
-                                    use_slave=False
+                                    use_slave=False, columns=None
                                     ).AndReturn(fake_insts)
         db.instance_fault_get_by_instance_uuids(
             self.context, [x['uuid'] for x in fake_insts]
@@ -915,6 +920,123 @@ class TestRemoteInstanceListObject(test_objects._RemoteTest,
     pass
 
 
+class TestInstanceListColumns(test.TestCase):
+    def setUp(self):
+        super(TestInstanceListColumns, self).setUp()
+        self.context = context.get_admin_context()
+        for i in range(3):
+            db.instance_create(self.context,
+                               {'host': 'host1', 'display_name': 'inst%d' % i,
+                                'vm_state': 'active',
+                                'metadata': {'index': str(i)}})
+
+    def _get_by_host(self, **kwargs):
+        return instance.InstanceList.get_by_host(self.context, 'host1',
+                                                 **kwargs)
+
+    def test_get_by_host_columns(self):
+        insts = self._get_by_host(columns=['vm_state'])
+        self.assertEqual(3, len(insts))
+        for inst in insts:
+            self.assertTrue(inst.obj_attr_is_set('id'))
+            self.assertTrue(inst.obj_attr_is_set('uuid'))
+            self.assertEqual('active', inst.vm_state)
+            self.assertFalse(inst.obj_attr_is_set('display_name'))
+            self.assertFalse(inst.obj_attr_is_set('metadata'))
+
+    def test_get_by_filters_columns(self):
+        insts = instance.InstanceList.get_by_filters(
+                self.context, {'deleted': False}, 'display_name', 'asc',
+                expected_attrs=['metadata', 'info_cache'],
+                columns=['display_name'])
+        self.assertEqual(['inst0', 'inst1', 'inst2'],
+                         [inst.display_name for inst in insts])
+        self.assertEqual({'index': '0'}, insts[0].metadata)
+        self.assertTrue(insts[0].obj_attr_is_set('info_cache'))
+        self.assertFalse(insts[0].obj_attr_is_set('host'))
+
+    def test_lazy_load_column_for_all(self):
+        insts = self._get_by_host(columns=[])
+        with mock.patch.object(db, 'instance_get_all_by_filters',
+                               wraps=db.instance_get_all_by_filters) as get:
+            names = sorted(inst.display_name for inst in insts)
+            self.assertEqual(1, get.call_count)
+        self.assertEqual(['inst0', 'inst1', 'inst2'], names)
+        for inst in insts:
+            self.assertFalse(inst.obj_attr_is_set('host'))
+            self.assertEqual(set(), inst.obj_what_changed())
+
+    def test_lazy_load_joined_for_all(self):
+        insts = self._get_by_host(columns=[])
+        with mock.patch.object(db, 'instance_get_all_by_filters',
+                               wraps=db.instance_get_all_by_filters) as get:
+            metadata = [inst.metadata for inst in insts]
+            self.assertEqual(1, get.call_count)
+        self.assertEqual([{'index': '0'}, {'index': '1'}, {'index': '2'}],
+                         sorted(metadata))
+        self.assertEqual(set(), insts[0].obj_what_changed())
+
+    def test_lazy_load_joined_without_columns_for_all(self):
+        insts = self._get_by_host()
+        with mock.patch.object(db, 'instance_get_all_by_filters',
+                               wraps=db.instance_get_all_by_filters) as get:
+            caches = [inst.info_cache for inst in insts]
+            self.assertEqual(1, get.call_count)
+        self.assertEqual([inst.uuid for inst in insts],
+                         [cache.instance_uuid for cache in caches])
+        self.assertEqual(set(), insts[0].obj_what_changed())
+
+    def test_lazy_load_fault_for_all(self):
+        insts = self._get_by_host()
+        db.instance_fault_create(self.context,
+                                 {'instance_uuid': insts[1].uuid,
+                                  'code': 500, 'message': 'boom',
+                                  'details': '', 'host': 'host1'})
+        with mock.patch.object(db, 'instance_fault_get_by_instance_uuids',
+                               wraps=db.instance_fault_get_by_instance_uuids
+                               ) as get:
+            faults = [inst.fault for inst in insts]
+            self.assertEqual(1, get.call_count)
+        self.assertIsNone(faults[0])
+        self.assertEqual('boom', faults[1].message)
+        self.assertIsNone(faults[2])
+
+    def test_lazy_load_bulk_counters(self):
+        insts = self._get_by_host(columns=[])
+        base.bulk_load_counters.pop('InstanceList', None)
+        [inst.host for inst in insts]
+        [inst.metadata for inst in insts]
+        self.assertEqual(dict(bulk_loads=2, objects=6, coalesced=4),
+                         base.bulk_load_counters['InstanceList'])
+
+    def test_lazy_load_column_alone(self):
+        inst = self._get_by_host(columns=[])[0].obj_clone()
+        self.assertEqual('host1', inst.host)
+        self.assertEqual(set(), inst.obj_what_changed())
+
+    def test_lazy_load_column_not_created(self):
+        inst = instance.Instance(context=self.context, uuid='fake-uuid')
+        self.assertRaises(exception.ObjectActionError, getattr, inst, 'host')
+
+
+class TestRemoteInstanceListColumns(test_objects._RemoteTest):
+    def test_lazy_load_column_remotes(self):
+        ctxt = context.get_admin_context()
+        for i in range(2):
+            db.instance_create(ctxt, {'host': 'host1',
+                                      'display_name': 'inst%d' % i})
+        insts = instance.InstanceList.get_by_host(ctxt, 'host1', columns=[])
+        del self.remote_object_calls[:]
+
+        names = sorted(inst.display_name for inst in insts)
+        self.assertEqual(['inst0', 'inst1'], names)
+        # Computes cannot read the database, so the missing columns are
+        # loaded through the conductor.
+        self.assertRemotes()
+        self.assertEqual(set([('InstanceList', 'get_attr_by_uuids')]),
+                         set(self.remote_object_calls))
+
+
 class TestInstanceObjectMisc(test.NoDBTestCase):
     def test_expected_cols(self):
         self.stubs.Set(instance, '_INSTANCE_OPTIONAL_JOINED_FIELDS', ['bar'])
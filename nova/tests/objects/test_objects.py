@@ -712,6 +712,63 @@ class TestObjectListBase(test.TestCase):
         self.assertEqual([x.foo for x in obj],
                          [y.foo for y in obj2])
 
+    def _make_bulk_list(self, bulk_loadable=True):
+        loads = []
+
+        class BulkElement(base.NovaObject):
+            fields = {'foo': fields.IntegerField(),
+                      'bar': fields.IntegerField()}
+
+            def obj_load_attr(self, attrname):
+                loads.append([self.foo])
+                self.bar = self.foo * 10
+
+        class BulkList(base.ObjectListBase, base.NovaObject):
+            fields = {'objects': fields.ListOfObjectsField('BulkElement')}
+            obj_bulk_lazy_load = True
+
+            def _obj_load_objects_attr(self, objects, attrname):
+                if not bulk_loadable:
+                    return False
+                loads.append([obj.foo for obj in objects])
+                for obj in objects:
+                    obj.bar = obj.foo * 10
+                return True
+
+        objlist = BulkList(objects=[BulkElement(foo=i) for i in range(3)])
+        return objlist, loads
+
+    def test_bulk_lazy_load(self):
+        objlist, loads = self._make_bulk_list()
+        base.bulk_load_counters.pop('BulkList', None)
+        self.assertEqual([0, 10, 20], [obj.bar for obj in objlist])
+        self.assertEqual([[0, 1, 2]], loads)
+        self.assertEqual(dict(bulk_loads=1, objects=3, coalesced=2),
+                         base.bulk_load_counters['BulkList'])
+
+    def test_bulk_lazy_load_by_index(self):
+        objlist, loads = self._make_bulk_list()
+        objlist.objects[1].bar = 5
+        self.assertEqual(20, objlist[2].bar)
+        self.assertEqual([[0, 2]], loads)
+
+    def test_bulk_lazy_load_not_taken_from_list(self):
+        objlist, loads = self._make_bulk_list()
+        self.assertEqual(10, objlist.objects[1].bar)
+        self.assertEqual([[1]], loads)
+
+    def test_bulk_lazy_load_unsupported(self):
+        objlist, loads = self._make_bulk_list(bulk_loadable=False)
+        self.assertEqual([0, 10, 20], [obj.bar for obj in objlist])
+        self.assertEqual([[0], [1], [2]], loads)
+
+    def test_bulk_lazy_load_list_gone(self):
+        objlist, loads = self._make_bulk_list()
+        obj = objlist[0]
+        del objlist
+        self.assertEqual(0, obj.bar)
+        self.assertEqual([[0]], loads)
+
 
 class TestObjectSerializer(_BaseTestCase):
     def test_serialize_entity_primitive(self):
@@ -16,6 +16,8 @@
 Tests For Filter Scheduler.
 """
 
+import random
+
 import mox
 
 from nova.compute import rpcapi as compute_rpcapi
@@ -29,6 +31,7 @@ from nova.pci import pci_request
 from nova.scheduler import driver
 from nova.scheduler import filter_scheduler
 from nova.scheduler import host_manager
+from nova.scheduler import stats as scheduler_stats
 from nova.scheduler import utils as scheduler_utils
 from nova.scheduler import weights
 from nova.tests.scheduler import fakes
@@ -168,7 +171,7 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.next_weight = 1.0
 
-        def _fake_weigh_objects(_self, functions, hosts, options):
+        def _fake_weigh_objects(_self, functions, hosts, options, **kwargs):
             self.next_weight += 2.0
             host_state = hosts[0]
             return [weights.WeighedHost(host_state, self.next_weight)]
@@ -199,6 +202,177 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         for weighed_host in weighed_hosts:
             self.assertIsNotNone(weighed_host.obj)
 
+    def _schedule_on_fake_hosts(self, batch_placement):
+        self.flags(scheduler_batch_placement=batch_placement,
+                   scheduler_host_subset_size=3,
+                   scheduler_default_filters=['RamFilter', 'CoreFilter'],
+                   ram_allocation_ratio=1.0)
+        sched = fakes.FakeFilterScheduler()
+        host_states = []
+        for i in xrange(20):
+            host_states.append(fakes.FakeHostState('host%d' % i,
+                    'node%d' % i,
+                    {'total_usable_ram_mb': 4096,
+                     'free_ram_mb': 512 * (i % 5),
+                     'vcpus_total': 4, 'vcpus_used': i % 3}))
+        self.stubs.Set(sched.host_manager, 'get_all_host_states',
+                       lambda context: iter(host_states))
+
+        filtered_counts = []
+        orig_get_filtered_hosts = sched.host_manager.get_filtered_hosts
+
+        def _get_filtered_hosts(hosts, filter_properties, index):
+            hosts = list(hosts)
+            filtered_counts.append(len(hosts))
+            return orig_get_filtered_hosts(hosts, filter_properties,
+                                           index=index)
+
+        self.stubs.Set(sched.host_manager, 'get_filtered_hosts',
+                       _get_filtered_hosts)
+
+        request_spec = {'num_instances': 30,
+                        'instance_type': {'memory_mb': 1024, 'root_gb': 0,
+                                          'ephemeral_gb': 0, 'vcpus': 1},
+                        'instance_properties': {'project_id': 1,
+                                                'root_gb': 0,
+                                                'memory_mb': 1024,
+                                                'ephemeral_gb': 0,
+                                                'vcpus': 1,
+                                                'os_type': 'Linux'}}
+        random.seed(42)
+        weighed_hosts = sched._schedule(self.context, request_spec, {})
+        return ([(weighed_host.obj.host, weighed_host.weight)
+                 for weighed_host in weighed_hosts], filtered_counts)
+
+    def test_schedule_batch_placement(self):
+        expected, filtered_counts = self._schedule_on_fake_hosts(False)
+        # The hosts only have room for 16 instances.
+        self.assertEqual(16, len(expected))
+        self.assertEqual(20, filtered_counts[0])
+
+        selected, filtered_counts = self._schedule_on_fake_hosts(True)
+        self.assertEqual(expected, selected)
+        # Only the chosen host is filtered again for each instance.
+        self.assertEqual([20] + [1] * 16, filtered_counts)
+
+    def test_schedule_profile(self):
+        self.flags(scheduler_profile_requests=True,
+                   scheduler_default_filters=['RamFilter'])
+        sched = fakes.FakeFilterScheduler()
+        host_states = [fakes.FakeHostState('host%d' % i, 'node%d' % i,
+                                           {'total_usable_ram_mb': 1024,
+                                            'free_ram_mb': 512 * i})
+                       for i in xrange(3)]
+        self.stubs.Set(sched.host_manager, 'get_all_host_states',
+                       lambda context: iter(host_states))
+        request_spec = {'num_instances': 1,
+                        'instance_type': {'memory_mb': 1024},
+                        'instance_properties': {'project_id': 1,
+                                                'root_gb': 0,
+                                                'memory_mb': 1024,
+                                                'ephemeral_gb': 0,
+                                                'vcpus': 1,
+                                                'os_type': 'Linux'}}
+        profile = scheduler_stats.new_profile()
+        self.stubs.Set(scheduler_stats, 'new_profile', lambda: profile)
+        filter_properties = {}
+        sched._schedule(self.context, request_spec, filter_properties)
+
+        self.assertNotIn('scheduler_profile', filter_properties)
+        self.assertEqual(1, len(profile['filters']))
+        self.assertEqual('RamFilter', profile['filters'][0]['name'])
+        self.assertEqual(3, profile['filters'][0]['hosts_in'])
+        self.assertEqual(2, profile['filters'][0]['hosts_out'])
+        self.assertEqual(['RAMWeigher'],
+                         [x['name'] for x in profile['weighers']])
+        self.assertEqual(1, sched.host_manager.stats.filters[
+                'RamFilter']['runs'])
+
+    def test_schedule_batch_placement_dependent_filter(self):
+        self.stubs.Set(host_manager.HostManager, 'hosts_are_independent',
+                       lambda *args: False)
+        expected, filtered_counts = self._schedule_on_fake_hosts(False)
+        selected, filtered_counts = self._schedule_on_fake_hosts(True)
+        self.assertEqual(expected, selected)
+        self.assertNotEqual(1, filtered_counts[1])
+
+    def test_schedule_sharded_falls_back_to_all_shards(self):
+        self.flags(scheduler_default_filters=['RamFilter'],
+                   ram_allocation_ratio=1.0)
+        sched = fakes.FakeFilterScheduler()
+        shard = [fakes.FakeHostState('host1', 'node1',
+                                     {'total_usable_ram_mb': 2048,
+                                      'free_ram_mb': 1024})]
+        other_shards = [fakes.FakeHostState('host%d' % i, 'node%d' % i,
+                                            {'total_usable_ram_mb': 2048,
+                                             'free_ram_mb': 2048})
+                        for i in xrange(2, 4)]
+
+        def fake_get_all_host_states(context, all_shards=False):
+            if all_shards:
+                return iter(shard + other_shards)
+            return iter(shard)
+
+        self.stubs.Set(sched.host_manager, 'get_all_host_states',
+                       fake_get_all_host_states)
+        self.stubs.Set(sched.host_manager, 'is_sharded', lambda: True)
+        request_spec = {'num_instances': 3,
+                        'instance_type': {'memory_mb': 1024},
+                        'instance_properties': {'project_id': 1,
+                                                'root_gb': 0,
+                                                'memory_mb': 1024,
+                                                'ephemeral_gb': 0,
+                                                'vcpus': 1,
+                                                'os_type': 'Linux'}}
+        weighed_hosts = sched._schedule(self.context, request_spec, {})
+
+        # The first instance fits in the shard of the scheduler.
+        self.assertEqual('host1', weighed_hosts[0].obj.host)
+        self.assertEqual(set(['host2', 'host3']),
+                         set(weighed_host.obj.host
+                             for weighed_host in weighed_hosts[1:]))
+
+    def _schedule_with_reservations(self, batch_placement):
+        self.flags(scheduler_reserve_resources=True,
+                   scheduler_batch_placement=batch_placement,
+                   scheduler_default_filters=['RamFilter'],
+                   ram_allocation_ratio=1.0)
+        sched = fakes.FakeFilterScheduler()
+        host_states = [fakes.FakeHostState('host%d' % i, 'node%d' % i,
+                                           {'total_usable_ram_mb': 4096,
+                                            'free_ram_mb': 1024 * i})
+                       for i in xrange(1, 4)]
+        self.stubs.Set(sched.host_manager, 'get_all_host_states',
+                       lambda context: iter(host_states))
+        reservations = []
+
+        def fake_reserve_resources(context, host_state, instance):
+            reservations.append(host_state.host)
+            # Another scheduler took the room left on the best host.
+            return host_state.host != 'host3'
+
+        self.stubs.Set(sched.host_manager, 'reserve_resources',
+                       fake_reserve_resources)
+        request_spec = {'num_instances': 2,
+                        'instance_type': {'memory_mb': 1024},
+                        'instance_properties': {'project_id': 1,
+                                                'root_gb': 0,
+                                                'memory_mb': 1024,
+                                                'ephemeral_gb': 0,
+                                                'vcpus': 1,
+                                                'os_type': 'Linux'}}
+        weighed_hosts = sched._schedule(self.context, request_spec, {})
+        self.assertEqual(['host3', 'host2', 'host1'], reservations)
+        self.assertEqual(['host2', 'host1'],
+                         [weighed_host.obj.host
+                          for weighed_host in weighed_hosts])
+
+    def test_schedule_reserve_resources(self):
+        self._schedule_with_reservations(False)
+
+    def test_schedule_batch_reserve_resources(self):
+        self._schedule_with_reservations(True)
+
     def test_max_attempts(self):
         self.flags(scheduler_max_attempts=4)
 
@@ -376,7 +550,7 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
                                            'ephemeral_gb': 0, 'vcpus': 1}}
         self.next_weight = 1.0
 
-        def _fake_weigh_objects(_self, functions, hosts, options):
+        def _fake_weigh_objects(_self, functions, hosts, options, **kwargs):
             self.next_weight += 2.0
             host_state = hosts[0]
             return [weights.WeighedHost(host_state, self.next_weight)]
@@ -504,7 +678,7 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.next_weight = 50
 
-        def _fake_weigh_objects(_self, functions, hosts, options):
+        def _fake_weigh_objects(_self, functions, hosts, options, **kwargs):
             this_weight = self.next_weight
             self.next_weight = 0
             host_state = hosts[0]
@@ -544,7 +718,7 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         selected_hosts = []
 
-        def _fake_weigh_objects(_self, functions, hosts, options):
+        def _fake_weigh_objects(_self, functions, hosts, options, **kwargs):
             self.next_weight += 2.0
             host_state = hosts[0]
             selected_hosts.append(host_state.host)
@@ -596,7 +770,7 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         selected_hosts = []
         selected_nodes = []
 
-        def _fake_weigh_objects(_self, functions, hosts, options):
+        def _fake_weigh_objects(_self, functions, hosts, options, **kwargs):
             self.next_weight += 2.0
             host_state = hosts[0]
             selected_hosts.append(host_state.host)
@@ -639,6 +813,39 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
                 self.driver.select_destinations, self.context,
                 {'num_instances': 1}, {})
 
+    def test_select_destinations_no_valid_host_releases_resources(self):
+        self.flags(scheduler_reserve_resources=True,
+                   scheduler_default_filters=['RamFilter'],
+                   ram_allocation_ratio=1.0)
+        sched = fakes.FakeFilterScheduler()
+        host_states = [fakes.FakeHostState('host%d' % i, 'node%d' % i,
+                                           {'total_usable_ram_mb': 4096,
+                                            'free_ram_mb': 1024 * i})
+                       for i in xrange(1, 3)]
+        self.stubs.Set(sched.host_manager, 'get_all_host_states',
+                       lambda context: iter(host_states))
+        reservations = []
+        self.stubs.Set(sched.host_manager, 'reserve_resources',
+                       lambda context, host_state, instance:
+                       reservations.append(host_state.host) or True)
+        self.stubs.Set(sched.host_manager, 'release_resources',
+                       lambda context, host_state, instance:
+                       reservations.remove(host_state.host))
+        # The hosts only have room for 3 of the 4 instances.
+        request_spec = {'num_instances': 4,
+                        'instance_type': {'memory_mb': 1024},
+                        'instance_properties': {'project_id': 1,
+                                                'root_gb': 0,
+                                                'memory_mb': 1024,
+                                                'ephemeral_gb': 0,
+                                                'vcpus': 1,
+                                                'os_type': 'Linux'}}
+
+        self.assertRaises(exception.NoValidHost,
+                          sched.select_destinations, self.context,
+                          request_spec, {})
+        self.assertEqual([], reservations)
+
     def test_handles_deleted_instance(self):
         """Test instance deletion while being scheduled."""
 
@@ -33,6 +33,16 @@ class Filter2(filters.BaseFilter):
     pass
 
 
+class Filter3(filters.BaseFilter):
+    """Test Filter class #3, which must run after Filter1."""
+    run_after = ('Filter1',)
+
+
+class DependentFilter(filters.BaseFilter):
+    """Test Filter class comparing objects with each other."""
+    depends_on_other_objects = True
+
+
 class FiltersTestCase(test.NoDBTestCase):
     def test_filter_all(self):
         filter_obj_list = ['obj1', 'obj2', 'obj3']
@@ -204,3 +214,88 @@ class FiltersTestCase(test.NoDBTestCase):
                                                      filter_objs_initial,
                                                      filter_properties)
         self.assertIsNone(result)
+
+
+class FilterOrderingTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(FilterOrderingTestCase, self).setUp()
+
+        def _fake_base_loader_init(*args, **kwargs):
+            pass
+
+        self.stubs.Set(loadables.BaseLoader, '__init__',
+                       _fake_base_loader_init)
+        self.filter_handler = filters.BaseFilterHandler(filters.BaseFilter)
+
+    def _set_costs(self, **costs):
+        for name, cost in costs.items():
+            self.filter_handler.filter_costs[name] = list(cost)
+
+    def test_filter_ran_running_average(self):
+        self.filter_handler.filter_ran('Filter1', 10, 5, 1.0, {})
+        self.assertEqual([0.1, 0.5],
+                         self.filter_handler.filter_costs['Filter1'])
+        self.filter_handler.filter_ran('Filter1', 10, 10, 2.0, {})
+        seconds, kept = self.filter_handler.filter_costs['Filter1']
+        self.assertAlmostEqual(0.12, seconds)
+        self.assertAlmostEqual(0.6, kept)
+        # Nothing to learn from a filter given no objects
+        self.filter_handler.filter_ran('Filter2', 0, 0, 1.0, {})
+        self.assertNotIn('Filter2', self.filter_handler.filter_costs)
+
+    def test_order_filters_by_cost_per_object_eliminated(self):
+        # Filter1 costs 1.0 per object eliminated, Filter2 0.4.
+        self._set_costs(Filter1=(0.1, 0.9), Filter2=(0.2, 0.5))
+        self.assertEqual([Filter2, Filter1],
+                         self.filter_handler.order_filters([Filter1,
+                                                            Filter2]))
+
+    def test_order_filters_unknown_and_unselective(self):
+        # Filters which never eliminated anything run last, and the ones
+        # which did not run yet first.
+        self._set_costs(Filter1=(1.0, 0.5), Filter3=(0.0, 1.0))
+        self.assertEqual([Filter2, Filter1, Filter3],
+                         self.filter_handler.order_filters(
+                                [Filter1, Filter2, Filter3]))
+
+    def test_order_filters_run_after(self):
+        self._set_costs(Filter1=(1.0, 0.5), Filter2=(0.5, 0.5),
+                        Filter3=(0.1, 0.5))
+        self.assertEqual([Filter2, Filter1, Filter3],
+                         self.filter_handler.order_filters(
+                                [Filter1, Filter2, Filter3]))
+        # Only filters which are enabled are waited for.
+        self.assertEqual([Filter3, Filter2],
+                         self.filter_handler.order_filters(
+                                [Filter2, Filter3]))
+
+    def test_order_filters_depends_on_other_objects(self):
+        self._set_costs(Filter1=(1.0, 0.5), Filter2=(0.1, 0.5),
+                        DependentFilter=(0.0, 0.1))
+        self.assertEqual([Filter1, DependentFilter, Filter2],
+                         self.filter_handler.order_filters(
+                                [Filter1, DependentFilter, Filter2]))
+        self.assertEqual([Filter2, Filter1, DependentFilter],
+                         self.filter_handler.order_filters(
+                                [Filter1, Filter2, DependentFilter]))
+
+    def test_get_filtered_objects_auto_order(self):
+        calls = []
+
+        class EvenFilter(filters.BaseFilter):
+            def _filter_one(self, obj, filter_properties):
+                calls.append('EvenFilter')
+                return obj % 2 == 0
+
+        class SmallFilter(filters.BaseFilter):
+            def _filter_one(self, obj, filter_properties):
+                calls.append('SmallFilter')
+                return obj < 2
+
+        filter_classes = [EvenFilter, SmallFilter]
+        self.filter_handler.auto_order_filters = True
+        self._set_costs(EvenFilter=(1.0, 0.5), SmallFilter=(1.0, 0.2))
+        result = self.filter_handler.get_filtered_objects(filter_classes,
+                                                          range(10), {})
+        self.assertEqual([0], result)
+        self.assertEqual(['SmallFilter'] * 10 + ['EvenFilter'] * 2, calls)
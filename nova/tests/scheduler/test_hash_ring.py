@@ -0,0 +1,57 @@
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For HashRing
+"""
+
+from nova.scheduler import hash_ring
+from nova import test
+
+
+class HashRingTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(HashRingTestCase, self).setUp()
+        self.keys = ['host%d' % i for i in xrange(1000)]
+
+    def _assignments(self, ring):
+        return dict((key, ring.get_member(key)) for key in self.keys)
+
+    def test_empty_ring(self):
+        self.assertIsNone(hash_ring.HashRing([]).get_member('host1'))
+
+    def test_keys_spread_over_members(self):
+        ring = hash_ring.HashRing(['sched1', 'sched2', 'sched3'])
+        assignments = self._assignments(ring)
+        for member in ring.members:
+            share = assignments.values().count(member)
+            self.assertTrue(200 < share < 500, share)
+
+    def test_same_assignments_in_any_member_order(self):
+        self.assertEqual(
+                self._assignments(hash_ring.HashRing(['a', 'b', 'c'])),
+                self._assignments(hash_ring.HashRing(['c', 'a', 'b'])))
+
+    def test_removing_member_only_moves_its_keys(self):
+        before = self._assignments(hash_ring.HashRing(['a', 'b', 'c']))
+        after = self._assignments(hash_ring.HashRing(['a', 'b']))
+        for key in self.keys:
+            if before[key] != 'c':
+                self.assertEqual(before[key], after[key])
+            else:
+                self.assertIn(after[key], ('a', 'b'))
+
+    def test_unicode_keys(self):
+        ring = hash_ring.HashRing([u'sched\xe9'])
+        self.assertEqual(u'sched\xe9', ring.get_member(u'h\xf4te'))
@@ -17,8 +17,10 @@ Tests For Scheduler Host Filters.
 
 import httplib
 
+import mox
 from oslo.config import cfg
 import stubout
+import testtools
 
 from nova import context
 from nova import db
@@ -28,6 +30,8 @@ from nova.pci import pci_stats
 from nova.scheduler import filters
 from nova.scheduler.filters import extra_specs_ops
 from nova.scheduler.filters import trusted_filter
+from nova.scheduler import host_columns
+from nova.scheduler import stats
 from nova import servicegroup
 from nova import test
 from nova.tests.scheduler import fakes
@@ -1462,6 +1466,100 @@ class HostFiltersTestCase(test.NoDBTestCase):
                                    {'service': service})
         self.assertFalse(filt_cls.host_passes(host, request))
 
+    def _stub_aggregate_metadata_db(self):
+        def _fail(*args, **kwargs):
+            self.fail('aggregate metadata read from the database')
+        self.stubs.Set(db, 'aggregate_metadata_get_by_host', _fail)
+
+    def _make_aggregate_host(self, host, aggregate_ids, metadata):
+        host_state = fakes.FakeHostState(host, 'node1', {})
+        host_state.aggregate_ids = frozenset(aggregate_ids)
+        host_state.aggregate_metadata = metadata
+        return host_state
+
+    def test_availability_zone_filter_cached_metadata(self):
+        self._stub_aggregate_metadata_db()
+        filt_cls = self.class_map['AvailabilityZoneFilter']()
+        request = self._make_zone_request('az1')
+        host1 = self._make_aggregate_host('host1', [1],
+                {'availability_zone': set(['az1']), 'ssd': set(['true'])})
+        host2 = self._make_aggregate_host('host2', [2],
+                {'availability_zone': set(['az2'])})
+        self.assertTrue(filt_cls.host_passes(host1, request))
+        self.assertFalse(filt_cls.host_passes(host2, request))
+
+    def test_availability_zone_filter_memoized(self):
+        self._stub_aggregate_metadata_db()
+        filt_cls = self.class_map['AvailabilityZoneFilter']()
+        metadata = {'availability_zone': set(['az1'])}
+        hosts = [self._make_aggregate_host('host1', [1], metadata),
+                 self._make_aggregate_host('host2', [1], metadata),
+                 self._make_aggregate_host('host3', [], {})]
+        self.mox.StubOutWithMock(filt_cls, 'host_passes')
+        filt_cls.host_passes(hosts[0], mox.IgnoreArg()).AndReturn(True)
+        filt_cls.host_passes(hosts[2], mox.IgnoreArg()).AndReturn(False)
+        self.mox.ReplayAll()
+        self.assertEqual(hosts[:2], list(filt_cls.filter_all(
+                hosts, self._make_zone_request('az1'))))
+
+    def test_availability_zone_filter_not_memoized_without_cache(self):
+        filt_cls = self.class_map['AvailabilityZoneFilter']()
+        hosts = [fakes.FakeHostState('host1', 'node1', {}),
+                 fakes.FakeHostState('host2', 'node2', {})]
+        self.mox.StubOutWithMock(filt_cls, 'host_passes')
+        filt_cls.host_passes(hosts[0], mox.IgnoreArg()).AndReturn(True)
+        filt_cls.host_passes(hosts[1], mox.IgnoreArg()).AndReturn(False)
+        self.mox.ReplayAll()
+        self.assertEqual(hosts[:1], list(filt_cls.filter_all(
+                hosts, self._make_zone_request('az1'))))
+
+    def test_aggregate_filter_extra_specs_cached_metadata(self):
+        self._stub_aggregate_metadata_db()
+        filt_cls = self.class_map['AggregateInstanceExtraSpecsFilter']()
+        filter_properties = {'context': self.context,
+            'instance_type': {'memory_mb': 1024,
+                              'extra_specs': {'ssd': 'true'}}}
+        host1 = self._make_aggregate_host('host1', [1],
+                                          {'ssd': set(['true'])})
+        host2 = self._make_aggregate_host('host2', [], {})
+        self.assertTrue(filt_cls.host_passes(host1, filter_properties))
+        self.assertFalse(filt_cls.host_passes(host2, filter_properties))
+
+    def test_aggregate_filter_tenancy_cached_metadata(self):
+        self._stub_aggregate_metadata_db()
+        filt_cls = self.class_map['AggregateMultiTenancyIsolation']()
+        filter_properties = {'context': self.context,
+                             'request_spec': {
+                                 'instance_properties': {
+                                     'project_id': 'my_tenantid'}}}
+        host1 = self._make_aggregate_host('host1', [1],
+                {'filter_tenant_id': set(['my_tenantid']),
+                 'availability_zone': set(['az1'])})
+        host2 = self._make_aggregate_host('host2', [2],
+                {'filter_tenant_id': set(['other_tenantid'])})
+        host3 = self._make_aggregate_host('host3', [3],
+                {'availability_zone': set(['az1'])})
+        self.assertTrue(filt_cls.host_passes(host1, filter_properties))
+        self.assertFalse(filt_cls.host_passes(host2, filter_properties))
+        self.assertTrue(filt_cls.host_passes(host3, filter_properties))
+
+    def test_image_properties_filter_memoized(self):
+        filt_cls = self.class_map['ImagePropertiesFilter']()
+        img_props = {'properties': {'architecture': 'x86_64'}}
+        filter_properties = {'request_spec': {'image': img_props}}
+        hosts = [fakes.FakeHostState('host%d' % i, 'node%d' % i,
+                    {'supported_instances': [(arch, 'kvm', 'hvm')],
+                     'hypervisor_version': 6000000})
+                 for i, arch in enumerate(['x86_64', 'arm', 'x86_64'])]
+        self.mox.StubOutWithMock(filt_cls, '_instance_supported')
+        filt_cls._instance_supported(hosts[0], img_props['properties'],
+                                     6000000).AndReturn(True)
+        filt_cls._instance_supported(hosts[1], img_props['properties'],
+                                     6000000).AndReturn(False)
+        self.mox.ReplayAll()
+        self.assertEqual([hosts[0], hosts[2]],
+                         list(filt_cls.filter_all(hosts, filter_properties)))
+
     def test_retry_filter_disabled(self):
         # Test case where retry/re-scheduling is disabled.
         filt_cls = self.class_map['RetryFilter']()
@@ -1634,3 +1732,162 @@ class HostFiltersTestCase(test.NoDBTestCase):
         self.pci_request_result = True
         self.assertRaises(AttributeError, filt_cls.host_passes,
                           host, filter_properties)
+
+
+@testtools.skipIf(host_columns.numpy is None, "NumPy is not installed")
+class HostFiltersColumnsTestCase(test.NoDBTestCase):
+    """Test case for the vectorized host filters."""
+
+    def setUp(self):
+        super(HostFiltersColumnsTestCase, self).setUp()
+        self.flags(scheduler_columnar_filters=True)
+        self.filter_handler = filters.HostFilterHandler()
+        self.class_map = dict(
+                (cls.__name__, cls)
+                for cls in self.filter_handler.get_matching_classes(
+                        ['nova.scheduler.filters.all_filters']))
+        self.instance_type = {'memory_mb': 1024, 'vcpus': 2, 'root_gb': 10,
+                              'ephemeral_gb': 5, 'swap': 512}
+
+    def _fake_hosts(self):
+        hosts = []
+        for i in xrange(64):
+            hosts.append(fakes.FakeHostState('host%s' % i, 'node',
+                    {'free_ram_mb': 512 * (i % 8) - 1024,
+                     'total_usable_ram_mb': 2048,
+                     'vcpus_total': i % 4,
+                     'vcpus_used': i % 16 + 40,
+                     'free_disk_mb': 4096 * (i % 8),
+                     'total_usable_disk_gb': 20,
+                     'num_instances': i,
+                     'num_io_ops': i % 10}))
+        return hosts
+
+    def _test_filter_matches_host_passes(self, filter_name, **flags):
+        self.flags(**flags)
+        filter_properties = {'instance_type': self.instance_type}
+        filt = self.class_map[filter_name]()
+        hosts = self._fake_hosts()
+        expected = [(host.host, host.limits) for host in hosts
+                    if filt.host_passes(host, filter_properties)]
+        self.assertTrue(0 < len(expected) < len(hosts))
+
+        hosts = self._fake_hosts()
+        columns = host_columns.HostStateColumns(hosts)
+        mask = filt.host_passes_columns(columns, filter_properties)
+        self.assertEqual(expected, [(host.host, host.limits)
+                                    for host in columns.select(mask)])
+
+    def test_ram_filter(self):
+        self._test_filter_matches_host_passes('RamFilter',
+                                              ram_allocation_ratio=1.5)
+
+    def test_core_filter(self):
+        self._test_filter_matches_host_passes('CoreFilter',
+                                              cpu_allocation_ratio=16.0)
+
+    def test_disk_filter(self):
+        self._test_filter_matches_host_passes('DiskFilter',
+                                              disk_allocation_ratio=1.0)
+
+    def test_num_instances_filter(self):
+        self._test_filter_matches_host_passes('NumInstancesFilter',
+                                              max_instances_per_host=50)
+
+    def test_io_ops_filter(self):
+        self._test_filter_matches_host_passes('IoOpsFilter',
+                                              max_io_ops_per_host=8)
+
+    def test_missing_column_falls_back(self):
+        filt = self.class_map['RamFilter']()
+        columns = host_columns.HostStateColumns(
+                [fakes.FakeHostState('host1', 'node1', {'free_ram_mb': 1})])
+        self.assertIsNone(filt.host_passes_columns(
+                columns, {'instance_type': self.instance_type}))
+
+    def test_refresh(self):
+        hosts = self._fake_hosts()
+        columns = host_columns.HostStateColumns(hosts)
+        self.assertEqual(-1024, columns.get('free_ram_mb')[0])
+        hosts[0].free_ram_mb = 0
+        hosts[1].free_ram_mb = 0
+        hosts[1].generation += 1
+        columns.refresh()
+        self.assertEqual(-1024, columns.get('free_ram_mb')[0])
+        self.assertEqual(0, columns.get('free_ram_mb')[1])
+
+    def _get_filtered_hosts(self, filter_classes):
+        hosts = self._fake_hosts()
+        for host in hosts:
+            host.service = {'host': host.host, 'disabled': False}
+        filter_properties = {'instance_type': self.instance_type}
+        result = self.filter_handler.get_filtered_objects(filter_classes,
+                hosts, filter_properties)
+        return [(host.host, host.limits) for host in result]
+
+    def test_get_filtered_objects(self):
+        self.stubs.Set(servicegroup.API, 'service_is_up',
+                       lambda self, service: service['host'] != 'host3')
+        filter_classes = [self.class_map['ComputeFilter'],
+                          self.class_map['RamFilter'],
+                          self.class_map['CoreFilter'],
+                          self.class_map['NumInstancesFilter']]
+
+        result = self._get_filtered_hosts(filter_classes)
+        self.flags(scheduler_columnar_filters=False)
+        expected = self._get_filtered_hosts(filter_classes)
+
+        self.assertEqual(expected, result)
+        self.assertNotIn('host3', [host for host, limits in result])
+        self.assertEqual(3072.0, result[0][1]['memory_mb'])
+
+    def test_get_filtered_objects_stats(self):
+        self.filter_handler.stats = stats.SchedulerStats()
+        self.stubs.Set(servicegroup.API, 'service_is_up',
+                       lambda self, service: service['host'] != 'host3')
+        filter_classes = [self.class_map['ComputeFilter'],
+                          self.class_map['RamFilter'],
+                          self.class_map['NumInstancesFilter']]
+
+        result = self._get_filtered_hosts(filter_classes)
+
+        filter_stats = self.filter_handler.stats.filters
+        self.assertEqual(set(['ComputeFilter', 'RamFilter',
+                              'NumInstancesFilter']), set(filter_stats))
+        # The vectorized filters run first.
+        self.assertEqual(64, filter_stats['RamFilter']['hosts_in'])
+        self.assertEqual(filter_stats['RamFilter']['hosts_out'],
+                         filter_stats['NumInstancesFilter']['hosts_in'])
+        self.assertEqual(filter_stats['NumInstancesFilter']['hosts_out'],
+                         filter_stats['ComputeFilter']['hosts_in'])
+        self.assertEqual(len(result),
+                         filter_stats['ComputeFilter']['hosts_out'])
+
+    def test_order_filters_costly_after_resources(self):
+        filter_classes = [self.class_map[name] for name in (
+                'JsonFilter', 'TrustedFilter', 'RamFilter',
+                'AggregateInstanceExtraSpecsFilter', 'ComputeFilter',
+                'ComputeCapabilitiesFilter', 'AvailabilityZoneFilter')]
+        # The costs of the filters are not known yet.
+        self.assertEqual(['RamFilter', 'ComputeFilter', 'JsonFilter',
+                          'TrustedFilter',
+                          'AggregateInstanceExtraSpecsFilter',
+                          'ComputeCapabilitiesFilter',
+                          'AvailabilityZoneFilter'],
+                         [cls.__name__ for cls in
+                          self.filter_handler.order_filters(filter_classes)])
+
+    def test_get_filtered_objects_auto_order(self):
+        self.stubs.Set(servicegroup.API, 'service_is_up',
+                       lambda self, service: service['host'] != 'host3')
+        filter_classes = [self.class_map['ComputeFilter'],
+                          self.class_map['RamFilter'],
+                          self.class_map['NumInstancesFilter']]
+        expected = self._get_filtered_hosts(filter_classes)
+
+        self.flags(scheduler_auto_order_filters=True)
+        self.filter_handler.filter_costs['ComputeFilter'] = [0.0, 0.5]
+        self.assertEqual(expected, self._get_filtered_hosts(filter_classes))
+        self.assertEqual(set(['ComputeFilter', 'RamFilter',
+                              'NumInstancesFilter']),
+                         set(self.filter_handler.filter_costs))
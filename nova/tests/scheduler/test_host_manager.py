@@ -15,6 +15,10 @@
 """
 Tests For HostManager
 """
+import datetime
+
+import testtools
+
 from nova.compute import task_states
 from nova.compute import vm_states
 from nova import db
@@ -22,6 +26,8 @@ from nova import exception
 from nova.openstack.common import jsonutils
 from nova.openstack.common import timeutils
 from nova.scheduler import filters
+from nova.scheduler import hash_ring
+from nova.scheduler import host_columns
 from nova.scheduler import host_manager
 from nova import test
 from nova.tests import matchers
@@ -68,6 +74,21 @@ class HostManagerTestCase(test.NoDBTestCase):
         self.assertEqual(len(filter_classes), 1)
         self.assertEqual(filter_classes[0].__name__, 'FakeFilterClass2')
 
+    def test_hosts_are_independent(self):
+        self.flags(scheduler_default_filters=['FakeFilterClass2'])
+        self.host_manager.filter_classes = [FakeFilterClass1,
+                FakeFilterClass2]
+        self.assertTrue(self.host_manager.hosts_are_independent())
+
+        self.stubs.Set(FakeFilterClass2, 'depends_on_other_objects', True)
+        self.assertFalse(self.host_manager.hosts_are_independent())
+        self.assertTrue(self.host_manager.hosts_are_independent(
+                ['FakeFilterClass1']))
+
+        self.flags(scheduler_weight_normalization=True)
+        self.assertFalse(self.host_manager.hosts_are_independent(
+                ['FakeFilterClass1']))
+
     def _mock_get_filtered_hosts(self, info, specified_filters=None):
         self.mox.StubOutWithMock(self.host_manager, '_choose_host_filters')
 
@@ -117,6 +138,27 @@ class HostManagerTestCase(test.NoDBTestCase):
                 fake_properties, filter_class_names=specified_filters)
         self._verify_result(info, result)
 
+    @testtools.skipIf(host_columns.numpy is None, "NumPy is not installed")
+    def test_get_filtered_hosts_reuses_columns(self):
+        self.flags(scheduler_columnar_filters=True)
+        self.host_manager.filter_classes = [FakeFilterClass1]
+        self.host_manager.host_state_map = dict(
+                ((host.host, host.nodename), host)
+                for host in self.fake_hosts)
+        hosts = self.host_manager.host_state_map.values()
+        self.stubs.Set(FakeFilterClass1, 'host_passes',
+                       lambda self, host_state, filter_properties: True)
+
+        result = self.host_manager.get_filtered_hosts(hosts, {},
+                filter_class_names=['FakeFilterClass1'])
+        columns = self.host_manager._host_columns
+        result2 = self.host_manager.get_filtered_hosts(hosts, {},
+                filter_class_names=['FakeFilterClass1'])
+
+        self.assertEqual(hosts, result)
+        self.assertEqual(hosts, result2)
+        self.assertIs(columns, self.host_manager._host_columns)
+
     def test_get_filtered_hosts_with_ignore(self):
         fake_properties = {'ignore_hosts': ['fake_host1', 'fake_host3',
             'fake_host5', 'fake_multihost']}
@@ -314,6 +356,45 @@ class HostManagerTestCase(test.NoDBTestCase):
                     ('host2', None): host2_cap}
         self.assertThat(service_states, matchers.DictMatches(expected))
 
+    def test_reserve_resources(self):
+        host_state = host_manager.HostState('host1', 'node1')
+        host_state.compute_node_id = 1
+        host_state.limits['memory_mb'] = 2048
+        instance = dict(memory_mb=512, vcpus=1, root_gb=10, ephemeral_gb=5)
+        self.mox.StubOutWithMock(db, 'compute_node_reserve')
+        db.compute_node_reserve('fake_context', 1, 512, 1, 15,
+                limits={'memory_mb': 2048}).AndReturn(True)
+        db.compute_node_reserve('fake_context', 1, 512, 1, 15,
+                limits={'memory_mb': 2048}).AndReturn(False)
+        self.mox.ReplayAll()
+
+        self.assertTrue(self.host_manager.reserve_resources('fake_context',
+                host_state, instance))
+        self.assertFalse(self.host_manager.reserve_resources('fake_context',
+                host_state, instance))
+        self.assertEqual(dict(reserved=1, refused=1),
+                         self.host_manager.stats.reservations)
+
+    def test_reserve_resources_without_compute_node(self):
+        host_state = host_manager.HostState('host1', 'node1')
+        instance = dict(memory_mb=512, vcpus=1, root_gb=10, ephemeral_gb=5)
+        self.assertTrue(self.host_manager.reserve_resources('fake_context',
+                host_state, instance))
+
+    def test_release_resources(self):
+        host_state = host_manager.HostState('host1', 'node1')
+        host_state.compute_node_id = 1
+        instance = dict(memory_mb=512, vcpus=1, root_gb=10, ephemeral_gb=5)
+        self.mox.StubOutWithMock(db, 'compute_node_release')
+        db.compute_node_release('fake_context', 1, 512, 1, 15)
+        self.mox.ReplayAll()
+
+        self.host_manager.release_resources('fake_context', host_state,
+                                            instance)
+        # Nothing was reserved without a compute node.
+        self.host_manager.release_resources('fake_context',
+                host_manager.HostState('host2', 'node2'), instance)
+
     def test_get_all_host_states(self):
 
         context = 'fake_context'
@@ -418,6 +499,281 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
         self.assertEqual(len(host_states_map), 0)
 
 
+class HostManagerHostStateCacheTestCase(test.NoDBTestCase):
+    """Test case for the incremental host state cache of HostManager."""
+
+    def setUp(self):
+        super(HostManagerHostStateCacheTestCase, self).setUp()
+        self.flags(scheduler_host_state_cache=True,
+                   scheduler_host_state_max_staleness=5,
+                   scheduler_host_state_full_sync_interval=300)
+        self.host_manager = host_manager.HostManager()
+        self.context = 'fake_context'
+        self.start = timeutils.utcnow()
+        timeutils.set_time_override(self.start)
+        self.addCleanup(timeutils.clear_time_override)
+        self.services = [dict(id=x, host='host%s' % x, disabled=False,
+                              binary='nova-compute', created_at=self.start,
+                              updated_at=None, deleted_at=None, deleted=0)
+                         for x in xrange(1, 4)]
+        self.compute_nodes = [self._compute_node(x) for x in xrange(1, 4)]
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'service_get_all_by_binary')
+
+    def _compute_node(self, x, free_ram_mb=1024, updated_at=None,
+                      deleted=0):
+        return dict(id=x, local_gb=1024, memory_mb=2048, vcpus=4,
+                    disk_available_least=512, free_ram_mb=free_ram_mb,
+                    vcpus_used=0, local_gb_used=0,
+                    created_at=self.start, updated_at=updated_at,
+                    deleted_at=updated_at if deleted else None,
+                    deleted=deleted, service=self.services[x - 1],
+                    hypervisor_hostname='node%s' % x,
+                    host_ip='127.0.0.1', hypervisor_version=0)
+
+    def test_cached_between_syncs(self):
+        db.compute_node_get_all(self.context).AndReturn(self.compute_nodes)
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(self.context)
+        host_state = self.host_manager.host_state_map[('host1', 'node1')]
+        host_state.consume_from_instance(dict(root_gb=0, ephemeral_gb=0,
+                                              memory_mb=512, vcpus=1))
+        timeutils.advance_time_seconds(2)
+        host_states = list(self.host_manager.get_all_host_states(
+                self.context))
+
+        self.assertEqual(3, len(host_states))
+        self.assertEqual(512, host_state.free_ram_mb)
+
+    def test_delta_sync_after_max_staleness(self):
+        updated_at = self.start + datetime.timedelta(seconds=3)
+        db.compute_node_get_all(self.context).AndReturn(self.compute_nodes)
+        db.compute_node_get_all(self.context,
+                updated_since=self.start).AndReturn(
+                        [self._compute_node(2, free_ram_mb=256,
+                                            updated_at=updated_at)])
+        heartbeat = dict(self.services[2], updated_at=updated_at)
+        db.service_get_all_by_binary(self.context, 'nova-compute',
+                updated_since=self.start).AndReturn([heartbeat])
+        db.compute_node_get_all(self.context,
+                updated_since=updated_at).AndReturn([])
+        db.service_get_all_by_binary(self.context, 'nova-compute',
+                updated_since=updated_at).AndReturn([])
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(self.context)
+        host_state = self.host_manager.host_state_map[('host1', 'node1')]
+        host_state.consume_from_instance(dict(root_gb=0, ephemeral_gb=0,
+                                              memory_mb=512, vcpus=1))
+        timeutils.advance_time_seconds(6)
+        self.host_manager.get_all_host_states(self.context)
+        timeutils.advance_time_seconds(6)
+        self.host_manager.get_all_host_states(self.context)
+
+        host_state_map = self.host_manager.host_state_map
+        self.assertEqual(3, len(host_state_map))
+        self.assertEqual(512, host_state_map[('host1', 'node1')].free_ram_mb)
+        self.assertEqual(256, host_state_map[('host2', 'node2')].free_ram_mb)
+        self.assertEqual(1024,
+                         host_state_map[('host3', 'node3')].free_ram_mb)
+        self.assertEqual(updated_at,
+                         host_state_map[('host3', 'node3')].service[
+                                 'updated_at'])
+
+    def test_delta_sync_removes_dead_nodes(self):
+        updated_at = self.start + datetime.timedelta(seconds=3)
+        db.compute_node_get_all(self.context).AndReturn(self.compute_nodes)
+        db.compute_node_get_all(self.context,
+                updated_since=self.start).AndReturn(
+                        [self._compute_node(2, updated_at=updated_at,
+                                            deleted=2)])
+        # The service of node3 is gone too
+        deleted_service = dict(self.services[2], deleted_at=updated_at,
+                               deleted=3)
+        db.service_get_all_by_binary(self.context, 'nova-compute',
+                updated_since=self.start).AndReturn([deleted_service])
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(self.context)
+        timeutils.advance_time_seconds(6)
+        self.host_manager.get_all_host_states(self.context)
+
+        self.assertEqual([('host1', 'node1')],
+                         self.host_manager.host_state_map.keys())
+
+    def test_full_sync_interval(self):
+        db.compute_node_get_all(self.context).AndReturn(self.compute_nodes)
+        db.compute_node_get_all(self.context).AndReturn(
+                self.compute_nodes[:1])
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(self.context)
+        timeutils.advance_time_seconds(301)
+        self.host_manager.get_all_host_states(self.context)
+
+        self.assertEqual([('host1', 'node1')],
+                         self.host_manager.host_state_map.keys())
+
+
+class HostManagerShardingTestCase(test.NoDBTestCase):
+    """Test case for the sharing of the hosts between schedulers."""
+
+    def setUp(self):
+        super(HostManagerShardingTestCase, self).setUp()
+        self.flags(scheduler_sharding=True, host='scheduler1')
+        self.host_manager = host_manager.HostManager()
+        self.context = 'fake_context'
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(self.host_manager.servicegroup_api,
+                                 'get_all')
+        self.hosts = set(node['service']['host']
+                         for node in fakes.COMPUTE_NODES if node['service'])
+
+    def _get_hosts(self, all_shards=False):
+        return set(host_state.host for host_state in
+                   self.host_manager.get_all_host_states(
+                           self.context, all_shards=all_shards))
+
+    def test_only_hosts_of_shard_tracked(self):
+        self.host_manager.servicegroup_api.get_all('scheduler').AndReturn(
+                ['scheduler1', 'scheduler2'])
+        for i in xrange(4):
+            db.compute_node_get_all(self.context).AndReturn(
+                    fakes.COMPUTE_NODES)
+        self.mox.ReplayAll()
+
+        ring = hash_ring.HashRing(['scheduler1', 'scheduler2'])
+        expected = set(host for host in self.hosts
+                       if ring.get_member(host) == 'scheduler1')
+        self.assertTrue(expected and expected != self.hosts)
+        self.assertEqual(expected, self._get_hosts())
+        self.assertTrue(self.host_manager.is_sharded())
+        self.assertEqual(expected, set(host for host, node in
+                                       self.host_manager.host_state_map))
+        # The other hosts are only loaded for the request asking for them.
+        self.assertEqual(self.hosts, self._get_hosts(all_shards=True))
+        self.assertEqual(expected, self._get_hosts())
+
+    def test_single_scheduler_not_sharded(self):
+        self.host_manager.servicegroup_api.get_all('scheduler').AndReturn([])
+        db.compute_node_get_all(self.context).AndReturn(fakes.COMPUTE_NODES)
+        self.mox.ReplayAll()
+
+        self.assertEqual(self.hosts, self._get_hosts(all_shards=True))
+        self.assertFalse(self.host_manager.is_sharded())
+
+    def test_schedulers_checked_at_refresh_interval(self):
+        self.flags(scheduler_shard_refresh_interval=10)
+        self.host_manager.servicegroup_api.get_all('scheduler').AndReturn(
+                ['scheduler1'])
+        db.compute_node_get_all(self.context).AndReturn(fakes.COMPUTE_NODES)
+        db.compute_node_get_all(self.context).AndReturn(fakes.COMPUTE_NODES)
+        self.host_manager.servicegroup_api.get_all('scheduler').AndReturn(
+                ['scheduler1', 'scheduler2'])
+        db.compute_node_get_all(self.context).AndReturn(fakes.COMPUTE_NODES)
+        self.mox.ReplayAll()
+
+        self.assertEqual(self.hosts, self._get_hosts())
+        timeutils.advance_time_seconds(5)
+        self.assertEqual(self.hosts, self._get_hosts())
+        timeutils.advance_time_seconds(6)
+        hosts = self._get_hosts()
+        self.assertTrue(self.host_manager.is_sharded())
+        self.assertEqual(set(host for host in self.hosts
+                             if self.host_manager.in_shard(host)), hosts)
+
+
+class FakeAggregate(dict):
+    def __init__(self, id, hosts, metadetails):
+        super(FakeAggregate, self).__init__(id=id)
+        self.hosts = hosts
+        self.metadetails = metadetails
+
+
+class HostManagerAggregateCacheTestCase(test.NoDBTestCase):
+    """Test case for the aggregate metadata cache of HostManager."""
+
+    def setUp(self):
+        super(HostManagerAggregateCacheTestCase, self).setUp()
+        self.flags(scheduler_aggregate_metadata_cache=True,
+                   scheduler_aggregate_metadata_max_age=60)
+        self.host_manager = host_manager.HostManager()
+        self.context = 'fake_context'
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.aggregates = [
+            FakeAggregate(1, ['host1', 'host2', 'host3'],
+                          {'availability_zone': 'az1'}),
+            FakeAggregate(2, ['host2', 'host3'], {'ssd': 'true'}),
+            FakeAggregate(3, ['host3'], {'ssd': 'false'}),
+        ]
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'aggregate_get_all')
+
+    def _get_host_states(self):
+        host_states = self.host_manager.get_all_host_states(self.context)
+        return dict((host_state.host, host_state)
+                    for host_state in host_states)
+
+    def test_aggregates_set_in_host_states(self):
+        db.compute_node_get_all(self.context).AndReturn(fakes.COMPUTE_NODES)
+        db.aggregate_get_all(self.context).AndReturn(self.aggregates)
+        self.mox.ReplayAll()
+
+        host_states = self._get_host_states()
+        self.assertEqual(frozenset([1]), host_states['host1'].aggregate_ids)
+        self.assertEqual({'availability_zone': set(['az1'])},
+                         host_states['host1'].aggregate_metadata)
+        self.assertEqual(frozenset([1, 2]),
+                         host_states['host2'].aggregate_ids)
+        self.assertEqual({'availability_zone': set(['az1']),
+                          'ssd': set(['true', 'false'])},
+                         host_states['host3'].aggregate_metadata)
+        self.assertEqual(frozenset(), host_states['host4'].aggregate_ids)
+        self.assertEqual({}, host_states['host4'].aggregate_metadata)
+
+    def test_aggregates_cached_until_changed(self):
+        db.compute_node_get_all(self.context).AndReturn(fakes.COMPUTE_NODES)
+        db.aggregate_get_all(self.context).AndReturn(self.aggregates)
+        db.compute_node_get_all(self.context).AndReturn(fakes.COMPUTE_NODES)
+        db.compute_node_get_all(self.context).AndReturn(fakes.COMPUTE_NODES)
+        db.aggregate_get_all(self.context).AndReturn(self.aggregates[:1])
+        self.mox.ReplayAll()
+
+        self._get_host_states()
+        host_states = self._get_host_states()
+        self.assertEqual(frozenset([1, 2]),
+                         host_states['host2'].aggregate_ids)
+
+        self.host_manager.aggregates_changed()
+        host_states = self._get_host_states()
+        self.assertEqual(frozenset([1]), host_states['host2'].aggregate_ids)
+
+    def test_aggregates_reloaded_after_max_age(self):
+        db.compute_node_get_all(self.context).AndReturn(fakes.COMPUTE_NODES)
+        db.aggregate_get_all(self.context).AndReturn(self.aggregates)
+        db.compute_node_get_all(self.context).AndReturn(fakes.COMPUTE_NODES)
+        db.aggregate_get_all(self.context).AndReturn([])
+        self.mox.ReplayAll()
+
+        self._get_host_states()
+        timeutils.advance_time_seconds(61)
+        host_states = self._get_host_states()
+        self.assertEqual(frozenset(), host_states['host1'].aggregate_ids)
+
+    def test_cache_disabled(self):
+        self.flags(scheduler_aggregate_metadata_cache=False)
+        db.compute_node_get_all(self.context).AndReturn(fakes.COMPUTE_NODES)
+        self.mox.ReplayAll()
+
+        host_states = self._get_host_states()
+        self.assertIsNone(host_states['host1'].aggregate_ids)
+        self.assertIsNone(host_states['host1'].aggregate_metadata)
+
+
 class HostStateTestCase(test.NoDBTestCase):
     """Test case for HostState class."""
 
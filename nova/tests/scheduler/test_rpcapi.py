@@ -76,6 +76,16 @@ class SchedulerRpcAPITestCase(test.NoDBTestCase):
                 host='fake_host', capabilities='fake_capabilities',
                 version='2.4')
 
+    def test_aggregates_changed(self):
+        self._test_scheduler_api('aggregates_changed',
+                rpc_method='fanout_cast', version='2.10')
+
+    def test_aggregates_changed_capped(self):
+        self.flags(scheduler='havana', group='upgrade_levels')
+        self.stubs.Set(rpc, 'fanout_cast', self.fail)
+        ctxt = context.RequestContext('fake_user', 'fake_project')
+        scheduler_rpcapi.SchedulerAPI().aggregates_changed(ctxt)
+
     def test_select_hosts(self):
         self._test_scheduler_api('select_hosts', rpc_method='call',
                 request_spec='fake_request_spec',
@@ -119,6 +119,19 @@ class SchedulerManagerTestCase(test.NoDBTestCase):
                 service_name=service_name, host=host,
                 capabilities=[capab1, capab2, capab3])
 
+    def test_aggregates_changed(self):
+        self.mox.StubOutWithMock(self.manager.driver, 'aggregates_changed')
+        self.manager.driver.aggregates_changed()
+        self.mox.ReplayAll()
+        self.manager.aggregates_changed(self.context)
+
+    def test_report_scheduler_stats(self):
+        stats = self.manager.driver.host_manager.stats
+        self.mox.StubOutWithMock(stats, 'report')
+        stats.report(self.context)
+        self.mox.ReplayAll()
+        self.manager._report_scheduler_stats(self.context)
+
     def test_show_host_resources(self):
         host = 'fake_host'
 
@@ -541,6 +554,13 @@ class SchedulerTestCase(test.NoDBTestCase):
         self.driver.update_service_capabilities(service_name,
                 host, capabilities)
 
+    def test_aggregates_changed(self):
+        self.mox.StubOutWithMock(self.driver.host_manager,
+                'aggregates_changed')
+        self.driver.host_manager.aggregates_changed()
+        self.mox.ReplayAll()
+        self.driver.aggregates_changed()
+
     def test_hosts_up(self):
         service1 = {'host': 'host1'}
         service2 = {'host': 'host2'}
@@ -0,0 +1,73 @@
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Smoke tests for the scheduler simulation harness in tools/scheduler.
+"""
+
+import imp
+import os
+import random
+
+import nova
+from nova import context
+from nova.scheduler import filter_scheduler
+from nova import test
+
+SIMULATE_PATH = os.path.join(os.path.dirname(nova.__file__), os.pardir,
+                             'tools', 'scheduler', 'simulate.py')
+
+
+class SimulateTestCase(test.TestCase):
+    def setUp(self):
+        super(SimulateTestCase, self).setUp()
+        if not os.path.exists(SIMULATE_PATH):
+            self.skipTest('tools/scheduler/simulate.py not available')
+        self.simulate = imp.load_source('nova_tools_scheduler_simulate',
+                                        SIMULATE_PATH)
+        self.flags(service_down_time=86400)
+
+    def test_percentile(self):
+        self.assertEqual(0.0, self.simulate.percentile([], 99))
+        self.assertEqual(3, self.simulate.percentile([4, 1, 3, 2], 50))
+        self.assertEqual(4, self.simulate.percentile([4, 1, 3, 2], 99))
+
+    def test_replay(self):
+        random.seed(0)
+        trace = self.simulate.generate_trace(
+                20, dict(boot=0.7, resize=0.1, delete=0.2),
+                {'m1.tiny': 1, 'm1.small': 1})
+        self.assertEqual(20, len(trace))
+        ctxt = context.get_admin_context()
+        cloud = self.simulate.SimulatedCloud(ctxt, 3, 8192, 8, 100)
+
+        latencies, failures = self.simulate.replay(
+                filter_scheduler.FilterScheduler(), cloud, ctxt, trace)
+
+        self.assertEqual(0, failures)
+        self.assertTrue(latencies)
+        placement = cloud.placement()
+        self.assertEqual(len(cloud.instances), placement['instances'])
+        self.assertTrue(0 < placement['hosts_used'] <= 3)
+
+    def test_replay_nothing_scheduled(self):
+        ctxt = context.get_admin_context()
+        cloud = self.simulate.SimulatedCloud(ctxt, 1, 8192, 8, 100)
+
+        latencies, failures = self.simulate.replay(
+                filter_scheduler.FilterScheduler(), cloud, ctxt,
+                [dict(op='delete', instance=0)])
+
+        self.assertEqual(([], 0), (latencies, failures))
+        self.assertEqual(0.0, self.simulate.percentile(latencies, 99))
@@ -0,0 +1,96 @@
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For scheduler filter and weigher statistics.
+"""
+
+from nova import context
+from nova.scheduler import stats
+from nova import test
+from nova.tests import fake_notifier
+
+
+class SchedulerStatsTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(SchedulerStatsTestCase, self).setUp()
+        self.stats = stats.SchedulerStats()
+        self.context = context.get_admin_context()
+        fake_notifier.stub_notifier(self.stubs)
+        self.addCleanup(fake_notifier.reset)
+
+    def test_record_filter(self):
+        self.stats.record_filter('RamFilter', 10, 8, 0.5)
+        self.stats.record_filter('RamFilter', 8, 2, 0.25)
+        self.stats.record_filter('CoreFilter', 2, 2, 0.125)
+        self.assertEqual({'RamFilter': dict(runs=2, seconds=0.75,
+                                            hosts_in=18, hosts_out=10),
+                          'CoreFilter': dict(runs=1, seconds=0.125,
+                                             hosts_in=2, hosts_out=2)},
+                         self.stats.filters)
+
+    def test_record_weigher(self):
+        self.stats.record_weigher('RAMWeigher', 10, 0.5)
+        self.stats.record_weigher('RAMWeigher', 4, 0.25)
+        self.assertEqual({'RAMWeigher': dict(runs=2, seconds=0.75,
+                                             hosts=14)},
+                         self.stats.weighers)
+
+    def test_record_in_profile(self):
+        filter_properties = {'scheduler_profile': stats.new_profile()}
+        self.stats.record_filter('RamFilter', 10, 8, 0.5, filter_properties)
+        self.stats.record_weigher('RAMWeigher', 8, 0.25, filter_properties)
+        self.stats.record_filter('RamFilter', 8, 7, 0.5, {})
+        self.assertEqual(
+                {'filters': [dict(name='RamFilter', seconds=0.5,
+                                  hosts_in=10, hosts_out=8)],
+                 'weighers': [dict(name='RAMWeigher', seconds=0.25,
+                                   hosts=8)]},
+                filter_properties['scheduler_profile'])
+
+    def test_report(self):
+        self.stats.record_filter('RamFilter', 10, 8, 0.5)
+        self.stats.record_weigher('RAMWeigher', 8, 0.25)
+        self.stats.report(self.context)
+
+        self.assertEqual(1, len(fake_notifier.NOTIFICATIONS))
+        msg = fake_notifier.NOTIFICATIONS[0]
+        self.assertEqual('scheduler.stats', msg.event_type)
+        self.assertEqual({'filters': {'RamFilter': dict(runs=1, seconds=0.5,
+                                                        hosts_in=10,
+                                                        hosts_out=8)},
+                          'weighers': {'RAMWeigher': dict(runs=1,
+                                                          seconds=0.25,
+                                                          hosts=8)},
+                          'reservations': dict(reserved=0, refused=0)},
+                         msg.payload)
+        self.assertEqual({}, self.stats.filters)
+        self.assertEqual({}, self.stats.weighers)
+
+    def test_report_reservations(self):
+        self.stats.record_reservation(True)
+        self.stats.record_reservation(False)
+        self.stats.record_reservation(True)
+        self.stats.report(self.context)
+
+        self.assertEqual(1, len(fake_notifier.NOTIFICATIONS))
+        self.assertEqual(dict(reserved=2, refused=1),
+                         fake_notifier.NOTIFICATIONS[0].payload[
+                                 'reservations'])
+        self.assertEqual(dict(reserved=0, refused=0),
+                         self.stats.reservations)
+
+    def test_report_nothing(self):
+        self.stats.report(self.context)
+        self.assertEqual([], fake_notifier.NOTIFICATIONS)
@@ -16,11 +16,17 @@
 Tests For Scheduler weights.
 """
 
+import testtools
+
 from nova import context
+from nova.scheduler import host_columns
+from nova.scheduler import stats
 from nova.scheduler import weights
+from nova.scheduler.weights import ram
 from nova import test
 from nova.tests import matchers
 from nova.tests.scheduler import fakes
+from nova import weights as base_weights
 
 
 class TestWeighedHost(test.NoDBTestCase):
@@ -38,6 +44,17 @@ class TestWeighedHost(test.NoDBTestCase):
         self.assertIn('RAMWeigher', class_names)
 
 
+class NormalizeTestCase(test.NoDBTestCase):
+    def test_normalize(self):
+        self.assertEqual([], base_weights.normalize([]))
+        self.assertEqual([0.0, 0.5, 1.0],
+                         base_weights.normalize([1, 2, 3]))
+        self.assertEqual([0.0, 0.0], base_weights.normalize([2, 2]))
+        self.assertEqual([0.25, 0.5, 0.75],
+                         base_weights.normalize([1, 2, 3], minval=0,
+                                                maxval=4))
+
+
 class RamWeigherTestCase(test.NoDBTestCase):
     def setUp(self):
         super(RamWeigherTestCase, self).setUp()
@@ -46,11 +63,14 @@ class RamWeigherTestCase(test.NoDBTestCase):
         self.weight_classes = self.weight_handler.get_matching_classes(
                 ['nova.scheduler.weights.ram.RAMWeigher'])
 
-    def _get_weighed_host(self, hosts, weight_properties=None):
+    def _get_weighed_hosts(self, hosts, weight_properties=None, **kwargs):
         if weight_properties is None:
             weight_properties = {}
         return self.weight_handler.get_weighed_objects(self.weight_classes,
-                hosts, weight_properties)[0]
+                hosts, weight_properties, **kwargs)
+
+    def _get_weighed_host(self, hosts, weight_properties=None):
+        return self._get_weighed_hosts(hosts, weight_properties)[0]
 
     def _get_all_hosts(self):
         ctxt = context.get_admin_context()
@@ -101,3 +121,62 @@ class RamWeigherTestCase(test.NoDBTestCase):
         weighed_host = self._get_weighed_host(hostinfo_list)
         self.assertEqual(weighed_host.weight, 8192 * 2)
         self.assertEqual(weighed_host.obj.host, 'host4')
+
+    def test_limit(self):
+        hostinfo_list = list(self._get_all_hosts())
+        weighed_hosts = self._get_weighed_hosts(hostinfo_list)
+        self.assertEqual(['host4', 'host3', 'host2', 'host1'],
+                         [x.obj.host for x in weighed_hosts])
+
+        top_hosts = self._get_weighed_hosts(hostinfo_list, limit=2)
+        self.assertEqual(['host4', 'host3'],
+                         [x.obj.host for x in top_hosts])
+        self.assertEqual([x.weight for x in weighed_hosts[:2]],
+                         [x.weight for x in top_hosts])
+
+    def test_limit_keeps_order_of_equal_weights(self):
+        host_states = [fakes.FakeHostState('host%d' % i, 'node%d' % i,
+                                           {'free_ram_mb': i % 2})
+                       for i in xrange(6)]
+        weighed_hosts = self._get_weighed_hosts(host_states, limit=2)
+        self.assertEqual(['host1', 'host3'],
+                         [x.obj.host for x in weighed_hosts])
+
+    def test_stats(self):
+        self.weight_handler.stats = stats.SchedulerStats()
+        self._get_weighed_hosts(self._get_all_hosts())
+        self.assertEqual(1, self.weight_handler.stats.weighers[
+                'RAMWeigher']['runs'])
+        self.assertEqual(4, self.weight_handler.stats.weighers[
+                'RAMWeigher']['hosts'])
+
+    def test_normalize_weights(self):
+        self.flags(ram_weight_multiplier=2.0)
+        hostinfo_list = self._get_all_hosts()
+
+        # host1: free_ram_mb=512
+        # host4: free_ram_mb=8192
+
+        # so, host4 should win with the highest normalized weight:
+        weighed_hosts = self._get_weighed_hosts(hostinfo_list,
+                                                normalize_weights=True)
+        self.assertEqual(2.0, weighed_hosts[0].weight)
+        self.assertEqual('host4', weighed_hosts[0].obj.host)
+        self.assertEqual(0.0, weighed_hosts[-1].weight)
+        self.assertEqual('host1', weighed_hosts[-1].obj.host)
+
+
+@testtools.skipIf(host_columns.numpy is None, 'NumPy is not installed')
+class RamWeigherColumnsTestCase(RamWeigherTestCase):
+    """Same tests, with the weights computed over HostStateColumns."""
+    def setUp(self):
+        super(RamWeigherColumnsTestCase, self).setUp()
+        self.flags(scheduler_columnar_filters=True)
+
+    def test_fallback_to_weigh_objects(self):
+        self.stubs.Set(ram.RAMWeigher, 'weigh_columns',
+                       lambda *args: None)
+        self.flags(ram_weight_multiplier=-1.0)
+        weighed_host = self._get_weighed_host(self._get_all_hosts())
+        self.assertEqual(-512, weighed_host.weight)
+        self.assertEqual('host1', weighed_host.obj.host)
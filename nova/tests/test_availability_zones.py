@@ -19,6 +19,7 @@
 Tests for availability zones
 """
 
+import mox
 from oslo.config import cfg
 
 from nova import availability_zones as az
@@ -232,3 +233,34 @@ class AvailabilityZoneTestCases(test.TestCase):
 
         self.assertEqual(self.availability_zone,
                 az.get_instance_availability_zone(self.context, fake_inst))
+
+    def test_get_instances_availability_zones(self):
+        """Test get availability zones of several instances at once."""
+        service = self._create_service_with_topic('compute', 'host170')
+        self._add_to_aggregate(service, self.agg)
+        fake_insts = [fakes.stub_instance(i, host=host,
+                                          uuid=fakes.get_fake_uuid(i))
+                      for i, host in enumerate(['host170', self.host,
+                                                'host170'])]
+        az.reset_cache()
+        az.get_instance_availability_zone(self.context, fake_insts[0])
+
+        self.mox.StubOutWithMock(az, 'get_hosts_availability_zones')
+        az.get_hosts_availability_zones(mox.IgnoreArg(),
+                set([self.host])).AndReturn({self.host: self.default_az})
+        self.mox.ReplayAll()
+
+        self.assertEqual({fake_insts[0]['uuid']: self.availability_zone,
+                          fake_insts[1]['uuid']: self.default_az,
+                          fake_insts[2]['uuid']: self.availability_zone},
+                az.get_instances_availability_zones(self.context, fake_insts))
+
+    def test_get_hosts_availability_zones(self):
+        """Test get availability zones of several hosts at once."""
+        service = self._create_service_with_topic('compute', 'host170')
+        self._add_to_aggregate(service, self.agg)
+
+        self.assertEqual({'host170': self.availability_zone,
+                          self.host: self.default_az},
+                az.get_hosts_availability_zones(self.context,
+                                                ['host170', self.host]))
@@ -15,15 +15,19 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import datetime
+
 import fixtures
 import StringIO
 import sys
 
 from nova.cmd import manage
+from nova.compute import flavors
 from nova import context
 from nova import db
 from nova import exception
 from nova.openstack.common.gettextutils import _
+from nova.openstack.common import timeutils
 from nova import test
 from nova.tests.db import fakes as db_fakes
 
@@ -388,10 +392,91 @@ class DBCommandsTestCase(test.TestCase):
     def setUp(self):
         super(DBCommandsTestCase, self).setUp()
         self.commands = manage.DbCommands()
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout',
+                                             StringIO.StringIO()))
 
     def test_archive_deleted_rows_negative(self):
         self.assertEqual(1, self.commands.archive_deleted_rows(-1))
 
+    def test_archive_invalid_params(self):
+        self.assertEqual(1, self.commands.archive(batch_size='0'))
+        self.assertEqual(1, self.commands.archive(max_rows='-1'))
+        self.assertEqual(1, self.commands.archive(older_than='x'))
+
+    def test_archive(self):
+        self.stubs.Set(db, 'archive_tablenames',
+                       lambda ctxt: ['consoles', 'console_pools'])
+        archived = {'consoles': [2, 2, 1], 'console_pools': [0]}
+        purged = {'consoles': [2, 0], 'console_pools': [0]}
+        calls = []
+
+        def fake_archive(ctxt, tablename, max_rows, deleted_before):
+            calls.append(('archive', tablename, max_rows, deleted_before))
+            return archived[tablename].pop(0)
+
+        def fake_purge(ctxt, tablename, deleted_before, max_rows):
+            calls.append(('purge', tablename, max_rows, deleted_before))
+            return purged[tablename].pop(0)
+
+        self.stubs.Set(db, 'archive_deleted_rows_for_table', fake_archive)
+        self.stubs.Set(db, 'purge_shadow_rows_for_table', fake_purge)
+        self.useFixture(test.TimeOverride())
+        now = timeutils.utcnow()
+
+        self.assertEqual(None, self.commands.archive(batch_size='2',
+                                                     purge_older_than='1'))
+        day_ago = now - datetime.timedelta(days=1)
+        self.assertEqual([('archive', 'consoles', 2, None),
+                          ('archive', 'consoles', 2, None),
+                          ('archive', 'consoles', 2, None),
+                          ('archive', 'console_pools', 2, None),
+                          ('purge', 'consoles', 2, day_ago),
+                          ('purge', 'consoles', 2, day_ago),
+                          ('purge', 'console_pools', 2, day_ago)], calls)
+
+    def test_archive_max_rows(self):
+        self.stubs.Set(db, 'archive_tablenames',
+                       lambda ctxt: ['consoles', 'console_pools'])
+        limits = []
+
+        def fake_archive(ctxt, tablename, max_rows, deleted_before):
+            limits.append(max_rows)
+            return max_rows
+
+        self.stubs.Set(db, 'archive_deleted_rows_for_table', fake_archive)
+        self.commands.archive(batch_size='2', max_rows='5')
+        self.assertEqual([2, 2, 1], limits)
+
+
+class VmCommandsTestCase(test.TestCase):
+    def setUp(self):
+        super(VmCommandsTestCase, self).setUp()
+        self.commands = manage.VmCommands()
+        self.context = context.get_admin_context()
+        sys_meta = flavors.save_flavor_info({}, flavors.get_default_flavor())
+        for i in range(5):
+            db.instance_create(self.context,
+                               {'display_name': 'vm%d' % i,
+                                'host': 'host%d' % (i % 2),
+                                'launch_index': 0,
+                                'system_metadata': sys_meta})
+        self.useFixture(fixtures.MonkeyPatch(
+            'nova.cmd.manage.INSTANCE_CHUNK_SIZE', 2))
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout',
+                                             StringIO.StringIO()))
+
+    def _listed(self):
+        lines = sys.stdout.getvalue().splitlines()[1:]
+        return sorted(line.split()[0] for line in lines)
+
+    def test_list(self):
+        self.commands.list()
+        self.assertEqual(['vm0', 'vm1', 'vm2', 'vm3', 'vm4'], self._listed())
+
+    def test_list_just_one_host(self):
+        self.commands.list(host='host1')
+        self.assertEqual(['vm1', 'vm3'], self._listed())
+
 
 class ServiceCommandsTestCase(test.TestCase):
     def setUp(self):
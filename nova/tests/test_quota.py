@@ -331,6 +331,11 @@ class FakeDriver(object):
     def expire(self, context):
         self.called.append(('expire', context))
 
+    def limits_changed(self, project_id=None, user_id=None,
+                       quota_class=None):
+        self.called.append(('limits_changed', project_id, user_id,
+                            quota_class))
+
 
 class BaseResourceTestCase(test.TestCase):
     def test_no_flag(self):
@@ -746,6 +751,24 @@ class QuotaEngineTestCase(test.TestCase):
                 ('expire', context),
                 ])
 
+    def test_limits_changed(self):
+        driver = FakeDriver()
+        quota_obj = self._make_quota_obj(driver)
+        quota_obj.limits_changed(project_id='test_project',
+                                 user_id='fake_user')
+
+        self.assertEqual(driver.called, [
+                ('limits_changed', 'test_project', 'fake_user', None),
+                ])
+
+    def test_limits_changed_without_driver_cache(self):
+        # A driver without a limits cache has nothing to drop.
+        quota_obj = self._make_quota_obj(object())
+        quota_obj.limits_changed(project_id='test_project',
+                                 user_id='fake_user')
+        self.assertEqual(dict(hits=0, misses=0, rate=0.0),
+                         quota_obj.get_limits_cache_stats())
+
     def test_resources(self):
         quota_obj = self._make_quota_obj(None)
 
@@ -1956,6 +1979,158 @@ class DbQuotaDriverTestCase(test.TestCase):
                      'fake_user', res, dict(in_use=-1)) for res in resources]
         self.assertEqual(calls, exemplar)
 
+    def _get_user_quotas(self):
+        return self.driver.get_user_quotas(
+            FakeContext('test_project', 'test_class'),
+            quota.QUOTAS._resources, 'test_project', 'fake_user',
+            usages=False)
+
+    def test_get_user_quotas_limits_not_cached(self):
+        self._stub_get_by_project_and_user()
+        self._get_user_quotas()
+        self._get_user_quotas()
+
+        self.assertEqual(self.calls, [
+                'quota_get_all_by_project_and_user',
+                'quota_get_all_by_project',
+                'quota_class_get_all_by_name',
+                ] * 2)
+
+    def test_get_user_quotas_limits_cached(self):
+        self.flags(quota_limits_cache_ttl=60)
+        self._stub_get_by_project_and_user()
+        result = self._get_user_quotas()
+
+        self.assertEqual(self._get_user_quotas(), result)
+        self.assertEqual(self.calls, [
+                'quota_get_all_by_project_and_user',
+                'quota_get_all_by_project',
+                'quota_class_get_all_by_name',
+                ])
+        self.assertEqual(self.driver.get_limits_cache_stats(),
+                         dict(hits=4, misses=4, rate=50.0))
+
+    def test_get_user_quotas_limits_cache_expired(self):
+        self.flags(quota_limits_cache_ttl=60)
+        self._stub_get_by_project_and_user()
+        self._get_user_quotas()
+        timeutils.advance_time_seconds(61)
+        self._get_user_quotas()
+
+        self.assertEqual(len(self.calls), 6)
+
+    def test_get_user_quotas_limits_cached_authorized(self):
+        self.flags(quota_limits_cache_ttl=60)
+        self._stub_get_by_project_and_user()
+        self._get_user_quotas()
+
+        self.assertRaises(exception.NotAuthorized,
+                          self.driver.get_user_quotas,
+                          FakeContext('other_project', 'test_class'),
+                          quota.QUOTAS._resources, 'test_project',
+                          'fake_user', usages=False)
+
+    def test_get_defaults_limits_cached(self):
+        self.flags(quota_limits_cache_ttl=60)
+        self._stub_quota_class_get_default()
+        self.driver.get_defaults(None, quota.QUOTAS._resources)
+        self.driver.get_defaults(None, quota.QUOTAS._resources)
+
+        self.assertEqual(self.calls, ['quota_class_get_default'])
+
+    def test_limits_changed_user(self):
+        self.flags(quota_limits_cache_ttl=60)
+        self._stub_get_by_project_and_user()
+        self._get_user_quotas()
+        self.driver.limits_changed(project_id='test_project',
+                                   user_id='fake_user')
+        self._get_user_quotas()
+
+        self.assertEqual(self.calls[3:], [
+                'quota_get_all_by_project_and_user',
+                ])
+
+    def test_limits_changed_project(self):
+        self.flags(quota_limits_cache_ttl=60)
+        self._stub_get_by_project_and_user()
+        self._get_user_quotas()
+        self.driver.limits_changed(project_id='test_project')
+        self._get_user_quotas()
+
+        self.assertEqual(self.calls[3:], [
+                'quota_get_all_by_project_and_user',
+                'quota_get_all_by_project',
+                ])
+
+    def test_limits_changed_quota_class(self):
+        self.flags(quota_limits_cache_ttl=60)
+        self._stub_get_by_project_and_user()
+        self._stub_quota_class_get_default()
+        self._get_user_quotas()
+        self.driver.get_defaults(None, quota.QUOTAS._resources)
+        self.driver.limits_changed(quota_class='test_class')
+        self._get_user_quotas()
+        self.driver.get_defaults(None, quota.QUOTAS._resources)
+
+        self.assertEqual(self.calls[4:], ['quota_class_get_all_by_name'])
+
+    def test_destroy_all_by_project_limits_changed(self):
+        self.flags(quota_limits_cache_ttl=60)
+        self._stub_get_by_project_and_user()
+        self.stubs.Set(db, 'quota_destroy_all_by_project',
+                       lambda context, project_id: None)
+        self._get_user_quotas()
+        self.driver.destroy_all_by_project(
+            FakeContext('test_project', 'test_class'), 'test_project')
+        self._get_user_quotas()
+
+        self.assertEqual(self.calls[3:], [
+                'quota_get_all_by_project_and_user',
+                'quota_get_all_by_project',
+                ])
+
+
+class ConditionalDbQuotaDriverTestCase(test.TestCase):
+    def setUp(self):
+        super(ConditionalDbQuotaDriverTestCase, self).setUp()
+        self.driver = quota.ConditionalDbQuotaDriver()
+        self.context = FakeContext('test_project', 'test_class')
+        self.calls = []
+
+        def fake_get_quotas(context, resources, keys, has_sync,
+                            project_id=None, user_id=None):
+            return dict((key, 10) for key in keys)
+        self.stubs.Set(self.driver, '_get_quotas', fake_get_quotas)
+
+        def make_fake(name, result=None):
+            def fake(context, *args, **kwargs):
+                self.calls.append(name)
+                return result
+            return fake
+        for name in ('quota_reserve', 'reservation_commit',
+                     'reservation_rollback', 'reservation_expire'):
+            self.stubs.Set(db, name, make_fake(name))
+            self.stubs.Set(db, name + '_conditional',
+                           make_fake(name + '_conditional', ['resv-1']))
+
+    def test_reserve(self):
+        result = self.driver.reserve(self.context, quota.QUOTAS._resources,
+                                     dict(instances=2))
+        self.assertEqual(['quota_reserve_conditional'], self.calls)
+        self.assertEqual(['resv-1'], result)
+
+    def test_commit(self):
+        self.driver.commit(self.context, ['resv-1'])
+        self.assertEqual(['reservation_commit_conditional'], self.calls)
+
+    def test_rollback(self):
+        self.driver.rollback(self.context, ['resv-1'])
+        self.assertEqual(['reservation_rollback_conditional'], self.calls)
+
+    def test_expire(self):
+        self.driver.expire(self.context)
+        self.assertEqual(['reservation_expire_conditional'], self.calls)
+
 
 class FakeSession(object):
     def begin(self):
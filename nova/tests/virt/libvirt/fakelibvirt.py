@@ -133,6 +133,10 @@ VIR_ERR_INTERNAL_ERROR = 950
 # Readonly
 VIR_CONNECT_RO = 1
 
+# listAllDomains flags
+VIR_CONNECT_LIST_DOMAINS_ACTIVE = 1
+VIR_CONNECT_LIST_DOMAINS_INACTIVE = 2
+
 # snapshotCreateXML flags
 VIR_DOMAIN_SNAPSHOT_CREATE_NO_METADATA = 4
 VIR_DOMAIN_SNAPSHOT_CREATE_DISK_ONLY = 16
@@ -201,6 +205,7 @@ class NWFilter(object):
 class Domain(object):
     def __init__(self, connection, xml, running=False, transient=False):
         self._connection = connection
+        self._id = -1
         if running:
             connection._mark_running(self)
 
@@ -209,7 +214,6 @@ class Domain(object):
         self._def = self._parse_definition(xml)
         self._has_saved_state = False
         self._snapshots = {}
-        self._id = self._connection._id_counter
 
     def _parse_definition(self, xml):
         try:
@@ -547,6 +551,7 @@ class Connection(object):
         del self._nwfilters[nwfilter._name]
 
     def _mark_running(self, dom):
+        dom._id = self._id_counter
         self._running_vms[self._id_counter] = dom
         self._emit_lifecycle(dom, VIR_DOMAIN_EVENT_STARTED, 0)
         self._id_counter += 1
@@ -584,6 +589,16 @@ class Connection(object):
     def listDomainsID(self):
         return self._running_vms.keys()
 
+    def listAllDomains(self, flags):
+        vms = []
+        for vm in self._vms.values():
+            if flags & VIR_CONNECT_LIST_DOMAINS_ACTIVE and vm._id == -1:
+                continue
+            if flags & VIR_CONNECT_LIST_DOMAINS_INACTIVE and vm._id != -1:
+                continue
+            vms.append(vm)
+        return vms
+
     def lookupByID(self, id):
         if id in self._running_vms:
             return self._running_vms[id]
@@ -908,7 +923,7 @@ class Connection(object):
         self._add_filter(nwfilter)
 
     def listDefinedDomains(self):
-        return []
+        return [vm.name() for vm in self._vms.values() if vm._id == -1]
 
     def listDevices(self, cap, flags):
         return []
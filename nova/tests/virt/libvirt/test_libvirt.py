@@ -44,6 +44,7 @@ from nova import db
 from nova import exception
 from nova.objects import instance as instance_obj
 from nova.openstack.common import fileutils
+from nova.openstack.common import imageutils
 from nova.openstack.common import importutils
 from nova.openstack.common import jsonutils
 from nova.openstack.common import loopingcall
@@ -56,6 +57,7 @@ import nova.tests.image.fake
 from nova.tests import matchers
 from nova.tests.objects import test_pci_device
 from nova.tests.virt.libvirt import fake_libvirt_utils
+from nova.tests.virt.libvirt import fakelibvirt
 from nova import unit
 from nova import utils
 from nova import version
@@ -172,6 +174,9 @@ class FakeVirtDomain(object):
     def name(self):
         return "fake-domain %s" % self
 
+    def ID(self):
+        return 1
+
     def info(self):
         return [power_state.RUNNING, None, None, None, None]
 
@@ -4635,9 +4640,10 @@ class LibvirtConnTestCase(test.TestCase):
         # Ensure destroy calls managedSaveRemove for saved instance.
         conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
 
-        def list_instances():
-            return ['fake1', 'fake2']
-        self.stubs.Set(conn, 'list_instances', list_instances)
+        def get_domains_stats():
+            return [{'id': 1, 'name': 'fake1', 'disks': []},
+                    {'id': -1, 'name': 'fake2', 'disks': []}]
+        self.stubs.Set(conn, 'get_domains_stats', get_domains_stats)
 
         fake_disks = {'fake1': [{'type': 'qcow2', 'path': '/somepath/disk1',
                                  'virt_disk_size': '10737418240',
@@ -4650,13 +4656,58 @@ class LibvirtConnTestCase(test.TestCase):
                                  'disk_size': '10737418240',
                                  'over_committed_disk_size': '0'}]}
 
-        def get_info(instance_name):
-            return jsonutils.dumps(fake_disks.get(instance_name))
-        self.stubs.Set(conn, 'get_instance_disk_info', get_info)
+        def get_info(instance_name, disks, volume_devices=(),
+                     use_cache=False):
+            return fake_disks.get(instance_name)
+        self.stubs.Set(conn, '_get_disks_info', get_info)
 
         result = conn.get_disk_over_committed_size_total()
         self.assertEqual(result, 10653532160)
 
+    def test_disk_over_committed_size_total_cached(self):
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        inst_base = self.useFixture(fixtures.TempDir()).path
+        path = os.path.join(inst_base, 'disk')
+        with open(path, 'w') as f:
+            f.write('x' * 1024)
+        domains = [{'id': 1, 'name': 'fake1',
+                    'disks': [{'type': 'file', 'path': path,
+                               'driver_type': 'qcow2', 'target': 'vda'}]}]
+
+        calls = []
+
+        def fake_qemu_img_info(path):
+            calls.append(path)
+            return imageutils.QemuImgInfo("image: %s\n"
+                                          "file format: qcow2\n"
+                                          "virtual size: 1M (1048576 bytes)\n"
+                                          "backing file: /base/image\n"
+                                          % path)
+        self.stubs.Set(images, 'qemu_img_info', fake_qemu_img_info)
+
+        self.assertEqual(1048576 - 1024,
+                         conn.get_disk_over_committed_size_total(domains))
+        self.assertEqual(1048576 - 1024,
+                         conn.get_disk_over_committed_size_total(domains))
+        self.assertEqual([path], calls)
+        self.assertEqual(1, conn._qemu_img_calls_avoided)
+
+        # A disk that changed is looked at again.
+        with open(path, 'a') as f:
+            f.write('x' * 1024)
+        self.assertEqual(1048576 - 2048,
+                         conn.get_disk_over_committed_size_total(domains))
+        self.assertEqual([path, path], calls)
+
+        # As are the disks of a migrated instance.
+        conn._forget_disk_info(inst_base)
+        conn.get_disk_over_committed_size_total(domains)
+        self.assertEqual([path, path, path], calls)
+
+        # The disks of deleted instances are forgotten.
+        conn.get_disk_over_committed_size_total([])
+        self.assertEqual({}, conn._disk_info_cache)
+
     def test_cpu_info(self):
         conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
 
@@ -5178,34 +5229,153 @@ class LibvirtConnTestCase(test.TestCase):
                   }
         self.assertEqual(actual, expect)
 
-    def test_failing_vcpu_count(self):
-        """Domain can fail to return the vcpu description in case it's
-        just starting up or shutting down. Make sure None is handled
-        gracefully.
+    def _connect_fake_domains(self, lib_version):
+        """Connect a driver to two running domains and a stopped one."""
+        driver = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
+        driver._wrapped_conn = fakelibvirt.Connection('qemu:///system',
+                                                      False,
+                                                      version=lib_version)
+        for name, vcpus, running in (('running1', 2, True),
+                                     ('running2', 4, True),
+                                     ('stopped', 8, False)):
+            xml = """<domain type='kvm'>
+                       <name>%(name)s</name>
+                       <memory>131072</memory>
+                       <vcpu>%(vcpus)d</vcpu>
+                       <os><type>hvm</type></os>
+                       <devices>
+                         <disk type='file' device='disk'>
+                           <driver name='qemu' type='qcow2'/>
+                           <source file='/%(name)s/disk'/>
+                           <target dev='vda' bus='virtio'/>
+                         </disk>
+                       </devices>
+                     </domain>""" % {'name': name, 'vcpus': vcpus}
+            dom = driver._conn.defineXML(xml)
+            if running:
+                dom.create()
+        return driver
+
+    def _test_get_domains_stats(self, lib_version):
+        driver = self._connect_fake_domains(lib_version)
+        domains = sorted(driver.get_domains_stats(),
+                         key=lambda domain: domain['name'])
+
+        self.assertEqual(['running1', 'running2', 'stopped'],
+                         [domain['name'] for domain in domains])
+        self.assertEqual([2, 4, 8], [domain['vcpus'] for domain in domains])
+        self.assertEqual(-1, domains[2]['id'])
+        self.assertNotIn(-1, [domains[0]['id'], domains[1]['id']])
+        self.assertEqual([{'type': 'file', 'path': '/running1/disk',
+                           'driver_type': 'qcow2', 'target': 'vda'}],
+                         domains[0]['disks'])
+        # Only the running domains use vcpus.
+        self.assertEqual(6, driver.get_vcpu_used(domains))
+
+    def test_get_domains_stats(self):
+        self._test_get_domains_stats(1000000)
+
+    def test_get_domains_stats_without_list_all(self):
+        self._test_get_domains_stats(9011)
+
+    def test_get_domains_stats_list_all(self):
+        driver = self._connect_fake_domains(1000000)
+        self.mox.StubOutWithMock(driver._conn, 'listDomainsID')
+        self.mox.StubOutWithMock(driver._conn, 'lookupByID')
+        self.mox.ReplayAll()
+        self.assertEqual(3, len(driver.get_domains_stats()))
+
+    def test_get_domains_stats_caches_devices(self):
+        driver = self._connect_fake_domains(1000000)
+        dumps = []
+        orig_xml_desc = fakelibvirt.Domain.XMLDesc
+
+        def fake_xml_desc(dom, flags):
+            dumps.append(dom.name())
+            return orig_xml_desc(dom, flags)
+        self.stubs.Set(fakelibvirt.Domain, 'XMLDesc', fake_xml_desc)
+
+        driver.get_domains_stats()
+        self.assertEqual(['running1', 'running2', 'stopped'], sorted(dumps))
+
+        # Only the devices of running domains are kept.
+        del dumps[:]
+        driver.get_domains_stats()
+        self.assertEqual(['stopped'], dumps)
+
+        # A change of devices or a restart parse them again.
+        del dumps[:]
+        driver._domain_changed('running1')
+        dom = driver._conn.lookupByName('running2')
+        dom.destroy()
+        dom.create()
+        driver.get_domains_stats()
+        self.assertEqual(['running1', 'running2', 'stopped'], sorted(dumps))
+
+    def test_get_domains_stats_forgets_deleted_domains(self):
+        driver = self._connect_fake_domains(1000000)
+        driver.get_domains_stats()
+        driver._domain_changed('running1')
+        self.assertIn('running1', driver._domain_devices)
+
+        driver._conn.lookupByName('running1').destroy()
+        driver._conn.lookupByName('running1').undefine()
+        driver.get_domains_stats()
+        self.assertNotIn('running1', driver._domain_devices)
+        self.assertNotIn('running1', driver._domain_generations)
+
+    def _test_failing_vcpu_count(self, lib_version):
+        """Domains can go away while they are listed, in case they are
+        just shutting down. Make sure they are skipped gracefully.
         """
+        driver = self._connect_fake_domains(lib_version)
+        orig_info = fakelibvirt.Domain.info
+
+        def fake_info(dom):
+            if dom.name() == 'running1':
+                raise fakelibvirt.libvirtError(
+                        'Domain not found',
+                        error_code=fakelibvirt.VIR_ERR_NO_DOMAIN)
+            return orig_info(dom)
+        self.stubs.Set(fakelibvirt.Domain, 'info', fake_info)
+
+        domains = driver.get_domains_stats()
+        self.assertEqual(['running2', 'stopped'],
+                         sorted(domain['name'] for domain in domains))
+        self.assertEqual(4, driver.get_vcpu_used(domains))
 
-        class DiagFakeDomain(object):
-            def __init__(self, vcpus):
-                self._vcpus = vcpus
+    def test_failing_vcpu_count(self):
+        self._test_failing_vcpu_count(1000000)
 
-            def vcpus(self):
-                if self._vcpus is None:
-                    return None
-                else:
-                    return ([1] * self._vcpus, [True] * self._vcpus)
+    def test_failing_vcpu_count_without_list_all(self):
+        self._test_failing_vcpu_count(9011)
 
-        driver = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
-        conn = driver._conn
-        self.mox.StubOutWithMock(driver, 'list_instance_ids')
-        conn.lookupByID = self.mox.CreateMockAnything()
+    def test_failing_vcpu_count_domain_gone(self):
+        """A running domain listed by its ID can be gone when it is looked
+        up, without the listing of all the domains.
+        """
+        driver = self._connect_fake_domains(9011)
+        orig_lookup = driver._conn.lookupByID
+        gone_id = driver._conn.lookupByName('running1').ID()
 
-        driver.list_instance_ids().AndReturn([1, 2])
-        conn.lookupByID(1).AndReturn(DiagFakeDomain(None))
-        conn.lookupByID(2).AndReturn(DiagFakeDomain(5))
+        def fake_lookup_by_id(domain_id):
+            if domain_id == gone_id:
+                raise fakelibvirt.libvirtError(
+                        'Domain not found',
+                        error_code=fakelibvirt.VIR_ERR_NO_DOMAIN)
+            return orig_lookup(domain_id)
+        self.stubs.Set(driver._conn, 'lookupByID', fake_lookup_by_id)
 
-        self.mox.ReplayAll()
+        self.assertEqual(4, driver.get_vcpu_used())
+
+    def test_failing_vcpu_count_error(self):
+        driver = self._connect_fake_domains(1000000)
 
-        self.assertEqual(5, driver.get_vcpu_used())
+        def fake_info(dom):
+            raise fakelibvirt.libvirtError('Internal error')
+        self.stubs.Set(fakelibvirt.Domain, 'info', fake_info)
+
+        self.assertRaises(fakelibvirt.libvirtError, driver.get_vcpu_used)
 
     def test_get_instance_capabilities(self):
         conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
@@ -5741,13 +5911,16 @@ class HostStateTestCase(test.TestCase):
         def get_vcpu_total(self):
             return 1
 
-        def get_vcpu_used(self):
+        def get_domains_stats(self):
+            return []
+
+        def get_vcpu_used(self, domains=None):
             return 0
 
         def get_cpu_info(self):
             return HostStateTestCase.cpu_info
 
-        def get_disk_over_committed_size_total(self):
+        def get_disk_over_committed_size_total(self, domains=None):
             return 0
 
         def get_local_gb_info(self):
@@ -5756,7 +5929,7 @@ class HostStateTestCase(test.TestCase):
         def get_memory_mb_total(self):
             return 497
 
-        def get_memory_mb_used(self):
+        def get_memory_mb_used(self, domains=None):
             return 88
 
         def get_hypervisor_type(self):
@@ -5781,6 +5954,24 @@ class HostStateTestCase(test.TestCase):
         def get_pci_passthrough_devices(self):
             return jsonutils.dumps(HostStateTestCase.pci_devices)
 
+    def test_update_status_collects_domains_once(self):
+        conn = self.FakeConnection()
+        domains = [{'id': 1, 'name': 'fake', 'memory': 1024, 'vcpus': 1,
+                    'disks': [], 'ifaces': []}]
+        self.mox.StubOutWithMock(conn, 'get_domains_stats')
+        self.mox.StubOutWithMock(conn, 'get_vcpu_used')
+        self.mox.StubOutWithMock(conn, 'get_memory_mb_used')
+        self.mox.StubOutWithMock(conn, 'get_disk_over_committed_size_total')
+        conn.get_domains_stats().AndReturn(domains)
+        conn.get_disk_over_committed_size_total(domains).AndReturn(0)
+        conn.get_vcpu_used(domains).AndReturn(1)
+        conn.get_memory_mb_used(domains).AndReturn(512)
+        self.mox.ReplayAll()
+
+        stats = libvirt_driver.HostState(conn)._stats
+        self.assertEqual(1, stats['vcpus_used'])
+        self.assertEqual(512, stats['memory_mb_used'])
+
     def test_update_status(self):
         hs = libvirt_driver.HostState(self.FakeConnection())
         stats = hs._stats
@@ -24,6 +24,7 @@ import netaddr
 import six
 
 from nova.compute import manager
+from nova.compute import power_state
 from nova import exception
 from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
@@ -476,6 +477,15 @@ class _VirtDriverTestCase(_FakeDriverBackendTestCase):
                           self.connection.get_info,
                           {'name': 'I just made this name up'})
 
+    @catch_notimplementederror
+    def test_get_power_states(self):
+        instance_ref, network_info = self._get_running_instance()
+        unknown = {'uuid': 'fake-uuid', 'name': 'I just made this name up'}
+        states = self.connection.get_power_states([instance_ref, unknown])
+        self.assertEqual(self.connection.get_info(instance_ref)['state'],
+                         states[instance_ref['uuid']])
+        self.assertEqual(power_state.NOSTATE, states['fake-uuid'])
+
     @catch_notimplementederror
     def test_get_diagnostics(self):
         instance_ref, network_info = self._get_running_instance()
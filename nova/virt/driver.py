@@ -26,6 +26,8 @@ import sys
 
 from oslo.config import cfg
 
+from nova.compute import power_state
+from nova import exception
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
@@ -128,6 +130,7 @@ class ComputeDriver(object):
     capabilities = {
         "has_imagecache": False,
         "supports_recreate": False,
+        "supports_lifecycle_events": False,
         }
 
     def __init__(self, virtapi):
@@ -155,6 +158,32 @@ class ComputeDriver(object):
         # TODO(Vek): Need to pass context in for access to auth_token
         raise NotImplementedError()
 
+    def get_power_states(self, instances):
+        """Return the power states of several instances at once.
+
+        :param instances: nova.objects.instance.Instance objects
+        :returns: a dict of power_state codes by instance uuid, with
+                  power_state.NOSTATE for the instances not found. The
+                  instances whose state could not be read are left out.
+
+        .. note::
+
+            This implementation works for all drivers, but it calls
+            get_info() for each instance in turn. Maintainers of the virt
+            drivers are encouraged to override this method with something
+            more efficient.
+        """
+        states = {}
+        for instance in instances:
+            try:
+                states[instance['uuid']] = self.get_info(instance)['state']
+            except exception.InstanceNotFound:
+                states[instance['uuid']] = power_state.NOSTATE
+            except Exception:
+                LOG.exception(_("Could not get the power state of the "
+                                "instance."), instance=instance)
+        return states
+
     def get_num_instances(self):
         """Return the total number of virtual machines.
 
@@ -35,6 +35,7 @@ from nova import exception
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
 from nova.virt import driver
+from nova.virt import event as virtevent
 from nova.virt import virtapi
 
 CONF = cfg.CONF
@@ -83,6 +84,7 @@ class FakeDriver(driver.ComputeDriver):
     capabilities = {
         "has_imagecache": True,
         "supports_recreate": True,
+        "supports_lifecycle_events": True,
         }
 
     """Fake hypervisor driver."""
@@ -114,6 +116,17 @@ class FakeDriver(driver.ComputeDriver):
     def list_instances(self):
         return self.instances.keys()
 
+    def _set_power_state(self, instance, state, transition):
+        """Change the power state of an instance, emitting the lifecycle
+        event the hypervisor would.
+        """
+        fake_instance = self.instances.get(instance['name'])
+        if fake_instance is None:
+            return
+        fake_instance.state = state
+        self.emit_event(virtevent.LifecycleEvent(instance['uuid'],
+                                                 transition))
+
     def plug_vifs(self, instance, network_info):
         """Plug VIFs into networks."""
         pass
@@ -128,6 +141,8 @@ class FakeDriver(driver.ComputeDriver):
         state = power_state.RUNNING
         fake_instance = FakeInstance(name, state)
         self.instances[name] = fake_instance
+        self.emit_event(virtevent.LifecycleEvent(
+            instance['uuid'], virtevent.EVENT_LIFECYCLE_STARTED))
 
     def snapshot(self, context, instance, name, update_task_state):
         if instance['name'] not in self.instances:
@@ -178,10 +193,12 @@ class FakeDriver(driver.ComputeDriver):
         pass
 
     def power_off(self, instance):
-        pass
+        self._set_power_state(instance, power_state.SHUTDOWN,
+                              virtevent.EVENT_LIFECYCLE_STOPPED)
 
     def power_on(self, context, instance, network_info, block_device_info):
-        pass
+        self._set_power_state(instance, power_state.RUNNING,
+                              virtevent.EVENT_LIFECYCLE_STARTED)
 
     def soft_delete(self, instance):
         pass
@@ -190,21 +207,28 @@ class FakeDriver(driver.ComputeDriver):
         pass
 
     def pause(self, instance):
-        pass
+        self._set_power_state(instance, power_state.PAUSED,
+                              virtevent.EVENT_LIFECYCLE_PAUSED)
 
     def unpause(self, instance):
-        pass
+        self._set_power_state(instance, power_state.RUNNING,
+                              virtevent.EVENT_LIFECYCLE_RESUMED)
 
     def suspend(self, instance):
-        pass
+        # NOTE: like a libvirt managed save, which stops the domain.
+        self._set_power_state(instance, power_state.SHUTDOWN,
+                              virtevent.EVENT_LIFECYCLE_STOPPED)
 
     def resume(self, context, instance, network_info, block_device_info=None):
-        pass
+        self._set_power_state(instance, power_state.RUNNING,
+                              virtevent.EVENT_LIFECYCLE_STARTED)
 
     def destroy(self, context, instance, network_info, block_device_info=None,
                 destroy_disks=True):
         key = instance['name']
         if key in self.instances:
+            self._set_power_state(instance, power_state.SHUTDOWN,
+                                  virtevent.EVENT_LIFECYCLE_STOPPED)
             del self.instances[key]
         else:
             LOG.warning(_("Key '%(key)s' not in instances '%(inst)s'") %
@@ -94,6 +94,7 @@ from nova.virt.disk import api as disk
 from nova.virt import driver
 from nova.virt import event as virtevent
 from nova.virt import firewall
+from nova.virt import images
 from nova.virt.libvirt import blockinfo
 from nova.virt.libvirt import config as vconfig
 from nova.virt.libvirt import firewall as libvirt_firewall
@@ -339,6 +340,8 @@ MIN_QEMU_LIVESNAPSHOT_VERSION = (1, 3, 0)
 MIN_LIBVIRT_BLOCKIO_VERSION = (0, 10, 2)
 # BlockJobInfo management requirement
 MIN_LIBVIRT_BLOCKJOBINFO_VERSION = (1, 1, 1)
+# Listing all the domains in one call
+MIN_LIBVIRT_LIST_ALL_DOMAINS_VERSION = (0, 9, 13)
 
 
 def libvirt_error_handler(context, err):
@@ -351,6 +354,7 @@ class LibvirtDriver(driver.ComputeDriver):
     capabilities = {
         "has_imagecache": True,
         "supports_recreate": True,
+        "supports_lifecycle_events": True,
         }
 
     def __init__(self, virtapi, read_only=False):
@@ -368,6 +372,14 @@ class LibvirtDriver(driver.ComputeDriver):
         self._wrapped_conn_lock = threading.Lock()
         self._caps = None
         self._vcpu_total = 0
+        # Devices parsed from the XML of the running domains, by domain
+        # name, with the domain ID and generation they were parsed for.
+        self._domain_devices = {}
+        self._domain_generations = {}
+        # The backing file and virtual size of the qcow2 disks, by path,
+        # with the mtime and size of the disk they were read for.
+        self._disk_info_cache = {}
+        self._qemu_img_calls_avoided = 0
         self.read_only = read_only
         self.firewall_driver = firewall.load_driver(
             DEFAULT_FIREWALL_DRIVER,
@@ -810,6 +822,118 @@ class LibvirtDriver(driver.ComputeDriver):
 
         return list(uuids)
 
+    def _list_domains(self):
+        """Return all the domains of the host, running or not.
+
+        libvirt lists them all in one call when it is recent enough,
+        otherwise the running domains are looked up one by one.
+        """
+        if self.has_min_version(MIN_LIBVIRT_LIST_ALL_DOMAINS_VERSION):
+            return self._conn.listAllDomains(0)
+
+        domains = []
+        for domain_id in self.list_instance_ids():
+            try:
+                domains.append(self._lookup_by_id(domain_id))
+            except exception.InstanceNotFound:
+                # Ignore deleted instance while listing
+                continue
+        for domain_name in self._conn.listDefinedDomains():
+            try:
+                domains.append(self._lookup_by_name(domain_name))
+            except exception.InstanceNotFound:
+                # Ignore deleted instance while listing
+                continue
+        return domains
+
+    def get_domains_stats(self):
+        """Collect the statistics of all the domains of the host at once.
+
+        This is the one pass over the domains made by the periodic update
+        of the host stats, whose results are then handed to
+        get_vcpu_used(), get_memory_mb_used() and
+        get_disk_over_committed_size_total().
+
+        :returns: a list with a dict for each domain, holding its id
+                  (-1 when it is not running), name, state, memory (KiB),
+                  vcpus and the disks and interfaces of its XML
+        """
+        stats = []
+        for dom in self._list_domains():
+            try:
+                name = dom.name()
+                dom_id = dom.ID()
+                info = dom.info()
+                devices = self._get_domain_devices(dom, name, dom_id)
+            except libvirt.libvirtError as ex:
+                if ex.get_error_code() == libvirt.VIR_ERR_NO_DOMAIN:
+                    # Ignore deleted instance while listing
+                    continue
+                raise
+            stats.append({'id': dom_id,
+                          'name': name,
+                          'state': info[0],
+                          'memory': info[2],
+                          'vcpus': info[3],
+                          'disks': devices['disks'],
+                          'ifaces': devices['ifaces']})
+            # NOTE(gtt116): give change to do other task.
+            greenthread.sleep(0)
+
+        names = set(domain['name'] for domain in stats)
+        for cache in (self._domain_devices, self._domain_generations):
+            for name in cache.keys():
+                if name not in names:
+                    del cache[name]
+        return stats
+
+    def _get_domain_devices(self, dom, name, dom_id):
+        """Return the disks and interfaces of a domain.
+
+        The devices of running domains are parsed once for each domain ID
+        and generation, so the XML is dumped again after the domain is
+        restarted or the driver changes its devices.
+        """
+        key = (dom_id, self._domain_generations.get(name, 0))
+        cached = self._domain_devices.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        devices = self._parse_domain_devices(dom.XMLDesc(0))
+        if dom_id != -1:
+            self._domain_devices[name] = (key, devices)
+        return devices
+
+    def _domain_changed(self, instance_name):
+        """Tell that the devices of a domain have changed."""
+        self._domain_generations[instance_name] = (
+            self._domain_generations.get(instance_name, 0) + 1)
+
+    @staticmethod
+    def _parse_domain_devices(xml):
+        """Parse the disks and interfaces out of the XML of a domain."""
+        devices = {'disks': [], 'ifaces': []}
+        try:
+            doc = etree.fromstring(xml)
+        except Exception:
+            return devices
+
+        for node in doc.findall('./devices/disk'):
+            source = node.find('source')
+            driver_node = node.find('driver')
+            target = node.find('target')
+            devices['disks'].append({
+                'type': node.get('type'),
+                'path': source is not None and source.get('file') or None,
+                'driver_type': (driver_node is not None and
+                                driver_node.get('type') or None),
+                'target': target is not None and target.get('dev') or None})
+        for node in doc.findall('./devices/interface'):
+            target = node.find('target')
+            if target is not None and target.get('dev'):
+                devices['ifaces'].append(target.get('dev'))
+        return devices
+
     def plug_vifs(self, instance, network_info):
         """Plug VIFs into networks."""
         for vif in network_info:
@@ -1178,6 +1302,7 @@ class LibvirtDriver(driver.ComputeDriver):
                 encryptor.attach_volume(context, **encryption)
 
             virt_dom.attachDeviceFlags(conf.to_xml(), flags)
+            self._domain_changed(instance_name)
         except Exception as ex:
             LOG.exception(ex)
             if isinstance(ex, libvirt.libvirtError):
@@ -1251,6 +1376,7 @@ class LibvirtDriver(driver.ComputeDriver):
             raise NotImplementedError(_("Swap only supports host devices"))
 
         self._swap_volume(virt_dom, disk_dev, conf.source_path)
+        self._domain_changed(instance_name)
         self.volume_driver_method('disconnect_volume',
                                   old_connection_info,
                                   disk_dev)
@@ -1301,6 +1427,7 @@ class LibvirtDriver(driver.ComputeDriver):
                 if state == power_state.RUNNING:
                     flags |= libvirt.VIR_DOMAIN_AFFECT_LIVE
                 virt_dom.detachDeviceFlags(xml, flags)
+                self._domain_changed(instance_name)
 
                 if encryption:
                     # The volume must be detached from the VM before
@@ -1339,6 +1466,7 @@ class LibvirtDriver(driver.ComputeDriver):
             if state == power_state.RUNNING:
                 flags |= libvirt.VIR_DOMAIN_AFFECT_LIVE
             virt_dom.attachDeviceFlags(cfg.to_xml(), flags)
+            self._domain_changed(instance['name'])
         except libvirt.libvirtError:
             LOG.error(_('attaching network adapter failed.'),
                      instance=instance)
@@ -1358,6 +1486,7 @@ class LibvirtDriver(driver.ComputeDriver):
             if state == power_state.RUNNING:
                 flags |= libvirt.VIR_DOMAIN_AFFECT_LIVE
             virt_dom.detachDeviceFlags(cfg.to_xml(), flags)
+            self._domain_changed(instance['name'])
         except libvirt.libvirtError as ex:
             error_code = ex.get_error_code()
             if error_code == libvirt.VIR_ERR_NO_DOMAIN:
@@ -1494,6 +1623,8 @@ class LibvirtDriver(driver.ComputeDriver):
                 else:
                     snapshot_backend.snapshot_extract(out_path, image_format)
             finally:
+                self._forget_disk_info(
+                    libvirt_utils.get_instance_path(instance))
                 new_dom = None
                 # NOTE(dkang): because previous managedSave is not called
                 #              for LXC, _create_domain must not be called.
@@ -3292,6 +3423,21 @@ class LibvirtDriver(driver.ComputeDriver):
                 'cpu_time': cpu_time,
                 'id': virt_dom.ID()}
 
+    def get_power_states(self, instances):
+        """Return the power states of several instances at once, from a
+        single listing of the domains.
+        """
+        states = {}
+        for dom in self._list_domains():
+            try:
+                states[dom.name()] = LIBVIRT_POWER_STATE[dom.info()[0]]
+            except libvirt.libvirtError as ex:
+                if ex.get_error_code() != libvirt.VIR_ERR_NO_DOMAIN:
+                    raise
+        return dict((instance['uuid'],
+                     states.get(instance['name'], power_state.NOSTATE))
+                    for instance in instances)
+
     def _create_domain(self, xml=None, domain=None,
                        instance=None, launch_flags=0, power_on=True):
         """Create a domain.
@@ -3578,9 +3724,11 @@ class LibvirtDriver(driver.ComputeDriver):
 
         return info
 
-    def get_vcpu_used(self):
+    def get_vcpu_used(self, domains=None):
         """Get vcpu usage number of physical computer.
 
+        :param domains: statistics from get_domains_stats(), collected
+                        here when not given
         :returns: The total number of vcpu that currently used.
 
         """
@@ -3589,26 +3737,18 @@ class LibvirtDriver(driver.ComputeDriver):
         if CONF.libvirt.virt_type == 'lxc':
             return total + 1
 
-        dom_ids = self.list_instance_ids()
-        for dom_id in dom_ids:
-            try:
-                dom = self._lookup_by_id(dom_id)
-                vcpus = dom.vcpus()
-                if vcpus is None:
-                    LOG.debug(_("couldn't obtain the vpu count from domain id:"
-                                " %s") % dom_id)
-                else:
-                    total += len(vcpus[1])
-            except exception.InstanceNotFound:
-                LOG.info(_("libvirt can't find a domain with id: %s") % dom_id)
-                continue
-            # NOTE(gtt116): give change to do other task.
-            greenthread.sleep(0)
+        if domains is None:
+            domains = self.get_domains_stats()
+        for domain in domains:
+            if domain['id'] != -1:
+                total += domain['vcpus']
         return total
 
-    def get_memory_mb_used(self):
+    def get_memory_mb_used(self, domains=None):
         """Get the free memory size(MB) of physical computer.
 
+        :param domains: statistics from get_domains_stats(), collected
+                        here when not given (xen only)
         :returns: the total usage of memory(MB).
 
         """
@@ -3622,13 +3762,13 @@ class LibvirtDriver(driver.ComputeDriver):
         idx3 = m.index('Cached:')
         if CONF.libvirt.virt_type == 'xen':
             used = 0
-            for domain_id in self.list_instance_ids():
-                try:
-                    dom_mem = int(self._lookup_by_id(domain_id).info()[2])
-                except exception.InstanceNotFound:
-                    LOG.info(_("libvirt can't find a domain with id: %s")
-                             % domain_id)
+            if domains is None:
+                domains = self.get_domains_stats()
+            for domain in domains:
+                domain_id = domain['id']
+                if domain_id == -1:
                     continue
+                dom_mem = int(domain['memory'])
                 # skip dom0
                 if domain_id != 0:
                     used += dom_mem
@@ -4421,6 +4561,7 @@ class LibvirtDriver(driver.ComputeDriver):
         :param network_info: instance network information
         :param block_migration: if true, post operation of block_migration.
         """
+        self._forget_disk_info(libvirt_utils.get_instance_path(instance))
         # Define migrated instance, otherwise, suspend/destroy does not work.
         dom_list = self._conn.listDefinedDomains()
         if instance["name"] not in dom_list:
@@ -4480,24 +4621,30 @@ class LibvirtDriver(driver.ComputeDriver):
             disk_dev = vol['mount_device'].rpartition("/")[2]
             volume_devices.add(disk_dev)
 
-        disk_info = []
-        doc = etree.fromstring(xml)
-        disk_nodes = doc.findall('.//devices/disk')
-        path_nodes = doc.findall('.//devices/disk/source')
-        driver_nodes = doc.findall('.//devices/disk/driver')
-        target_nodes = doc.findall('.//devices/disk/target')
+        disks = self._parse_domain_devices(xml)['disks']
+        return jsonutils.dumps(self._get_disks_info(instance_name, disks,
+                                                    volume_devices))
 
-        for cnt, path_node in enumerate(path_nodes):
-            disk_type = disk_nodes[cnt].get('type')
-            path = path_node.get('file')
-            target = target_nodes[cnt].attrib['dev']
+    def _get_disks_info(self, instance_name, disks, volume_devices=(),
+                        use_cache=False):
+        """Return the sizes of the local file disks of an instance.
+
+        :param disks: the disks of the domain from _parse_domain_devices()
+        :param volume_devices: the targets of the disks that are volumes
+        :param use_cache: reuse what qemu-img told of the qcow2 disks that
+                          did not change since
+        """
+        disk_info = []
+        for disk_dev in disks:
+            path = disk_dev['path']
+            target = disk_dev['target']
 
             if not path:
                 LOG.debug(_('skipping disk for %s as it does not have a path'),
                           instance_name)
                 continue
 
-            if disk_type != 'file':
+            if disk_dev['type'] != 'file':
                 LOG.debug(_('skipping %s since it looks like volume'), path)
                 continue
 
@@ -4510,10 +4657,13 @@ class LibvirtDriver(driver.ComputeDriver):
             # raise a localized error if image is unavailable
             dk_size = int(os.path.getsize(path))
 
-            disk_type = driver_nodes[cnt].get('type')
+            disk_type = disk_dev['driver_type']
             if disk_type == "qcow2":
-                backing_file = libvirt_utils.get_disk_backing_file(path)
-                virt_size = disk.get_disk_size(path)
+                if use_cache:
+                    backing_file, virt_size = self._get_qcow2_info(path)
+                else:
+                    backing_file = libvirt_utils.get_disk_backing_file(path)
+                    virt_size = disk.get_disk_size(path)
                 over_commit_size = int(virt_size) - dk_size
             else:
                 backing_file = ""
@@ -4526,17 +4676,54 @@ class LibvirtDriver(driver.ComputeDriver):
                               'backing_file': backing_file,
                               'disk_size': dk_size,
                               'over_committed_disk_size': over_commit_size})
-        return jsonutils.dumps(disk_info)
+        return disk_info
+
+    def _get_qcow2_info(self, path):
+        """Return the backing file and virtual size of a qcow2 disk.
 
-    def get_disk_over_committed_size_total(self):
-        """Return total over committed disk size for all instances."""
+        qemu-img is only run again when the mtime or size of the disk
+        changed since it last was.
+        """
+        st = os.stat(path)
+        key = (st.st_mtime, st.st_size)
+        cached = self._disk_info_cache.get(path)
+        if cached is not None and cached[0] == key:
+            self._qemu_img_calls_avoided += 1
+            return cached[1]
+
+        img_info = images.qemu_img_info(path)
+        backing_file = img_info.backing_file
+        if backing_file:
+            backing_file = os.path.basename(backing_file)
+        info = (backing_file, int(img_info.virtual_size))
+        self._disk_info_cache[path] = (key, info)
+        return info
+
+    def _forget_disk_info(self, inst_base):
+        """Drop what qemu-img told of the disks in an instance directory."""
+        for path in self._disk_info_cache.keys():
+            if path.startswith(inst_base):
+                del self._disk_info_cache[path]
+
+    def get_disk_over_committed_size_total(self, domains=None):
+        """Return total over committed disk size for all instances.
+
+        :param domains: statistics from get_domains_stats(), collected
+                        here when not given
+        """
         # Disk size that all instance uses : virtual_size - disk_size
-        instances_name = self.list_instances()
+        if domains is None:
+            domains = self.get_domains_stats()
+        self._qemu_img_calls_avoided = 0
         disk_over_committed_size = 0
-        for i_name in instances_name:
+        for domain in domains:
+            # We skip domains with ID 0 (hypervisors).
+            if domain['id'] == 0:
+                continue
+            i_name = domain['name']
             try:
-                disk_infos = jsonutils.loads(
-                        self.get_instance_disk_info(i_name))
+                disk_infos = self._get_disks_info(i_name, domain['disks'],
+                                                  use_cache=True)
                 for info in disk_infos:
                     disk_over_committed_size += int(
                         info['over_committed_disk_size'])
@@ -4546,11 +4733,18 @@ class LibvirtDriver(driver.ComputeDriver):
                               {'i_name': i_name, 'e': e})
                 else:
                     raise
-            except exception.InstanceNotFound:
-                # Instance was deleted during the check so ignore it
-                pass
             # NOTE(gtt116): give change to do other task.
             greenthread.sleep(0)
+
+        # Forget the disks that are gone.
+        paths = set(disk_dev['path'] for domain in domains
+                    for disk_dev in domain['disks'])
+        for path in self._disk_info_cache.keys():
+            if path not in paths:
+                del self._disk_info_cache[path]
+        LOG.debug(_("Computed disk over commit, %(avoided)d qemu-img calls "
+                    "avoided for unchanged disks"),
+                  {'avoided': self._qemu_img_calls_avoided})
         return disk_over_committed_size
 
     def unfilter_instance(self, instance, network_info):
@@ -4632,6 +4826,7 @@ class LibvirtDriver(driver.ComputeDriver):
         # shared storage for instance dir (eg. NFS).
         inst_base = libvirt_utils.get_instance_path(instance)
         inst_base_resize = inst_base + "_resize"
+        self._forget_disk_info(inst_base)
         shared_storage = self._is_storage_shared_with(dest, inst_base)
 
         # try to create the directory on the remote compute node
@@ -4697,6 +4892,7 @@ class LibvirtDriver(driver.ComputeDriver):
                          network_info, image_meta, resize_instance,
                          block_device_info=None, power_on=True):
         LOG.debug(_("Starting finish_migration"), instance=instance)
+        self._forget_disk_info(libvirt_utils.get_instance_path(instance))
 
         # resize disks. only "disk" and "disk.local" are necessary.
         disk_info = jsonutils.loads(disk_info)
@@ -4771,6 +4967,7 @@ class LibvirtDriver(driver.ComputeDriver):
 
         inst_base = libvirt_utils.get_instance_path(instance)
         inst_base_resize = inst_base + "_resize"
+        self._forget_disk_info(inst_base)
 
         # NOTE(danms): if we're recovering from a failed migration,
         # make sure we don't have a left-over same-host base directory
@@ -4799,23 +4996,6 @@ class LibvirtDriver(driver.ComputeDriver):
         self._cleanup_resize(instance, network_info)
 
     def get_diagnostics(self, instance):
-        def get_io_devices(xml_doc):
-            """get the list of io devices from the xml document."""
-            result = {"volumes": [], "ifaces": []}
-            try:
-                doc = etree.fromstring(xml_doc)
-            except Exception:
-                return result
-            blocks = [('./devices/disk', 'volumes'),
-                ('./devices/interface', 'ifaces')]
-            for block, key in blocks:
-                section = doc.findall(block)
-                for node in section:
-                    for child in node.getchildren():
-                        if child.tag == 'target' and child.get('dev'):
-                            result[key].append(child.get('dev'))
-            return result
-
         domain = self._lookup_by_name(instance['name'])
         output = {}
         # get cpu time, might launch an exception if the method
@@ -4828,9 +5008,10 @@ class LibvirtDriver(driver.ComputeDriver):
         except libvirt.libvirtError:
             pass
         # get io status
-        xml = domain.XMLDesc(0)
-        dom_io = get_io_devices(xml)
-        for disk in dom_io["volumes"]:
+        devices = self._get_domain_devices(domain, instance['name'],
+                                           domain.ID())
+        for disk in [disk_dev['target'] for disk_dev in devices['disks']
+                     if disk_dev['target']]:
             try:
                 # blockStats might launch an exception if the method
                 # is not supported by the underlying hypervisor being
@@ -4843,7 +5024,7 @@ class LibvirtDriver(driver.ComputeDriver):
                 output[disk + "_errors"] = stats[4]
             except libvirt.libvirtError:
                 pass
-        for interface in dom_io["ifaces"]:
+        for interface in devices['ifaces']:
             try:
                 # interfaceStats might launch an exception if the method
                 # is not supported by the underlying hypervisor being
@@ -4979,13 +5160,14 @@ class HostState(object):
             """
             disk_free_gb = disk_info_dict['free']
             disk_over_committed = (self.driver.
-                    get_disk_over_committed_size_total())
+                    get_disk_over_committed_size_total(domains))
             # Disk available least size
             available_least = disk_free_gb * unit.Gi - disk_over_committed
             return (available_least / unit.Gi)
 
         LOG.debug(_("Updating host stats"))
         disk_info_dict = self.driver.get_local_gb_info()
+        domains = self.driver.get_domains_stats()
         data = {}
 
         #NOTE(dprince): calling capabilities before getVersion works around
@@ -4998,8 +5180,8 @@ class HostState(object):
         data["vcpus"] = self.driver.get_vcpu_total()
         data["memory_mb"] = self.driver.get_memory_mb_total()
         data["local_gb"] = disk_info_dict['total']
-        data["vcpus_used"] = self.driver.get_vcpu_used()
-        data["memory_mb_used"] = self.driver.get_memory_mb_used()
+        data["vcpus_used"] = self.driver.get_vcpu_used(domains)
+        data["memory_mb_used"] = self.driver.get_memory_mb_used(domains)
         data["local_gb_used"] = disk_info_dict['used']
         data["hypervisor_type"] = self.driver.get_hypervisor_type()
         data["hypervisor_version"] = self.driver.get_hypervisor_version()
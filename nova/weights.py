@@ -17,9 +17,35 @@
 Pluggable Weighing support
 """
 
+import heapq
+import itertools
+import operator
+import time
+
 from nova import loadables
 
 
+def normalize(weight_list, minval=None, maxval=None):
+    """Normalize the values in a list between 0 and 1.0.
+
+    The minimum and maximum of the list are mapped to 0 and 1.0, unless
+    minval and/or maxval are given, in which case they are used instead.
+    If all the values are equal, they are all normalized to 0.
+    """
+    if not weight_list:
+        return []
+    if maxval is None:
+        maxval = max(weight_list)
+    if minval is None:
+        minval = min(weight_list)
+    maxval = float(maxval)
+    minval = float(minval)
+    if minval == maxval:
+        return [0.0] * len(weight_list)
+    range_ = maxval - minval
+    return [(weight - minval) / range_ for weight in weight_list]
+
+
 class WeighedObject(object):
     """Object with weight information."""
     def __init__(self, obj, weight):
@@ -32,6 +58,18 @@ class WeighedObject(object):
 
 class BaseWeigher(object):
     """Base class for pluggable weighers."""
+
+    # Set to true in a subclass if the weight of an object can change
+    # when another object is chosen for an earlier instance of the
+    # request, e.g. because weigh_objects() is overridden to compare the
+    # objects with each other.
+    depends_on_other_objects = False
+
+    # Bounds used when normalizing the weights of this weigher.  If None,
+    # the lowest and highest weights of the objects being weighed are used.
+    minval = None
+    maxval = None
+
     def _weight_multiplier(self):
         """How weighted this weigher should be.  Normally this would
         be overridden in a subclass based on a config value.
@@ -52,20 +90,61 @@ class BaseWeigher(object):
             obj.weight += (self._weight_multiplier() *
                            self._weigh_object(obj.obj, weight_properties))
 
+    def get_weights(self, obj_list, weight_properties):
+        """Return the weight of each object, before applying the
+        multiplier.  Used when the weights are normalized.
+        """
+        return [self._weigh_object(obj, weight_properties)
+                for obj in obj_list]
+
 
 class BaseWeightHandler(loadables.BaseLoader):
     object_class = WeighedObject
 
+    def weigher_ran(self, cls_name, num_objs, seconds, weighing_properties):
+        """Called after each weigher ran, with the number of objects it
+        weighed and the time it took.  Override this in a subclass to
+        collect statistics.
+        """
+        pass
+
     def get_weighed_objects(self, weigher_classes, obj_list,
-            weighing_properties):
-        """Return a sorted (highest score first) list of WeighedObjects."""
+            weighing_properties, limit=None, normalize_weights=False):
+        """Return a sorted (highest score first) list of WeighedObjects.
+
+        :param limit: only return the limit highest weighed objects
+        :param normalize_weights: normalize the weights of each weigher
+                                  between 0 and 1.0 before applying its
+                                  multiplier
+        """
 
         if not obj_list:
             return []
 
         weighed_objs = [self.object_class(obj, 0.0) for obj in obj_list]
         for weigher_cls in weigher_classes:
+            start = time.time()
             weigher = weigher_cls()
-            weigher.weigh_objects(weighed_objs, weighing_properties)
+            if not normalize_weights:
+                weigher.weigh_objects(weighed_objs, weighing_properties)
+            else:
+                weights = weigher.get_weights([x.obj for x in weighed_objs],
+                                              weighing_properties)
+                multiplier = weigher._weight_multiplier()
+                for weighed_obj, weight in itertools.izip(weighed_objs,
+                        normalize(weights, weigher.minval, weigher.maxval)):
+                    weighed_obj.weight += multiplier * weight
+            self.weigher_ran(weigher_cls.__name__, len(weighed_objs),
+                             time.time() - start, weighing_properties)
+
+        return self._sort_weighed_objects(weighed_objs, limit)
 
-        return sorted(weighed_objs, key=lambda x: x.weight, reverse=True)
+    def _sort_weighed_objects(self, weighed_objs, limit=None):
+        """Return the limit highest weighed objects, highest first.
+
+        Objects with the same weight keep their relative order.
+        """
+        key = operator.attrgetter('weight')
+        if limit is not None and limit < len(weighed_objs):
+            return heapq.nlargest(limit, weighed_objs, key=key)
+        return sorted(weighed_objs, key=key, reverse=True)
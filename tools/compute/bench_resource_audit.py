@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark the periodic resource update of a compute node.
+
+A compute node with many instances (500 by default) runs the periodic
+ResourceTracker.update_available_resource() a number of times, first with
+resource_audit_interval at 1, auditing every run, and then with a larger
+interval, where the runs in between only reconcile the tracked usage with
+the instances of the node in the database.  The mean and worst latency of
+a run and the SQL statements it makes are reported for both.
+
+Usage:
+
+    tools/with_venv.sh python tools/compute/bench_resource_audit.py \\
+        --instances 500 --runs 20 --interval 10
+"""
+
+import argparse
+import os
+import sys
+import time
+import uuid
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(__file__),
+                                                os.pardir, os.pardir,
+                                                os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+from oslo.config import cfg
+from sqlalchemy import event as sqla_event
+
+from nova.compute import resource_tracker
+from nova.compute import vm_states
+from nova import context
+from nova.db.sqlalchemy import migration
+from nova.db.sqlalchemy import models
+from nova.openstack.common.db.sqlalchemy import session as db_session
+from nova.virt import driver
+
+CONF = cfg.CONF
+
+HOST = 'host1'
+NODE = 'node1'
+
+
+class BenchVirtDriver(driver.ComputeDriver):
+    """Hypervisor big enough for all the instances of the node."""
+
+    def __init__(self, num_instances):
+        super(BenchVirtDriver, self).__init__(None)
+        self.num_instances = num_instances
+
+    def get_available_resource(self, nodename):
+        return {'vcpus': self.num_instances,
+                'memory_mb': self.num_instances * 512,
+                'local_gb': self.num_instances * 10,
+                'vcpus_used': 0,
+                'memory_mb_used': 0,
+                'local_gb_used': 0,
+                'hypervisor_type': 'fake',
+                'hypervisor_version': 1,
+                'hypervisor_hostname': nodename,
+                'disk_available_least': 0,
+                'cpu_info': ''}
+
+    def get_per_instance_usage(self):
+        return {}
+
+
+class StatementCounter(object):
+    def __init__(self, engine):
+        self.count = 0
+        sqla_event.listen(engine, 'before_cursor_execute', self)
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+def populate(engine, num_instances):
+    """Insert the compute service and the instances of the node."""
+    engine.execute(models.Service.__table__.insert(),
+                   [dict(id=1, host=HOST, binary='nova-compute',
+                         topic='compute', report_count=1, disabled=False,
+                         deleted=0)])
+    instances = []
+    for i in xrange(num_instances):
+        instances.append(dict(uuid=str(uuid.uuid4()), host=HOST, node=NODE,
+                              vm_state=vm_states.ACTIVE, vcpus=1,
+                              memory_mb=512, root_gb=10, ephemeral_gb=0,
+                              instance_type_id=1, project_id='project1',
+                              user_id='user1', deleted=0))
+    engine.execute(models.Instance.__table__.insert(), instances)
+
+
+def run(num_instances, num_runs, interval, statements):
+    CONF.set_override('resource_audit_interval', interval)
+    ctxt = context.get_admin_context()
+    rt = resource_tracker.ResourceTracker(HOST,
+                                          BenchVirtDriver(num_instances),
+                                          NODE)
+    # The first run always audits, as the compute node starts up.
+    rt.update_available_resource(ctxt)
+
+    samples = []
+    statements.count = 0
+    for i in xrange(num_runs):
+        start = time.time()
+        rt.update_available_resource(ctxt)
+        samples.append((time.time() - start) * 1000)
+    assert rt.compute_node['vcpus_used'] == num_instances
+    return samples, statements.count / float(num_runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--instances', type=int, default=500,
+                        help='Instances of the compute node')
+    parser.add_argument('--runs', type=int, default=20,
+                        help='Periodic resource updates per interval')
+    parser.add_argument('--interval', type=int, default=10,
+                        help='resource_audit_interval to compare with 1')
+    args = parser.parse_args()
+
+    CONF([], project='nova', default_config_files=[])
+    CONF.set_override('connection', 'sqlite://', group='database')
+    CONF.set_override('sqlite_synchronous', False)
+    CONF.set_override('use_local', True, group='conductor')
+    migration.db_sync()
+    engine = db_session.get_engine()
+    populate(engine, args.instances)
+    statements = StatementCounter(engine)
+
+    print('%8s %10s %10s %12s' % ('interval', 'mean(ms)', 'max(ms)',
+                                  'statements'))
+    for interval in (1, args.interval):
+        samples, per_run = run(args.instances, args.runs, interval,
+                               statements)
+        print('%8d %10.2f %10.2f %12.1f' % (interval,
+                                            sum(samples) / len(samples),
+                                            max(samples), per_run))
+
+
+if __name__ == '__main__':
+    main()
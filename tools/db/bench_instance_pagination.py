@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark paging through the instances of a project by marker.
+
+This fills a sqlite database with the instances of a few projects, then
+pages through the instances of one project the way the servers API does,
+newest first, with the previous page's last instance as the marker.  The
+time taken by the first, middle and last full pages is reported, both for
+db.instance_get_all_by_filters() and for the query it built before, which
+loaded the whole marker instance and left the database to find the marker
+from the OR of the sort criteria, and both with and without the instances
+pagination indexes.
+
+Usage:
+
+    tools/with_venv.sh python tools/db/bench_instance_pagination.py \
+        --instances 50000 --limit 100
+"""
+
+import argparse
+import datetime
+import os
+import sys
+import time
+import uuid
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(__file__),
+                                                os.pardir, os.pardir,
+                                                os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+from oslo.config import cfg
+import sqlalchemy
+
+from nova import context
+from nova import db
+from nova.db import migration
+from nova.db.sqlalchemy import api as sqlalchemy_api
+from nova.db.sqlalchemy import models
+from nova.openstack.common.db.sqlalchemy import utils as sqlalchemyutils
+
+CONF = cfg.CONF
+
+INDEXES = ['instances_project_id_deleted_created_at_id_idx',
+           'instances_deleted_created_at_id_idx']
+
+PROJECTS = 4
+
+
+def fill_instances(engine, num_instances):
+    """Insert num_instances instances for each project, created a second
+    apart, a tenth of them deleted.
+    """
+    start = datetime.datetime(2013, 1, 1)
+    table = models.Instance.__table__
+    for project in xrange(PROJECTS):
+        rows = []
+        for i in xrange(num_instances):
+            rows.append(dict(uuid=str(uuid.uuid4()),
+                             project_id='project%d' % project,
+                             user_id='user', vm_state='active',
+                             display_name='server%d' % i,
+                             created_at=start + datetime.timedelta(
+                                 seconds=i // 2),
+                             deleted=0))
+        engine.execute(table.insert(), rows)
+    # Mark a tenth of the instances as deleted, as nova does.
+    engine.execute(table.update().
+                   where(table.c.id % 10 == 0).
+                   values(deleted=table.c.id))
+
+
+def drop_indexes(engine):
+    meta = sqlalchemy.MetaData(bind=engine)
+    table = sqlalchemy.Table('instances', meta, autoload=True)
+    for index in table.indexes:
+        if index.name in INDEXES:
+            index.drop()
+
+
+def legacy_page(ctxt, filters, limit, marker):
+    """Return a page of instances as instance_get_all_by_filters() did
+    before the pagination indexes.
+    """
+    session = sqlalchemy_api.get_session()
+    query = session.query(models.Instance).\
+                order_by(sqlalchemy.desc(models.Instance.created_at)).\
+                filter_by(deleted=0).\
+                filter(models.Instance.vm_state != 'soft-delete').\
+                filter_by(project_id=filters['project_id'])
+    if marker is not None:
+        marker = sqlalchemy_api._instance_get_by_uuid(ctxt, marker,
+                                                      session=session)
+    query = sqlalchemyutils.paginate_query(query, models.Instance, limit,
+                                           ['created_at', 'created_at',
+                                            'id'],
+                                           marker=marker, sort_dir='desc')
+    return sqlalchemy_api._instances_fill_metadata(ctxt, query.all(), [])
+
+
+def current_page(ctxt, filters, limit, marker):
+    return db.instance_get_all_by_filters(ctxt, filters, 'created_at',
+                                          'desc', limit=limit, marker=marker,
+                                          columns_to_join=[])
+
+
+def page_through(get_page, limit):
+    """Return the time in milliseconds taken by each page and the uuids
+    of the instances.
+    """
+    ctxt = context.get_admin_context()
+    filters = {'project_id': 'project1', 'deleted': False}
+    # Warm up the query compilation and the database page cache.
+    get_page(ctxt, filters, limit, None)
+    samples = []
+    uuids = []
+    marker = None
+    while True:
+        start = time.time()
+        instances = get_page(ctxt, filters, limit, marker)
+        samples.append((time.time() - start) * 1000)
+        uuids.extend(instance['uuid'] for instance in instances)
+        if len(instances) < limit:
+            # Leave out the last page, which is shorter.
+            return samples[:-1], uuids
+        marker = instances[-1]['uuid']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--instances', type=int, default=50000,
+                        help='Number of instances of each project')
+    parser.add_argument('--limit', type=int, default=100,
+                        help='Instances per page')
+    args = parser.parse_args()
+
+    CONF([], project='nova', default_config_files=[])
+    CONF.set_override('connection', 'sqlite://', group='database')
+    CONF.set_override('sqlite_synchronous', False)
+    migration.db_sync()
+    engine = sqlalchemy_api.get_engine()
+    fill_instances(engine, args.instances)
+
+    print('%8s %8s %6s %12s %12s %12s' % ('indexes', 'query', 'pages',
+                                          'first(ms)', 'middle(ms)',
+                                          'last(ms)'))
+    results = []
+    for indexes in (True, False):
+        if not indexes:
+            drop_indexes(engine)
+        for name, get_page in (('current', current_page),
+                               ('legacy', legacy_page)):
+            samples, uuids = page_through(get_page, args.limit)
+            results.append(uuids)
+            print('%8s %8s %6d %12.2f %12.2f %12.2f' % (
+                    indexes and 'yes' or 'no', name, len(samples),
+                    samples[0], samples[len(samples) // 2], samples[-1]))
+    assert all(uuids == results[0] for uuids in results)
+
+
+if __name__ == '__main__':
+    main()
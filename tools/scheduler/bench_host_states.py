@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark HostManager.get_all_host_states() against a sqlite database.
+
+For an increasing number of fake compute nodes, this measures the latency
+of loading the host states for a scheduling request, first reloading every
+compute node on each request and then with scheduler_host_state_cache
+enabled.  Between two requests a fraction of the compute nodes (--churn)
+report new resource usage, and the cache is allowed no staleness at all, so
+every cached request still goes to the database for the changed nodes.
+
+Usage:
+
+    tools/with_venv.sh python tools/scheduler/bench_host_states.py \
+        --nodes 100,1000,10000 --requests 20
+"""
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(__file__),
+                                                os.pardir, os.pardir,
+                                                os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+from oslo.config import cfg
+
+from nova import context
+from nova.db.sqlalchemy import migration
+from nova.db.sqlalchemy import models
+from nova.openstack.common.db.sqlalchemy import session as db_session
+from nova.openstack.common import timeutils
+from nova.scheduler import host_manager
+
+CONF = cfg.CONF
+
+
+def populate(engine, num_nodes):
+    """Insert num_nodes compute services and compute nodes."""
+    start = timeutils.utcnow() - datetime.timedelta(seconds=60)
+    services = []
+    nodes = []
+    stats = []
+    for i in xrange(1, num_nodes + 1):
+        # Compute nodes report at different times within their period.
+        now = start + datetime.timedelta(seconds=random.uniform(0, 60))
+        services.append(dict(id=i, host='host%d' % i, binary='nova-compute',
+                             topic='compute', report_count=1, disabled=False,
+                             created_at=now, updated_at=now, deleted=0))
+        nodes.append(dict(id=i, service_id=i, vcpus=16, memory_mb=65536,
+                          local_gb=1024, vcpus_used=0, memory_mb_used=0,
+                          local_gb_used=0, free_ram_mb=65536,
+                          free_disk_gb=1024, disk_available_least=1024,
+                          hypervisor_type='fake', hypervisor_version=1,
+                          hypervisor_hostname='node%d' % i, cpu_info='',
+                          host_ip='127.0.0.1', running_vms=0,
+                          current_workload=0, created_at=now,
+                          updated_at=now, deleted=0))
+        stats.append(dict(compute_node_id=i, key='num_instances', value='0',
+                          created_at=now, deleted=0))
+        stats.append(dict(compute_node_id=i, key='io_workload', value='0',
+                          created_at=now, deleted=0))
+    engine.execute(models.Service.__table__.insert(), services)
+    engine.execute(models.ComputeNode.__table__.insert(), nodes)
+    engine.execute(models.ComputeNodeStat.__table__.insert(), stats)
+
+
+def report_usage(engine, num_nodes, churn):
+    """Have a random fraction of the compute nodes report new usage."""
+    table = models.ComputeNode.__table__
+    now = timeutils.utcnow()
+    for node_id in random.sample(xrange(1, num_nodes + 1),
+                                 max(1, int(num_nodes * churn))):
+        engine.execute(table.update().
+                       where(table.c.id == node_id).
+                       values(free_ram_mb=random.randint(0, 65536),
+                              updated_at=now))
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100.0))]
+
+
+def run(num_nodes, num_requests, churn, use_cache):
+    CONF.set_override('scheduler_host_state_cache', use_cache)
+    CONF.set_override('scheduler_host_state_max_staleness', 0)
+    engine = db_session.get_engine()
+    ctxt = context.get_admin_context()
+    hm = host_manager.HostManager()
+    # Warm up, so that the cached run starts from a populated cache.
+    list(hm.get_all_host_states(ctxt))
+
+    samples = []
+    for i in xrange(num_requests):
+        report_usage(engine, num_nodes, churn)
+        start = time.time()
+        host_states = list(hm.get_all_host_states(ctxt))
+        samples.append((time.time() - start) * 1000)
+        assert len(host_states) == num_nodes
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--nodes', default='100,1000,10000',
+                        help='Comma separated numbers of compute nodes')
+    parser.add_argument('--requests', type=int, default=20,
+                        help='Scheduling requests per run')
+    parser.add_argument('--churn', type=float, default=0.01,
+                        help='Fraction of the nodes updated between requests')
+    args = parser.parse_args()
+
+    CONF([], project='nova', default_config_files=[])
+    CONF.set_override('connection', 'sqlite://', group='database')
+    CONF.set_override('sqlite_synchronous', False)
+
+    print('%8s %8s %10s %10s %10s' % ('nodes', 'cache', 'mean(ms)',
+                                      'p50(ms)', 'p99(ms)'))
+    for num_nodes in [int(n) for n in args.nodes.split(',')]:
+        for use_cache in (False, True):
+            db_session.cleanup()
+            migration.db_sync()
+            populate(db_session.get_engine(), num_nodes)
+            samples = run(num_nodes, args.requests, args.churn, use_cache)
+            print('%8d %8s %10.2f %10.2f %10.2f' % (
+                    num_nodes, use_cache and 'on' or 'off',
+                    sum(samples) / len(samples), percentile(samples, 50),
+                    percentile(samples, 99)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark FilterScheduler._schedule() for multi-instance requests.
+
+For an increasing number of instances in a single request, this measures
+the time taken to choose a host for every instance, first filtering and
+weighing every host for each instance and then with
+scheduler_batch_placement enabled.  The host states are built in memory,
+so only the filtering, weighing and host choice are measured.
+
+Usage:
+
+    tools/with_venv.sh python tools/scheduler/bench_placement.py \
+        --hosts 1000 --instances 1,100,1000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(__file__),
+                                                os.pardir, os.pardir,
+                                                os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+from oslo.config import cfg
+
+from nova import context
+from nova.scheduler import filter_scheduler
+from nova.scheduler import host_manager
+
+CONF = cfg.CONF
+
+FILTERS = ['RetryFilter', 'RamFilter', 'CoreFilter', 'DiskFilter',
+           'ComputeCapabilitiesFilter', 'ImagePropertiesFilter',
+           'NumInstancesFilter']
+
+
+def make_host_states(num_hosts):
+    """Return num_hosts HostStates with some of their resources used."""
+    host_states = []
+    for i in xrange(num_hosts):
+        host_state = host_manager.HostState('host%d' % i, 'node%d' % i)
+        host_state.total_usable_ram_mb = 65536
+        host_state.free_ram_mb = random.randint(0, 65536)
+        host_state.total_usable_disk_gb = 1024
+        host_state.free_disk_mb = random.randint(0, 1024) * 1024
+        host_state.vcpus_total = 16
+        host_state.vcpus_used = random.randint(0, 16)
+        host_states.append(host_state)
+    return host_states
+
+
+def run(num_hosts, num_instances, batch_placement):
+    CONF.set_override('scheduler_batch_placement', batch_placement)
+    scheduler = filter_scheduler.FilterScheduler()
+    host_states = make_host_states(num_hosts)
+    scheduler.host_manager.get_all_host_states = (
+            lambda context: iter(host_states))
+    instance_type = {'memory_mb': 2048, 'root_gb': 20, 'ephemeral_gb': 0,
+                     'swap': 0, 'vcpus': 1}
+    instance_properties = dict(instance_type, project_id='fake',
+                               os_type='linux')
+    request_spec = {'num_instances': num_instances,
+                    'instance_type': instance_type,
+                    'instance_properties': instance_properties}
+    start = time.time()
+    weighed_hosts = scheduler._schedule(context.get_admin_context(),
+                                        request_spec, {})
+    elapsed = (time.time() - start) * 1000
+    return elapsed, len(weighed_hosts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--hosts', type=int, default=1000,
+                        help='Number of compute hosts')
+    parser.add_argument('--instances', default='1,100,1000',
+                        help='Comma separated numbers of instances')
+    args = parser.parse_args()
+
+    CONF([], project='nova', default_config_files=[])
+    CONF.set_override('scheduler_default_filters', FILTERS)
+
+    print('%10s %8s %10s %10s' % ('instances', 'batch', 'time(ms)',
+                                  'placed'))
+    for num_instances in [int(n) for n in args.instances.split(',')]:
+        for batch_placement in (False, True):
+            random.seed(num_instances)
+            elapsed, placed = run(args.hosts, num_instances,
+                                  batch_placement)
+            print('%10d %8s %10.2f %10d' % (
+                    num_instances, batch_placement and 'on' or 'off',
+                    elapsed, placed))
+
+
+if __name__ == '__main__':
+    main()
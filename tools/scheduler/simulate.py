@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Replay a trace of boot, resize and delete requests through the scheduler.
+
+The FilterScheduler runs with its usual HostManager against an in-memory
+sqlite database, filled with compute nodes described by the fake virt
+driver and resized to --host-ram, --host-vcpus and --host-disk.  Each
+request goes through select_destinations(), and the compute host side is
+simulated by writing the new resource usage of the compute node to the
+database as the ResourceTracker would.
+
+The trace is either generated from --requests and --mix, or read from a
+JSON file written with --save-trace, so that runs can be compared.  The
+report gives the scheduling throughput and latency, how the instances were
+placed and the peak memory of the process.  The --max-p99-ms, --min-rps
+and --max-failures thresholds make the script exit with an error, to gate
+scheduler changes on it.
+
+Usage:
+
+    tools/with_venv.sh python tools/scheduler/simulate.py \\
+        --hosts 1000 --requests 5000 --mix boot=0.7,resize=0.1,delete=0.2 \\
+        --set scheduler_host_state_cache=true
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import resource
+import sys
+import time
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(__file__),
+                                                os.pardir, os.pardir,
+                                                os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+from oslo.config import cfg
+
+from nova import context
+from nova import db
+from nova.db.sqlalchemy import migration
+from nova import exception
+from nova.openstack.common.db.sqlalchemy import session as db_session
+from nova.scheduler import filter_scheduler
+from nova.virt import fake
+
+CONF = cfg.CONF
+CONF.import_opt('scheduler_default_filters', 'nova.scheduler.host_manager')
+CONF.import_opt('scheduler_weight_classes', 'nova.scheduler.host_manager')
+CONF.import_opt('service_down_time', 'nova.service')
+
+FLAVORS = {
+    'm1.tiny': dict(memory_mb=512, vcpus=1, root_gb=1, ephemeral_gb=0),
+    'm1.small': dict(memory_mb=2048, vcpus=1, root_gb=20, ephemeral_gb=0),
+    'm1.medium': dict(memory_mb=4096, vcpus=2, root_gb=40, ephemeral_gb=0),
+    'm1.large': dict(memory_mb=8192, vcpus=4, root_gb=80, ephemeral_gb=0),
+    'm1.xlarge': dict(memory_mb=16384, vcpus=8, root_gb=160, ephemeral_gb=0),
+}
+
+
+def parse_pairs(value, convert=str):
+    """Parse 'key=value,key=value' into a dict."""
+    pairs = {}
+    for item in value.split(','):
+        key, sep, val = item.partition('=')
+        pairs[key.strip()] = convert(val.strip())
+    return pairs
+
+
+def generate_trace(num_requests, mix, flavors):
+    """Return a list of requests, booting, resizing and deleting instances
+    in the proportions of mix and with flavors in the proportions of
+    flavors.
+    """
+    def choose(weights):
+        point = random.uniform(0, sum(weights.values()))
+        for key, weight in sorted(weights.items()):
+            point -= weight
+            if point <= 0:
+                return key
+        return key
+
+    trace = []
+    live = []
+    next_id = 0
+    for i in xrange(num_requests):
+        op = choose(mix)
+        if op == 'boot' or not live:
+            trace.append(dict(op='boot', instance=next_id,
+                              flavor=choose(flavors)))
+            live.append(next_id)
+            next_id += 1
+        elif op == 'resize':
+            trace.append(dict(op='resize', instance=random.choice(live),
+                              flavor=choose(flavors)))
+        else:
+            instance = live.pop(random.randrange(len(live)))
+            trace.append(dict(op='delete', instance=instance))
+    return trace
+
+
+class SimulatedCloud(object):
+    """Compute nodes in the database, and the instances placed on them."""
+
+    def __init__(self, ctxt, num_hosts, ram_mb, vcpus, disk_gb):
+        self.ctxt = ctxt
+        nodenames = ['node%d' % i for i in xrange(num_hosts)]
+        fake.set_nodes(nodenames)
+        driver = fake.FakeDriver(None)
+        # { nodename : compute node values }
+        self.nodes = {}
+        for i, nodename in enumerate(nodenames):
+            service = db.service_create(ctxt, dict(host='host%d' % i,
+                    binary='nova-compute', topic=CONF.compute_topic,
+                    report_count=1, disabled=False))
+            values = driver.get_available_resource(nodename)
+            values.update(service_id=service['id'], memory_mb=ram_mb,
+                          vcpus=vcpus, local_gb=disk_gb, free_ram_mb=ram_mb,
+                          free_disk_gb=disk_gb, disk_available_least=disk_gb,
+                          host_ip='127.0.0.1', running_vms=0,
+                          current_workload=0)
+            node = db.compute_node_create(ctxt, values)
+            self.nodes[nodename] = dict(values, id=node['id'],
+                                        instances=0)
+        fake.restore_nodes()
+        # { instance : (nodename, flavor) }
+        self.instances = {}
+
+    def _add_usage(self, nodename, flavor, sign):
+        node = self.nodes[nodename]
+        node['memory_mb_used'] += sign * flavor['memory_mb']
+        node['vcpus_used'] += sign * flavor['vcpus']
+        node['local_gb_used'] += sign * (flavor['root_gb'] +
+                                         flavor['ephemeral_gb'])
+        node['instances'] += sign
+        node['free_ram_mb'] = node['memory_mb'] - node['memory_mb_used']
+        node['free_disk_gb'] = node['local_gb'] - node['local_gb_used']
+        node['disk_available_least'] = node['free_disk_gb']
+        node['running_vms'] = node['instances']
+        # What the ResourceTracker of the compute node would write.
+        values = dict((key, node[key]) for key in (
+                'memory_mb_used', 'vcpus_used', 'local_gb_used',
+                'free_ram_mb', 'free_disk_gb', 'disk_available_least',
+                'running_vms'))
+        values['stats'] = {'num_instances': node['instances']}
+        db.compute_node_update(self.ctxt, node['id'], values)
+
+    def place(self, instance, nodename, flavor):
+        self.remove(instance)
+        self._add_usage(nodename, flavor, 1)
+        self.instances[instance] = (nodename, flavor)
+
+    def remove(self, instance):
+        if instance in self.instances:
+            nodename, flavor = self.instances.pop(instance)
+            self._add_usage(nodename, flavor, -1)
+
+    def placement(self):
+        """Return statistics of how the instances are spread."""
+        nodes = self.nodes.values()
+        used = [node for node in nodes if node['instances']]
+        usage = [float(node['memory_mb_used']) / node['memory_mb']
+                 for node in nodes]
+        mean = sum(usage) / len(usage)
+        return dict(instances=len(self.instances),
+                    hosts_used=len(used),
+                    hosts_used_pct=100.0 * len(used) / len(nodes),
+                    ram_used_pct_of_used_hosts=(
+                            100.0 * sum(node['memory_mb_used']
+                                        for node in used) /
+                            max(1, sum(node['memory_mb'] for node in used))),
+                    ram_used_stddev_pct=100.0 * math.sqrt(
+                            sum((u - mean) ** 2 for u in usage) /
+                            len(usage)))
+
+
+def request_spec(instance, flavor_name):
+    flavor = dict(FLAVORS[flavor_name], name=flavor_name, swap=0,
+                  extra_specs={})
+    instance_properties = dict(flavor, project_id='project%d' % (
+            instance % 10), os_type='linux', uuid='instance-%d' % instance)
+    return {'num_instances': 1, 'image': {},
+            'instance_type': flavor,
+            'instance_properties': instance_properties}
+
+
+def replay(scheduler, cloud, ctxt, trace):
+    """Replay the trace and return the latency of every scheduling request
+    in seconds and the number of requests which found no valid host.
+    """
+    latencies = []
+    failures = 0
+    for request in trace:
+        instance = request['instance']
+        if request['op'] == 'delete':
+            cloud.remove(instance)
+            continue
+        if request['op'] == 'resize' and instance not in cloud.instances:
+            continue
+        spec = request_spec(instance, request['flavor'])
+        filter_properties = {'instance_type': spec['instance_type']}
+        start = time.time()
+        try:
+            dests = scheduler.select_destinations(ctxt, spec,
+                                                  filter_properties)
+        except exception.NoValidHost:
+            dests = None
+        latencies.append(time.time() - start)
+        if not dests:
+            failures += 1
+            continue
+        cloud.place(instance, dests[0]['nodename'],
+                    FLAVORS[request['flavor']])
+    return latencies, failures
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100.0))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--hosts', type=int, default=1000,
+                        help='Number of compute hosts')
+    parser.add_argument('--host-ram', type=int, default=131072,
+                        help='RAM of each host, in MB')
+    parser.add_argument('--host-vcpus', type=int, default=32,
+                        help='VCPUs of each host')
+    parser.add_argument('--host-disk', type=int, default=2048,
+                        help='Disk of each host, in GB')
+    parser.add_argument('--requests', type=int, default=5000,
+                        help='Number of requests of the generated trace')
+    parser.add_argument('--mix', default='boot=0.7,resize=0.1,delete=0.2',
+                        help='Proportions of the requests of the generated '
+                             'trace')
+    parser.add_argument('--flavors',
+                        default='m1.tiny=1,m1.small=4,m1.medium=3,'
+                                'm1.large=2,m1.xlarge=1',
+                        help='Proportions of the flavors of the generated '
+                             'trace, among %s' % ', '.join(sorted(FLAVORS)))
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the generated trace and of the host '
+                             'choices')
+    parser.add_argument('--trace', help='Replay this JSON trace instead of '
+                                        'generating one')
+    parser.add_argument('--save-trace', help='Save the trace to this file')
+    parser.add_argument('--filters',
+                        help='Comma separated filters, instead of '
+                             'scheduler_default_filters')
+    parser.add_argument('--weighers',
+                        help='Comma separated weigher classes, instead of '
+                             'scheduler_weight_classes')
+    parser.add_argument('--set', action='append', default=[],
+                        metavar='OPTION=VALUE',
+                        help='Override a configuration option, with a JSON '
+                             'or string value. Can be repeated')
+    parser.add_argument('--json', action='store_true',
+                        help='Print the results as JSON')
+    parser.add_argument('--max-p99-ms', type=float,
+                        help='Fail if the p99 latency is above this')
+    parser.add_argument('--min-rps', type=float,
+                        help='Fail if fewer requests per second are '
+                             'scheduled')
+    parser.add_argument('--max-failures', type=int,
+                        help='Fail if more requests find no valid host')
+    args = parser.parse_args()
+
+    CONF([], project='nova', default_config_files=[])
+    CONF.set_override('connection', 'sqlite://', group='database')
+    CONF.set_override('sqlite_synchronous', False)
+    CONF.set_override('use_local', True, group='conductor')
+    CONF.set_override('service_down_time', 86400)
+    if args.filters:
+        CONF.set_override('scheduler_default_filters',
+                          args.filters.split(','))
+    if args.weighers:
+        CONF.set_override('scheduler_weight_classes',
+                          args.weighers.split(','))
+    for override in args.set:
+        name, sep, value = override.partition('=')
+        try:
+            value = json.loads(value)
+        except ValueError:
+            pass
+        CONF.set_override(name, value)
+
+    random.seed(args.seed)
+    if args.trace:
+        with open(args.trace) as f:
+            trace = json.load(f)
+    else:
+        trace = generate_trace(args.requests,
+                               parse_pairs(args.mix, float),
+                               parse_pairs(args.flavors, float))
+    if args.save_trace:
+        with open(args.save_trace, 'w') as f:
+            json.dump(trace, f)
+
+    migration.db_sync()
+    ctxt = context.get_admin_context()
+    cloud = SimulatedCloud(ctxt, args.hosts, args.host_ram, args.host_vcpus,
+                           args.host_disk)
+    scheduler = filter_scheduler.FilterScheduler()
+
+    start = time.time()
+    latencies, failures = replay(scheduler, cloud, ctxt, trace)
+    elapsed = time.time() - start
+    db_session.cleanup()
+
+    results = dict(hosts=args.hosts, trace_requests=len(trace),
+                   scheduled=len(latencies), failures=failures,
+                   elapsed_s=elapsed,
+                   requests_per_s=len(latencies) / max(sum(latencies), 1e-9),
+                   p50_ms=percentile(latencies, 50) * 1000,
+                   p99_ms=percentile(latencies, 99) * 1000,
+                   max_rss_mb=resource.getrusage(
+                           resource.RUSAGE_SELF).ru_maxrss / 1024.0)
+    results.update(cloud.placement())
+    if args.json:
+        print(json.dumps(results, sort_keys=True, indent=4))
+    else:
+        for key in sorted(results):
+            value = results[key]
+            if isinstance(value, float):
+                value = '%.2f' % value
+            print('%-28s %s' % (key, value))
+
+    errors = []
+    if args.max_p99_ms is not None and results['p99_ms'] > args.max_p99_ms:
+        errors.append('p99 latency %.2fms above %.2fms' % (
+                results['p99_ms'], args.max_p99_ms))
+    if (args.min_rps is not None and
+            results['requests_per_s'] < args.min_rps):
+        errors.append('%.2f requests per second below %.2f' % (
+                results['requests_per_s'], args.min_rps))
+    if args.max_failures is not None and failures > args.max_failures:
+        errors.append('%d requests found no valid host, more than %d' % (
+                failures, args.max_failures))
+    if errors:
+        sys.exit('\n'.join(errors))
+
+
+if __name__ == '__main__':
+    main()